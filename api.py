@@ -0,0 +1,346 @@
+"""
+Headless HTTP API for the optimization pipeline
+
+Serves the same pipeline as the Streamlit app to programmatic clients. Every
+worker process builds one PromptAgent, PromptEngine and PromptEnhancer at
+startup and shares them (and their caches) across requests; the blocking
+pipeline stages run on a thread pool of Config.API_THREADS threads.
+
+Endpoints (JSON in, JSON out; invalid bodies get 422 with the errors):
+    GET  /health
+    GET  /metrics               this worker process's metrics (Prometheus text format)
+    POST /v1/process            PromptAgent.process_input ("stream": true sends the
+                                prompt first and its quality score as a second line)
+    POST /v1/optimize           PromptEngine.smart_optimize
+    POST /v1/enhance            PromptEnhancer.quick_enhance
+    POST /v1/analyze-response   ResponseAnalyzer.analyze_response
+    POST /v1/batch              many prompts through one operation, streamed as
+                                newline-delimited JSON in completion order
+    POST /v1/jobs               queue a background job (run by job_worker.py)
+    GET  /v1/jobs/{id}          job status and progress
+    GET  /v1/jobs/{id}/results  its sessions and versions (?offset=&limit=)
+    GET  /v1/usage              LLM tokens and cost (?group_by=stage,model&since=
+                                &session_id=&request_id=&user_id=)
+
+Any request with an "X-Profile: 1" header or ?profile=1 is profiled
+(core.profiling); the X-Profile-Id response header names its files.
+
+Usage:
+    python api.py [--host 127.0.0.1] [--port 8000] [--workers 4]
+    uvicorn api:app --workers 4
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Annotated, List, Literal, Optional
+
+from pydantic import BaseModel, Field, ValidationError
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.middleware import Middleware
+from starlette.routing import Route
+
+from core import jobs
+from core.config import Config
+from core.database import DatabaseManager
+from core.deadline import Deadline
+from core.metrics import CONTENT_TYPE, observe_rate_limit_wait, render
+from core.profiling import request_profiles, wants_profile
+from core.prompt_agent import PromptResult, get_prompt_agent
+from core.prompt_engine import get_prompt_engine
+from core.prompt_enhancer import get_enhancer
+from core.response_analyzer import ResponseAnalyzer
+from core.serialize import optimize_result_json, to_json
+from core.usage import usage_scope
+
+NDJSON = "application/x-ndjson"
+
+PromptText = Field(min_length=1, max_length=Config.API_MAX_PROMPT_CHARS)
+DeadlineSeconds = Field(default=None, gt=0, le=300)
+
+
+# ==================== REQUEST MODELS ====================
+
+class ProcessRequest(BaseModel):
+    user_input: str = PromptText
+    file_content: Optional[str] = None
+    file_type: Optional[str] = Field(default=None, max_length=50)
+    deadline_seconds: Optional[float] = DeadlineSeconds
+    stream: bool = False
+
+
+class OptimizeRequest(BaseModel):
+    prompt: str = PromptText
+    deadline_seconds: Optional[float] = DeadlineSeconds
+
+
+class AnalyzeResponseRequest(BaseModel):
+    response: str = Field(min_length=1, max_length=10 * Config.API_MAX_PROMPT_CHARS)
+    prompt: str = PromptText
+
+
+class JobRequest(BaseModel):
+    kind: Literal["optimize", "agent"] = "optimize"
+    prompts: List[Annotated[str, PromptText]] = Field(min_length=1)
+    priority: int = 0
+    deadline_seconds: Optional[float] = DeadlineSeconds
+
+
+class BatchRequest(BaseModel):
+    operation: Literal["process", "optimize", "enhance"]
+    prompts: List[Annotated[str, PromptText]] = Field(min_length=1, max_length=Config.API_MAX_BATCH)
+    deadline_seconds: Optional[float] = DeadlineSeconds
+
+
+# ==================== SERIALIZATION ====================
+
+def ndjson_line(data: dict) -> bytes:
+    return (json.dumps(data) + "\n").encode()
+
+
+# ==================== PIPELINE CALLS ====================
+
+def _deadline(seconds: Optional[float]) -> Optional[Deadline]:
+    return Deadline(seconds) if seconds else None
+
+
+async def run_process(user_input: str, file_content: Optional[str] = None, file_type: Optional[str] = None,
+                      deadline_seconds: Optional[float] = None, defer_evaluation: bool = False) -> PromptResult:
+    return await get_prompt_agent().process_input(
+        user_input, file_content, file_type,
+        deadline=_deadline(deadline_seconds), defer_evaluation=defer_evaluation
+    )
+
+
+async def run_optimize(prompt: str, deadline_seconds: Optional[float] = None) -> dict:
+    result = await asyncio.to_thread(get_prompt_engine().smart_optimize, prompt, _deadline(deadline_seconds))
+    return optimize_result_json(result)
+
+
+async def run_enhance(prompt: str, deadline_seconds: Optional[float] = None):
+    return await asyncio.to_thread(get_enhancer().quick_enhance, prompt, _deadline(deadline_seconds))
+
+
+BATCH_OPERATIONS = {
+    "process": lambda prompt, seconds: run_process(prompt, deadline_seconds=seconds),
+    "optimize": run_optimize,
+    "enhance": run_enhance,
+}
+
+
+# ==================== HANDLERS ====================
+
+async def parse(request: Request, model):
+    """(validated body, None) or (None, error response)"""
+    try:
+        body = await request.json()
+    except ValueError:
+        return None, JSONResponse({"detail": "Request body must be JSON"}, status_code=400)
+    try:
+        return model.model_validate(body), None
+    except ValidationError as e:
+        return None, JSONResponse({"detail": e.errors(include_url=False, include_context=False)}, status_code=422)
+
+
+async def health(request: Request):
+    return JSONResponse({"status": "ok"})
+
+
+async def metrics(request: Request):
+    return PlainTextResponse(render(), media_type=CONTENT_TYPE)
+
+
+async def process(request: Request):
+    body, error = await parse(request, ProcessRequest)
+    if error:
+        return error
+    result = await run_process(body.user_input, body.file_content, body.file_type,
+                               body.deadline_seconds, defer_evaluation=body.stream)
+    if not body.stream:
+        return JSONResponse(to_json(result))
+    return StreamingResponse(stream_process(result), media_type=NDJSON)
+
+
+async def stream_process(result: PromptResult):
+    """The prompt now, then its quality score once the background evaluation finishes"""
+    yield ndjson_line({"event": "result", **to_json(result)})
+    if result.evaluation is None:
+        return
+    try:
+        quality_score, suggestions = await asyncio.wrap_future(result.evaluation)
+    except Exception as e:
+        yield ndjson_line({"event": "evaluation", "error": str(e)})
+    else:
+        yield ndjson_line({"event": "evaluation", "quality_score": quality_score, "suggestions": suggestions})
+
+
+async def optimize(request: Request):
+    body, error = await parse(request, OptimizeRequest)
+    if error:
+        return error
+    return JSONResponse(to_json(await run_optimize(body.prompt, body.deadline_seconds)))
+
+
+async def enhance(request: Request):
+    body, error = await parse(request, OptimizeRequest)
+    if error:
+        return error
+    return JSONResponse(to_json(await run_enhance(body.prompt, body.deadline_seconds)))
+
+
+async def analyze_response(request: Request):
+    body, error = await parse(request, AnalyzeResponseRequest)
+    if error:
+        return error
+    return JSONResponse(to_json(ResponseAnalyzer.analyze_response(body.response, body.prompt)))
+
+
+async def batch(request: Request):
+    body, error = await parse(request, BatchRequest)
+    if error:
+        return error
+    return StreamingResponse(stream_batch(body), media_type=NDJSON)
+
+
+async def stream_batch(body: BatchRequest):
+    """One line per prompt as it finishes, API_BATCH_CONCURRENCY at a time"""
+    operation = BATCH_OPERATIONS[body.operation]
+    semaphore = asyncio.Semaphore(Config.API_BATCH_CONCURRENCY)
+
+    async def run(index: int, prompt: str) -> dict:
+        queued = time.perf_counter()
+        async with semaphore:
+            observe_rate_limit_wait('api_batch', time.perf_counter() - queued)
+            try:
+                return {"index": index, "result": to_json(await operation(prompt, body.deadline_seconds))}
+            except Exception as e:
+                return {"index": index, "error": str(e)}
+
+    tasks = [asyncio.create_task(run(i, prompt)) for i, prompt in enumerate(body.prompts)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield ndjson_line(await finished)
+    finally:
+        for t in tasks:  # Client went away: stop what hasn't started
+            t.cancel()
+
+
+async def create_job(request: Request):
+    body, error = await parse(request, JobRequest)
+    if error:
+        return error
+    options = {'deadline_seconds': body.deadline_seconds} if body.deadline_seconds else {}
+    job_id = await asyncio.to_thread(jobs.enqueue, body.kind, body.prompts, options, None, body.priority)
+    return JSONResponse({"id": job_id}, status_code=202)
+
+
+async def get_job(request: Request):
+    job = await asyncio.to_thread(DatabaseManager.get_job, request.path_params['job_id'])
+    if job is None:
+        return JSONResponse({"detail": "Job not found"}, status_code=404)
+    return JSONResponse(to_json(job._asdict()))
+
+
+async def get_job_results(request: Request):
+    try:
+        offset = int(request.query_params.get('offset', 0))
+        limit = int(request.query_params.get('limit', 100))
+    except ValueError:
+        return JSONResponse({"detail": "offset and limit must be integers"}, status_code=422)
+    results = await asyncio.to_thread(DatabaseManager.get_job_results, request.path_params['job_id'], offset, limit)
+    return JSONResponse([item._asdict() for item in results])
+
+
+async def usage(request: Request):
+    params = request.query_params
+    try:
+        since = datetime.fromisoformat(params['since']) if 'since' in params else None
+        user_id = int(params['user_id']) if 'user_id' in params else None
+        group_by = tuple(g for g in params.get('group_by', 'stage,model').split(',') if g)
+        rows = await asyncio.to_thread(
+            DatabaseManager.get_llm_usage, group_by, since=since, session_id=params.get('session_id'),
+            request_id=params.get('request_id'), user_id=user_id,
+        )
+    except ValueError as e:
+        return JSONResponse({"detail": str(e)}, status_code=422)
+    return JSONResponse(rows)
+
+
+# ==================== APP ====================
+
+class ProfileRequests:
+    """ASGI middleware: profile the pipeline calls of requests that ask for it"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        request = Request(scope)
+        if not wants_profile(request.headers, request.query_params):
+            return await self.app(scope, receive, send)
+
+        # One request id for its pipeline calls: the profile files and llm_usage rows carry it
+        with usage_scope() as usage, request_profiles():
+            async def send_with_id(message):
+                if message['type'] == 'http.response.start':
+                    message['headers'] = list(message.get('headers', [])) + [
+                        (b'x-profile-id', usage.request_id.encode())
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_id)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    # Blocking stages (asyncio.to_thread) share one pool sized for LLM latency
+    executor = ThreadPoolExecutor(Config.API_THREADS, thread_name_prefix="api")
+    asyncio.get_running_loop().set_default_executor(executor)
+    # Build the shared clients before the first request instead of racing to
+    get_prompt_agent()
+    get_prompt_engine()
+    get_enhancer()
+    yield
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = Starlette(
+    routes=[
+        Route("/health", health),
+        Route("/metrics", metrics),
+        Route("/v1/process", process, methods=["POST"]),
+        Route("/v1/optimize", optimize, methods=["POST"]),
+        Route("/v1/enhance", enhance, methods=["POST"]),
+        Route("/v1/analyze-response", analyze_response, methods=["POST"]),
+        Route("/v1/batch", batch, methods=["POST"]),
+        Route("/v1/jobs", create_job, methods=["POST"]),
+        Route("/v1/jobs/{job_id:int}", get_job),
+        Route("/v1/jobs/{job_id:int}/results", get_job_results),
+        Route("/v1/usage", usage),
+    ],
+    middleware=[Middleware(ProfileRequests)],
+    lifespan=lifespan,
+)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the prompt optimizer over HTTP")
+    parser.add_argument("--host", default=Config.API_HOST)
+    parser.add_argument("--port", type=int, default=Config.API_PORT)
+    parser.add_argument("--workers", type=int, default=Config.API_WORKERS)
+    args = parser.parse_args()
+    # Worker processes each hold their own clients and in-memory caches
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Optimize a prompt library from the command line
+
+Reads prompts from a file or stdin, as JSONL (one string, or an object with
+"prompt" and an optional "id", per line) or as text separated by `---`
+(the Batch Optimize format). Results are written to stdout as JSONL in
+completion order, each tagged with the prompt's input offset; the summary
+(throughput, latency percentiles, fallbacks) goes to stderr.
+
+Memory stays constant: prompts are read as they are needed, at most
+--concurrency are in flight, and deduplication remembers the last
+--dedup-window prompts. After an interruption, rerun with the summary's
+resume_offset as --resume-from: every prompt before it has been written.
+
+Usage:
+    python batch_optimize.py prompts.jsonl > results.jsonl
+    cat prompts.txt | python batch_optimize.py --format text --mode agent --concurrency 8
+    python batch_optimize.py prompts.jsonl --resume-from 12000 >> results.jsonl
+"""
+import argparse
+import heapq
+import json
+import sys
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from core.deadline import Deadline
+from core.hedging import LatencyHistogram
+from core.singleflight import fingerprint
+
+# Shorter prompts are skipped, as in Batch Optimize
+MIN_PROMPT_CHARS = 6
+
+# (offset, id, prompt); offsets count every record read, skipped ones included
+Record = Tuple[int, Optional[str], str]
+
+
+# ==================== INPUT ====================
+
+def read_jsonl(lines: Iterable[str]) -> Iterator[Tuple[Optional[str], str]]:
+    """(id, prompt) per non-blank line; unparseable lines yield an empty prompt"""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield None, ""
+            continue
+        if isinstance(item, dict):
+            item_id = item.get("id")
+            yield (str(item_id) if item_id is not None else None), str(item.get("prompt") or "")
+        else:
+            yield None, str(item)
+
+
+def read_text(lines: Iterable[str]) -> Iterator[Tuple[Optional[str], str]]:
+    """(None, prompt) per `---`-separated block, without holding more than one block"""
+    block: List[str] = []
+    for line in lines:
+        *complete, rest = line.replace('\r\n', '\n').split('---')
+        for part in complete:
+            block.append(part)
+            yield None, "".join(block)
+            block = []
+        block.append(rest)
+    yield None, "".join(block)
+
+
+def read_records(stream: TextIO, fmt: str = "auto") -> Iterator[Record]:
+    """Records from a JSONL or `---`-separated stream ("auto": JSONL if the first line parses)"""
+    lines = iter(stream)
+    if fmt == "auto":
+        first = next(lines, "")
+        fmt = "jsonl" if _is_json(first) else "text"
+        lines = _chain(first, lines)
+    reader = read_jsonl if fmt == "jsonl" else read_text
+    for offset, (item_id, prompt) in enumerate(reader(lines)):
+        yield offset, item_id, prompt.strip()
+
+
+def _is_json(line: str) -> bool:
+    """Whether a line is a JSONL record (a bare number or word is text)"""
+    try:
+        return isinstance(json.loads(line), (dict, str))
+    except ValueError:
+        return False
+
+
+def _chain(first: str, rest: Iterator[str]) -> Iterator[str]:
+    yield first
+    yield from rest
+
+
+# ==================== PROCESSORS ====================
+
+def optimize_processor(deadline_seconds: Optional[float] = None) -> Callable[[str], Tuple[dict, List[str]]]:
+    """PromptEngine.smart_optimize as (JSON result, degraded stages)"""
+    from core.prompt_engine import get_prompt_engine
+    from core.serialize import optimize_result_json
+
+    engine = get_prompt_engine()
+
+    def process(prompt: str):
+        deadline = Deadline(deadline_seconds) if deadline_seconds else None
+        result = engine.smart_optimize(prompt, deadline=deadline)
+        return optimize_result_json(result), result.get('degraded', [])
+    return process
+
+
+def agent_processor(deadline_seconds: Optional[float] = None) -> Callable[[str], Tuple[dict, List[str]]]:
+    """PromptAgent.process_input_sync (scored, not deferred) as (JSON result, degraded stages)"""
+    from core.prompt_agent import get_prompt_agent
+    from core.serialize import to_json
+
+    agent = get_prompt_agent()
+
+    def process(prompt: str):
+        deadline = Deadline(deadline_seconds) if deadline_seconds else None
+        result = agent.process_input_sync(prompt, deadline=deadline, defer_evaluation=False)
+        return to_json(result), result.metadata.get('degraded', [])
+    return process
+
+
+PROCESSORS = {'optimize': optimize_processor, 'agent': agent_processor}
+
+
+# ==================== BATCH ====================
+
+class BatchRun:
+    """
+    Runs records through a processor and writes JSONL as results complete
+
+    Output lines carry "offset" (and "id" if given) plus "result", "error",
+    or "duplicate_of" (offset of the identical prompt processed earlier).
+    """
+
+    def __init__(self, process: Callable[[str], Tuple[dict, List[str]]], out: TextIO,
+                 concurrency: int = 4, dedup_window: int = 100000):
+        self.process = process
+        self.out = out
+        self.concurrency = max(1, concurrency)
+        self.dedup_window = dedup_window
+        self.latency = LatencyHistogram()
+        self.counts: Counter = Counter()
+        self.fallbacks: Counter = Counter()
+        self.resume_offset = 0
+        self._done: List[int] = []  # Finished offsets above resume_offset (a heap)
+        self._seen: "OrderedDict[str, int]" = OrderedDict()
+        self._started = time.perf_counter()
+
+    def run(self, records: Iterable[Record], resume_from: int = 0) -> Dict:
+        """Process every record at or after `resume_from`; returns the summary"""
+        self.resume_offset = resume_from
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix="batch") as executor:
+            pending = {}
+            try:
+                for offset, item_id, prompt in records:
+                    if offset < resume_from:
+                        continue
+                    if not self._admit(offset, item_id, prompt):
+                        continue
+                    pending[executor.submit(self._timed, prompt)] = (offset, item_id)
+                    if len(pending) >= self.concurrency:
+                        self._collect(pending)
+                self._collect(pending, drain=True)
+            except KeyboardInterrupt:
+                # Drop what hasn't started; write what is running (the pool waits for it anyway)
+                for future in list(pending):
+                    if future.cancel():
+                        del pending[future]
+                self._collect(pending, drain=True)
+                self.counts['interrupted'] += 1
+        return self.summary()
+
+    def _admit(self, offset: int, item_id: Optional[str], prompt: str) -> bool:
+        """Whether a record needs processing (otherwise it is finished here)"""
+        if len(prompt) < MIN_PROMPT_CHARS:  # Also blank and unparseable lines
+            self.counts['skipped'] += 1
+            self._finish(offset)
+            return False
+        key = fingerprint(" ".join(prompt.lower().split()))
+        first = self._seen.get(key)
+        if first is not None:
+            self._seen.move_to_end(key)
+            self.counts['duplicates'] += 1
+            self._write({"offset": offset, "id": item_id, "duplicate_of": first})
+            self._finish(offset)
+            return False
+        self._seen[key] = offset
+        if len(self._seen) > self.dedup_window:
+            self._seen.popitem(last=False)
+        return True
+
+    def _timed(self, prompt: str):
+        started = time.perf_counter()
+        result, degraded = self.process(prompt)
+        return result, degraded, time.perf_counter() - started
+
+    def _collect(self, pending: Dict, drain: bool = False):
+        """Write results as futures finish: at least one, or (drain) all of them"""
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                offset, item_id = pending.pop(future)
+                line = {"offset": offset, "id": item_id}
+                try:
+                    result, degraded, seconds = future.result()
+                except Exception as e:
+                    self.counts['failed'] += 1
+                    line["error"] = f"{type(e).__name__}: {e}"
+                else:
+                    self.counts['processed'] += 1
+                    self.latency.record(seconds)
+                    if degraded:
+                        self.counts['fallbacks'] += 1
+                        self.fallbacks.update(degraded)
+                    line.update(latency_s=round(seconds, 3), result=result)
+                self._write(line)
+                self._finish(offset)
+            if not drain:
+                return
+
+    def _write(self, line: Dict):
+        if line.get("id") is None:
+            line.pop("id", None)
+        self.out.write(json.dumps(line) + "\n")
+        self.out.flush()
+
+    def _finish(self, offset: int):
+        """Advance resume_offset past every finished offset below the lowest unfinished one"""
+        heapq.heappush(self._done, offset)
+        while self._done and self._done[0] <= self.resume_offset:
+            if heapq.heappop(self._done) == self.resume_offset:
+                self.resume_offset += 1
+
+    def summary(self) -> Dict:
+        elapsed = time.perf_counter() - self._started
+        handled = self.counts['processed'] + self.counts['failed']
+        return {
+            'processed': self.counts['processed'],
+            'failed': self.counts['failed'],
+            'duplicates': self.counts['duplicates'],
+            'skipped': self.counts['skipped'],
+            'fallbacks': self.counts['fallbacks'],
+            'fallback_stages': dict(self.fallbacks),
+            'elapsed_s': round(elapsed, 2),
+            'throughput_per_s': round(handled / elapsed, 2) if elapsed else None,
+            'latency_s': self.latency.summary(),
+            'resume_offset': self.resume_offset,
+            'interrupted': bool(self.counts['interrupted']),
+        }
+
+
+def format_summary(summary: Dict) -> str:
+    latency = summary['latency_s']
+    ms = lambda s: f"{s * 1000:.0f} ms" if s is not None else "-"
+    stages = ", ".join(f"{stage} {n}" for stage, n in sorted(summary['fallback_stages'].items()))
+    return "\n".join([
+        f"Processed {summary['processed']} ({summary['failed']} failed, {summary['duplicates']} duplicates, "
+        f"{summary['skipped']} skipped) in {summary['elapsed_s']} s: {summary['throughput_per_s']}/s",
+        f"Latency p50 {ms(latency['p50'])}, p95 {ms(latency['p95'])}, p99 {ms(latency['p99'])}",
+        f"Fallbacks: {summary['fallbacks']}" + (f" ({stages})" if stages else ""),
+        f"{'Interrupted; resume' if summary['interrupted'] else 'Resume'} with --resume-from {summary['resume_offset']}",
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimize prompts from JSONL or ---separated text, streaming JSONL results")
+    parser.add_argument("input", nargs="?", default="-", help="input file (default: stdin)")
+    parser.add_argument("--format", choices=["auto", "jsonl", "text"], default="auto")
+    parser.add_argument("--mode", choices=sorted(PROCESSORS), default="optimize",
+                        help="optimize: PromptEngine.smart_optimize; agent: PromptAgent")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--resume-from", type=int, default=0, help="skip records before this offset")
+    parser.add_argument("--dedup-window", type=int, default=100000,
+                        help="how many recent prompts duplicates are detected against")
+    parser.add_argument("--deadline", type=float, default=None, help="seconds per prompt (default: REQUEST_DEADLINE_SECONDS)")
+    parser.add_argument("--summary-json", action="store_true", help="print the summary to stderr as JSON")
+    args = parser.parse_args()
+
+    process = PROCESSORS[args.mode](args.deadline)
+    run = BatchRun(process, sys.stdout, concurrency=args.concurrency, dedup_window=args.dedup_window)
+    stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    try:
+        summary = run.run(read_records(stream, args.format), resume_from=args.resume_from)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    print(json.dumps(summary) if args.summary_json else format_summary(summary), file=sys.stderr)
+    return 130 if summary['interrupted'] else 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
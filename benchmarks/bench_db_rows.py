@@ -0,0 +1,101 @@
+"""
+Benchmark: ORM instances vs. read-only row tuples for template listing
+
+Fills a scratch SQLite database with N templates and compares the old
+ORM + expunge read path against DatabaseManager.get_templates(), which
+selects columns straight into TemplateRow tuples.
+
+Usage:
+    python benchmarks/bench_db_rows.py [--rows 100000] [--repeat 3]
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+
+from core import database
+from core.database import Base, DatabaseManager, PromptTemplate
+
+
+def orm_get_templates():
+    """The previous read path: full ORM instances, expunged one by one"""
+    with DatabaseManager.get_session() as session:
+        templates = session.query(PromptTemplate)\
+            .filter_by(is_public=True)\
+            .order_by(PromptTemplate.uses_count.desc())\
+            .all()
+        for template in templates:
+            session.expunge(template)
+        return templates
+
+
+def measure(label, fn, repeat):
+    """Report best wall time and peak traced memory for fn"""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(result)
+    del result
+
+    print(f"{label:<12} rows={count:<8} best={min(timings) * 1000:9.1f} ms   peak={peak / 1024 / 1024:8.1f} MiB")
+    return min(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="Number of templates to insert")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed repetitions per read path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bench_engine)
+        database.SessionLocal.configure(bind=bench_engine)
+
+        print(f"Inserting {args.rows:,} templates...")
+        rows = [
+            {
+                "name": f"Template {i}",
+                "description": f"Benchmark template number {i}",
+                "role": ("phd", "masters", "data_scientist", "python_dev")[i % 4],
+                "task_type": ("lit_review", "debugging", "eda", "summary")[i % 4],
+                "field": "Benchmark",
+                "base_prompt": "Please help me with [TOPIC]. " * 10,
+                "tags": ["bench", f"group-{i % 10}"],
+                "is_public": True,
+                "uses_count": i % 997,
+                "rating": (i % 50) / 10,
+            }
+            for i in range(args.rows)
+        ]
+        with bench_engine.begin() as conn:
+            conn.execute(insert(PromptTemplate), rows)
+        del rows
+
+        orm_time, orm_peak = measure("orm", orm_get_templates, args.repeat)
+        row_time, row_peak = measure("rows", DatabaseManager.get_templates, args.repeat)
+
+        print(f"\nrows vs orm: {orm_time / row_time:.2f}x faster, {orm_peak / row_peak:.2f}x less peak memory")
+        bench_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark: FTS5 search over templates and prompt history
+
+Fills a scratch SQLite database with synthetic templates and prompt sessions
+(the FTS indexes are maintained by the same triggers the app uses), then
+compares search_templates / search_history latency against a LIKE scan.
+
+Usage:
+    python benchmarks/bench_fts.py [--rows 1000000] [--queries 50]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, text
+
+from core import database
+from core.database import Base, DatabaseManager, PromptSession, PromptTemplate
+
+TOPICS = [
+    "literature", "review", "regression", "pandas", "dataframe", "neural", "network",
+    "debugging", "exception", "refactoring", "hypothesis", "methodology", "thesis",
+    "forecasting", "anomaly", "deployment", "latency", "docker", "kubernetes", "sql",
+    "visualization", "clustering", "survey", "citation", "grant", "tutorial", "api",
+]
+FILLER = [f"w{i}" for i in range(5000)]
+
+# Mix of common topic words (~10% of rows each), rare words and prefixes
+QUERIES = [
+    "literature review", "pandas dataframe", "neural network deploy", "debugging exception",
+    "anomaly forecasting", "sql", "thesis methodology", "kubernetes latency", "citat",
+    "w1234", "w42 w4242", "regression w777", "w31",
+]
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    """Random text with a few topic words mixed into filler vocabulary"""
+    out = [rng.choice(FILLER) for _ in range(words)]
+    for _ in range(3):
+        out[rng.randrange(words)] = rng.choice(TOPICS)
+    return " ".join(out)
+
+
+def fill(bench_engine, rows: int, chunk: int = 20_000):
+    """Insert synthetic templates and sessions through the sync triggers"""
+    rng = random.Random(42)
+    start_date = datetime.now() - timedelta(days=365)
+    step = timedelta(days=365) / rows
+
+    start = time.perf_counter()
+    with bench_engine.begin() as conn:
+        for offset in range(0, rows, chunk):
+            size = min(chunk, rows - offset)
+            conn.execute(insert(PromptTemplate), [
+                {
+                    "name": sentence(rng, 4),
+                    "description": sentence(rng, 12),
+                    "base_prompt": sentence(rng, 60),
+                    "tags": [rng.choice(TOPICS), rng.choice(TOPICS)],
+                    "is_public": True,
+                }
+                for _ in range(size)
+            ])
+            conn.execute(insert(PromptSession), [
+                {
+                    "role": "phd",
+                    "task_type": "summary",
+                    "raw_prompt": sentence(rng, 40),
+                    "created_at": start_date + step * (offset + i),
+                }
+                for i in range(size)
+            ])
+    return time.perf_counter() - start
+
+
+def timed(fn, queries):
+    """Latency of fn over the query list, in milliseconds"""
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "max": latencies[-1],
+    }
+
+
+def like_scan(bench_engine, table, column):
+    """Baseline without an index: every match must be found before it can be ranked"""
+    def run(q):
+        with bench_engine.connect() as conn:
+            clauses = " AND ".join(f"{column} LIKE :p{i}" for i, _ in enumerate(q.split()))
+            params = {f"p{i}": f"%{w}%" for i, w in enumerate(q.split())}
+            return conn.execute(text(f"SELECT id, {column} FROM {table} WHERE {clauses}"), params).fetchall()
+    return run
+
+
+def report(label, stats):
+    print(f"  {label:<28} p50={stats['p50']:8.2f} ms   p95={stats['p95']:8.2f} ms   max={stats['max']:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000, help="Templates and sessions to insert (each)")
+    parser.add_argument("--queries", type=int, default=50, help="Queries per measurement")
+    args = parser.parse_args()
+
+    queries = [QUERIES[i % len(QUERIES)] for i in range(args.queries)]
+    last_month = datetime.now() - timedelta(days=30)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bench_engine)
+        with bench_engine.begin() as conn:
+            database._ensure_fts(conn)
+        database.SessionLocal.configure(bind=bench_engine)
+
+        print(f"Inserting {args.rows:,} templates and {args.rows:,} sessions...")
+        elapsed = fill(bench_engine, args.rows)
+        print(f"  insert with FTS triggers: {elapsed:.1f} s ({2 * args.rows / elapsed:,.0f} rows/s)")
+
+        print("\nTemplates:")
+        report("search_templates", timed(lambda q: DatabaseManager.search_templates(q), queries))
+        report("LIKE scan (base_prompt)", timed(like_scan(bench_engine, "prompt_templates", "base_prompt"), queries))
+
+        print("\nHistory:")
+        report("search_history", timed(lambda q: DatabaseManager.search_history(q), queries))
+        report("search_history (last month)", timed(lambda q: DatabaseManager.search_history(q, since=last_month), queries))
+        report("LIKE scan (raw_prompt)", timed(like_scan(bench_engine, "prompt_sessions", "raw_prompt"), queries))
+
+        bench_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: cost of recording metrics, alone and from contending threads
+
+Times Counter.inc() and Histogram.observe() on one labelled series and on
+one series per thread, with 1 to --threads threads recording at once, then
+a @traced no-op with metrics and tracing off vs. metrics on (the stage
+timer every pipeline stage pays).
+
+Usage:
+    python benchmarks/bench_metrics.py [--calls 200000] [--threads 8]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import Config
+from core.metrics import Counter, Histogram
+from core.tracing import traced
+
+
+@traced("bench.noop")
+def traced_noop():
+    pass
+
+
+def ns_per_call(threads: int, calls: int, record) -> float:
+    """Nanoseconds per record(i) call, `calls` split over `threads` threads"""
+    per_thread = calls // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def work(i: int):
+        barrier.wait()
+        for _ in range(per_thread):
+            record(i)
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    return (time.perf_counter() - start) * 1e9 / (per_thread * threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    counter = Counter("bench_total", "Bench", ("series",))
+    histogram = Histogram("bench_seconds", "Bench", ("series",))
+    cases = [
+        ("counter, shared series", lambda i: counter.labels("shared").inc()),
+        ("counter, series per thread", lambda i: counter.labels(str(i)).inc()),
+        ("histogram, shared series", lambda i: histogram.labels("shared").observe(0.02)),
+    ]
+    thread_counts = sorted({1, 2, 4, args.threads})
+    print(f"{'':<28}" + "".join(f"{f'{n} thr':>10}" for n in thread_counts) + "   (ns per call)")
+    for name, record in cases:
+        print(f"{name:<28}" + "".join(f"{ns_per_call(n, args.calls, record):>10.0f}" for n in thread_counts))
+
+    original = Config.METRICS_ENABLED, Config.TRACING_ENABLED
+    Config.TRACING_ENABLED = False
+    try:
+        for enabled in (False, True):
+            Config.METRICS_ENABLED = enabled
+            ns = ns_per_call(1, args.calls, lambda i: traced_noop())
+            print(f"{'@traced, metrics ' + ('on' if enabled else 'off'):<28}{ns:>10.0f}")
+    finally:
+        Config.METRICS_ENABLED, Config.TRACING_ENABLED = original
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Benchmark: near-duplicate cache hit rate vs. false-hit rate
+
+Builds a synthetic corpus of prompts from templates with slot fillers and
+caches one result per prompt, then looks up:
+
+  format     a cached prompt with changed case, whitespace or punctuation  -> should hit
+  edit       a cached prompt with a typo or an added filler word           -> should hit
+  swap       a cached prompt with one single-word slot swapped
+             ("python" -> "rust"): one word edit, but a different question -> must miss
+  different  new prompts whose closest cached prompt (same template)
+             differs in two or more slots                                   -> must miss
+
+"hit rate" counts returns of the source prompt's result; "false hits" are
+results served for a different question (any result for a swap or
+different query).
+
+Usage:
+    python benchmarks/bench_near_duplicate.py [--prompts 2000] [--thresholds 0.8 0.85 0.89 0.92]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.near_duplicate import NearDuplicateCache, normalize
+
+TEMPLATES = [
+    "write a {adj} literature review on {topic} for my {level} thesis focusing on {aspect}",
+    "explain how {topic} works to a {level} student with examples in {lang}",
+    "debug this {lang} function that {verb} {object} and raises an error when the input is empty",
+    "help me design the methodology for a study on {topic} using {method} and {aspect}",
+    "refactor my {lang} code that {verb} {object} so it is easier to test and faster",
+    "summarize recent papers about {topic} and list open questions about {aspect}",
+    "build a {method} model in {lang} to predict {object} from {topic} data",
+]
+WORDS = {
+    'adj': ["concise", "critical", "systematic", "short", "detailed", "comparative", "scoping", "narrative",
+            "rigorous", "structured", "balanced", "brief"],
+    'topic': ["climate policy", "sleep research", "graph neural networks", "supply chains", "protein folding",
+              "urban mobility", "language acquisition", "microfinance", "battery chemistry", "misinformation",
+              "coral reefs", "remote work", "vaccine uptake", "soil carbon", "quantum error correction",
+              "housing prices", "music cognition", "wildfire risk", "gut microbiome", "election forecasting"],
+    'level': ["undergraduate", "masters", "phd", "beginner", "postdoc", "intermediate", "advanced", "junior"],
+    'aspect': ["ethics", "sampling bias", "reproducibility", "cost", "scalability", "measurement error",
+               "privacy", "fairness", "validity", "interpretability", "latency", "generalization"],
+    'lang': ["python", "rust", "java", "typescript", "go", "julia", "kotlin", "scala", "haskell", "ruby",
+             "swift", "elixir"],
+    'verb': ["parses", "sorts", "merges", "validates", "downloads", "caches", "compresses", "encrypts",
+             "deduplicates", "streams", "renders", "schedules"],
+    'object': ["csv files", "user records", "sensor readings", "invoices", "log lines", "images", "emails",
+               "transactions", "audio clips", "geojson shapes", "tweets", "orders"],
+    'method': ["regression", "random forest", "survey", "interview", "transformer", "bayesian", "clustering",
+               "ethnography", "simulation", "boosting", "experiment", "autoencoder"],
+}
+FILLERS = ["please", "thanks", "quickly", "hey", "again"]
+
+
+def make_prompt(rng: random.Random):
+    template = rng.choice(TEMPLATES)
+    slots = {name: rng.choice(words) for name, words in WORDS.items() if "{" + name + "}" in template}
+    return template, slots
+
+
+def render(template: str, slots: dict) -> str:
+    return template.format(**slots)
+
+
+def format_edit(rng: random.Random, prompt: str) -> str:
+    edit = rng.randrange(3)
+    if edit == 0:
+        return prompt.upper()
+    if edit == 1:
+        return "  " + "   ".join(prompt.split()) + " \n"
+    return prompt[0].upper() + prompt[1:] + rng.choice(["?", ".", "!!", " :)"])
+
+
+def word_edit(rng: random.Random, prompt: str) -> str:
+    words = prompt.split()
+    if rng.random() < 0.5:
+        i = rng.choice([i for i, w in enumerate(words) if len(w) > 3])
+        j = rng.randrange(len(words[i]) - 1)
+        w = words[i]
+        words[i] = w[:j] + w[j + 1] + w[j] + w[j + 2:]  # Swap two letters
+    else:
+        words.insert(rng.choice([0, len(words)]), rng.choice(FILLERS))
+    return " ".join(words)
+
+
+def slot_swap(rng: random.Random, template: str, slots: dict):
+    names = [n for n in slots if " " not in slots[n]]
+    if not names:
+        return None
+    name = rng.choice(names)
+    options = [w for w in WORDS[name] if w != slots[name] and " " not in w]
+    return dict(slots, **{name: rng.choice(options)}) if options else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=int, default=2000, help="Cached prompts")
+    parser.add_argument("--queries", type=int, default=2000, help="Queries per kind")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.8, 0.85, 0.89, 0.92])
+    parser.add_argument("--max-word-edits", type=int, nargs="+", default=[0, 1, 2])
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    cached = {}
+    while len(cached) < args.prompts:
+        template, slots = make_prompt(rng)
+        cached[normalize(render(template, slots))] = (template, slots)
+    by_template = {}
+    for template, slots in cached.values():
+        by_template.setdefault(template, []).append(slots)
+
+    def slot_distance(template, slots):
+        return min(sum(s[n] != slots[n] for n in slots) for s in by_template.get(template, [{}]))
+
+    sources = list(cached.values())
+    queries = {'format': [], 'edit': [], 'swap': [], 'different': []}
+    for _ in range(args.queries):
+        template, slots = rng.choice(sources)
+        prompt = render(template, slots)
+        queries['format'].append((format_edit(rng, prompt), prompt))
+        queries['edit'].append((word_edit(rng, prompt), prompt))
+        swapped = slot_swap(rng, template, slots)
+        if swapped and normalize(render(template, swapped)) not in cached:
+            queries['swap'].append((render(template, swapped), prompt))
+    while len(queries['different']) < args.queries:
+        template, slots = make_prompt(rng)
+        if slot_distance(template, slots) >= 2:
+            queries['different'].append((render(template, slots), None))
+
+    print(f"{len(cached):,} cached prompts; {args.queries:,} queries per kind "
+          f"({len(queries['swap']):,} swaps)\n")
+    print(f"{'word edits':>10} {'threshold':>9} | {'hit rate: format':>16} {'edit':>6} | "
+          f"{'false hits: swap':>16} {'different':>9} {'all':>6} | {'lookup':>7}")
+    for max_edits in args.max_word_edits:
+        for threshold in args.thresholds:
+            cache = NearDuplicateCache(max_entries=len(cached), ttl_seconds=0, threshold=threshold,
+                                       min_tokens=0, max_word_edits=max_edits)
+            for template, slots in sources:
+                prompt = render(template, slots)
+                cache.put("bench", prompt, prompt)
+
+            hits, wrong = {}, {}
+            lookups, start = 0, time.perf_counter()
+            for kind, pairs in queries.items():
+                results = [(cache.get("bench", query), source) for query, source in pairs]
+                lookups += len(pairs)
+                hits[kind] = sum(r is not None and r == source for r, source in results) / len(pairs)
+                # A swapped slot is another question, so its source's result is wrong too
+                wrong[kind] = sum(r is not None and (r != source or kind == 'swap')
+                                  for r, source in results) / len(pairs)
+            per_lookup = (time.perf_counter() - start) / lookups * 1e6
+            swaps, different = len(queries['swap']), len(queries['different'])
+            false_hits = (wrong['swap'] * swaps + wrong['different'] * different) / (swaps + different)
+
+            print(f"{max_edits:>10} {threshold:>9.2f} | {hits['format']:>16.1%} {hits['edit']:>6.1%} | "
+                  f"{wrong['swap']:>16.1%} {wrong['different']:>9.2%} {false_hits:>6.1%} | {per_lookup:>4.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark: fleet-wide usage stats from rollups vs. summing every profile
+
+Fills a scratch SQLite database through DatabaseManager.apply_preference_deltas
+(the same write path preference flushes use) with synthetic sessions spread
+over a date range, then compares get_fleet_usage() against loading every
+stored preference counter and summing it in Python.
+
+Usage:
+    python benchmarks/bench_rollups.py [--events 1000000] [--sessions 20000] [--days 90]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select
+
+from core import database
+from core.database import Base, DatabaseManager, PreferenceCounter
+
+DOMAINS = ["academic", "ml-data-science", "python-development", "business", "creative"]
+ROLES = ["phd", "masters", "professor", "data_scientist", "software_dev", "analyst", "student"]
+TASKS = ["research", "writing", "analysis", "debugging", "coding", "summary", "teaching", "eda"]
+VERSIONS = ["basic", "critical", "tutor", "safe"]
+
+
+def fill(events: int, sessions: int, days: int):
+    """Replay events as per-session flushes of coalesced deltas"""
+    rng = random.Random(7)
+    start = datetime.utcnow() - timedelta(days=days)
+    flushes = max(1, events // 25)  # A flush carries ~25 events of one session
+
+    for i in range(flushes):
+        deltas = Counter()
+        for _ in range(events // flushes):
+            domain, role, task = rng.choice(DOMAINS), rng.choice(ROLES), rng.choice(TASKS)
+            deltas[('domain_usage', domain)] += 1
+            deltas[('role_usage', role)] += 1
+            deltas[('task_usage', task)] += 1
+            deltas[('combinations', f"{domain}|{role}|{task}")] += 1
+            deltas[('version_usage', rng.choice(VERSIONS))] += 1
+        at = start + timedelta(days=days) * (i / flushes)
+        DatabaseManager.apply_preference_deltas(f"session-{rng.randrange(sessions)}", dict(deltas), at=at)
+
+
+def naive_fleet_usage():
+    """Without rollups: load every profile's counters and sum them"""
+    totals = {}
+    with DatabaseManager.get_session() as session:
+        for kind, key, count in session.execute(
+            select(PreferenceCounter.kind, PreferenceCounter.key, PreferenceCounter.count)
+        ):
+            totals.setdefault(kind, Counter())[key] += count
+    return totals
+
+
+def timed(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000, help="Optimization events to replay")
+    parser.add_argument("--sessions", type=int, default=20_000, help="Distinct preference profiles")
+    parser.add_argument("--days", type=int, default=90, help="Days the events are spread over")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed repetitions per query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bench_engine)
+        database.SessionLocal.configure(bind=bench_engine)
+
+        print(f"Replaying {args.events:,} events from {args.sessions:,} sessions over {args.days} days...")
+        start = time.perf_counter()
+        fill(args.events, args.sessions, args.days)
+        print(f"  write path: {time.perf_counter() - start:.1f} s")
+
+        total = DatabaseManager.get_fleet_usage()['total_optimizations']
+        assert total == sum(naive_fleet_usage()['domain_usage'].values())
+
+        last_week = datetime.utcnow() - timedelta(days=7)
+        print(f"\nFleet stats over {total:,} events (median of {args.repeat}):")
+        print(f"  get_fleet_usage (all time, daily)   {timed(DatabaseManager.get_fleet_usage, args.repeat):8.2f} ms")
+        print(f"  get_fleet_usage (last 7 days, hourly) "
+              f"{timed(lambda: DatabaseManager.get_fleet_usage(since=last_week, granularity='hour'), args.repeat):6.2f} ms")
+        print(f"  sum of every profile's counters     {timed(naive_fleet_usage, args.repeat):8.2f} ms")
+
+        bench_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark: shared cache throughput with several processes hammering one file
+
+Each process runs a get-heavy mix over a common key space (a miss is
+followed by a set of a ~2 KB value, as a worker caching an LLM result would)
+against one SQLite file in WAL mode. Reports aggregate operations per second
+(over the slowest process's run), per-operation latency percentiles and the
+hit rate per process count, with the entry limit low enough that eviction
+runs throughout.
+
+Usage:
+    python benchmarks/bench_shared_cache.py [--processes 1 2 4 8] [--ops 20000] [--keys 5000]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.shared_cache import SharedCache
+
+VALUE = {'best_version': "x" * 2000, 'scores': list(range(20))}
+
+
+def hammer(args):
+    """One process: `ops` gets (sets after misses) over `keys` keys; returns its counts and latencies"""
+    path, ops, keys, max_entries, seed = args
+    cache = SharedCache(path, ttl=3600, max_entries=max_entries)
+    rng = random.Random(seed)
+    latencies, hits, sets = [], 0, 0
+    started = time.perf_counter()
+    for _ in range(ops):
+        key = int(keys * rng.random() ** 2)  # Popular prompts repeat
+        t = time.perf_counter()
+        if cache.get('bench', key) is not None:
+            hits += 1
+        else:
+            cache.set('bench', key, VALUE)
+            sets += 1
+        latencies.append(time.perf_counter() - t)
+    return ops, sets, hits, time.perf_counter() - started, latencies
+
+
+def run(processes, ops, keys, max_entries):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.db")
+        SharedCache(path)  # Create the schema before the race
+        with multiprocessing.get_context('spawn').Pool(processes) as pool:
+            results = pool.map(hammer, [(path, ops, keys, max_entries, seed) for seed in range(processes)])
+        entries = len(SharedCache(path, max_entries=max_entries))
+
+    latencies = sorted(seconds for *_, samples in results for seconds in samples)
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1e6
+    total_ops = sum(r[0] for r in results)
+    total_sets = sum(r[1] for r in results)
+    hit_rate = sum(r[2] for r in results) / total_ops
+    busiest = max(r[3] for r in results)
+    print(f"{processes:>9} {total_ops / busiest:>12,.0f} {percentile(50):>10.0f} {percentile(99):>10.0f} "
+          f"{percentile(99.9):>10.0f} {hit_rate:>8.1%} {total_sets:>8} {entries:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--ops", type=int, default=20000, help="Operations per process")
+    parser.add_argument("--keys", type=int, default=5000, help="Distinct keys")
+    parser.add_argument("--max-entries", type=int, default=2000, help="Entry limit (below --keys: eviction runs)")
+    args = parser.parse_args()
+
+    print(f"{args.ops} ops/process over {args.keys} keys, entry limit {args.max_entries}, ~2 KB values\n")
+    print(f"CPUs: {os.cpu_count()} (aggregate ops/s cannot grow past them)")
+    print(f"{'processes':>9} {'ops/s':>12} {'p50 (us)':>10} {'p99 (us)':>10} {'p99.9 (us)':>10} {'hits':>8} {'sets':>8} {'entries':>8}")
+    for processes in args.processes:
+        run(processes, args.ops, args.keys, args.max_entries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark: database startup cost, cold vs. warm
+
+Each measurement runs in a fresh interpreter against a scratch SQLite file:
+import core.database and serve the first get_templates() call. The first
+run creates, migrates and seeds the database; later runs should only read
+PRAGMA user_version before querying. Library imports (SQLAlchemy, the LLM
+clients pulled in by core/__init__) are loaded before the clock starts.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import sys, time
+sys.path.insert(0, {root!r})
+import core
+import sqlalchemy.orm, sqlalchemy.ext.declarative, sqlalchemy.dialects.sqlite
+from core.config import Config
+Config.DATABASE_URL = "sqlite:///" + {db!r}
+
+start = time.perf_counter()
+from core.database import DatabaseManager
+DatabaseManager.get_templates()
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def startup_ms(db_path: str) -> float:
+    """Milliseconds from importing core.database to the first listing"""
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD.format(root=ROOT, db=db_path)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="Warm starts to measure")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "startup.db")
+        cold = startup_ms(db_path)
+        warm = [startup_ms(db_path) for _ in range(args.runs)]
+
+    print(f"cold start (create + seed): {cold:8.1f} ms")
+    print(f"warm start, median of {args.runs}: {statistics.median(warm):8.1f} ms   (min {min(warm):.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
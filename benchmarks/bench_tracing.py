@@ -0,0 +1,73 @@
+"""
+Benchmark: cost of a span, tracing off vs. on
+
+Times a function that does nothing, called bare, through @traced, and
+inside `with span(...)`, with Config.TRACING_ENABLED off (the default) and
+on. Traced requests of ten nested spans each are exported to a scratch
+JSONL file, so the "on" numbers include writing them.
+
+Usage:
+    python benchmarks/bench_tracing.py [--calls 200000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import tracing
+from core.config import Config
+from core.tracing import span, traced
+
+SPANS_PER_TRACE = 10
+
+
+def noop():
+    pass
+
+
+traced_noop = traced("bench.noop")(noop)
+
+
+def with_span():
+    with span("bench.noop"):
+        pass
+
+
+def ns_per_call(fn, calls: int) -> float:
+    """Nanoseconds per fn() call: the calls are grouped in traces of SPANS_PER_TRACE"""
+    start = time.perf_counter()
+    for _ in range(calls // SPANS_PER_TRACE):
+        with span("bench.request"):
+            for _ in range(SPANS_PER_TRACE - 1):
+                fn()
+    return (time.perf_counter() - start) * 1e9 / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+
+    original = Config.TRACING_ENABLED, Config.TRACE_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.TRACE_PATH = os.path.join(tmp, "traces.jsonl")
+        try:
+            print(f"{'':<10} {'bare':>10} {'@traced':>10} {'span()':>10}   (ns per call)")
+            for enabled in (False, True):
+                Config.TRACING_ENABLED = enabled
+                tracing._tracer = None
+                row = [ns_per_call(fn, args.calls) for fn in (noop, traced_noop, with_span)]
+                print(f"{'on' if enabled else 'off':<10} " + " ".join(f"{ns:>10.0f}" for ns in row))
+            size = os.path.getsize(Config.TRACE_PATH) if os.path.exists(Config.TRACE_PATH) else 0
+            print(f"\nExported {size / 1e6:.1f} MB of spans")
+        finally:
+            Config.TRACING_ENABLED, Config.TRACE_PATH = original
+            tracing._tracer = None
+
+
+if __name__ == "__main__":
+    main()
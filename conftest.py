@@ -0,0 +1,21 @@
+"""
+Pytest setup: the runtime stores the tests fill (database, durable tasks,
+shared cache, traces, profiles) go to a scratch directory instead of data/
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="prompt-optimizer-tests-")
+atexit.register(shutil.rmtree, _scratch, ignore_errors=True)
+
+# Read when core.config is first imported, so set before any test module loads it
+for name, default in (
+    ("DATABASE_PATH", "prompts.db"),
+    ("TASK_STORE_PATH", "tasks.db"),
+    ("SHARED_CACHE_PATH", "shared_cache.db"),
+    ("TRACE_PATH", "traces.jsonl"),
+    ("PROFILE_DIR", "profiles"),
+):
+    os.environ[name] = os.path.join(_scratch, default)
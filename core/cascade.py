@@ -0,0 +1,198 @@
+"""
+Model Cascade - Answer with the cheapest tier that is confident enough
+Analysis and evaluation calls try local heuristics first, then a fast Gemini
+model, and escalate to the stronger model only when an earlier tier is unsure
+or its output fails validation. Every tier's hit rate and latency is recorded.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import google.generativeai as genai
+
+from core.config import Config
+from core.deadline import current_deadline
+from core.metrics import count_fallback
+from core.tracing import span
+
+# Cheapest first; cascades use a subset in this order
+TIERS = ('classifier', 'heuristics', 'fast', 'strong')
+
+# Tiers that call an LLM, skipped when the request's deadline is too close
+LLM_TIERS = ('fast', 'strong')
+
+# Latency samples kept per tier for percentiles
+_LATENCY_SAMPLES = 1000
+
+
+class CascadeStats:
+    """
+    Thread-safe per-cascade, per-tier counters
+
+    A tier is "called" when the cascade reaches it and "answers" when its
+    result is accepted; everything else escalates (or errored).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests: Dict[str, int] = {}
+        self._deadline_skips: Dict[str, int] = {}
+        self._tiers: Dict[Tuple[str, str], Dict] = {}
+
+    def record_request(self, cascade: str):
+        with self._lock:
+            self._requests[cascade] = self._requests.get(cascade, 0) + 1
+
+    def record_deadline_skip(self, cascade: str):
+        """A request stopped before its LLM tiers for lack of time"""
+        with self._lock:
+            self._deadline_skips[cascade] = self._deadline_skips.get(cascade, 0) + 1
+
+    def record(self, cascade: str, tier: str, answered: bool, error: bool, ms: float):
+        with self._lock:
+            stats = self._tiers.get((cascade, tier))
+            if stats is None:
+                stats = self._tiers[(cascade, tier)] = {
+                    'calls': 0, 'answered': 0, 'errors': 0, 'total_ms': 0.0,
+                    'latencies': deque(maxlen=_LATENCY_SAMPLES)
+                }
+            stats['calls'] += 1
+            stats['answered'] += answered
+            stats['errors'] += error
+            stats['total_ms'] += ms
+            stats['latencies'].append(ms)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Current numbers per cascade
+
+        Returns:
+            cascade -> {'requests': n, 'deadline_skips': n, 'tiers': tier ->
+            {calls, answered, errors, hit_rate (answered / calls), share
+            (answered / requests), avg_ms, p50_ms, p95_ms}}
+        """
+        with self._lock:
+            requests = dict(self._requests)
+            skips = dict(self._deadline_skips)
+            tiers = {key: dict(stats, latencies=sorted(stats['latencies'])) for key, stats in self._tiers.items()}
+
+        result = {name: {'requests': n, 'deadline_skips': skips.get(name, 0), 'tiers': {}}
+                  for name, n in requests.items()}
+        for (name, tier), stats in sorted(tiers.items(), key=lambda item: TIERS.index(item[0][1])):
+            latencies = stats['latencies']
+            result.setdefault(name, {'requests': 0, 'deadline_skips': 0, 'tiers': {}})['tiers'][tier] = {
+                'calls': stats['calls'],
+                'answered': stats['answered'],
+                'errors': stats['errors'],
+                'hit_rate': stats['answered'] / stats['calls'],
+                'share': stats['answered'] / max(result[name]['requests'], 1),
+                'avg_ms': stats['total_ms'] / stats['calls'],
+                'p50_ms': latencies[len(latencies) // 2],
+                'p95_ms': latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+            }
+        return result
+
+    def report(self) -> str:
+        """Plain-text table of snapshot()"""
+        lines = []
+        for name, data in self.snapshot().items():
+            lines.append(f"{name}: {data['requests']} requests"
+                         + (f", {data['deadline_skips']} out of time" if data['deadline_skips'] else ""))
+            for tier, t in data['tiers'].items():
+                lines.append(
+                    f"  {tier:<11} calls {t['calls']:>6}  hit rate {t['hit_rate']:>6.1%}  "
+                    f"answered {t['share']:>6.1%}  p50 {t['p50_ms']:>8.1f} ms  p95 {t['p95_ms']:>8.1f} ms"
+                    + (f"  errors {t['errors']}" if t['errors'] else "")
+                )
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._requests.clear()
+            self._deadline_skips.clear()
+            self._tiers.clear()
+
+
+class ModelCascade:
+    """
+    Runs stages cheapest first until one answers
+
+    A stage is (tier, fn): fn gets the cascade's arguments and returns a
+    result to accept it, or None to escalate. Thresholds live in the stage
+    functions (read from Config on every call), so they can be tuned per
+    tier without rebuilding the cascade. Exceptions escalate too.
+
+    Under a request deadline (core.deadline), LLM tiers are skipped once
+    too little time is left, and the request is marked degraded.
+    """
+
+    def __init__(self, name: str, stages: List[Tuple[str, Callable]], stats: Optional[CascadeStats] = None):
+        """
+        Initialize the cascade
+
+        Args:
+            name: Name the stats are reported under
+            stages: (tier, fn) pairs, cheapest first
+            stats: Where to record hit rates (defaults to the shared instance)
+        """
+        self.name = name
+        self.stages = list(stages)
+        self.stats = stats or get_cascade_stats()
+
+    def run(self, *args, **kwargs) -> Tuple[Optional[object], Optional[str]]:
+        """
+        Try every stage in order
+
+        Returns:
+            (result, tier that answered), or (None, None) if none did
+        """
+        self.stats.record_request(self.name)
+        deadline = current_deadline()
+        for tier, fn in self.stages:
+            if deadline is not None and tier in LLM_TIERS and not deadline.can_call():
+                deadline.mark_degraded(self.name)
+                self.stats.record_deadline_skip(self.name)
+                break
+            start = time.perf_counter()
+            error = False
+            with span(f"{self.name}:{tier}") as tier_span:
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception:
+                    result, error = None, True
+                tier_span.set(answered=result is not None)
+            self.stats.record(self.name, tier, result is not None, error, (time.perf_counter() - start) * 1000)
+            if result is not None:
+                return result, tier
+        if deadline is not None and not deadline.can_call():
+            deadline.mark_degraded(self.name)  # The last tier ran out of time
+            count_fallback(self.name, 'deadline')
+        else:
+            count_fallback(self.name, 'exhausted')
+        return None, None
+
+
+def use_fast_tier() -> bool:
+    """Whether a separate fast model sits in front of the strong one"""
+    return Config.CASCADE_ENABLED and Config.GEMINI_FAST_MODEL != Config.GEMINI_STRONG_MODEL
+
+
+def fast_model():
+    """The fast tier's Gemini model, or None when the cascade has no fast tier"""
+    if not use_fast_tier():
+        return None
+    genai.configure(api_key=Config.GEMINI_API_KEY)
+    return genai.GenerativeModel(Config.GEMINI_FAST_MODEL)
+
+
+# Global stats instance
+_stats: Optional[CascadeStats] = None
+
+
+def get_cascade_stats() -> CascadeStats:
+    """Get or create the process-wide cascade stats"""
+    global _stats
+    if _stats is None:
+        _stats = CascadeStats()
+    return _stats
@@ -2,6 +2,7 @@
 Configuration management for AI Prompt Optimizer
 Academic & Technical Edition
 """
+import json
 import os
 from dotenv import load_dotenv
 from pathlib import Path
@@ -23,13 +24,163 @@ class Config:
 
     # Database
     BASE_DIR = Path(__file__).resolve().parent.parent
-    DATABASE_PATH = BASE_DIR / "data" / "prompts.db"
+    DATABASE_PATH = Path(os.getenv("DATABASE_PATH", str(BASE_DIR / "data" / "prompts.db")))
     DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+    # How often cached template/workflow reads re-check the shared version row
+    DB_CACHE_VERSION_CHECK_SECONDS = float(os.getenv("DB_CACHE_VERSION_CHECK_SECONDS", "1.0"))
+    # Full-text search ranks at most this many of the newest matches, keeping
+    # very broad queries interactive on large tables
+    SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "10000"))
+    # Usage counters (copy clicks, ratings) are coalesced in memory and written
+    # every COUNTER_FLUSH_SECONDS, or sooner once COUNTER_MAX_PENDING events queue up
+    COUNTER_FLUSH_SECONDS = float(os.getenv("COUNTER_FLUSH_SECONDS", "5.0"))
+    COUNTER_MAX_PENDING = int(os.getenv("COUNTER_MAX_PENDING", "500"))
+    # Preference tracking persists its counter deltas at most this often
+    PREFERENCES_FLUSH_SECONDS = float(os.getenv("PREFERENCES_FLUSH_SECONDS", "2.0"))
+    # Half-life of past choices in smart defaults; 0 keeps every event at full weight
+    PREFERENCE_HALF_LIFE_DAYS = float(os.getenv("PREFERENCE_HALF_LIFE_DAYS", "0"))
+    # Per-session preferences kept in memory (LRU, lock-striped shards)
+    PREFERENCE_STORE_SHARDS = int(os.getenv("PREFERENCE_STORE_SHARDS", "16"))
+    PREFERENCE_STORE_MAX_SESSIONS = int(os.getenv("PREFERENCE_STORE_MAX_SESSIONS", "2000"))
+    PREFERENCE_STORE_IDLE_SECONDS = float(os.getenv("PREFERENCE_STORE_IDLE_SECONDS", "1800"))
+
+    # Near-duplicate cache: reuse results for prompts that differ only trivially.
+    # Similarity is the share of agreeing SimHash bits (candidates below 0.89 are
+    # found on a best-effort basis by the LSH bands); a hit must also be within
+    # NEAR_DUP_MAX_WORD_EDITS words of the query. Prompts under NEAR_DUP_MIN_TOKENS
+    # words only match exactly (after normalizing case, whitespace and punctuation).
+    # A one-word edit can change the question ("python" -> "rust"), so near
+    # matches are off by default: 0 edits only reuses normalized-identical prompts.
+    # See benchmarks/bench_near_duplicate.py for hit vs. false-hit rates
+    NEAR_DUP_CACHE_ENABLED = os.getenv("NEAR_DUP_CACHE_ENABLED", "true").lower() == "true"
+    NEAR_DUP_SIMILARITY = float(os.getenv("NEAR_DUP_SIMILARITY", "0.8"))
+    NEAR_DUP_MAX_WORD_EDITS = int(os.getenv("NEAR_DUP_MAX_WORD_EDITS", "0"))
+    NEAR_DUP_MIN_TOKENS = int(os.getenv("NEAR_DUP_MIN_TOKENS", "8"))
+    NEAR_DUP_MAX_ENTRIES = int(os.getenv("NEAR_DUP_MAX_ENTRIES", "5000"))
+    NEAR_DUP_TTL_SECONDS = float(os.getenv("NEAR_DUP_TTL_SECONDS", "900"))
+    # Shared cache: a SQLite file (WAL) every worker process on the box reads and
+    # fills, so a result computed by one Streamlit/API/job worker serves the rest.
+    # Entries closest to expiry are evicted beyond the entry or size limit.
+    # See benchmarks/bench_shared_cache.py for multi-process throughput
+    SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", "true").lower() == "true"
+    SHARED_CACHE_PATH = Path(os.getenv("SHARED_CACHE_PATH", str(BASE_DIR / "data" / "shared_cache.db")))
+    SHARED_CACHE_TTL_SECONDS = float(os.getenv("SHARED_CACHE_TTL_SECONDS", "3600"))
+    SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "50000"))
+    SHARED_CACHE_MAX_MB = float(os.getenv("SHARED_CACHE_MAX_MB", "256"))
+
+    # Local classifier: label prompts without an LLM call when confident enough
+    LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "true").lower() == "true"
+    LOCAL_CLASSIFIER_DIR = Path(os.getenv("LOCAL_CLASSIFIER_DIR", str(BASE_DIR / "data" / "classifiers")))
+    LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.85"))
+    LOG_LLM_LABELS = os.getenv("LOG_LLM_LABELS", "true").lower() == "true"
 
     # LLM Settings
     LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")  # Options: openai, anthropic, gemini
     DEFAULT_MODEL = "gpt-4o"  # For OpenAI
     GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")  # For Google Gemini (latest stable)
+    # Model cascade: cheap tiers answer first, the strong model only when they are unsure
+    CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "true").lower() == "true"
+    GEMINI_FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash-lite")
+    GEMINI_STRONG_MODEL = os.getenv("GEMINI_STRONG_MODEL", GEMINI_MODEL)
+    # Minimum confidence at which keyword heuristics / the fast model answer without escalating
+    CASCADE_HEURISTIC_THRESHOLD = float(os.getenv("CASCADE_HEURISTIC_THRESHOLD", "0.8"))
+    CASCADE_FAST_THRESHOLD = float(os.getenv("CASCADE_FAST_THRESHOLD", "0.75"))
+    # Hedged requests: if the primary LLM call is slower than its HEDGE_PERCENTILE
+    # latency, race a backup ("provider:model" list; empty = the same model again)
+    HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+    HEDGE_BACKUPS = os.getenv("HEDGE_BACKUPS", "")
+    HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    # Until a target has HEDGE_MIN_SAMPLES latencies, hedge after the default delay
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS", "8"))
+    HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.5"))
+    HEDGE_MAX_DELAY_SECONDS = float(os.getenv("HEDGE_MAX_DELAY_SECONDS", "30"))
+    HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "16"))
+    # Time budget of one request across all its LLM calls (0 = unlimited); stages
+    # that cannot start with DEADLINE_MIN_CALL_SECONDS left use local heuristics
+    REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "30"))
+    DEADLINE_MIN_CALL_SECONDS = float(os.getenv("DEADLINE_MIN_CALL_SECONDS", "1"))
+    # Return chat prompts before their quality score: evaluation runs on the
+    # "evaluation" task queue and the score arrives later
+    DEFER_EVALUATION = os.getenv("DEFER_EVALUATION", "true").lower() == "true"
+
+    # Background tasks: worker threads per named queue ("name=n,..."; others get
+    # TASK_DEFAULT_WORKERS), retries with doubling backoff, and a SQLite file that
+    # keeps durable tasks across restarts. Processes sharing the file lease their
+    # pending tasks; a lease not renewed within TASK_LEASE_SECONDS is taken over
+    TASK_QUEUES = os.getenv("TASK_QUEUES", "evaluation=4,persistence=1")
+    TASK_DEFAULT_WORKERS = int(os.getenv("TASK_DEFAULT_WORKERS", "2"))
+    TASK_MAX_RETRIES = int(os.getenv("TASK_MAX_RETRIES", "3"))
+    TASK_RETRY_BACKOFF_SECONDS = float(os.getenv("TASK_RETRY_BACKOFF_SECONDS", "1.0"))
+    TASK_DURABLE = os.getenv("TASK_DURABLE", "true").lower() == "true"
+    TASK_STORE_PATH = Path(os.getenv("TASK_STORE_PATH", str(BASE_DIR / "data" / "tasks.db")))
+    TASK_LEASE_SECONDS = float(os.getenv("TASK_LEASE_SECONDS", "30"))
+    TASK_SHUTDOWN_SECONDS = float(os.getenv("TASK_SHUTDOWN_SECONDS", "10"))
+
+    # Jobs: batches run by worker processes (python job_worker.py run) that lease
+    # them from the jobs table; a lease not extended within JOB_LEASE_SECONDS
+    # (one prompt) is taken over by another worker, up to JOB_MAX_ATTEMPTS times
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+    JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+    # Headless HTTP API (api.py): worker processes, threads per worker for the
+    # blocking pipeline stages, and request size limits
+    API_HOST = os.getenv("API_HOST", "127.0.0.1")
+    API_PORT = int(os.getenv("API_PORT", "8000"))
+    API_WORKERS = int(os.getenv("API_WORKERS", "4"))
+    API_THREADS = int(os.getenv("API_THREADS", "64"))
+    API_MAX_PROMPT_CHARS = int(os.getenv("API_MAX_PROMPT_CHARS", "20000"))
+    API_MAX_BATCH = int(os.getenv("API_MAX_BATCH", "100"))
+    API_BATCH_CONCURRENCY = int(os.getenv("API_BATCH_CONCURRENCY", "8"))
+
+    # Tracing: nested spans around pipeline stages and LLM calls. Finished
+    # requests are appended to TRACE_PATH as JSONL (one span per line) and the
+    # last TRACE_RECENT kept for the sidebar waterfall. Off, a span costs one flag check
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    TRACE_PATH = Path(os.getenv("TRACE_PATH", str(BASE_DIR / "data" / "traces.jsonl")))
+    TRACE_RECENT = int(os.getenv("TRACE_RECENT", "20"))
+
+    # Token accounting: prompt/completion tokens of every LLM call (as the provider
+    # reports them, else estimated at USAGE_CHARS_PER_TOKEN), written to the
+    # llm_usage table every USAGE_FLUSH_SECONDS or USAGE_MAX_PENDING calls
+    USAGE_TRACKING_ENABLED = os.getenv("USAGE_TRACKING_ENABLED", "true").lower() == "true"
+    USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "10"))
+    USAGE_MAX_PENDING = int(os.getenv("USAGE_MAX_PENDING", "200"))
+    USAGE_CHARS_PER_TOKEN = float(os.getenv("USAGE_CHARS_PER_TOKEN", "4"))
+    # USD per million (input, output) tokens by model; LLM_PRICES takes
+    # '{"model": [input, output], ...}' to add or override models
+    LLM_PRICES = {
+        "gemini-2.5-pro": (1.25, 10.0),
+        "gemini-2.5-flash": (0.30, 2.50),
+        "gemini-2.5-flash-lite": (0.10, 0.40),
+        "gemini-2.0-flash": (0.10, 0.40),
+        "gemini-1.5-flash": (0.075, 0.30),
+        "gpt-4o": (2.50, 10.0),
+        "gpt-4o-mini": (0.15, 0.60),
+        **{model: tuple(price) for model, price in json.loads(os.getenv("LLM_PRICES", "{}")).items()},
+    }
+
+    # Metrics: request counts, stage latency, cache hits, fallbacks, rate-limit
+    # waits and database write latency in Prometheus text format. Served at
+    # METRICS_HOST:METRICS_PORT/metrics when METRICS_PORT is set (job worker
+    # processes take the ports after it), and at /metrics on the API
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+    # Profiling: one in PROFILE_SAMPLE_EVERY pipeline requests (0: none, 1: all),
+    # plus those that ask (API X-Profile header or ?profile=1, unless
+    # PROFILE_ON_DEMAND is off), write pstats and collapsed-stack files to
+    # PROFILE_DIR. PROFILE_MODE "sampling" samples every busy thread each
+    # PROFILE_INTERVAL_MS; "cprofile" takes exact stats of the entry thread
+    PROFILE_SAMPLE_EVERY = int(os.getenv("PROFILE_SAMPLE_EVERY", "0"))
+    PROFILE_ON_DEMAND = os.getenv("PROFILE_ON_DEMAND", "true").lower() == "true"
+    PROFILE_MODE = os.getenv("PROFILE_MODE", "sampling")
+    PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(BASE_DIR / "data" / "profiles")))
+
     DEFAULT_TEMPERATURE = 0.7
     DEFAULT_MAX_TOKENS = 2000
 
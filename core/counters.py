@@ -0,0 +1,174 @@
+"""
+Usage Counters - Coalesced, batched updates for template and version stats
+Copy clicks and ratings are buffered in memory and written periodically with
+single `UPDATE ... SET col = col + ?` statements instead of read-modify-write
+"""
+import atexit
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from core.config import Config
+from core.tasks import submit_task
+
+
+def _check_stars(stars: int):
+    if not 1 <= stars <= 5:
+        raise ValueError(f"Ratings are 1-5 stars, got {stars}")
+
+
+class CounterBuffer:
+    """
+    Coalesces counter deltas in memory and applies them in batches
+
+    A hot template clicked a thousand times between flushes costs one
+    UPDATE, not a thousand. Template ratings are kept as (sum, count) deltas
+    so the stored average can be advanced incrementally in SQL.
+    """
+
+    def __init__(self, flush_interval: Optional[float] = None, max_pending: Optional[int] = None):
+        """
+        Initialize the buffer
+
+        Args:
+            flush_interval: Seconds between automatic flushes
+            max_pending: Flush immediately once this many events are buffered
+        """
+        self.flush_interval = Config.COUNTER_FLUSH_SECONDS if flush_interval is None else flush_interval
+        self.max_pending = Config.COUNTER_MAX_PENDING if max_pending is None else max_pending
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_queued = False
+        self._reset()
+
+    def _reset(self):
+        self._template_uses: Counter = Counter()
+        self._template_ratings: Dict[int, List[int]] = {}  # id -> [sum, count]
+        self._version_copies: set = set()
+        self._version_ratings: Dict[int, int] = {}
+        self._pending = 0
+
+    # ==================== RECORDING ====================
+
+    def record_template_use(self, template_id: int, count: int = 1):
+        """Count a copy/use of a template"""
+        with self._lock:
+            self._template_uses[template_id] += count
+            self._pending += 1
+        self._after_record()
+
+    def rate_template(self, template_id: int, stars: int):
+        """Add a 1-5 star rating to a template's running average"""
+        _check_stars(stars)
+        with self._lock:
+            totals = self._template_ratings.setdefault(template_id, [0, 0])
+            totals[0] += stars
+            totals[1] += 1
+            self._pending += 1
+        self._after_record()
+
+    def mark_version_copied(self, version_id: int):
+        """Flag a generated version as copied"""
+        with self._lock:
+            self._version_copies.add(version_id)
+            self._pending += 1
+        self._after_record()
+
+    def rate_version(self, version_id: int, stars: int):
+        """Set a generated version's 1-5 star rating (last rating wins)"""
+        _check_stars(stars)
+        with self._lock:
+            self._version_ratings[version_id] = stars
+            self._pending += 1
+        self._after_record()
+
+    def pending(self) -> int:
+        """Number of events recorded since the last flush"""
+        return self._pending
+
+    # ==================== FLUSHING ====================
+
+    def flush(self) -> int:
+        """
+        Write buffered deltas to the database
+
+        Returns:
+            Number of events applied
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._pending == 0:
+                    return 0
+                snapshot = (
+                    dict(self._template_uses),
+                    {tid: (s, n) for tid, (s, n) in self._template_ratings.items()},
+                    set(self._version_copies),
+                    dict(self._version_ratings),
+                )
+                pending = self._pending
+                self._reset()
+
+            from core.database import DatabaseManager
+            try:
+                DatabaseManager.apply_usage_deltas(*snapshot)
+            except Exception:
+                self._restore(snapshot, pending)
+                raise
+
+            return pending
+
+    def _restore(self, snapshot: Tuple, pending: int):
+        """Put deltas from a failed flush back so the next flush retries them"""
+        uses, ratings, copies, version_ratings = snapshot
+        with self._lock:
+            self._template_uses.update(uses)
+            for tid, (s, n) in ratings.items():
+                totals = self._template_ratings.setdefault(tid, [0, 0])
+                totals[0] += s
+                totals[1] += n
+            self._version_copies |= copies
+            for vid, stars in version_ratings.items():
+                self._version_ratings.setdefault(vid, stars)
+            self._pending += pending
+
+    def _after_record(self):
+        if self._pending >= self.max_pending:
+            # Full: flush now, but on the task queue rather than the caller's thread
+            submit_task(self._flush_quietly, queue='persistence', priority=1, retries=0)
+        else:
+            self._schedule()
+
+    def _schedule(self):
+        """Queue a delayed flush on the persistence task queue unless one is queued"""
+        with self._lock:
+            if self._flush_queued:
+                return
+            self._flush_queued = True
+        submit_task(self._on_timer, queue='persistence', delay=self.flush_interval, retries=0)
+
+    def _on_timer(self):
+        with self._lock:
+            self._flush_queued = False
+        self._flush_quietly()
+        if self._pending:
+            self._schedule()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            pass  # Deltas were restored; the next flush retries them
+
+
+# Global instance
+_counter_buffer = None
+
+
+def get_counter_buffer() -> CounterBuffer:
+    """Get global counter buffer (flushed on interpreter exit)"""
+    global _counter_buffer
+    if _counter_buffer is None:
+        _counter_buffer = CounterBuffer()
+        atexit.register(_counter_buffer._flush_quietly)
+    return _counter_buffer
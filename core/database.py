@@ -1,19 +1,59 @@
 """
 Database models and operations for AI Prompt Optimizer
 """
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, JSON
+import json
+import math
+import re
+import threading
+import time
+from pathlib import Path
+from sqlalchemy import create_engine, event, func, select, update, insert, text, bindparam, and_, or_, case, cast, Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Index, JSON
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, Session
-from datetime import datetime
-from typing import List, Optional, Dict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Hashable, List, Optional, Dict, NamedTuple, Tuple
 from contextlib import contextmanager
 from .config import Config
+from .metrics import observe_db_write
 
 # Create engine and base
 engine = create_engine(Config.DATABASE_URL, echo=False)
 Base = declarative_base()
 SessionLocal = sessionmaker(bind=engine)
 
+_WRITE_STATEMENTS = ('insert', 'update', 'delete', 'replace')
+
+
+# power() for decayed preference scores, on SQLite builds without math functions
+@event.listens_for(engine, 'connect')
+def _sqlite_functions(dbapi_conn, connection_record):
+    if engine.dialect.name == 'sqlite':
+        dbapi_conn.create_function('power', 2, math.pow, deterministic=True)
+
+
+# Write statement latency for the metrics (a failed statement records nothing)
+@event.listens_for(engine, 'before_cursor_execute')
+def _write_started(conn, cursor, statement, parameters, context, executemany):
+    if Config.METRICS_ENABLED and context is not None:
+        head = statement.lstrip()[:7].lower()
+        verb = next((verb for verb in _WRITE_STATEMENTS if head.startswith(verb)), None)
+        if verb is not None:
+            context.write_started = (verb, time.perf_counter())
+
+
+@event.listens_for(engine, 'after_cursor_execute')
+def _write_finished(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'write_started', None)
+    if started is not None:
+        observe_db_write('app', started[0], time.perf_counter() - started[1])
+
+# Bump whenever models, indexes or seed_data.json change; SQLite databases
+# record it in PRAGMA user_version so warm starts skip init_db's work
+SCHEMA_VERSION = 7
+_init_lock = threading.Lock()
+_initialized = False
+
 
 # ==================== MODELS ====================
 
@@ -52,7 +92,8 @@ class PromptTemplate(Base):
     tags = Column(JSON)  # List of tags for search
     is_public = Column(Boolean, default=False)
     uses_count = Column(Integer, default=0)
-    rating = Column(Float, default=0.0)
+    rating = Column(Float, default=0.0)  # Running average of star ratings
+    rating_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -82,7 +123,11 @@ class PromptSession(Base):
     missing_info = Column(JSON)  # List of missing information
     suggestions = Column(JSON)  # List of suggestions
 
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    # Set for sessions written by a background job: the job and the prompt's position in it
+    job_id = Column(Integer, ForeignKey('jobs.id'), nullable=True, index=True)
+    job_item = Column(Integer)
 
     # Relationships
     user = relationship("User", back_populates="sessions")
@@ -160,6 +205,524 @@ class UserPreferenceRecord(Base):
         return f"<UserPreference(user_id={self.user_id}, optimizations={self.total_optimizations})>"
 
 
+class CacheVersion(Base):
+    """Shared version counters used to invalidate per-process read caches"""
+    __tablename__ = 'cache_versions'
+
+    name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<CacheVersion(name='{self.name}', version={self.version})>"
+
+
+class PreferenceCounter(Base):
+    """One usage counter of a preference profile, advanced by delta upserts"""
+    __tablename__ = 'preference_counters'
+
+    session_key = Column(String(255), primary_key=True)
+    kind = Column(String(32), primary_key=True)  # domain_usage, role_usage, task_usage, version_usage, combinations
+    key = Column(String(255), primary_key=True)  # Combinations are stored as "domain|role|task"
+    count = Column(Integer, nullable=False, default=0)
+    # Count with every event halved per PREFERENCE_HALF_LIFE_DAYS of age, as of updated_at
+    score = Column(Float)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<PreferenceCounter(session_key='{self.session_key}', {self.kind}[{self.key}]={self.count})>"
+
+
+class UsageRollup(Base):
+    """Fleet-wide usage per hour or day, summed over all preference profiles"""
+    __tablename__ = 'usage_rollups'
+
+    granularity = Column(String(8), primary_key=True)  # hour, day
+    bucket = Column(DateTime, primary_key=True)  # Start of the hour/day (UTC)
+    kind = Column(String(32), primary_key=True)  # Same kinds as PreferenceCounter
+    key = Column(String(255), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<UsageRollup({self.granularity} {self.bucket}, {self.kind}[{self.key}]={self.count})>"
+
+
+class LLMLabel(Base):
+    """Labels an LLM assigned to a prompt (training data for the local classifier)"""
+    __tablename__ = 'llm_labels'
+
+    id = Column(Integer, primary_key=True)
+    source = Column(String(32), nullable=False, index=True)  # smart_analyzer, prompt_agent
+    text = Column(Text, nullable=False)
+    labels = Column(JSON, nullable=False)  # {head: label}
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<LLMLabel(source='{self.source}', labels={self.labels})>"
+
+
+class LLMUsage(Base):
+    """Tokens of one LLM call (core/usage.py)"""
+    __tablename__ = 'llm_usage'
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    request_id = Column(String(32), index=True)  # Calls of one request share it
+    session_id = Column(String(64), index=True)  # Chat session, job, ...
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=True, index=True)
+    stage = Column(String(64), nullable=False, index=True)  # prompt_agent.analyze, prompt_engine.optimize, ...
+    model = Column(String(100), nullable=False)  # provider:model
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cost_usd = Column(Float)  # None for models without a price
+    estimated = Column(Boolean, nullable=False, default=False)  # Counted from the text, not reported
+
+    def __repr__(self):
+        return f"<LLMUsage(stage='{self.stage}', model='{self.model}', {self.prompt_tokens}+{self.completion_tokens} tokens)>"
+
+
+class Job(Base):
+    """A background optimization job, leased by worker processes (core/jobs.py)"""
+    __tablename__ = 'jobs'
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(32), nullable=False)  # optimize, agent
+    status = Column(String(16), nullable=False, default='queued')  # queued, running, done, failed, cancelled
+    priority = Column(Integer, nullable=False, default=0)
+    payload = Column(JSON, nullable=False)  # {"prompts": [...], "options": {...}}
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+
+    # Lease: the worker holding the job, until when (an expired lease is up for grabs)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    lease_owner = Column(String(100))
+    lease_expires_at = Column(DateTime)
+
+    # Progress: prompts [0, progress_done) are finished, each committed with its PromptSession
+    progress_done = Column(Integer, nullable=False, default=0)
+    progress_total = Column(Integer, nullable=False, default=0)
+    failed_items = Column(Integer, nullable=False, default=0)
+    result = Column(JSON)  # Summary once finished
+    error = Column(Text)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (Index('ix_jobs_status_priority', 'status', 'priority', 'id'),)
+
+    def __repr__(self):
+        return f"<Job(id={self.id}, kind='{self.kind}', status='{self.status}', {self.progress_done}/{self.progress_total})>"
+
+
+class JobLeaseLost(Exception):
+    """The worker no longer holds the job's lease (it expired or the job was cancelled)"""
+
+
+# ==================== READ MODELS ====================
+#
+# Read-only rows for the list views. Selecting plain columns into named tuples
+# skips the identity map and per-instance attribute instrumentation, and the
+# rows stay usable after the session closes without expunging anything.
+
+class TemplateRow(NamedTuple):
+    """Read-only snapshot of a PromptTemplate"""
+    id: int
+    owner_id: Optional[int]
+    name: str
+    description: Optional[str]
+    role: Optional[str]
+    task_type: Optional[str]
+    field: Optional[str]
+    base_prompt: str
+    tags: Optional[List[str]]
+    is_public: bool
+    uses_count: int
+    rating: float
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+
+class WorkflowRow(NamedTuple):
+    """Read-only snapshot of a Workflow"""
+    id: int
+    name: str
+    description: Optional[str]
+    workflow_type: Optional[str]
+    role: Optional[str]
+    field: Optional[str]
+    steps: Optional[List[Dict[str, Any]]]
+    is_public: bool
+    created_at: Optional[datetime]
+
+
+class SessionRow(NamedTuple):
+    """Read-only snapshot of a PromptSession"""
+    id: int
+    user_id: Optional[int]
+    role: str
+    task_type: str
+    field: Optional[str]
+    raw_prompt: str
+    intent: Optional[str]
+    clarity_score: Optional[int]
+    safety_score: Optional[int]
+    risks: Optional[List[str]]
+    missing_info: Optional[List[str]]
+    suggestions: Optional[List[str]]
+    created_at: Optional[datetime]
+
+
+class JobRow(NamedTuple):
+    """Read-only snapshot of a Job (without its payload)"""
+    id: int
+    kind: str
+    status: str
+    priority: int
+    user_id: Optional[int]
+    attempts: int
+    max_attempts: int
+    lease_owner: Optional[str]
+    lease_expires_at: Optional[datetime]
+    progress_done: int
+    progress_total: int
+    failed_items: int
+    result: Optional[Dict[str, Any]]
+    error: Optional[str]
+    created_at: Optional[datetime]
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+
+class JobLease(NamedTuple):
+    """A job a worker has leased: what to run and where to resume"""
+    id: int
+    kind: str
+    payload: Dict[str, Any]
+    user_id: Optional[int]
+    progress_done: int
+    attempts: int
+
+
+class JobItemResult(NamedTuple):
+    """The session a job wrote for one of its prompts, with its versions"""
+    job_item: int
+    session_id: int
+    raw_prompt: str
+    versions: Dict[str, str]
+
+
+class TemplateSearchHit(NamedTuple):
+    """A full-text search match over templates"""
+    id: int
+    name: str
+    description: Optional[str]
+    role: Optional[str]
+    task_type: Optional[str]
+    snippet: str
+    rank: float
+
+
+class SessionSearchHit(NamedTuple):
+    """A full-text search match over past prompts"""
+    id: int
+    user_id: Optional[int]
+    role: str
+    task_type: str
+    snippet: str
+    created_at: Optional[datetime]
+    rank: float
+
+
+def _row_columns(model, row_type) -> list:
+    """Table columns matching the fields of a read model, in field order"""
+    return [model.__table__.c[name] for name in row_type._fields]
+
+
+_TEMPLATE_COLUMNS = _row_columns(PromptTemplate, TemplateRow)
+_WORKFLOW_COLUMNS = _row_columns(Workflow, WorkflowRow)
+_SESSION_COLUMNS = _row_columns(PromptSession, SessionRow)
+_JOB_COLUMNS = _row_columns(Job, JobRow)
+
+
+# ==================== READ-THROUGH CACHE ====================
+
+class ReadThroughCache:
+    """
+    In-process cache for rarely-changing query results
+
+    Entries are keyed by the query's filter arguments. Writers call
+    invalidate() inside their transaction, which bumps a local generation
+    counter and the shared row in `cache_versions`; other processes notice
+    the new version on their next (throttled) check and drop their entries.
+    """
+
+    def __init__(self, name: str, check_interval: Optional[float] = None):
+        self.name = name
+        self.check_interval = Config.DB_CACHE_VERSION_CHECK_SECONDS if check_interval is None else check_interval
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, Any] = {}
+        self._generation = 0
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for key, loading it on a miss"""
+        self._sync_version()
+
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            # Drop results that raced with an invalidation
+            if generation == self._generation:
+                self._entries[key] = value
+        return value
+
+    def invalidate(self, session: Optional[Session] = None):
+        """Drop local entries and, given a session, bump the shared version"""
+        self._clear()
+
+        if session is not None:
+            # Readers may refill from the pre-commit state; clear again once committed
+            event.listen(session, 'after_commit', lambda _: self._clear(), once=True)
+            bumped = session.execute(
+                update(CacheVersion)
+                .where(CacheVersion.name == self.name)
+                .values(version=CacheVersion.version + 1)
+            )
+            if bumped.rowcount == 0:
+                session.execute(insert(CacheVersion).values(name=self.name, version=1))
+
+    def _clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def _sync_version(self):
+        """Clear local entries if another process bumped the shared version"""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+
+        _ensure_initialized()
+        with engine.connect() as conn:
+            version = conn.execute(
+                select(CacheVersion.version).where(CacheVersion.name == self.name)
+            ).scalar() or 0
+
+        with self._lock:
+            self._checked_at = now
+            if version != self._version:
+                self._version = version
+                self._generation += 1
+                self._entries.clear()
+
+
+_template_cache = ReadThroughCache('templates')
+_workflow_cache = ReadThroughCache('workflows')
+
+
+# ==================== FULL-TEXT SEARCH ====================
+#
+# External-content FTS5 indexes over templates and prompt history. Triggers
+# keep them in step with the base tables; the update triggers only fire for
+# indexed columns so counter updates never touch the index.
+
+_FTS_INDEXES = {
+    'prompt_templates_fts': {
+        'table': 'prompt_templates',
+        'columns': ['name', 'description', 'base_prompt', 'tags'],
+    },
+    'prompt_sessions_fts': {
+        'table': 'prompt_sessions',
+        'columns': ['raw_prompt'],
+    },
+}
+
+# Column weights for bm25(): a hit in the name beats one in the body
+_TEMPLATE_BM25 = "bm25(prompt_templates_fts, 10.0, 5.0, 1.0, 3.0)"
+
+
+def _ensure_fts(conn):
+    """Create FTS5 tables and sync triggers, backfilling new indexes"""
+    for fts, spec in _FTS_INDEXES.items():
+        table = spec['table']
+        cols = ', '.join(spec['columns'])
+        new_cols = ', '.join(f'new.{c}' for c in spec['columns'])
+        old_cols = ', '.join(f'old.{c}' for c in spec['columns'])
+
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': fts}
+        ).first()
+        if exists:
+            continue
+
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, "
+            f"content='{table}', content_rowid='id', tokenize='porter unicode61', prefix='2 3')"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+        ))
+        conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES('rebuild')"))
+
+
+def _fts_window(fts: str, join: str = "", filters: str = "") -> str:
+    """
+    SQL for the lowest rowid worth ranking
+
+    bm25() has to score every match before the top N are known, which is what
+    makes one-word queries slow on big tables. Ids grow over time, so ranking
+    only the newest SEARCH_RANK_WINDOW matches keeps latency bounded and
+    favours recent rows when a query is too broad to discriminate anyway.
+
+    The window counts only matches passing the search's own filters (`join`
+    brings in the base table they refer to), so other users' or other task
+    types' matches can't push the filtered rows out of it.
+    """
+    return (
+        f"coalesce((SELECT {fts}.rowid FROM {fts} {join} WHERE {fts} MATCH :match{filters} "
+        f"ORDER BY {fts}.rowid DESC LIMIT 1 OFFSET :window), 0)"
+    )
+
+
+def _fts_query(query: str) -> Optional[str]:
+    """
+    Turn free text into a safe FTS5 MATCH expression
+
+    Every word is quoted so user input can't inject FTS syntax; the last
+    word becomes a prefix match so results update while typing.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _snippet(texts: List[Optional[str]], query: str, size: int = 12) -> str:
+    """
+    Highlight query words in the best-matching text, FTS snippet() style
+
+    Built in Python from the rows already fetched: asking FTS5 for snippets
+    re-opens a MATCH cursor per hit, which dominates latency on big indexes.
+    """
+    words = [w.lower() for w in re.findall(r'\w+', query)]
+    best_tokens, best_hits = [], []
+    for value in texts:
+        tokens = (value or '').split()
+        hits = [i for i, tok in enumerate(tokens)
+                if any(re.sub(r'\W', '', tok).lower().startswith(w) for w in words)]
+        if len(hits) > len(best_hits):
+            best_tokens, best_hits = tokens, hits
+    if not best_hits:
+        tokens = next((v.split() for v in texts if v), [])
+        return ' '.join(tokens[:size]) + ('...' if len(tokens) > size else '')
+
+    start = max(0, min(best_hits[0] - size // 4, len(best_tokens) - size))
+    end = min(len(best_tokens), start + size)
+    hits = set(best_hits)
+    window = [f"**{tok}**" if i in hits else tok for i, tok in enumerate(best_tokens[start:end], start)]
+    return ('...' if start > 0 else '') + ' '.join(window) + ('...' if end < len(best_tokens) else '')
+
+
+# ==================== SCHEMA ====================
+
+def _ensure_initialized():
+    """Run init_db once per process, on first use rather than at import"""
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if not _initialized:
+            DatabaseManager.init_db()
+            _initialized = True
+
+
+def _migrate_sqlite(session: Session):
+    """Bring an existing SQLite database up to SCHEMA_VERSION"""
+    # create_all skips indexes and columns on tables that already exist
+    session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_prompt_sessions_created_at ON prompt_sessions (created_at)"
+    ))
+    _ensure_fts(session.connection())
+    columns = {row[1] for row in session.execute(text("PRAGMA table_info(prompt_templates)"))}
+    if 'rating_count' not in columns:
+        session.execute(text("ALTER TABLE prompt_templates ADD COLUMN rating_count INTEGER DEFAULT 0"))
+    columns = {row[1] for row in session.execute(text("PRAGMA table_info(prompt_sessions)"))}
+    if 'job_id' not in columns:
+        session.execute(text("ALTER TABLE prompt_sessions ADD COLUMN job_id INTEGER REFERENCES jobs (id)"))
+        session.execute(text("ALTER TABLE prompt_sessions ADD COLUMN job_item INTEGER"))
+    session.execute(text("CREATE INDEX IF NOT EXISTS ix_prompt_sessions_job_id ON prompt_sessions (job_id)"))
+    columns = {row[1] for row in session.execute(text("PRAGMA table_info(preference_counters)"))}
+    if 'score' not in columns:
+        # Counters from before decayed scores start from their raw count
+        session.execute(text("ALTER TABLE preference_counters ADD COLUMN score FLOAT"))
+        session.execute(text("UPDATE preference_counters SET score = count"))
+
+    # Counters stored before rollups existed are attributed to their last update
+    if session.execute(text("SELECT count(*) FROM usage_rollups")).scalar() == 0:
+        for granularity, bucket_format in (('hour', '%Y-%m-%d %H:00:00.000000'), ('day', '%Y-%m-%d 00:00:00.000000')):
+            session.execute(text(f"""
+                INSERT INTO usage_rollups (granularity, bucket, kind, key, count)
+                SELECT '{granularity}', strftime('{bucket_format}', updated_at), kind, key, sum(count)
+                FROM preference_counters
+                WHERE updated_at IS NOT NULL
+                GROUP BY 2, kind, key
+            """))
+
+    # Older releases re-inserted every seed template on each start; keep the
+    # first copy and drop unused duplicates
+    seed_names = [t['name'] for t in _load_seed_data()['templates']]
+    session.execute(
+        text("""
+            DELETE FROM prompt_templates
+            WHERE owner_id IS NULL AND name IN :names AND coalesce(uses_count, 0) = 0
+              AND id NOT IN (SELECT min(id) FROM prompt_templates WHERE owner_id IS NULL GROUP BY name)
+        """).bindparams(bindparam('names', expanding=True)),
+        {'names': seed_names}
+    )
+
+
+def _rollup_buckets(at: datetime) -> List[Tuple[str, datetime]]:
+    """(granularity, bucket start) pairs an event at `at` is counted in"""
+    hour = at.replace(minute=0, second=0, microsecond=0)
+    return [('hour', hour), ('day', hour.replace(hour=0))]
+
+
+def _halvings(later, earlier, half_life_days: float):
+    """SQL for the decay factor over later - earlier: 0.5 per half-life (1 if either is NULL)"""
+    if engine.dialect.name == 'postgresql':
+        days = func.extract('epoch', later - earlier) / 86400
+    else:
+        days = func.julianday(later) - func.julianday(earlier)
+    return func.power(0.5, func.coalesce(days, 0) / half_life_days)
+
+
+def _upsert(model):
+    """INSERT that supports on_conflict_do_update() on SQLite and PostgreSQL"""
+    if engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(model)
+    return sqlite_insert(model)
+
+
 # ==================== DATABASE OPERATIONS ====================
 
 class DatabaseManager:
@@ -169,6 +732,7 @@ class DatabaseManager:
     @contextmanager
     def get_session() -> Session:
         """Context manager for database sessions"""
+        _ensure_initialized()
         session = SessionLocal()
         try:
             yield session
@@ -181,8 +745,20 @@ class DatabaseManager:
 
     @staticmethod
     def init_db():
-        """Initialize database tables"""
+        """Create or migrate tables and seed them (a no-op once up to date)"""
+        sqlite = engine.dialect.name == 'sqlite'
+        if sqlite:
+            with engine.connect() as conn:
+                if conn.execute(text("PRAGMA user_version")).scalar() >= SCHEMA_VERSION:
+                    return
+
         Base.metadata.create_all(engine)
+        with Session(engine) as session, session.begin():
+            if sqlite:
+                _migrate_sqlite(session)
+            seed_database(session)
+            if sqlite:
+                session.execute(text(f"PRAGMA user_version = {SCHEMA_VERSION}"))
 
     @staticmethod
     def create_user(username: str, email: Optional[str] = None, role: Optional[str] = None, field: Optional[str] = None) -> User:
@@ -247,39 +823,33 @@ class DatabaseManager:
             return version
 
     @staticmethod
-    def get_user_sessions(user_id: int, limit: int = 10) -> List[PromptSession]:
+    def get_user_sessions(user_id: int, limit: int = 10) -> List[SessionRow]:
         """Get recent sessions for a user"""
-        with DatabaseManager.get_session() as session:
-            sessions = session.query(PromptSession)\
-                .filter_by(user_id=user_id)\
-                .order_by(PromptSession.created_at.desc())\
-                .limit(limit)\
-                .all()
+        query = select(*_SESSION_COLUMNS)\
+            .where(PromptSession.user_id == user_id)\
+            .order_by(PromptSession.created_at.desc())\
+            .limit(limit)
 
-            # Expunge objects from session so they can be used after session closes
-            for sess in sessions:
-                session.expunge(sess)
-
-            return sessions
+        with DatabaseManager.get_session() as session:
+            return [SessionRow._make(row) for row in session.execute(query)]
 
     @staticmethod
-    def get_templates(role: Optional[str] = None, task_type: Optional[str] = None, is_public: bool = True) -> List[PromptTemplate]:
-        """Get templates with optional filtering"""
-        with DatabaseManager.get_session() as session:
-            query = session.query(PromptTemplate).filter_by(is_public=is_public)
+    def get_templates(role: Optional[str] = None, task_type: Optional[str] = None, is_public: bool = True) -> List[TemplateRow]:
+        """Get templates with optional filtering (cached until the next template write)"""
+        def load() -> List[TemplateRow]:
+            query = select(*_TEMPLATE_COLUMNS).where(PromptTemplate.is_public == is_public)
 
             if role:
-                query = query.filter_by(role=role)
+                query = query.where(PromptTemplate.role == role)
             if task_type:
-                query = query.filter_by(task_type=task_type)
+                query = query.where(PromptTemplate.task_type == task_type)
 
-            templates = query.order_by(PromptTemplate.uses_count.desc()).all()
+            query = query.order_by(PromptTemplate.uses_count.desc())
 
-            # Expunge objects from session so they can be used after session closes
-            for template in templates:
-                session.expunge(template)
+            with DatabaseManager.get_session() as session:
+                return [TemplateRow._make(row) for row in session.execute(query)]
 
-            return templates
+        return list(_template_cache.get((role, task_type, is_public), load))
 
     @staticmethod
     def create_template(
@@ -308,35 +878,242 @@ class DatabaseManager:
             )
             session.add(template)
             session.flush()
+            _template_cache.invalidate(session)
             session.expunge(template)
             return template
 
     @staticmethod
-    def get_workflows(workflow_type: Optional[str] = None) -> List[Workflow]:
-        """Get workflows"""
-        with DatabaseManager.get_session() as session:
-            query = session.query(Workflow).filter_by(is_public=True)
+    def get_workflows(workflow_type: Optional[str] = None) -> List[WorkflowRow]:
+        """Get workflows (cached until the next workflow write)"""
+        def load() -> List[WorkflowRow]:
+            query = select(*_WORKFLOW_COLUMNS).where(Workflow.is_public == True)  # noqa: E712
 
             if workflow_type:
-                query = query.filter_by(workflow_type=workflow_type)
+                query = query.where(Workflow.workflow_type == workflow_type)
 
-            workflows = query.all()
+            with DatabaseManager.get_session() as session:
+                return [WorkflowRow._make(row) for row in session.execute(query)]
 
-            # Access all attributes to load them before session closes
-            for workflow in workflows:
-                _ = workflow.name
-                _ = workflow.description
-                _ = workflow.workflow_type
-                _ = workflow.role
-                _ = workflow.field
-                _ = workflow.steps
-                _ = workflow.is_public
-                _ = workflow.created_at
+        return list(_workflow_cache.get(workflow_type, load))
 
-            # Make objects independent of session
-            session.expunge_all()
+    @staticmethod
+    def search_templates(
+        query: str,
+        limit: int = 20,
+        role: Optional[str] = None,
+        task_type: Optional[str] = None,
+        is_public: bool = True
+    ) -> List[TemplateSearchHit]:
+        """
+        Full-text search over template name, description, prompt and tags
+
+        Args:
+            query: Free-text search terms (all must match; last one as a prefix)
+            limit: Maximum number of hits
+            role: Optional role filter
+            task_type: Optional task type filter
+            is_public: Search public or private templates
 
-            return workflows
+        Returns:
+            Hits ordered by BM25 relevance, with a highlighted snippet
+            (very broad queries rank only the newest Config.SEARCH_RANK_WINDOW matches)
+        """
+        match = _fts_query(query)
+        if not match:
+            return []
+
+        params = {'match': match, 'is_public': is_public, 'limit': limit, 'window': Config.SEARCH_RANK_WINDOW}
+        filters = " AND t.is_public = :is_public"
+        if role:
+            filters += " AND t.role = :role"
+            params['role'] = role
+        if task_type:
+            filters += " AND t.task_type = :task_type"
+            params['task_type'] = task_type
+
+        # Rank on (rowid, rank) alone, then fetch columns for the top hits only;
+        # CROSS JOIN pins the join order so phase two seeks by primary key
+        join = "CROSS JOIN prompt_templates t ON t.id = prompt_templates_fts.rowid"
+        sql = f"""
+            WITH top AS (
+                SELECT prompt_templates_fts.rowid AS id, {_TEMPLATE_BM25} AS rank
+                FROM prompt_templates_fts
+                JOIN prompt_templates t ON t.id = prompt_templates_fts.rowid
+                WHERE prompt_templates_fts MATCH :match
+                  AND prompt_templates_fts.rowid > {_fts_window('prompt_templates_fts', join, filters)}{filters}
+                ORDER BY rank
+                LIMIT :limit
+            )
+            SELECT t.id, t.name, t.description, t.role, t.task_type, t.base_prompt, t.tags, top.rank
+            FROM top
+            CROSS JOIN prompt_templates t ON t.id = top.id
+            ORDER BY top.rank
+        """
+
+        with DatabaseManager.get_session() as session:
+            return [
+                TemplateSearchHit(
+                    id=row.id,
+                    name=row.name,
+                    description=row.description,
+                    role=row.role,
+                    task_type=row.task_type,
+                    snippet=_snippet([row.name, row.description, row.base_prompt, row.tags], query),
+                    rank=row.rank
+                )
+                for row in session.execute(text(sql), params)
+            ]
+
+    @staticmethod
+    def search_history(
+        query: str,
+        user_id: Optional[int] = None,
+        limit: int = 20,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> List[SessionSearchHit]:
+        """
+        Full-text search over past raw prompts
+
+        Args:
+            query: Free-text search terms (all must match; last one as a prefix)
+            user_id: Restrict to one user's sessions
+            limit: Maximum number of hits
+            since: Only sessions created at or after this time
+            until: Only sessions created before this time
+
+        Returns:
+            Hits ordered by BM25 relevance, with a highlighted snippet
+            (very broad queries rank only the newest Config.SEARCH_RANK_WINDOW matches)
+        """
+        match = _fts_query(query)
+        if not match:
+            return []
+
+        params = {'match': match, 'limit': limit, 'window': Config.SEARCH_RANK_WINDOW}
+        typed_params = []
+        filters = ""
+        if user_id is not None:
+            filters += " AND s.user_id = :user_id"
+            params['user_id'] = user_id
+        if since is not None:
+            filters += " AND s.created_at >= :since"
+            params['since'] = since
+            typed_params.append(bindparam('since', type_=DateTime))
+        if until is not None:
+            filters += " AND s.created_at < :until"
+            params['until'] = until
+            typed_params.append(bindparam('until', type_=DateTime))
+
+        join = "CROSS JOIN prompt_sessions s ON s.id = prompt_sessions_fts.rowid" if filters else ""
+        lower_bound = _fts_window('prompt_sessions_fts', join, filters)
+        if since is not None:
+            # Ids grow with created_at too, so the date also bounds the rowid range
+            lower_bound = (
+                f"max({lower_bound}, "
+                f"(SELECT coalesce(min(id), 1) - 1 FROM prompt_sessions WHERE created_at >= :since))"
+            )
+        filters = f" AND prompt_sessions_fts.rowid > {lower_bound}" + filters
+        sql = f"""
+            WITH top AS (
+                SELECT prompt_sessions_fts.rowid AS id, bm25(prompt_sessions_fts) AS rank
+                FROM prompt_sessions_fts
+                {join}
+                WHERE prompt_sessions_fts MATCH :match{filters}
+                ORDER BY rank
+                LIMIT :limit
+            )
+            SELECT s.id, s.user_id, s.role, s.task_type, s.raw_prompt, s.created_at, top.rank
+            FROM top
+            CROSS JOIN prompt_sessions s ON s.id = top.id
+            ORDER BY top.rank
+        """
+
+        stmt = text(sql).bindparams(*typed_params).columns(created_at=DateTime)
+        with DatabaseManager.get_session() as session:
+            return [
+                SessionSearchHit(
+                    id=row.id,
+                    user_id=row.user_id,
+                    role=row.role,
+                    task_type=row.task_type,
+                    snippet=_snippet([row.raw_prompt], query, size=16),
+                    created_at=row.created_at,
+                    rank=row.rank
+                )
+                for row in session.execute(stmt, params)
+            ]
+
+    @staticmethod
+    def apply_usage_deltas(
+        template_uses: Dict[int, int],
+        template_ratings: Dict[int, tuple],
+        version_copies: set,
+        version_ratings: Dict[int, int]
+    ):
+        """
+        Apply coalesced counter deltas in one transaction (see core.counters)
+
+        Each counter is advanced in SQL (`uses_count = uses_count + :n`), so
+        concurrent writers never lose increments, and template ratings move
+        as a running average from (sum, count) deltas without touching versions.
+
+        Args:
+            template_uses: template_id -> number of uses to add
+            template_ratings: template_id -> (sum of stars, number of ratings)
+            version_copies: version ids to mark as copied
+            version_ratings: version_id -> latest star rating
+        """
+        templates = PromptTemplate.__table__
+        versions = PromptVersion.__table__
+        rating_count = func.coalesce(templates.c.rating_count, 0)
+
+        with DatabaseManager.get_session() as session:
+            if template_uses:
+                session.execute(
+                    update(templates)
+                    .where(templates.c.id == bindparam('tid'))
+                    .values(
+                        uses_count=func.coalesce(templates.c.uses_count, 0) + bindparam('n'),
+                        updated_at=templates.c.updated_at
+                    ),
+                    [{'tid': tid, 'n': n} for tid, n in template_uses.items()]
+                )
+            if template_ratings:
+                session.execute(
+                    update(templates)
+                    .where(templates.c.id == bindparam('tid'))
+                    .values(
+                        rating=(func.coalesce(templates.c.rating, 0.0) * rating_count + bindparam('total'))
+                        / (rating_count + bindparam('n')),
+                        rating_count=rating_count + bindparam('n'),
+                        updated_at=templates.c.updated_at
+                    ),
+                    [{'tid': tid, 'total': float(total), 'n': n} for tid, (total, n) in template_ratings.items()]
+                )
+            if version_copies:
+                session.execute(
+                    update(versions)
+                    .where(versions.c.id.in_(version_copies))
+                    .values(was_copied=True)
+                )
+            if version_ratings:
+                session.execute(
+                    update(versions)
+                    .where(versions.c.id == bindparam('vid'))
+                    .values(was_rated=True, rating=bindparam('stars')),
+                    [{'vid': vid, 'stars': stars} for vid, stars in version_ratings.items()]
+                )
+            if template_uses or template_ratings:
+                # Listings are ordered by uses_count
+                _template_cache.invalidate(session)
+
+    @staticmethod
+    def invalidate_read_caches():
+        """Drop cached template and workflow listings in every process"""
+        with DatabaseManager.get_session() as session:
+            _template_cache.invalidate(session)
+            _workflow_cache.invalidate(session)
 
     @staticmethod
     def save_preferences(user_preferences, session_key: str = "default") -> UserPreferenceRecord:
@@ -427,774 +1204,521 @@ class DatabaseManager:
             }
 
 
-# Initialize database on import
-DatabaseManager.init_db()
+    @staticmethod
+    def apply_preference_deltas(
+        session_key: str,
+        deltas: Dict[Tuple[str, str], int],
+        at: Optional[datetime] = None,
+        half_life_days: Optional[float] = None
+    ):
+        """
+        Add counter deltas to a stored preference profile and the fleet rollups
 
+        One upsert per changed counter (`count = count + excluded.count`), so a
+        click costs a single row write instead of rewriting the JSON profile.
+        The decayed score advances in the same upsert: the stored score is
+        decayed from its updated_at to `at`, then the delta is added (a delta
+        older than the row is decayed instead). The same deltas advance the
+        hourly and daily usage_rollups rows.
 
-# ==================== SEED DATA ====================
+        Args:
+            session_key: Session identifier
+            deltas: (kind, key) -> amount to add
+            at: When the events happened (UTC, default now)
+            half_life_days: Age at which an event's score halves
+                (default: Config.PREFERENCE_HALF_LIFE_DAYS; 0 disables decay)
+        """
+        if not deltas:
+            return
+
+        at = at or datetime.utcnow()
+        half_life = Config.PREFERENCE_HALF_LIFE_DAYS if half_life_days is None else half_life_days
+        stmt = _upsert(PreferenceCounter)
+        stored = PreferenceCounter.updated_at
+        newer = or_(stored.is_(None), stmt.excluded.updated_at >= stored)
+        score = func.coalesce(PreferenceCounter.score, PreferenceCounter.count)
+        if half_life:
+            score = case(
+                (newer, score * _halvings(stmt.excluded.updated_at, stored, half_life) + stmt.excluded.score),
+                else_=score + stmt.excluded.score * _halvings(stored, stmt.excluded.updated_at, half_life)
+            )
+        else:
+            score = score + stmt.excluded.score
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['session_key', 'kind', 'key'],
+            set_={
+                'count': PreferenceCounter.count + stmt.excluded.count,
+                'score': score,
+                'updated_at': case((newer, stmt.excluded.updated_at), else_=stored)
+            }
+        )
+        rollup = _upsert(UsageRollup)
+        rollup = rollup.on_conflict_do_update(
+            index_elements=['granularity', 'bucket', 'kind', 'key'],
+            set_={'count': UsageRollup.count + rollup.excluded.count}
+        )
+        with DatabaseManager.get_session() as session:
+            session.execute(stmt, [
+                {'session_key': session_key, 'kind': kind, 'key': key, 'count': n, 'score': n, 'updated_at': at}
+                for (kind, key), n in deltas.items()
+            ])
+            session.execute(rollup, [
+                {'granularity': granularity, 'bucket': bucket, 'kind': kind, 'key': key, 'count': n}
+                for granularity, bucket in _rollup_buckets(at)
+                for (kind, key), n in deltas.items()
+            ])
 
-def seed_templates():
-    """Seed initial templates for 4 priority domains"""
-    templates = [
-        # ==================== ACADEMIC & RESEARCH ====================
-        {
-            "name": "Literature Review Starter",
-            "description": "Comprehensive template for beginning a literature review",
-            "role": "phd",
-            "task_type": "lit_review",
-            "field": "Computer Science",
-            "base_prompt": """I need to conduct a literature review on [TOPIC] in the field of [FIELD].
-
-Please help me:
-1. Identify key research questions and themes
-2. Suggest search strategies and keywords
-3. Outline a framework for organizing the findings
-4. Highlight recent influential papers (last 5 years)
-
-Context: I am a [ROLE] with [BACKGROUND KNOWLEDGE LEVEL] in this area.
-Target audience: [AUDIENCE]
-Scope: [TIME PERIOD / GEOGRAPHIC / THEMATIC SCOPE]""",
-            "tags": ["literature review", "research", "academic"]
-        },
-        {
-            "name": "Paper Summary Template",
-            "description": "Structured template for summarizing academic papers",
-            "role": "masters",
-            "task_type": "summary",
-            "field": "General",
-            "base_prompt": """Please provide a structured summary of the paper: [PAPER TITLE/DOI]
-
-Include:
-1. Main research question and objectives
-2. Methodology used
-3. Key findings and results
-4. Implications and contributions
-5. Limitations acknowledged by authors
-6. Potential areas for future research
-
-Target length: [WORD COUNT]
-Audience: [AUDIENCE LEVEL]""",
-            "tags": ["summary", "paper", "analysis"]
-        },
-        {
-            "name": "Reviewer Response Helper",
-            "description": "Template for responding to peer reviewer comments",
-            "role": "postdoc",
-            "task_type": "reviewer_reply",
-            "field": "General",
-            "base_prompt": """I received the following reviewer comment:
-
-[PASTE REVIEWER COMMENT]
-
-My current response approach: [YOUR INITIAL THOUGHTS]
-
-Please help me:
-1. Understand what the reviewer is truly asking for
-2. Craft a professional, respectful response
-3. Identify what changes (if any) are needed in the manuscript
-4. Ensure I address all parts of the comment
-
-Context: [PAPER TOPIC], [JOURNAL/CONFERENCE]""",
-            "tags": ["peer review", "response", "publishing"]
-        },
-
-        # ==================== MACHINE LEARNING & DATA SCIENCE ====================
-        {
-            "name": "ML Model Selection Guide",
-            "description": "Comprehensive template for selecting the right ML model",
-            "role": "ml_engineer",
-            "task_type": "model_selection",
-            "field": "Machine Learning",
-            "base_prompt": """I need to select an appropriate machine learning model for the following problem:
-
-Problem Type: [CLASSIFICATION / REGRESSION / CLUSTERING / etc.]
-Dataset Size: [NUMBER OF SAMPLES]
-Number of Features: [NUMBER]
-Data Characteristics: [BALANCED/IMBALANCED, CONTINUOUS/CATEGORICAL, etc.]
-
-Requirements:
-- Performance Goal: [ACCURACY/F1/RMSE TARGET]
-- Interpretability: [HIGH/MEDIUM/LOW]
-- Latency Constraints: [REAL-TIME / BATCH]
-- Training Time Constraints: [IF ANY]
-
-Please recommend:
-1. Top 3 model architectures to consider
-2. Pros/cons of each for my specific case
-3. Baseline model to start with
-4. Key hyperparameters to tune
-5. Evaluation strategy""",
-            "tags": ["ml", "model selection", "data science"]
-        },
-        {
-            "name": "Feature Engineering Assistant",
-            "description": "Template for systematic feature engineering",
-            "role": "data_scientist",
-            "task_type": "feature_eng",
-            "field": "Data Science",
-            "base_prompt": """I need help with feature engineering for a [PROBLEM TYPE] problem.
-
-Current Features:
-[LIST YOUR CURRENT FEATURES]
-
-Target Variable: [DESCRIBE TARGET]
-
-Domain Context: [DESCRIBE THE DOMAIN - e.g., finance, healthcare, etc.]
-
-Please suggest:
-1. Feature transformations (scaling, encoding, etc.)
-2. Feature interactions to explore
-3. Domain-specific features based on the context
-4. Feature selection strategies
-5. How to handle missing values and outliers
-6. Dimensionality reduction techniques if applicable""",
-            "tags": ["feature engineering", "ml", "data preprocessing"]
-        },
-        {
-            "name": "Hyperparameter Tuning Strategy",
-            "description": "Template for efficient hyperparameter optimization",
-            "role": "ml_engineer",
-            "task_type": "hyperparameter",
-            "field": "Machine Learning",
-            "base_prompt": """I need to tune hyperparameters for a [MODEL NAME] model.
-
-Current Setup:
-- Model: [MODEL TYPE]
-- Dataset Size: [NUMBER OF SAMPLES]
-- Compute Resources: [GPU/CPU, TIME CONSTRAINTS]
-- Current Performance: [BASELINE METRICS]
-
-Please help me:
-1. Identify the most important hyperparameters to tune
-2. Suggest reasonable search ranges for each
-3. Recommend search strategy (Grid/Random/Bayesian)
-4. Design cross-validation approach
-5. Propose a tuning budget (iterations/time)
-6. Suggest stopping criteria""",
-            "tags": ["hyperparameter tuning", "optimization", "ml"]
-        },
-        {
-            "name": "Model Deployment Checklist",
-            "description": "Production deployment readiness template",
-            "role": "ml_engineer",
-            "task_type": "model_deploy",
-            "field": "MLOps",
-            "base_prompt": """I'm preparing to deploy a [MODEL TYPE] model to production.
-
-Deployment Context:
-- Expected Traffic: [REQUESTS PER SECOND]
-- Latency Requirement: [MS]
-- Infrastructure: [CLOUD PROVIDER / ON-PREM]
-- Serving Pattern: [BATCH / REAL-TIME / STREAMING]
-
-Please provide:
-1. Pre-deployment checklist (testing, validation, etc.)
-2. Model serving recommendations (TF Serving, FastAPI, etc.)
-3. Monitoring strategy (metrics to track, alerts)
-4. Rollback plan and A/B testing approach
-5. Data drift detection setup
-6. Performance optimization tips
-7. Documentation requirements""",
-            "tags": ["deployment", "mlops", "production"]
-        },
-        {
-            "name": "Exploratory Data Analysis (EDA) Framework",
-            "description": "Systematic approach to EDA",
-            "role": "data_analyst",
-            "task_type": "eda",
-            "field": "Data Analysis",
-            "base_prompt": """I need to perform EDA on a dataset for a [PROJECT TYPE] project.
-
-Dataset Info:
-- Size: [ROWS × COLUMNS]
-- Target Variable: [IF SUPERVISED LEARNING]
-- Data Types: [NUMERICAL, CATEGORICAL, TEXT, etc.]
-- Known Issues: [MISSING DATA, OUTLIERS, etc.]
-
-Please guide me through:
-1. Initial data quality checks
-2. Univariate analysis (distributions, summary stats)
-3. Bivariate/multivariate analysis
-4. Correlation analysis
-5. Outlier detection strategies
-6. Missing data patterns
-7. Key visualizations to create
-8. Insights to look for specific to [DOMAIN]""",
-            "tags": ["eda", "data analysis", "visualization"]
-        },
-
-        # ==================== PYTHON & PROGRAMMING ====================
-        {
-            "name": "Python Function with Best Practices",
-            "description": "Template for writing production-quality Python functions",
-            "role": "software_dev",
-            "task_type": "refactoring",
-            "field": "Python",
-            "base_prompt": """I need to write a Python function that [DESCRIBE FUNCTIONALITY].
-
-Requirements:
-- Input: [DESCRIBE INPUTS WITH TYPES]
-- Output: [DESCRIBE EXPECTED OUTPUT]
-- Edge Cases: [LIST ANY KNOWN EDGE CASES]
-- Python Version: [3.8, 3.9, 3.10, etc.]
-
-Please provide:
-1. Clean, well-documented function with type hints
-2. Comprehensive docstring (Google or NumPy style)
-3. Error handling for edge cases
-4. Example usage
-5. Suggested unit tests (pytest format)
-6. Any performance considerations""",
-            "tags": ["python", "clean code", "best practices"]
-        },
-        {
-            "name": "Debug Python Code",
-            "description": "Systematic debugging template",
-            "role": "software_dev",
-            "task_type": "debugging",
-            "field": "Python",
-            "base_prompt": """I'm encountering a bug in my Python code.
-
-Error/Issue:
-[PASTE ERROR MESSAGE OR DESCRIBE THE PROBLEM]
-
-Code:
-```python
-[PASTE YOUR CODE HERE]
-```
-
-Expected Behavior: [WHAT SHOULD HAPPEN]
-Actual Behavior: [WHAT ACTUALLY HAPPENS]
-Python Version: [VERSION]
-Dependencies: [LIST RELEVANT PACKAGES]
-
-Please help me:
-1. Identify the root cause of the issue
-2. Explain why the error occurs
-3. Provide a fix with explanation
-4. Suggest how to prevent similar issues
-5. Recommend debugging strategies for future""",
-            "tags": ["debugging", "python", "troubleshooting"]
-        },
-        {
-            "name": "Code Refactoring Guide",
-            "description": "Template for refactoring legacy Python code",
-            "role": "software_dev",
-            "task_type": "refactoring",
-            "field": "Software Engineering",
-            "base_prompt": """I need to refactor the following Python code:
-
-```python
-[PASTE CODE TO REFACTOR]
-```
-
-Refactoring Goals:
-- [ ] Improve readability
-- [ ] Better performance
-- [ ] Add type hints
-- [ ] Follow PEP 8
-- [ ] Improve error handling
-- [ ] Better naming conventions
-
-Please provide:
-1. Refactored version with explanations
-2. Key improvements made
-3. Performance comparison (if applicable)
-4. Tests to ensure functionality is preserved
-5. Migration strategy if breaking changes""",
-            "tags": ["refactoring", "clean code", "python"]
-        },
-        {
-            "name": "Python Testing Strategy",
-            "description": "Comprehensive testing approach template",
-            "role": "software_dev",
-            "task_type": "testing",
-            "field": "Software Testing",
-            "base_prompt": """I need to create a testing strategy for [DESCRIBE YOUR CODE/MODULE].
-
-Code Context:
-- Module Purpose: [DESCRIPTION]
-- Key Functions/Classes: [LIST MAIN COMPONENTS]
-- Dependencies: [EXTERNAL LIBRARIES]
-- Complexity: [SIMPLE / MODERATE / COMPLEX]
-
-Please help me design:
-1. Unit test structure (pytest)
-2. Test cases to cover (happy path, edge cases, errors)
-3. Mocking strategy for external dependencies
-4. Fixtures and test data setup
-5. Coverage goals and how to achieve them
-6. Integration test approach
-7. CI/CD integration recommendations""",
-            "tags": ["testing", "pytest", "quality assurance"]
-        },
-        {
-            "name": "Performance Optimization Guide",
-            "description": "Template for optimizing slow Python code",
-            "role": "software_dev",
-            "task_type": "performance",
-            "field": "Performance Optimization",
-            "base_prompt": """I need to optimize the performance of this Python code:
-
-```python
-[PASTE CODE HERE]
-```
-
-Performance Issues:
-- Current Runtime: [TIME]
-- Expected Runtime: [TARGET TIME]
-- Dataset Size: [IF APPLICABLE]
-- Bottleneck: [IF KNOWN]
-
-Please analyze and suggest:
-1. Profiling approach (cProfile, line_profiler)
-2. Algorithmic improvements
-3. Data structure optimizations
-4. Vectorization opportunities (NumPy/Pandas)
-5. Caching strategies
-6. Parallelization possibilities
-7. Memory optimization tips""",
-            "tags": ["performance", "optimization", "python"]
-        },
-
-        # ==================== TIME SERIES & FORECASTING ====================
-        {
-            "name": "Time Series Forecasting Setup",
-            "description": "Complete template for starting a forecasting project",
-            "role": "data_scientist",
-            "task_type": "forecast_setup",
-            "field": "Time Series",
-            "base_prompt": """I need to forecast [WHAT YOU'RE FORECASTING] using time series analysis.
-
-Data Characteristics:
-- Frequency: [HOURLY / DAILY / WEEKLY / MONTHLY / etc.]
-- History Length: [NUMBER OF PERIODS]
-- Patterns Observed: [TREND / SEASONALITY / CYCLES]
-- Forecast Horizon: [HOW FAR AHEAD]
-- Update Frequency: [HOW OFTEN TO RETRAIN]
-
-Please guide me through:
-1. Data preparation and cleaning steps
-2. Stationarity testing and transformation
-3. Train/validation/test split strategy
-4. Baseline model selection
-5. Feature engineering for time series
-6. Evaluation metrics appropriate for my use case
-7. Cross-validation approach for time series""",
-            "tags": ["forecasting", "time series", "prediction"]
-        },
-        {
-            "name": "ARIMA vs LSTM Model Selection",
-            "description": "Choosing between classical and deep learning approaches",
-            "role": "data_scientist",
-            "task_type": "model_select",
-            "field": "Forecasting",
-            "base_prompt": """I'm deciding between ARIMA and LSTM for my forecasting problem.
-
-Problem Details:
-- Data Frequency: [FREQUENCY]
-- History Length: [NUMBER OF POINTS]
-- Forecast Horizon: [STEPS AHEAD]
-- Data Patterns: [LINEAR/NON-LINEAR, SEASONAL, etc.]
-- Computational Resources: [LIMITED / MODERATE / AMPLE]
-- Interpretability Need: [HIGH / MEDIUM / LOW]
-
-Please help me:
-1. Compare ARIMA and LSTM for my specific case
-2. Recommend which to try first
-3. Outline implementation steps for recommended model
-4. Suggest hybrid approaches if applicable
-5. Identify when to use each model type
-6. Provide evaluation strategy""",
-            "tags": ["arima", "lstm", "model selection"]
-        },
-        {
-            "name": "Seasonality Decomposition Guide",
-            "description": "Template for analyzing seasonal patterns",
-            "role": "data_analyst",
-            "task_type": "seasonality",
-            "field": "Time Series Analysis",
-            "base_prompt": """I need to analyze and handle seasonality in my time series data.
-
-Data Info:
-- Series: [WHAT YOU'RE MEASURING]
-- Frequency: [DATA FREQUENCY]
-- Suspected Seasonality: [DAILY / WEEKLY / MONTHLY / YEARLY]
-- Data Span: [TIME PERIOD]
-
-Please help me:
-1. Decompose the series (additive vs multiplicative)
-2. Identify seasonal patterns and strength
-3. Extract seasonal components
-4. Remove seasonality for modeling (if needed)
-5. Visualize seasonal patterns
-6. Handle multiple seasonal patterns if present
-7. Validate seasonality statistically""",
-            "tags": ["seasonality", "decomposition", "time series"]
-        },
-        {
-            "name": "Anomaly Detection in Time Series",
-            "description": "Template for detecting outliers and anomalies",
-            "role": "data_scientist",
-            "task_type": "anomaly_detect",
-            "field": "Anomaly Detection",
-            "base_prompt": """I need to detect anomalies in my time series data.
-
-Context:
-- Data Type: [WHAT YOU'RE MONITORING]
-- Frequency: [DATA FREQUENCY]
-- Anomaly Types Expected: [SPIKES / DROPS / LEVEL SHIFTS / etc.]
-- Real-time vs Batch: [DETECTION MODE]
-- False Positive Tolerance: [HIGH / MEDIUM / LOW]
-
-Please guide me on:
-1. Appropriate anomaly detection methods
-2. Statistical vs ML-based approaches
-3. Threshold setting strategies
-4. Handling seasonality in detection
-5. Distinguishing anomalies from changepoints
-6. Evaluation metrics for anomaly detection
-7. Alert system design""",
-            "tags": ["anomaly detection", "outliers", "monitoring"]
-        },
-        {
-            "name": "Multivariate Forecasting Template",
-            "description": "Template for forecasting with multiple variables",
-            "role": "data_scientist",
-            "task_type": "multivariate",
-            "field": "Advanced Forecasting",
-            "base_prompt": """I need to forecast [TARGET VARIABLE] using multiple input variables.
-
-Variables:
-- Target: [TARGET VARIABLE]
-- Exogenous Variables: [LIST PREDICTOR VARIABLES]
-- Relationships: [KNOWN CORRELATIONS OR DEPENDENCIES]
-- Data Frequency: [FREQUENCY]
-- Forecast Horizon: [STEPS AHEAD]
-
-Please help me with:
-1. Exploratory analysis of variable relationships
-2. Causality testing (Granger causality)
-3. Model selection (VAR, VARMAX, Prophet with regressors, ML models)
-4. Feature engineering for multivariate series
-5. Handling different variable frequencies
-6. Cross-validation approach
-7. Interpreting variable contributions""",
-            "tags": ["multivariate", "forecasting", "exogenous variables"]
-        }
-    ]
+    @staticmethod
+    def get_fleet_usage(
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        granularity: str = 'day'
+    ) -> Dict:
+        """
+        Usage across all users, read from the rollup tables
 
-    for template_data in templates:
-        try:
-            DatabaseManager.create_template(**template_data)
-        except Exception:
-            pass  # Template might already exist
-
-
-def seed_workflows():
-    """Seed domain-specific workflows for 4 priority domains"""
-    from sqlalchemy.orm import Session
-
-    workflows = [
-        # ==================== ACADEMIC WORKFLOWS ====================
-        {
-            "name": "Complete Literature Review",
-            "description": "Step-by-step workflow for conducting a comprehensive literature review",
-            "workflow_type": "lit_review",
-            "role": "phd",
-            "field": "General",
-            "steps": [
-                {
-                    "step": 1,
-                    "name": "Define Research Questions",
-                    "prompt_template": "Help me formulate clear research questions for a literature review on [TOPIC]"
-                },
-                {
-                    "step": 2,
-                    "name": "Develop Search Strategy",
-                    "prompt_template": "Create a comprehensive search strategy including keywords, databases, and Boolean operators for [RESEARCH QUESTIONS]"
-                },
-                {
-                    "step": 3,
-                    "name": "Screen and Select Papers",
-                    "prompt_template": "Help me develop inclusion/exclusion criteria for screening papers on [TOPIC]"
-                },
-                {
-                    "step": 4,
-                    "name": "Extract Key Information",
-                    "prompt_template": "What information should I extract from each paper for my review on [TOPIC]? Suggest a data extraction template."
-                },
-                {
-                    "step": 5,
-                    "name": "Synthesize Findings",
-                    "prompt_template": "Help me synthesize findings from [NUMBER] papers on [TOPIC]. Key themes: [THEMES]"
-                }
-            ]
-        },
-
-        # ==================== ML/DS WORKFLOWS ====================
-        {
-            "name": "End-to-End ML Project",
-            "description": "Complete workflow for building and deploying an ML model",
-            "workflow_type": "ml_project",
-            "role": "data_scientist",
-            "field": "Machine Learning",
-            "steps": [
-                {
-                    "step": 1,
-                    "name": "Problem Definition & Data Understanding",
-                    "prompt_template": "Help me define the ML problem: [BUSINESS PROBLEM]. What type of ML task is this? What data do I need?"
-                },
-                {
-                    "step": 2,
-                    "name": "Exploratory Data Analysis",
-                    "prompt_template": "Guide me through EDA for this dataset: [DESCRIBE DATASET]. What should I look for?"
-                },
-                {
-                    "step": 3,
-                    "name": "Feature Engineering",
-                    "prompt_template": "Suggest feature engineering strategies for: [DESCRIBE DATA AND TARGET]. What features should I create?"
-                },
-                {
-                    "step": 4,
-                    "name": "Model Selection & Training",
-                    "prompt_template": "Recommend 3 models to try for [PROBLEM TYPE] with [DATA CHARACTERISTICS]. Help me set up training pipeline."
-                },
-                {
-                    "step": 5,
-                    "name": "Hyperparameter Tuning",
-                    "prompt_template": "Guide me through hyperparameter tuning for [MODEL]. What parameters should I tune and what ranges?"
-                },
-                {
-                    "step": 6,
-                    "name": "Model Evaluation & Validation",
-                    "prompt_template": "Help me evaluate [MODEL] for [PROBLEM]. What metrics should I use? How to validate properly?"
-                },
-                {
-                    "step": 7,
-                    "name": "Deployment Preparation",
-                    "prompt_template": "Guide me through deployment prep: model serving, monitoring, documentation for [MODEL]"
-                }
-            ]
-        },
-        {
-            "name": "Data Science Investigation",
-            "description": "Workflow for exploratory data analysis and insights discovery",
-            "workflow_type": "data_analysis",
-            "role": "data_analyst",
-            "field": "Data Science",
-            "steps": [
-                {
-                    "step": 1,
-                    "name": "Business Question Framing",
-                    "prompt_template": "Help me translate this business question into data analysis tasks: [BUSINESS QUESTION]"
-                },
-                {
-                    "step": 2,
-                    "name": "Data Collection & Cleaning",
-                    "prompt_template": "Guide me through data cleaning for: [DESCRIBE DATA AND QUALITY ISSUES]"
-                },
-                {
-                    "step": 3,
-                    "name": "Statistical Analysis",
-                    "prompt_template": "What statistical tests should I run to answer: [QUESTION]? Guide me through the analysis."
-                },
-                {
-                    "step": 4,
-                    "name": "Visualization Strategy",
-                    "prompt_template": "Suggest visualizations to communicate [FINDINGS] to [AUDIENCE]"
-                },
-                {
-                    "step": 5,
-                    "name": "Insight Synthesis",
-                    "prompt_template": "Help me synthesize insights from this analysis: [SUMMARIZE FINDINGS]"
-                }
-            ]
-        },
-
-        # ==================== PYTHON WORKFLOWS ====================
-        {
-            "name": "Python Package Development",
-            "description": "Complete workflow for creating a production-ready Python package",
-            "workflow_type": "package_dev",
-            "role": "software_dev",
-            "field": "Python",
-            "steps": [
-                {
-                    "step": 1,
-                    "name": "Project Setup & Structure",
-                    "prompt_template": "Help me set up a Python package structure for: [PACKAGE PURPOSE]. Include setup.py, directory structure, etc."
-                },
-                {
-                    "step": 2,
-                    "name": "Core Implementation",
-                    "prompt_template": "Guide me through implementing [CORE FUNCTIONALITY] with clean code practices"
-                },
-                {
-                    "step": 3,
-                    "name": "Testing Strategy",
-                    "prompt_template": "Create comprehensive testing strategy for [PACKAGE]. Include unit tests, integration tests, fixtures."
-                },
-                {
-                    "step": 4,
-                    "name": "Documentation",
-                    "prompt_template": "Help me create documentation: README, API docs, examples for [PACKAGE]"
-                },
-                {
-                    "step": 5,
-                    "name": "CI/CD Setup",
-                    "prompt_template": "Guide me through CI/CD setup: GitHub Actions, testing, linting, coverage for Python package"
-                },
-                {
-                    "step": 6,
-                    "name": "Package Distribution",
-                    "prompt_template": "Help me prepare for PyPI distribution: versioning, build, upload process"
-                }
-            ]
-        },
-        {
-            "name": "Code Refactoring Project",
-            "description": "Systematic workflow for refactoring legacy Python code",
-            "workflow_type": "refactoring",
-            "role": "software_dev",
-            "field": "Software Engineering",
-            "steps": [
-                {
-                    "step": 1,
-                    "name": "Code Assessment",
-                    "prompt_template": "Analyze this code and identify refactoring opportunities: [CODE]"
-                },
-                {
-                    "step": 2,
-                    "name": "Write Tests First",
-                    "prompt_template": "Help me write comprehensive tests for existing behavior before refactoring: [CODE]"
-                },
-                {
-                    "step": 3,
-                    "name": "Incremental Refactoring",
-                    "prompt_template": "Guide me through refactoring [COMPONENT]. What should I refactor first?"
-                },
-                {
-                    "step": 4,
-                    "name": "Add Type Hints",
-                    "prompt_template": "Help me add type hints to this code: [CODE]"
-                },
-                {
-                    "step": 5,
-                    "name": "Performance Optimization",
-                    "prompt_template": "Identify and fix performance bottlenecks in: [CODE]"
-                },
-                {
-                    "step": 6,
-                    "name": "Documentation Update",
-                    "prompt_template": "Update documentation to reflect refactored code: [CHANGES MADE]"
-                }
-            ]
-        },
-
-        # ==================== TIME SERIES WORKFLOWS ====================
-        {
-            "name": "Time Series Forecasting Project",
-            "description": "Complete workflow for building a forecasting model",
-            "workflow_type": "forecasting",
-            "role": "data_scientist",
-            "field": "Time Series",
-            "steps": [
-                {
-                    "step": 1,
-                    "name": "Problem & Data Understanding",
-                    "prompt_template": "Help me understand my forecasting problem: [WHAT TO FORECAST], frequency: [FREQUENCY], horizon: [HORIZON]"
-                },
-                {
-                    "step": 2,
-                    "name": "Data Preprocessing",
-                    "prompt_template": "Guide me through time series preprocessing: handling missing data, outliers for [DATA DESCRIPTION]"
-                },
-                {
-                    "step": 3,
-                    "name": "Exploratory Time Series Analysis",
-                    "prompt_template": "Help me analyze: trend, seasonality, stationarity for [TIME SERIES]"
-                },
-                {
-                    "step": 4,
-                    "name": "Feature Engineering for Time Series",
-                    "prompt_template": "Suggest time series features: lags, rolling stats, seasonal indicators for [PROBLEM]"
-                },
-                {
-                    "step": 5,
-                    "name": "Model Selection & Training",
-                    "prompt_template": "Recommend forecasting models for [DATA CHARACTERISTICS]. Compare ARIMA, Prophet, LSTM, etc."
-                },
-                {
-                    "step": 6,
-                    "name": "Cross-Validation",
-                    "prompt_template": "Design time series cross-validation strategy for [MODEL] with [DATA LENGTH]"
-                },
-                {
-                    "step": 7,
-                    "name": "Evaluation & Diagnostics",
-                    "prompt_template": "Help me evaluate forecast quality: metrics, residual analysis for [MODEL]"
-                },
-                {
-                    "step": 8,
-                    "name": "Production Forecasting",
-                    "prompt_template": "Guide me through production setup: retraining schedule, monitoring, drift detection for [FORECAST]"
-                }
-            ]
-        },
-        {
-            "name": "Anomaly Detection System",
-            "description": "Workflow for building a time series anomaly detection system",
-            "workflow_type": "anomaly_detection",
-            "role": "data_scientist",
-            "field": "Anomaly Detection",
-            "steps": [
-                {
-                    "step": 1,
-                    "name": "Define Normal Behavior",
-                    "prompt_template": "Help me characterize normal behavior in [TIME SERIES]. What patterns are expected?"
-                },
-                {
-                    "step": 2,
-                    "name": "Anomaly Type Identification",
-                    "prompt_template": "What types of anomalies should I detect in [CONTEXT]? Point anomalies, contextual, collective?"
-                },
-                {
-                    "step": 3,
-                    "name": "Method Selection",
-                    "prompt_template": "Recommend anomaly detection methods for [TIME SERIES TYPE]. Statistical vs ML approaches?"
-                },
-                {
-                    "step": 4,
-                    "name": "Threshold Tuning",
-                    "prompt_template": "Guide me through threshold selection to balance false positives/negatives for [USE CASE]"
-                },
-                {
-                    "step": 5,
-                    "name": "Validation Strategy",
-                    "prompt_template": "How to validate anomaly detection without labeled data for [SCENARIO]?"
-                },
-                {
-                    "step": 6,
-                    "name": "Alert System Design",
-                    "prompt_template": "Design alert system: severity levels, notification strategy for [MONITORING CONTEXT]"
-                }
+        Args:
+            since: Include buckets starting at or after this time (UTC)
+            until: Include buckets starting before this time (UTC)
+            granularity: Bucket size the range is resolved to (hour or day)
+
+        Returns:
+            Dictionary shaped like UserPreferences.get_usage_stats()
+        """
+        query = select(UsageRollup.kind, UsageRollup.key, func.sum(UsageRollup.count))\
+            .where(UsageRollup.granularity == granularity)\
+            .group_by(UsageRollup.kind, UsageRollup.key)
+        if since:
+            query = query.where(UsageRollup.bucket >= since)
+        if until:
+            query = query.where(UsageRollup.bucket < until)
+
+        with DatabaseManager.get_session() as session:
+            rows = session.execute(query).all()
+
+        totals: Dict[str, Dict[str, int]] = {}
+        for kind, key, count in rows:
+            totals.setdefault(kind, {})[key] = int(count)
+
+        domains = totals.get('domain_usage', {})
+        versions = totals.get('version_usage', {})
+        combinations = sorted(totals.get('combinations', {}).items(), key=lambda item: -item[1])
+        total_optimizations = sum(domains.values())
+
+        stats = {
+            'total_optimizations': total_optimizations,
+            'domains': domains,
+            'roles': totals.get('role_usage', {}),
+            'tasks': totals.get('task_usage', {}),
+            'versions': versions,
+            'top_combinations': [
+                dict(zip(('domain', 'role', 'task'), key.split('|')), count=count)
+                for key, count in combinations[:5]
             ]
         }
-    ]
-
-    with SessionLocal() as session:
-        for workflow_data in workflows:
-            existing = session.query(Workflow).filter_by(name=workflow_data["name"]).first()
-            if not existing:
-                workflow = Workflow(**workflow_data)
-                session.add(workflow)
-        session.commit()
-
-
-# Seed on first run
-try:
-    seed_templates()
-    seed_workflows()
-except Exception:
-    pass  # Tables might not exist yet
+        if total_optimizations > 0:
+            stats['domain_percentages'] = {
+                domain: (count / total_optimizations) * 100 for domain, count in domains.items()
+            }
+            version_total = sum(versions.values())
+            stats['version_percentages'] = {
+                version: (count / version_total) * 100 for version, count in versions.items()
+            } if version_total else {}
+        return stats
+
+    @staticmethod
+    def get_usage_timeseries(
+        kind: str = 'domain_usage',
+        granularity: str = 'day',
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> List[Tuple[datetime, str, int]]:
+        """
+        Fleet-wide counts per bucket for one counter kind
+
+        Returns:
+            (bucket start, key, count) tuples in bucket order
+        """
+        query = select(UsageRollup.bucket, UsageRollup.key, UsageRollup.count)\
+            .where(UsageRollup.granularity == granularity, UsageRollup.kind == kind)\
+            .order_by(UsageRollup.bucket, UsageRollup.key)
+        if since:
+            query = query.where(UsageRollup.bucket >= since)
+        if until:
+            query = query.where(UsageRollup.bucket < until)
+
+        with DatabaseManager.get_session() as session:
+            return [tuple(row) for row in session.execute(query)]
+
+    @staticmethod
+    def load_preference_counters(session_key: str) -> Optional[Dict]:
+        """
+        Load the counters stored by apply_preference_deltas
+
+        Args:
+            session_key: Session identifier
+
+        Returns:
+            {'counters': {kind: {key: count}}, 'scores': {kind: {key: decayed score}},
+            'updated_at': {kind: {key: datetime}}, 'last_updated': datetime} or None
+        """
+        with DatabaseManager.get_session() as session:
+            rows = session.execute(
+                select(
+                    PreferenceCounter.kind, PreferenceCounter.key, PreferenceCounter.count,
+                    PreferenceCounter.score, PreferenceCounter.updated_at
+                ).where(PreferenceCounter.session_key == session_key)
+            ).all()
+
+        if not rows:
+            return None
+
+        counters: Dict[str, Dict[str, int]] = {}
+        scores: Dict[str, Dict[str, float]] = {}
+        updated_at: Dict[str, Dict[str, datetime]] = {}
+        for kind, key, count, score, at in rows:
+            counters.setdefault(kind, {})[key] = count
+            scores.setdefault(kind, {})[key] = count if score is None else score
+            if at is not None:
+                updated_at.setdefault(kind, {})[key] = at
+        return {
+            'counters': counters,
+            'scores': scores,
+            'updated_at': updated_at,
+            'last_updated': max((row.updated_at for row in rows if row.updated_at), default=None)
+        }
+
+    @staticmethod
+    def clear_preference_counters(session_key: str):
+        """Delete every stored counter of a preference profile"""
+        with DatabaseManager.get_session() as session:
+            session.query(PreferenceCounter).filter_by(session_key=session_key).delete()
+
+
+    @staticmethod
+    def log_llm_labels(source: str, text: str, labels: Dict[str, Any]):
+        """Store labels an LLM returned for a prompt"""
+        with DatabaseManager.get_session() as session:
+            session.execute(insert(LLMLabel).values(source=source, text=text, labels=labels))
+
+    @staticmethod
+    def get_llm_labels(source: str, limit: Optional[int] = None) -> List[Tuple[str, Dict]]:
+        """
+        Logged (text, labels) pairs of one source, newest first
+
+        Args:
+            source: Label source (smart_analyzer, prompt_agent)
+            limit: Maximum number of pairs
+        """
+        query = select(LLMLabel.text, LLMLabel.labels)\
+            .where(LLMLabel.source == source)\
+            .order_by(LLMLabel.id.desc())\
+            .limit(limit)
+        with DatabaseManager.get_session() as session:
+            return [(row.text, row.labels) for row in session.execute(query)]
+
+    # ==================== TOKEN USAGE ====================
+
+    @staticmethod
+    def record_llm_usage(records: List[Any]):
+        """Store usage records (core.usage.UsageRecord) in one statement"""
+        with DatabaseManager.get_session() as session:
+            session.execute(insert(LLMUsage), [record._asdict() for record in records])
+
+    @staticmethod
+    def get_llm_usage(
+        group_by: Tuple[str, ...] = ('stage', 'model'),
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        request_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        user_id: Optional[int] = None,
+        stage: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Token usage summed per group, most expensive first
+
+        Args:
+            group_by: Any of request_id, session_id, user_id, stage, model, day
+            since: Include calls at or after this time (UTC)
+            until: Include calls before this time (UTC)
+            request_id, session_id, user_id, stage: Only these calls
+
+        Returns:
+            {group columns..., calls, prompt_tokens, completion_tokens,
+            total_tokens, cost_usd, estimated_calls} per group
+        """
+        columns = {name: getattr(LLMUsage, name) for name in ('request_id', 'session_id', 'user_id', 'stage', 'model')}
+        columns['day'] = func.date(LLMUsage.created_at)
+        unknown = set(group_by) - set(columns)
+        if unknown:
+            raise ValueError(f"Cannot group usage by {', '.join(sorted(unknown))} (choose from {', '.join(columns)})")
+
+        keys = [columns[name].label(name) for name in group_by]
+        cost = func.sum(LLMUsage.cost_usd)
+        query = select(
+            *keys,
+            func.count().label('calls'),
+            func.sum(LLMUsage.prompt_tokens).label('prompt_tokens'),
+            func.sum(LLMUsage.completion_tokens).label('completion_tokens'),
+            cost.label('cost_usd'),
+            func.sum(cast(LLMUsage.estimated, Integer)).label('estimated_calls'),
+        ).group_by(*keys).order_by(func.coalesce(cost, 0).desc(), func.count().desc())
+        for name, value in (('request_id', request_id), ('session_id', session_id),
+                            ('user_id', user_id), ('stage', stage)):
+            if value is not None:
+                query = query.where(columns[name] == value)
+        if since:
+            query = query.where(LLMUsage.created_at >= since)
+        if until:
+            query = query.where(LLMUsage.created_at < until)
+
+        with DatabaseManager.get_session() as session:
+            rows = session.execute(query).all()
+        return [
+            dict(row._asdict(),
+                 prompt_tokens=int(row.prompt_tokens or 0),
+                 completion_tokens=int(row.completion_tokens or 0),
+                 total_tokens=int((row.prompt_tokens or 0) + (row.completion_tokens or 0)),
+                 estimated_calls=int(row.estimated_calls or 0))
+            for row in rows
+        ]
+
+    # ==================== JOBS ====================
+
+    @staticmethod
+    def enqueue_job(
+        kind: str,
+        prompts: List[str],
+        options: Optional[Dict[str, Any]] = None,
+        user_id: Optional[int] = None,
+        priority: int = 0,
+        max_attempts: Optional[int] = None
+    ) -> int:
+        """Queue a job over `prompts` for the worker processes; returns its id"""
+        with DatabaseManager.get_session() as session:
+            return session.execute(insert(Job).values(
+                kind=kind,
+                payload={'prompts': list(prompts), 'options': options or {}},
+                user_id=user_id,
+                priority=priority,
+                max_attempts=max_attempts or Config.JOB_MAX_ATTEMPTS,
+                progress_total=len(prompts)
+            )).inserted_primary_key[0]
+
+    @staticmethod
+    def lease_job(owner: str, lease_seconds: float, kinds: Optional[List[str]] = None) -> Optional[JobLease]:
+        """
+        Lease the next job: the highest priority queued one, or one whose lease expired
+
+        Leasing is a conditional UPDATE, so of several workers racing for a
+        job exactly one gets it. Jobs whose worker died max_attempts times fail.
+
+        Args:
+            owner: Worker id, required to record progress while the lease lasts
+            lease_seconds: Visibility timeout; extended with every finished prompt
+            kinds: Only lease these job kinds
+        """
+        now = datetime.utcnow()
+        expired = and_(Job.status == 'running', Job.lease_expires_at < now)
+        available = or_(Job.status == 'queued', expired)
+        with DatabaseManager.get_session() as session:
+            session.execute(
+                update(Job)
+                .where(expired, Job.attempts >= Job.max_attempts)
+                .values(status='failed', finished_at=now, lease_owner=None,
+                        error='Lease expired on every attempt (worker crashed or stalled)')
+            )
+            query = select(Job.id).where(available)
+            if kinds:
+                query = query.where(Job.kind.in_(kinds))
+            candidates = session.execute(query.order_by(Job.priority.desc(), Job.id).limit(5)).scalars().all()
+            for job_id in candidates:
+                claimed = session.execute(
+                    update(Job)
+                    .where(Job.id == job_id, available)
+                    .values(status='running', lease_owner=owner, attempts=Job.attempts + 1,
+                            lease_expires_at=now + timedelta(seconds=lease_seconds),
+                            started_at=func.coalesce(Job.started_at, now))
+                ).rowcount
+                if claimed:
+                    row = session.execute(
+                        select(Job.id, Job.kind, Job.payload, Job.user_id, Job.progress_done, Job.attempts)
+                        .where(Job.id == job_id)
+                    ).one()
+                    return JobLease._make(row)
+        return None
+
+    @staticmethod
+    def record_job_item(
+        job_id: int,
+        owner: str,
+        item: int,
+        lease_seconds: float,
+        session_fields: Optional[Dict[str, Any]] = None,
+        versions: Optional[Dict[str, str]] = None
+    ) -> Optional[int]:
+        """
+        Store the result of prompt `item` and advance the job's progress, in one transaction
+
+        Without session_fields the prompt is counted as failed. Also extends
+        the lease. Returns the PromptSession id (None for a failed prompt).
+
+        Raises:
+            JobLeaseLost: `owner` no longer holds the job; nothing is written
+        """
+        now = datetime.utcnow()
+        with DatabaseManager.get_session() as session:
+            advanced = session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.lease_owner == owner, Job.status == 'running',
+                       Job.progress_done == item)
+                .values(progress_done=item + 1,
+                        failed_items=Job.failed_items + (0 if session_fields else 1),
+                        lease_expires_at=now + timedelta(seconds=lease_seconds))
+            ).rowcount
+            if not advanced:
+                raise JobLeaseLost(f"Job {job_id} is no longer leased by {owner}")
+            if not session_fields:
+                return None
+            prompt_session = PromptSession(job_id=job_id, job_item=item, **session_fields)
+            session.add(prompt_session)
+            session.flush()
+            if versions:
+                session.execute(insert(PromptVersion), [
+                    {'session_id': prompt_session.id, 'label': label, 'optimized_prompt': prompt}
+                    for label, prompt in versions.items()
+                ])
+            return prompt_session.id
+
+    @staticmethod
+    def finish_job(job_id: int, owner: str, status: str = 'done',
+                   result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> bool:
+        """Mark a leased job done or failed; False if `owner` lost the lease"""
+        with DatabaseManager.get_session() as session:
+            return bool(session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.lease_owner == owner, Job.status == 'running')
+                .values(status=status, result=result, error=error, lease_owner=None,
+                        lease_expires_at=None, finished_at=datetime.utcnow())
+            ).rowcount)
+
+    @staticmethod
+    def release_job(job_id: int, owner: str) -> bool:
+        """Hand a leased job back to the queue unfinished (worker shutting down)"""
+        with DatabaseManager.get_session() as session:
+            return bool(session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.lease_owner == owner, Job.status == 'running')
+                .values(status='queued', lease_owner=None, lease_expires_at=None,
+                        attempts=Job.attempts - 1)  # Not the job's fault
+            ).rowcount)
+
+    @staticmethod
+    def cancel_job(job_id: int) -> bool:
+        """Cancel a queued or running job (a running one stops after its current prompt)"""
+        with DatabaseManager.get_session() as session:
+            return bool(session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status.in_(['queued', 'running']))
+                .values(status='cancelled', lease_owner=None, lease_expires_at=None,
+                        finished_at=datetime.utcnow())
+            ).rowcount)
+
+    @staticmethod
+    def get_job(job_id: int) -> Optional[JobRow]:
+        """Status and progress of a job"""
+        with DatabaseManager.get_session() as session:
+            row = session.execute(select(*_JOB_COLUMNS).where(Job.id == job_id)).first()
+            return JobRow._make(row) if row else None
+
+    @staticmethod
+    def get_jobs(status: Optional[str] = None, limit: int = 50) -> List[JobRow]:
+        """Most recent jobs, optionally of one status"""
+        query = select(*_JOB_COLUMNS).order_by(Job.id.desc()).limit(limit)
+        if status:
+            query = query.where(Job.status == status)
+        with DatabaseManager.get_session() as session:
+            return [JobRow._make(row) for row in session.execute(query)]
+
+    @staticmethod
+    def get_job_results(job_id: int, offset: int = 0, limit: Optional[int] = None) -> List[JobItemResult]:
+        """
+        Sessions a job wrote, by prompt position, with their optimized versions
+
+        Args:
+            job_id: Job id
+            offset: First prompt position
+            limit: Maximum number of results
+        """
+        sessions = select(PromptSession.id, PromptSession.job_item, PromptSession.raw_prompt)\
+            .where(PromptSession.job_id == job_id, PromptSession.job_item >= offset)\
+            .order_by(PromptSession.job_item)\
+            .limit(limit)
+        with DatabaseManager.get_session() as session:
+            rows = session.execute(sessions).all()
+            versions: Dict[int, Dict[str, str]] = {row.id: {} for row in rows}
+            if rows:
+                for session_id, label, prompt in session.execute(
+                    select(PromptVersion.session_id, PromptVersion.label, PromptVersion.optimized_prompt)
+                    .where(PromptVersion.session_id.in_(list(versions)))
+                    .order_by(PromptVersion.id)
+                ):
+                    versions[session_id][label] = prompt
+            return [JobItemResult(row.job_item, row.id, row.raw_prompt, versions[row.id]) for row in rows]
+
+
+# ==================== SEED DATA ====================
+
+SEED_DATA_PATH = Path(__file__).with_name('seed_data.json')
+
+
+def _load_seed_data() -> Dict[str, List[Dict]]:
+    with open(SEED_DATA_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _insert_missing(session: Session, model, rows: List[Dict], now: datetime) -> int:
+    """
+    Insert rows whose name is not already taken, in one executemany statement
+
+    Portable INSERT ... SELECT ... WHERE NOT EXISTS keyed on the natural key
+    (name among shared, ownerless rows), so re-running the seed never duplicates.
+    """
+    table = model.__table__
+    columns = [c for c in table.columns if c.name != 'id']
+    key_filter = table.c.name == bindparam('name')
+    if 'owner_id' in table.c:
+        key_filter = key_filter & table.c.owner_id.is_(None)
+
+    stmt = insert(table).from_select(
+        [c.name for c in columns],
+        select(*[bindparam(c.name, type_=c.type) for c in columns])
+        .where(~select(table.c.id).where(key_filter).exists())
+    )
+    defaults = {c.name: None for c in columns}
+    defaults.update(is_public=True, created_at=now)
+    if model is PromptTemplate:
+        defaults.update(uses_count=0, rating=0.0, rating_count=0, updated_at=now)
+
+    return session.execute(stmt, [{**defaults, **row} for row in rows]).rowcount
+
+
+def seed_database(session: Session) -> Dict[str, int]:
+    """
+    Bulk-insert built-in templates and workflows from seed_data.json
+
+    Returns:
+        Number of rows added per table
+    """
+    seed = _load_seed_data()
+    now = datetime.utcnow()
+    added = {
+        'templates': _insert_missing(session, PromptTemplate, seed['templates'], now),
+        'workflows': _insert_missing(session, Workflow, seed['workflows'], now),
+    }
+    if added['templates']:
+        _template_cache.invalidate(session)
+    if added['workflows']:
+        _workflow_cache.invalidate(session)
+    return added
@@ -0,0 +1,134 @@
+"""
+Request Deadlines - One time budget for every stage of a request
+A chat request runs analysis, template generation and evaluation back to back;
+a Deadline set at the entry point is shared by all of them. Each LLM call gets
+the remaining budget as its HTTP timeout, and stages that cannot start in time
+degrade to local heuristics instead of making the user wait.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from core.config import Config
+
+_current: contextvars.ContextVar = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Not enough of the request's time budget left for another LLM call"""
+
+
+class Deadline:
+    """
+    Absolute end time of one request
+
+    Stages record in `degraded` where they fell back to heuristics because
+    of it, so callers can tell (and avoid caching) a reduced answer.
+    """
+
+    def __init__(self, seconds: float):
+        """
+        Initialize the deadline
+
+        Args:
+            seconds: Budget from now
+        """
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.degraded: List[str] = []
+
+    @classmethod
+    def from_config(cls) -> Optional["Deadline"]:
+        """Deadline of Config.REQUEST_DEADLINE_SECONDS from now, None if disabled (0)"""
+        if Config.REQUEST_DEADLINE_SECONDS <= 0:
+            return None
+        return cls(Config.REQUEST_DEADLINE_SECONDS)
+
+    def remaining(self) -> float:
+        """Seconds left (never negative)"""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def can_call(self) -> bool:
+        """Whether enough budget is left to start an LLM call"""
+        return self.remaining() >= Config.DEADLINE_MIN_CALL_SECONDS
+
+    def timeout(self) -> float:
+        """
+        HTTP timeout for the next LLM call: the remaining budget
+
+        Raises:
+            DeadlineExceeded: Less than Config.DEADLINE_MIN_CALL_SECONDS left
+        """
+        remaining = self.remaining()
+        if remaining < Config.DEADLINE_MIN_CALL_SECONDS:
+            raise DeadlineExceeded(f"{remaining:.2f} s left of a {self.seconds:g} s budget")
+        return remaining
+
+    def mark_degraded(self, stage: str):
+        if stage not in self.degraded:
+            self.degraded.append(stage)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline of the request running in this context, if any"""
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline] = None) -> Iterator[Optional[Deadline]]:
+    """
+    Make a deadline current for the calls inside the block
+
+    Nested scopes keep the earlier of the two deadlines, so a stage cannot
+    extend its caller's budget. Without a deadline and outside any scope,
+    Deadline.from_config() applies.
+
+    Yields:
+        The deadline in effect (None when deadlines are disabled)
+    """
+    outer = _current.get()
+    if deadline is None:
+        deadline = outer or Deadline.from_config()
+    elif outer is not None and outer.expires_at < deadline.expires_at:
+        deadline = outer
+
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def request_options() -> Dict:
+    """
+    Keyword arguments for Gemini's generate_content() under the current deadline
+
+    Returns:
+        {'request_options': {'timeout': seconds}}, or {} outside a deadline
+
+    Raises:
+        DeadlineExceeded: Too little budget left to start the call
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return {}
+    return {'request_options': {'timeout': deadline.timeout()}}
+
+
+def note_degraded(stage: str) -> bool:
+    """
+    Record that `stage` fell back because the current deadline ran out
+
+    Returns:
+        True if it did (False if there is no deadline or budget remains,
+        i.e. the fallback had another cause)
+    """
+    deadline = _current.get()
+    if deadline is None or deadline.can_call():
+        return False
+    deadline.mark_degraded(stage)
+    return True
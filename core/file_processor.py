@@ -2,6 +2,7 @@
 File Processor - Handles various file types for the AI Prompt Agent
 Supports: PDF, Documents, Images, Code files, Audio
 """
+import hashlib
 import io
 import os
 import tempfile
@@ -9,6 +10,10 @@ from typing import Optional, Tuple
 from pathlib import Path
 import google.generativeai as genai
 from core.config import Config
+from core.shared_cache import get_shared_cache
+from core.llm import call_model
+from core.profiling import profiled
+from core.tracing import annotate, traced
 
 
 class FileProcessor:
@@ -43,6 +48,8 @@ class FileProcessor:
         """Check if file type is supported"""
         return self.get_file_type(filename) != "unknown"
 
+    @traced('file_processor.process_file')
+    @profiled('file_processor.process_file')
     def process_file(self, uploaded_file) -> Tuple[str, str]:
         """
         Process uploaded file and extract content
@@ -55,6 +62,7 @@ class FileProcessor:
         """
         filename = uploaded_file.name
         file_type = self.get_file_type(filename)
+        annotate(file_type=file_type)
 
         try:
             if file_type == "documents":
@@ -74,6 +82,7 @@ class FileProcessor:
         except Exception as e:
             return f"Error processing file: {str(e)}", "error"
 
+    @traced('file_processor.document')
     def _process_document(self, uploaded_file, filename: str) -> str:
         """Process document files (PDF, TXT, MD, DOC)"""
         ext = Path(filename).suffix.lower()
@@ -111,6 +120,7 @@ class FileProcessor:
 
         return "Unsupported document format"
 
+    @traced('file_processor.code')
     def _process_code(self, uploaded_file) -> str:
         """Process code files"""
         try:
@@ -122,6 +132,7 @@ class FileProcessor:
         except Exception as e:
             return f"Error reading code file: {str(e)}"
 
+    @traced('file_processor.image')
     def _process_image(self, uploaded_file) -> str:
         """Process images using Gemini Vision"""
         try:
@@ -141,14 +152,15 @@ class FileProcessor:
 
 Provide a comprehensive description that captures all relevant information."""
 
-            response = self.vision_model.generate_content([prompt, image])
-            return response.text
+            return self._cached_analysis('image', image_data, prompt,
+                                         lambda: call_model('file_processor.image', self.vision_model, [prompt, image]).text)
 
         except ImportError:
             return "Image processing requires Pillow package"
         except Exception as e:
             return f"Error analyzing image: {str(e)}"
 
+    @traced('file_processor.audio')
     def _process_audio(self, uploaded_file) -> str:
         """Process audio files - transcribe to text"""
         try:
@@ -181,11 +193,20 @@ Provide a comprehensive description that captures all relevant information."""
         try:
             # For PDFs and documents, use Gemini's file handling
             content = uploaded_file.read()
-            response = self.vision_model.generate_content([prompt, {"mime_type": "application/pdf", "data": content}])
-            return response.text
+            return self._cached_analysis('pdf', content, prompt, lambda: call_model(
+                'file_processor.pdf', self.vision_model, [prompt, {"mime_type": "application/pdf", "data": content}]
+            ).text)
         except Exception as e:
             return f"Analysis failed: {str(e)}"
 
+    def _cached_analysis(self, kind: str, data: bytes, prompt: str, analyze) -> str:
+        """Gemini's analysis of a file, shared by every worker process that sees the same bytes"""
+        shared = get_shared_cache()
+        if shared is None:
+            return analyze()
+        key = (hashlib.sha256(data).hexdigest(), prompt)
+        return shared.get_or_compute(f'file_processor.{kind}', key, analyze)
+
 
 class VoiceProcessor:
     """Process voice input from Streamlit's audio_input"""
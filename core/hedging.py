@@ -0,0 +1,224 @@
+"""
+Hedged Requests - Keep one slow provider call from setting the tail latency
+If the primary LLM call has not answered by its usual high-percentile latency,
+a backup request goes to another model or provider (or the same one again);
+the first valid answer wins. Per-target latency histograms set the hedge delay.
+"""
+import bisect
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.config import Config
+from core.deadline import DeadlineExceeded
+
+# Histogram bucket upper bounds: 10 ms to ~10 minutes, 15% apart
+_BOUNDS = [0.01 * 1.15 ** i for i in range(int(math.log(60000) / math.log(1.15)) + 2)]
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram (seconds)
+
+    Fixed buckets 15% apart keep percentiles within 15% of the true value
+    at constant memory, however many calls are recorded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(_BOUNDS) + 1)
+        self.count = 0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(_BOUNDS, seconds)] += 1
+            self.count += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Upper bound of the bucket holding the p-th percentile (0-100), None if empty"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = math.ceil(self.count * p / 100)
+            seen = 0
+            for i, n in enumerate(self._counts):
+                seen += n
+                if seen >= rank:
+                    return _BOUNDS[i] if i < len(_BOUNDS) else float("inf")
+        return None
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {
+            'count': self.count,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99)
+        }
+
+
+class Hedger:
+    """
+    Races a primary call against delayed backups
+
+    Attempts are (target, fn) pairs, primary first. Each backup is sent once
+    the attempts before it have been running for the hedge delay of the
+    previous target (its Config.HEDGE_PERCENTILE latency), or right away if
+    they all failed. The first result that passes `validate` is returned.
+
+    Python threads cannot be interrupted: a losing call is cancelled if it
+    has not started, otherwise left to finish in the background, where its
+    latency still feeds the histogram.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or Config.HEDGE_MAX_WORKERS, thread_name_prefix="hedge"
+        )
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self.stats = {'calls': 0, 'hedged': 0, 'backup_wins': 0}
+
+    def histogram(self, target: str) -> LatencyHistogram:
+        with self._lock:
+            if target not in self._histograms:
+                self._histograms[target] = LatencyHistogram()
+            return self._histograms[target]
+
+    def hedge_delay(self, target: str) -> float:
+        """Seconds to wait on target before sending a backup"""
+        histogram = self.histogram(target)
+        if histogram.count < Config.HEDGE_MIN_SAMPLES:
+            return Config.HEDGE_DEFAULT_DELAY_SECONDS
+        delay = histogram.percentile(Config.HEDGE_PERCENTILE)
+        return min(max(delay, Config.HEDGE_MIN_DELAY_SECONDS), Config.HEDGE_MAX_DELAY_SECONDS)
+
+    def call(
+        self,
+        attempts: List[Tuple[str, Callable[[], Any]]],
+        validate: Optional[Callable[[Any], bool]] = None,
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Run the primary attempt, hedging with the backups
+
+        Args:
+            attempts: (target, fn) pairs, primary first
+            validate: Results it rejects count as failures
+            timeout: Seconds to wait for a valid result in total (the
+                request's remaining deadline); attempts still running
+                are abandoned after it
+
+        Returns:
+            The first valid result
+
+        Raises:
+            DeadlineExceeded: No valid result within `timeout`
+            The last attempt's exception if none produced a valid result
+        """
+        with self._lock:
+            self.stats['calls'] += 1
+
+        pending: Dict[Future, int] = {}
+        last_error: Optional[BaseException] = None
+        launched = 0
+
+        def launch():
+            nonlocal launched
+            target, fn = attempts[launched]
+            pending[self._executor.submit(self._timed, target, fn)] = launched
+            launched += 1
+
+        launch()
+        give_up = None if timeout is None else time.monotonic() + timeout
+        hedge_at = time.monotonic() + self.hedge_delay(attempts[0][0])
+        try:
+            while pending:
+                now = time.monotonic()
+                if give_up is not None and now >= give_up:
+                    raise DeadlineExceeded(f"No valid response within {timeout:.1f} s")
+                # Wake up for the next hedge or the deadline, whichever is first
+                wake_at = [t for t in (hedge_at if launched < len(attempts) else None, give_up) if t is not None]
+                wait_for = max(min(wake_at) - now, 0) if wake_at else None
+                done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if validate is None or validate(result):
+                        if index > 0:
+                            with self._lock:
+                                self.stats['backup_wins'] += 1
+                        return result
+                    last_error = ValueError(f"Invalid response from {attempts[index][0]}")
+
+                # Hedge when the delay has passed, or at once if everything in flight failed
+                if launched < len(attempts) and (not pending or time.monotonic() >= hedge_at):
+                    previous = attempts[launched - 1][0]
+                    launch()
+                    with self._lock:
+                        self.stats['hedged'] += 1
+                    hedge_at = time.monotonic() + self.hedge_delay(previous)
+        finally:
+            for future in pending:
+                future.cancel()
+
+        raise last_error if last_error else RuntimeError("No attempts to run")
+
+    def report(self, extra: Optional[Dict[str, LatencyHistogram]] = None) -> str:
+        """
+        Plain-text latency percentiles per target, plus hedge counts
+
+        Args:
+            extra: Other named histograms to list first (never used for hedge delays)
+        """
+        with self._lock:
+            histograms = dict(self._histograms)
+            stats = dict(self.stats)
+        lines = [
+            f"{stats['calls']} calls, {stats['hedged']} hedged, {stats['backup_wins']} won by a backup"
+        ] if stats['calls'] else []
+        for target, histogram in list((extra or {}).items()) + sorted(histograms.items()):
+            s = histogram.summary()
+            if s['count']:
+                lines.append(
+                    f"  {target:<32} n {s['count']:>5}  p50 {s['p50']:6.2f} s  "
+                    f"p95 {s['p95']:6.2f} s  p99 {s['p99']:6.2f} s"
+                )
+        return "\n".join(lines)
+
+    def _timed(self, target: str, fn: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        result = fn()
+        self.histogram(target).record(time.perf_counter() - start)
+        return result
+
+
+def hedge_targets(primary: str) -> List[str]:
+    """
+    Targets to race for a "provider:model" primary
+
+    Config.HEDGE_BACKUPS lists backups (comma-separated "provider:model");
+    when it is empty the backup is the primary itself, sent again.
+    """
+    backups = [spec.strip() for spec in Config.HEDGE_BACKUPS.split(",") if spec.strip()]
+    return [primary] + (backups or [primary])
+
+
+# Global hedger instance
+_hedger: Optional[Hedger] = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger() -> Hedger:
+    """Get or create the process-wide hedger (shared worker pool and histograms)"""
+    global _hedger
+    if _hedger is None:
+        with _hedger_lock:
+            if _hedger is None:
+                _hedger = Hedger()
+    return _hedger
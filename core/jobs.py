@@ -0,0 +1,197 @@
+"""
+Jobs - Optimization batches that outlive the process that queued them
+A job is a list of prompts in the jobs table. Worker processes lease jobs
+(the lease is a visibility timeout: if a worker dies, another takes the job
+over once it expires), run each prompt through the pipeline and store the
+result as a PromptSession with its PromptVersions, committed together with
+the job's progress. A job taken over resumes at the first unfinished prompt.
+
+Scaling out is starting more workers against the same database:
+    python job_worker.py run --processes 4
+"""
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.config import Config
+from core.database import DatabaseManager, JobLease, JobLeaseLost
+from core.deadline import Deadline
+from core.metrics import start_metrics_server
+from core.usage import usage_scope
+
+# Errors kept in a finished job's result
+_MAX_ERRORS = 20
+
+# (PromptSession fields, {version label: prompt}, degraded stages)
+ItemResult = Tuple[Dict[str, Any], Dict[str, str], List[str]]
+
+_handlers: Dict[str, Callable[[str, Dict[str, Any]], ItemResult]] = {}
+
+
+def job_handler(kind: str) -> Callable:
+    """Register the function that runs one prompt of a `kind` job"""
+    def register(fn: Callable[[str, Dict[str, Any]], ItemResult]) -> Callable:
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+def _deadline(options: Dict[str, Any]) -> Optional[Deadline]:
+    seconds = options.get('deadline_seconds')
+    return Deadline(seconds) if seconds else None
+
+
+@job_handler('optimize')
+def _optimize(prompt: str, options: Dict[str, Any]) -> ItemResult:
+    """PromptEngine.smart_optimize: the analysis on the session, every version"""
+    from core.prompt_engine import get_prompt_engine
+
+    result = get_prompt_engine().smart_optimize(prompt, deadline=_deadline(options))
+    detection, analysis = result['detection'], result['analysis']
+    session = {
+        'role': detection['role'],
+        'task_type': detection['task'],
+        'field': detection['domain'],
+        'raw_prompt': prompt,
+        'intent': analysis.intent,
+        'clarity_score': analysis.clarity_score,
+        'safety_score': analysis.safety_score,
+        'risks': analysis.risks,
+        'missing_info': analysis.missing_info,
+        'suggestions': analysis.suggestions,
+    }
+    return session, dict(result['all_versions']), result.get('degraded', [])
+
+
+@job_handler('agent')
+def _agent(prompt: str, options: Dict[str, Any]) -> ItemResult:
+    """PromptAgent (scored, not deferred): one version named after its template"""
+    from core.prompt_agent import get_prompt_agent
+
+    result = get_prompt_agent().process_input_sync(prompt, deadline=_deadline(options), defer_evaluation=False)
+    session = {
+        'role': 'agent',
+        'task_type': result.task_type,
+        'field': result.domain,
+        'raw_prompt': prompt,
+        'intent': result.template_used,
+        'clarity_score': result.quality_score,
+        'suggestions': result.suggestions,
+    }
+    return session, {result.template_used: result.optimized_prompt}, result.metadata.get('degraded', [])
+
+
+def enqueue(kind: str, prompts: List[str], options: Optional[Dict[str, Any]] = None,
+            user_id: Optional[int] = None, priority: int = 0) -> int:
+    """Queue a job for the workers; returns its id"""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind '{kind}' (known: {', '.join(sorted(_handlers))})")
+    if not prompts:
+        raise ValueError("A job needs at least one prompt")
+    return DatabaseManager.enqueue_job(kind, prompts, options=options, user_id=user_id, priority=priority)
+
+
+class JobWorker:
+    """
+    Leases jobs one at a time and runs their prompts in order
+
+    `stop` ends the worker between prompts: the job it holds goes back to
+    the queue, without counting as a failed attempt.
+    """
+
+    def __init__(self, owner: Optional[str] = None, lease_seconds: Optional[float] = None,
+                 poll_seconds: Optional[float] = None, kinds: Optional[List[str]] = None):
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds or Config.JOB_LEASE_SECONDS
+        self.poll_seconds = poll_seconds or Config.JOB_POLL_SECONDS
+        self.kinds = kinds
+        self.stop = threading.Event()
+
+    def run(self):
+        """Work until stopped, polling while the queue is empty"""
+        while not self.stop.is_set():
+            if not self.run_once():
+                self.stop.wait(self.poll_seconds)
+
+    def run_once(self) -> bool:
+        """Lease and run one job; False if none was available"""
+        lease = DatabaseManager.lease_job(self.owner, self.lease_seconds, self.kinds)
+        if lease is None:
+            return False
+        try:
+            self._run(lease)
+        except JobLeaseLost:
+            pass  # Cancelled, or taken over after our lease expired: the new holder carries on
+        return True
+
+    def _run(self, lease: JobLease):
+        handler = _handlers.get(lease.kind)
+        if handler is None:
+            DatabaseManager.finish_job(lease.id, self.owner, 'failed', error=f"Unknown job kind '{lease.kind}'")
+            return
+
+        prompts, options = lease.payload['prompts'], lease.payload.get('options') or {}
+        errors: List[Dict[str, Any]] = []
+        fallbacks: Counter = Counter()
+        started = time.perf_counter()
+        for item in range(lease.progress_done, len(prompts)):
+            if self.stop.is_set():
+                DatabaseManager.release_job(lease.id, self.owner)
+                return
+            try:
+                # Each prompt is a request of its own, billed to the job and its owner
+                with usage_scope(session_id=f"job-{lease.id}", user_id=lease.user_id):
+                    session, versions, degraded = handler(prompts[item], options)
+            except Exception as e:
+                session, versions, degraded = None, None, []
+                if len(errors) < _MAX_ERRORS:
+                    errors.append({'item': item, 'error': f"{type(e).__name__}: {e}"})
+            fallbacks.update(degraded)
+            DatabaseManager.record_job_item(lease.id, self.owner, item, self.lease_seconds, session, versions)
+
+        DatabaseManager.finish_job(lease.id, self.owner, 'done', result={
+            # Of this worker's run (a job taken over after a crash also ran elsewhere before)
+            'errors': errors,
+            'fallback_stages': dict(fallbacks),
+            'elapsed_s': round(time.perf_counter() - started, 2),
+        })
+
+
+def _worker_process(kinds: Optional[List[str]], index: int = 0):
+    """Entry point of one worker process: SIGTERM/SIGINT stop it between prompts"""
+    start_metrics_server(offset=1 + index)  # METRICS_PORT itself is the app's
+    worker = JobWorker(kinds=kinds)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: worker.stop.set())
+    worker.run()
+
+
+def _interrupt(*_):
+    raise KeyboardInterrupt
+
+
+def run_workers(processes: Optional[int] = None, kinds: Optional[List[str]] = None):
+    """Run `processes` worker processes until interrupted"""
+    signal.signal(signal.SIGTERM, _interrupt)  # Stopping the parent stops the workers cleanly
+    # Spawned, not forked: each worker opens its own database connections and model clients
+    context = multiprocessing.get_context('spawn')
+    workers = [
+        context.Process(target=_worker_process, args=(kinds, i), name=f"job-worker-{i}")
+        for i in range(processes or Config.JOB_WORKERS)
+    ]
+    for p in workers:
+        p.start()
+    try:
+        for p in workers:
+            p.join()
+    except KeyboardInterrupt:
+        for p in workers:
+            p.terminate()  # SIGTERM: finish the current prompt, release the job
+        for p in workers:
+            p.join()
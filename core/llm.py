@@ -0,0 +1,191 @@
+"""
+LLM Calls - One entry point for text generation across providers
+Targets are "provider:model" strings, e.g. "gemini:gemini-2.5-flash" or
+"openai:gpt-4o", so callers (and hedged backups) can name any model.
+Every call is traced and its tokens are accounted to the calling stage;
+calls the provider rejects as rate limited are counted in the metrics.
+"""
+import contextvars
+import threading
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+import google.generativeai as genai
+import openai
+
+from core.config import Config
+from core.deadline import current_deadline
+from core.hedging import get_hedger, hedge_targets
+from core.metrics import count_rate_limited
+from core.tracing import span
+from core.usage import record_usage
+
+_lock = threading.Lock()
+_gemini_models: Dict[str, "genai.GenerativeModel"] = {}
+_openai_client = None
+
+
+def parse_target(target: str):
+    """("provider", "model") of a "provider:model" target"""
+    provider, _, model = target.partition(":")
+    if not model or provider not in ("gemini", "openai"):
+        raise ValueError(f"Unknown LLM target '{target}' (expected gemini:<model> or openai:<model>)")
+    return provider, model
+
+
+def model_target(model: Any) -> str:
+    """"provider:model" of a Gemini model object (targets are returned as they are)"""
+    if isinstance(model, str):
+        return model
+    name = str(getattr(model, 'model_name', type(model).__name__))
+    return f"gemini:{name[7:] if name.startswith('models/') else name}"
+
+
+def call_model(stage: str, model: Any, contents: Any, **options) -> Any:
+    """
+    model.generate_content(contents, **options), traced and with its tokens recorded
+
+    Args:
+        stage: Pipeline stage the tokens are accounted to, "<component>.<stage>"
+        model: Gemini model object
+        contents: Prompt text or content parts
+
+    Returns:
+        The Gemini response
+    """
+    target = model_target(model)
+    with span('llm', model=target, stage=stage) as call:
+        try:
+            response = model.generate_content(contents, **options)
+        except Exception as e:
+            count_rate_limited(target, e)
+            raise
+        _account(call, stage, target, contents, response)
+    return response
+
+
+def _account(call, stage: str, target: str, prompt: Any, response: Any, completion: Optional[str] = None):
+    usage = record_usage(stage, target, prompt, response, completion)
+    if usage is not None:
+        call.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+
+def generate(
+    target: str,
+    prompt: str,
+    system: Optional[str] = None,
+    generation_config: Optional[Dict] = None,
+    json_mode: bool = False,
+    timeout: Optional[float] = None,
+    stage: str = 'llm.generate'
+) -> str:
+    """
+    Text of one completion
+
+    Args:
+        target: "provider:model"
+        prompt: User message
+        system: System instructions (prepended to the prompt for Gemini)
+        generation_config: Gemini-style settings ('temperature', 'max_output_tokens')
+        json_mode: Ask OpenAI for a JSON object (Gemini prompts ask for JSON themselves)
+        timeout: HTTP timeout in seconds (default: the client's)
+        stage: Pipeline stage the tokens are accounted to
+
+    Returns:
+        Response text
+    """
+    provider, model = parse_target(target)
+    if provider == "gemini":
+        contents = f"{system}\n\n{prompt}" if system else prompt
+        options = {}
+        if generation_config:
+            options['generation_config'] = generation_config
+        if timeout is not None:
+            options['request_options'] = {'timeout': timeout}
+        return call_model(stage, _gemini_model(model), contents, **options).text
+
+    config = generation_config or {}
+    messages = ([{"role": "system", "content": system}] if system else []) + [{"role": "user", "content": prompt}]
+    kwargs = {
+        'model': model,
+        'messages': messages,
+        'temperature': config.get('temperature', Config.DEFAULT_TEMPERATURE),
+        'max_tokens': config.get('max_output_tokens', Config.DEFAULT_MAX_TOKENS)
+    }
+    if json_mode:
+        kwargs['response_format'] = {"type": "json_object"}
+    if timeout is not None:
+        kwargs['timeout'] = timeout
+    with span('llm', model=target, stage=stage) as call:
+        try:
+            response = _openai().chat.completions.create(**kwargs)
+        except Exception as e:
+            count_rate_limited(target, e)
+            raise
+        text = response.choices[0].message.content
+        _account(call, stage, target, [m['content'] for m in messages], response, text)
+    return text
+
+
+def generate_hedged(
+    target: str,
+    prompt: str,
+    primary: Optional[Callable[[], str]] = None,
+    validate: Optional[Callable[[str], bool]] = None,
+    **kwargs
+) -> str:
+    """
+    generate(), hedged with Config.HEDGE_BACKUPS when Config.HEDGE_ENABLED
+
+    Under a request deadline every call gets the remaining budget as its
+    timeout, and a hedged race is abandoned when the budget runs out. Every
+    attempt, won or lost, is traced and accounted to the caller's request.
+
+    Args:
+        target: "provider:model" of the primary call
+        prompt: User message
+        primary: Call to use for the primary instead of generate(target, ...)
+            (e.g. a model object the caller already holds)
+        validate: Responses it rejects lose the race (default: non-empty)
+        kwargs: Passed to generate() for every target
+
+    Returns:
+        The first valid response text
+
+    Raises:
+        DeadlineExceeded: Not enough of the request's deadline left
+    """
+    deadline = current_deadline()
+    if deadline is not None:
+        kwargs['timeout'] = deadline.timeout()
+    primary = primary or partial(generate, target, prompt, **kwargs)
+    if not Config.HEDGE_ENABLED:
+        return primary()
+
+    backups = hedge_targets(target)[1:]
+    attempts = [(target, primary)] + [
+        (backup, primary if backup == target else partial(generate, backup, prompt, **kwargs))
+        for backup in backups
+    ]
+    # Attempts run on the hedger's threads: each in a copy of this context (request, span)
+    return get_hedger().call(
+        [(t, partial(contextvars.copy_context().run, fn)) for t, fn in attempts],
+        validate=validate or (lambda text: bool(text and text.strip())),
+        timeout=deadline.remaining() if deadline is not None else None
+    )
+
+
+def _gemini_model(name: str):
+    # The API key is the one the caller passed to genai.configure()
+    with _lock:
+        if name not in _gemini_models:
+            _gemini_models[name] = genai.GenerativeModel(name)
+        return _gemini_models[name]
+
+
+def _openai():
+    global _openai_client
+    with _lock:
+        if _openai_client is None:
+            _openai_client = openai.OpenAI(api_key=openai.api_key or Config.OPENAI_API_KEY)
+        return _openai_client
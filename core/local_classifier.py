@@ -0,0 +1,279 @@
+"""
+Local Classifier - Hashed n-gram labels without an LLM round trip
+Predicts domain / role / task labels from prompt text with a NumPy linear model
+trained on labels the LLM assigned earlier (see train_classifier.py)
+"""
+import re
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import Config
+from core.tasks import submit_task, task
+
+_TOKEN_RE = re.compile(r"[a-z0-9_+#.]+")
+
+
+def hashed_features(text: str, n_features: int) -> np.ndarray:
+    """
+    Unique hashed unigram and bigram indices of a text (the hashing trick)
+
+    crc32 is used instead of hash() so indices are stable across processes.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    if not grams:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.fromiter(
+        (zlib.crc32(g.encode()) for g in grams), dtype=np.int64, count=len(grams)
+    ) % n_features)
+
+
+class HashedNgramClassifier:
+    """
+    Multinomial logistic regression over hashed n-grams, one softmax per head
+
+    Each head (e.g. "domain", "task") has its own label set. Weights are
+    stored as (n_features, labels) so a prediction gathers one row per
+    n-gram present: a few microseconds for a typical prompt.
+    """
+
+    def __init__(self, labels: Dict[str, List[str]], n_features: int = 2 ** 16):
+        """
+        Initialize an untrained classifier
+
+        Args:
+            labels: head -> ordered list of label names
+            n_features: Hash space size
+        """
+        self.labels = {head: list(names) for head, names in labels.items()}
+        self.n_features = n_features
+        self.weights = {
+            head: np.zeros((n_features, len(names)), dtype=np.float32) for head, names in self.labels.items()
+        }
+        self.bias = {head: np.zeros(len(names), dtype=np.float32) for head, names in self.labels.items()}
+
+    # ==================== TRAINING ====================
+
+    @classmethod
+    def fit(
+        cls,
+        texts: List[str],
+        targets: List[Dict[str, str]],
+        heads: List[str],
+        min_count: int = 3,
+        epochs: int = 8,
+        learning_rate: float = 0.5,
+        n_features: int = 2 ** 16,
+        seed: int = 0
+    ) -> 'HashedNgramClassifier':
+        """
+        Train with plain SGD on the cross-entropy of every head
+
+        Args:
+            texts: Prompt texts
+            targets: Per text, head -> label (missing heads are skipped)
+            heads: Heads to learn
+            min_count: Labels seen fewer times are not learned
+            epochs: Passes over the data
+            learning_rate: Initial step size (decays linearly)
+            n_features: Hash space size
+            seed: Shuffle seed
+
+        Returns:
+            Trained classifier
+        """
+        counts: Dict[str, Dict[str, int]] = {head: {} for head in heads}
+        for target in targets:
+            for head in heads:
+                label = normalize_label(target.get(head))
+                if label:
+                    counts[head][label] = counts[head].get(label, 0) + 1
+
+        model = cls({
+            head: sorted(label for label, n in counts[head].items() if n >= min_count) for head in heads
+        }, n_features=n_features)
+        index = {head: {label: i for i, label in enumerate(names)} for head, names in model.labels.items()}
+
+        examples = []
+        for text, target in zip(texts, targets):
+            ys = {
+                head: index[head].get(normalize_label(target.get(head)))
+                for head in heads if len(model.labels[head]) > 1
+            }
+            ys = {head: y for head, y in ys.items() if y is not None}
+            if ys:
+                examples.append((hashed_features(text, n_features), ys))
+
+        rng = np.random.default_rng(seed)
+        steps, step = epochs * len(examples), 0
+        for _ in range(epochs):
+            for i in rng.permutation(len(examples)):
+                features, ys = examples[i]
+                lr = learning_rate * (1.0 - step / max(steps, 1)) + 1e-3
+                step += 1
+                scale = 1.0 / np.sqrt(max(len(features), 1))
+                for head, y in ys.items():
+                    grad = model._softmax(head, features)
+                    grad[y] -= 1.0
+                    model.weights[head][features] -= (lr * scale) * grad
+                    model.bias[head] -= lr * grad
+        return model
+
+    # ==================== PREDICTION ====================
+
+    def predict(self, text: str) -> Dict[str, Tuple[str, float]]:
+        """
+        Most likely label of every head
+
+        Returns:
+            head -> (label, probability)
+        """
+        features = hashed_features(text, self.n_features)
+        result = {}
+        for head, names in self.labels.items():
+            if not names:
+                continue
+            probs = self._softmax(head, features)
+            best = int(probs.argmax())
+            result[head] = (names[best], float(probs[best]))
+        return result
+
+    def confidence(self, prediction: Dict[str, Tuple[str, float]]) -> float:
+        """Confidence of a whole prediction: that of its least certain head"""
+        return min((prob for _, prob in prediction.values()), default=0.0)
+
+    def evaluate(self, texts: List[str], targets: List[Dict[str, str]], threshold: float) -> Dict:
+        """
+        Accuracy against reference (LLM) labels
+
+        Returns:
+            Per-head accuracy, plus the share of texts answered locally at
+            `threshold` and the all-heads accuracy on that share
+        """
+        correct = {head: 0 for head in self.labels}
+        seen = {head: 0 for head in self.labels}
+        covered = covered_correct = 0
+
+        for text, target in zip(texts, targets):
+            prediction = self.predict(text)
+            all_right = True
+            for head, (label, _) in prediction.items():
+                expected = normalize_label(target.get(head))
+                if not expected:
+                    continue
+                seen[head] += 1
+                hit = label == expected
+                correct[head] += hit
+                all_right &= hit
+            if self.confidence(prediction) >= threshold:
+                covered += 1
+                covered_correct += all_right
+
+        return {
+            'examples': len(texts),
+            'accuracy': {head: correct[head] / seen[head] for head in self.labels if seen[head]},
+            'threshold': threshold,
+            'coverage': covered / len(texts) if texts else 0.0,
+            'covered_accuracy': covered_correct / covered if covered else None
+        }
+
+    def _softmax(self, head: str, features: np.ndarray) -> np.ndarray:
+        # Feature values are 1/sqrt(n) so long prompts don't saturate the softmax
+        z = self.weights[head][features].sum(axis=0) / np.sqrt(max(len(features), 1)) + self.bias[head]
+        z = np.exp(z - z.max())
+        return z / z.sum()
+
+    # ==================== PERSISTENCE ====================
+
+    def save(self, path: Path):
+        """Write the model to an .npz file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {'n_features': np.array(self.n_features), 'heads': np.array(list(self.labels))}
+        for head, names in self.labels.items():
+            arrays[f'labels/{head}'] = np.array(names, dtype=str)
+            arrays[f'weights/{head}'] = self.weights[head]
+            arrays[f'bias/{head}'] = self.bias[head]
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> 'HashedNgramClassifier':
+        """Read a model written by save()"""
+        with np.load(path) as data:
+            heads = [str(head) for head in data['heads']]
+            model = cls({head: [str(x) for x in data[f'labels/{head}']] for head in heads}, int(data['n_features']))
+            for head in heads:
+                model.weights[head] = data[f'weights/{head}']
+                model.bias[head] = data[f'bias/{head}']
+        return model
+
+
+def normalize_label(label) -> Optional[str]:
+    """Canonical form of a label ("Data Scientist" -> "data-scientist")"""
+    if not isinstance(label, str) or not label.strip():
+        return None
+    return re.sub(r"[\s_]+", "-", label.strip().lower())
+
+
+def model_path(source: str) -> Path:
+    """Where the model for one label source is stored"""
+    return Path(Config.LOCAL_CLASSIFIER_DIR) / f"{source}.npz"
+
+
+# Loaded models, per label source
+_classifiers: Dict[str, Optional[HashedNgramClassifier]] = {}
+
+
+def get_local_classifier(source: str) -> Optional[HashedNgramClassifier]:
+    """Get the trained model for a label source, or None if none was trained"""
+    if source not in _classifiers:
+        path = model_path(source)
+        _classifiers[source] = HashedNgramClassifier.load(path) if path.exists() else None
+    return _classifiers[source]
+
+
+def local_labels(source: str, text: str) -> Optional[Dict[str, Tuple[str, float]]]:
+    """
+    Labels for text if the local model is confident enough, else None
+
+    Callers fall back to the LLM on None (no model, or confidence below
+    Config.LOCAL_CLASSIFIER_THRESHOLD).
+    """
+    if not Config.LOCAL_CLASSIFIER_ENABLED:
+        return None
+    model = get_local_classifier(source)
+    if model is None:
+        return None
+    prediction = model.predict(text)
+    if not prediction or model.confidence(prediction) < Config.LOCAL_CLASSIFIER_THRESHOLD:
+        return None
+    return prediction
+
+
+def log_llm_labels(source: str, text: str, labels: Dict[str, str], background: bool = False):
+    """
+    Record labels the LLM assigned, as training data (best effort)
+
+    Args:
+        background: Write them from the durable "persistence" task queue
+            instead of the caller's thread (retried if the database is busy)
+    """
+    if not Config.LOG_LLM_LABELS:
+        return
+    try:
+        if background:
+            submit_task('llm_labels.log', source, text, labels, queue='persistence', durable=True)
+        else:
+            _store_llm_labels(source, text, labels)
+    except Exception:
+        pass  # Never fail an analysis because logging did
+
+
+@task('llm_labels.log')
+def _store_llm_labels(source: str, text: str, labels: Dict[str, str]):
+    from core.database import DatabaseManager
+    DatabaseManager.log_llm_labels(source, text, labels)
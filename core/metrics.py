@@ -0,0 +1,323 @@
+"""
+Metrics - Counters and histograms of this process, in Prometheus text format
+Requests and stage latencies come from the tracing spans (span() and @traced
+time their stage even while tracing is off); caches, fallbacks, rate limits
+and database writes report here directly. render() produces the exposition
+text, served by start_metrics_server() and the API's /metrics route.
+
+    from core.metrics import count_fallback
+    count_fallback('prompt_engine.optimize', 'error')
+
+Every labelled series has its own lock, held for an addition or two, so
+Streamlit's script threads and the worker pools rarely wait on each other.
+"""
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from core.config import Config
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histogram bucket upper bounds (seconds)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class _CounterSeries:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramSeries:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Per bucket, not cumulative; the last is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class _Metric:
+    """A metric family: one series per combination of label values"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """The series for these label values (created on first use)"""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                series = self._series.get(values)
+                if series is None:
+                    series = self._series[values] = self._new_series()
+        return series
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def _items(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return sorted(self._series.items())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, series in self._items():
+            lines.extend(self._render_series(_format_labels(self.labelnames, values), values, series))
+        return lines
+
+    def _render_series(self, labels: str, values: Tuple[str, ...], series) -> List[str]:
+        raise NotImplementedError
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter(_Metric):
+    """Monotonic count"""
+
+    kind = "counter"
+
+    def _new_series(self) -> _CounterSeries:
+        return _CounterSeries()
+
+    def inc(self, amount: float = 1):
+        """Increment the unlabelled series"""
+        self.labels().inc(amount)
+
+    def value(self, *values: str) -> float:
+        series = self._series.get(values)
+        return series.value if series is not None else 0.0
+
+    def _render_series(self, labels, values, series) -> List[str]:
+        return [f"{self.name}{labels} {_format_value(series.value)}"]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self) -> _HistogramSeries:
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value: float):
+        """Record a value in the unlabelled series"""
+        self.labels().observe(value)
+
+    def count(self, *values: str) -> int:
+        series = self._series.get(values)
+        return series.count if series is not None else 0
+
+    def _render_series(self, labels, values, series) -> List[str]:
+        counts, total, count = series.snapshot()
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            le = _format_labels(self.labelnames + ('le',), values + (_format_value(bound),))
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metric families rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Every metric in Prometheus text exposition format (0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """Drop every series (the metrics stay registered)"""
+        with self._lock:
+            for metric in self._metrics.values():
+                metric.clear()
+
+
+registry = MetricsRegistry()
+
+REQUESTS = registry.register(Counter(
+    "prompt_optimizer_requests_total", "Pipeline requests by entry point and outcome", ("entry", "outcome")))
+STAGE_SECONDS = registry.register(Histogram(
+    "prompt_optimizer_stage_duration_seconds", "Time spent in each pipeline stage", ("stage",)))
+CACHE_LOOKUPS = registry.register(Counter(
+    "prompt_optimizer_cache_lookups_total", "Result cache lookups by cache and result", ("cache", "result")))
+FALLBACKS = registry.register(Counter(
+    "prompt_optimizer_fallbacks_total",
+    "Stages answered by a template or heuristic instead of the model", ("stage", "reason")))
+RATE_LIMITED = registry.register(Counter(
+    "prompt_optimizer_llm_rate_limited_total", "LLM calls the provider rejected as rate limited", ("model",)))
+RATE_LIMIT_WAIT_SECONDS = registry.register(Histogram(
+    "prompt_optimizer_rate_limit_wait_seconds", "Time spent waiting for a concurrency limit",
+    ("limiter",), WAIT_BUCKETS))
+DB_WRITE_SECONDS = registry.register(Histogram(
+    "prompt_optimizer_db_write_seconds", "Latency of database write statements",
+    ("db", "statement"), DB_BUCKETS))
+
+
+# ==================== RECORDING ====================
+
+def observe_stage(stage: str, seconds: float, root: bool = False, error: bool = False):
+    """Record a stage's duration; a root stage is also counted as a request"""
+    if not Config.METRICS_ENABLED:
+        return
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    if root:
+        REQUESTS.labels(stage, "error" if error else "ok").inc()
+
+
+def count_cache(cache: str, result: str):
+    """Count a cache lookup ("hit", "miss", or a kind of hit such as "near_hit")"""
+    if Config.METRICS_ENABLED:
+        CACHE_LOOKUPS.labels(cache, result).inc()
+
+
+def count_fallback(stage: str, reason: str = "error"):
+    """Count a stage falling back ("error", "deadline", or another cause)"""
+    if Config.METRICS_ENABLED:
+        FALLBACKS.labels(stage, reason).inc()
+
+
+def count_rate_limited(model: str, error: BaseException) -> bool:
+    """Count the error if it is a provider rate limit (HTTP 429); returns whether it was"""
+    status = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    limited = status == 429 or type(error).__name__ in ('ResourceExhausted', 'RateLimitError')
+    if limited and Config.METRICS_ENABLED:
+        RATE_LIMITED.labels(model).inc()
+    return limited
+
+
+def observe_rate_limit_wait(limiter: str, seconds: float):
+    if Config.METRICS_ENABLED:
+        RATE_LIMIT_WAIT_SECONDS.labels(limiter).observe(seconds)
+
+
+def observe_db_write(db: str, statement: str, seconds: float):
+    if Config.METRICS_ENABLED:
+        DB_WRITE_SECONDS.labels(db, statement).observe(seconds)
+
+
+def render() -> str:
+    """This process's metrics in Prometheus text format"""
+    return registry.render()
+
+
+# ==================== HTTP ENDPOINT ====================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # A scrape every few seconds would flood stderr
+
+
+def serve_metrics(host: str, port: int) -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread (port 0 picks a free one)"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(offset: int = 0) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve this process's metrics at Config.METRICS_HOST:METRICS_PORT + offset
+
+    Safe to call on every Streamlit rerun: the server starts once per process.
+
+    Args:
+        offset: Added to the port, so several processes on a box get their own
+
+    Returns:
+        The server, or None if METRICS_PORT is unset or the port is taken
+    """
+    global _server
+    if _server is None and Config.METRICS_ENABLED and Config.METRICS_PORT:
+        with _server_lock:
+            if _server is None:
+                try:
+                    _server = serve_metrics(Config.METRICS_HOST, Config.METRICS_PORT + offset)
+                except OSError as e:
+                    print(f"Metrics server not started on port {Config.METRICS_PORT + offset}: {e}")
+                    return None
+    return _server
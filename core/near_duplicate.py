@@ -0,0 +1,247 @@
+"""
+Near-Duplicate Cache - Reuse results for prompts that differ only trivially
+Prompts are normalized (case, whitespace, punctuation) and fingerprinted with a
+64-bit SimHash; an LSH index over the signature's bands finds cached neighbours,
+which are returned when their similarity reaches Config.NEAR_DUP_SIMILARITY and
+they differ by at most Config.NEAR_DUP_MAX_WORD_EDITS words
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from core.config import Config
+from core.metrics import count_cache
+
+SIGNATURE_BITS = 64
+# 8 bands of 8 bits: two signatures within 7 differing bits share at least one band
+BANDS = 8
+BAND_BITS = SIGNATURE_BITS // BANDS
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """Canonical form of a prompt: NFKC, lowercase, words separated by single spaces"""
+    return " ".join(_WORD_RE.findall(unicodedata.normalize("NFKC", text).lower()))
+
+
+def simhash(normalized: str) -> int:
+    """
+    64-bit SimHash over the character trigrams of each word of a normalized text
+
+    Every trigram votes on each bit with its hash; the signature keeps the
+    majority. Texts sharing most trigrams get signatures a few bits apart.
+    Character trigrams keep a typo down to a few changed features, where
+    word n-grams would lose the whole word (and both its bigrams).
+    """
+    grams = [f" {word} "[i:i + 3] for word in normalized.split() for i in range(len(word))]
+    if not grams:
+        return 0
+    hashes = np.frombuffer(
+        b"".join(hashlib.blake2b(g.encode(), digest_size=8).digest() for g in grams), dtype=np.uint8
+    ).reshape(len(grams), 8)
+    votes = np.unpackbits(hashes, axis=1).sum(axis=0, dtype=np.int32) * 2 - len(grams)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+
+def similarity(a: int, b: int) -> float:
+    """Share of signature bits two SimHashes agree on (1.0 = same signature)"""
+    return 1.0 - bin(a ^ b).count("1") / SIGNATURE_BITS
+
+
+def word_edits_within(a: List[str], b: List[str], limit: int) -> bool:
+    """Whether token lists a and b are at most `limit` word insertions/deletions/substitutions apart"""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    # Levenshtein over words, only on the diagonal band that can stay within limit
+    far = limit + 1
+    previous = {j: j for j in range(0, min(len(b), limit) + 1)}
+    for i in range(1, len(a) + 1):
+        current = {}
+        for j in range(max(0, i - limit), min(len(b), i + limit) + 1):
+            if j == 0:
+                current[j] = i
+                continue
+            current[j] = min(
+                previous.get(j - 1, far) + (a[i - 1] != b[j - 1]),
+                previous.get(j, far) + 1,
+                current.get(j - 1, far) + 1
+            )
+        if min(current.values()) > limit:
+            return False
+        previous = current
+    return previous.get(len(b), far) <= limit
+
+
+def _bands(signature: int) -> List[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [(signature >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+class NearDuplicateCache:
+    """
+    LRU cache keyed by prompt text, tolerant of small edits
+
+    Lookups first try the exact normalized text, then LSH candidates (entries
+    sharing a signature band) ranked by SimHash similarity. SimHash alone
+    also pairs prompts that share most words but differ in several, so a
+    candidate must also be within a few word edits of the query. Entries live in a
+    namespace (e.g. the operation plus any non-text inputs such as attached
+    files), and only match within it. Cached results are shared between
+    callers: treat them as read-only.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        threshold: Optional[float] = None,
+        min_tokens: Optional[int] = None,
+        max_word_edits: Optional[int] = None
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Entries kept (least recently used evicted first)
+            ttl_seconds: Entries older than this are never returned
+            threshold: Minimum SimHash similarity of a near-duplicate hit
+            min_tokens: Shorter prompts only match exactly (after normalization)
+            max_word_edits: Most words a near-duplicate may differ by
+        """
+        self.max_entries = Config.NEAR_DUP_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl_seconds = Config.NEAR_DUP_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._threshold = threshold
+        self._min_tokens = min_tokens
+        self._max_word_edits = max_word_edits
+
+        self._lock = threading.Lock()
+        # (namespace, normalized) -> (signature, result, stored_at)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, Any, float]]" = OrderedDict()
+        self._index: Dict[Tuple[str, int, int], Set[Tuple[str, str]]] = {}
+        self.stats = {'exact_hits': 0, 'near_hits': 0, 'misses': 0}
+
+    @property
+    def threshold(self) -> float:
+        return Config.NEAR_DUP_SIMILARITY if self._threshold is None else self._threshold
+
+    @property
+    def min_tokens(self) -> int:
+        return Config.NEAR_DUP_MIN_TOKENS if self._min_tokens is None else self._min_tokens
+
+    @property
+    def max_word_edits(self) -> int:
+        return Config.NEAR_DUP_MAX_WORD_EDITS if self._max_word_edits is None else self._max_word_edits
+
+    def get(self, namespace: str, text: str) -> Optional[Any]:
+        """Cached result for text or a near-duplicate of it, else None"""
+        match = self.lookup(namespace, text)
+        return None if match is None else match[0]
+
+    def lookup(self, namespace: str, text: str) -> Optional[Tuple[Any, float]]:
+        """
+        Like get(), with the match's similarity
+
+        Returns:
+            (result, similarity), or None on a miss
+        """
+        normalized = normalize(text)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live_entry((namespace, normalized), now)
+            if entry is not None:
+                self.stats['exact_hits'] += 1
+                count_cache('near_duplicate', 'exact_hit')
+                return entry[1], 1.0
+
+            tokens = normalized.split()
+            if self.max_word_edits > 0 and len(tokens) >= self.min_tokens:
+                signature = simhash(normalized)
+                candidates = {}
+                for band, value in enumerate(_bands(signature)):
+                    for key in self._index.get((namespace, band, value), ()):
+                        if key not in candidates:
+                            candidates[key] = similarity(signature, self._entries[key][0])
+                for key, score in sorted(candidates.items(), key=lambda item: -item[1]):
+                    if score < self.threshold:
+                        break
+                    if not word_edits_within(tokens, key[1].split(), self.max_word_edits):
+                        continue
+                    entry = self._live_entry(key, now)
+                    if entry is not None:
+                        self.stats['near_hits'] += 1
+                        count_cache('near_duplicate', 'near_hit')
+                        return entry[1], score
+
+            self.stats['misses'] += 1
+            count_cache('near_duplicate', 'miss')
+            return None
+
+    def put(self, namespace: str, text: str, result: Any):
+        """Cache result for text"""
+        normalized = normalize(text)
+        key = (namespace, normalized)
+        signature = simhash(normalized)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (signature, result, time.monotonic())
+            for band, value in enumerate(_bands(signature)):
+                self._index.setdefault((namespace, band, value), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def get_or_compute(self, namespace: str, text: str, compute: Callable[[], Any]) -> Any:
+        """Cached result for text, or compute() it and cache it"""
+        result = self.get(namespace, text)
+        if result is None:
+            result = compute()
+            self.put(namespace, text, result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _live_entry(self, key, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl_seconds and now - entry[2] > self.ttl_seconds:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        signature = self._entries.pop(key)[0]
+        for band, value in enumerate(_bands(signature)):
+            bucket = self._index.get((key[0], band, value))
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._index[(key[0], band, value)]
+
+
+# Global cache instance
+_near_duplicate_cache: Optional[NearDuplicateCache] = None
+
+
+def get_near_duplicate_cache() -> Optional[NearDuplicateCache]:
+    """Get the process-wide cache, or None when Config.NEAR_DUP_CACHE_ENABLED is off"""
+    global _near_duplicate_cache
+    if not Config.NEAR_DUP_CACHE_ENABLED:
+        return None
+    if _near_duplicate_cache is None:
+        _near_duplicate_cache = NearDuplicateCache()
+    return _near_duplicate_cache
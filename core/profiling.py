@@ -0,0 +1,239 @@
+"""
+Profiling - Where one request's CPU and wall time go, function by function
+Pipeline entry points decorated with @profiled are profiled when the request
+asks for it (request_profiles(): the API's X-Profile header or ?profile=1, the
+app's ?profile=1) or is one of every Config.PROFILE_SAMPLE_EVERY requests.
+Each profile writes two files to Config.PROFILE_DIR, named after the request
+id its LLM calls are accounted under (core.usage):
+
+    <stamp>-<request id>-<entry>.prof     pstats: python -m pstats, snakeviz
+    <stamp>-<request id>-<entry>.folded   collapsed stacks: flamegraph.pl, speedscope
+
+A stack sampler takes both from every busy thread (worker pools and
+asyncio.to_thread included), so sample counts stand in for call counts.
+With Config.PROFILE_MODE "cprofile" the .prof file comes from cProfile
+instead: exact calls and times, but of the entry point's own thread only.
+"""
+import contextvars
+import cProfile
+import functools
+import inspect
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from core.config import Config
+from core.tracing import annotate
+from core.usage import usage_scope
+
+# Whether the current request asked to be profiled
+_requested: contextvars.ContextVar = contextvars.ContextVar('profile_requested', default=False)
+# The profile running in this context (nested entry points join it)
+_active: contextvars.ContextVar = contextvars.ContextVar('profile_active', default=None)
+
+_requests = itertools.count(1)
+_recent: deque = deque(maxlen=20)
+
+# Innermost frames of a thread with nothing to do (its samples are dropped)
+_IDLE_FILES = ('threading.py', 'selectors.py', 'queue.py', 'socketserver.py')
+
+# pstats key of a function: (file, first line, name)
+FuncKey = Tuple[str, int, str]
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of the process's busy threads at a fixed interval
+
+    Threads waiting on a lock, queue or selector are skipped, except `thread`
+    (the request's own), whose waits show where it blocked on other threads.
+    """
+
+    def __init__(self, interval: Optional[float] = None, thread: Optional[int] = None):
+        """
+        Initialize the sampler
+
+        Args:
+            interval: Seconds between samples (default: Config.PROFILE_INTERVAL_MS)
+            thread: Ident of the thread always sampled (default: the caller's)
+        """
+        self.interval = Config.PROFILE_INTERVAL_MS / 1000 if interval is None else interval
+        self.thread = threading.get_ident() if thread is None else thread
+        self.samples: Counter = Counter()  # (thread name, FuncKey, ...) root first -> count
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "StackSampler":
+        self._sampler = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self._stop.set()
+        self._sampler.join()
+        return False
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(skip=own)
+
+    def sample(self, skip: Optional[int] = None):
+        """Record the current stack of every busy thread"""
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == skip:
+                continue
+            if ident != self.thread and os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples[(names.get(ident, str(ident)), *stack)] += 1
+
+    def folded(self) -> List[str]:
+        """Collapsed stacks: "thread;func (file:line);... count" per distinct stack"""
+        lines = []
+        for (thread, *stack), count in sorted(self.samples.items(), key=lambda item: -item[1]):
+            frames = [f"{name} ({os.path.basename(path)}:{line})" for path, line, name in stack]
+            lines.append(";".join([thread.replace(";", ":")] + frames) + f" {count}")
+        return lines
+
+    def create_stats(self):
+        """pstats data of the samples (pstats.Stats(sampler) loads it like a cProfile run)"""
+        stats: Dict[FuncKey, list] = {}
+        callers: Dict[FuncKey, Dict[FuncKey, list]] = {}
+        for (_, *stack), count in self.samples.items():
+            seconds = count * self.interval
+            for func in set(stack):  # Inclusive time, once per stack however deep the recursion
+                entry = stats.setdefault(func, [0, 0, 0.0, 0.0])
+                entry[0] += count
+                entry[1] += count
+                entry[3] += seconds
+            stats[stack[-1]][2] += seconds  # Self time of the innermost frame
+            for caller, callee in set(zip(stack, stack[1:])):
+                edge = callers.setdefault(callee, {}).setdefault(caller, [0, 0, 0.0, 0.0])
+                edge[0] += count
+                edge[1] += count
+                edge[3] += seconds
+                if callee == stack[-1]:
+                    edge[2] += seconds
+        self.stats = {
+            func: (cc, nc, tt, ct, {caller: tuple(edge) for caller, edge in callers.get(func, {}).items()})
+            for func, (cc, nc, tt, ct) in stats.items()
+        }
+
+
+@contextmanager
+def request_profiles(enabled: bool = True) -> Iterator[None]:
+    """Profile the pipeline requests started inside the block (and threads they hand work to)"""
+    token = _requested.set(bool(enabled) and Config.PROFILE_ON_DEMAND)
+    try:
+        yield
+    finally:
+        _requested.reset(token)
+
+
+def wants_profile(headers, query_params) -> bool:
+    """Whether an HTTP request asks to be profiled (X-Profile header or ?profile=)"""
+    value = headers.get('x-profile') or query_params.get('profile') or ''
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _sampled() -> bool:
+    every = Config.PROFILE_SAMPLE_EVERY
+    return every > 0 and next(_requests) % every == 0
+
+
+@contextmanager
+def profile_scope(name: str, exact: bool = True) -> Iterator[Optional[str]]:
+    """
+    Profile the block if the request asked for it or is sampled
+
+    Nested scopes (an entry point calling another) join the outer profile.
+
+    Args:
+        name: Entry point, used in the file names
+        exact: Allow cProfile (PROFILE_MODE "cprofile"); off for coroutines,
+            whose thread is the event loop's
+
+    Yields:
+        The request id the files are named after, or None when not profiling
+    """
+    if _active.get() is not None or not (_requested.get() or _sampled()):
+        yield _active.get()
+        return
+
+    with usage_scope() as usage:
+        token = _active.set(usage.request_id)
+        profiler = cProfile.Profile() if exact and Config.PROFILE_MODE == 'cprofile' else None
+        sampler = StackSampler()
+        try:
+            with sampler:
+                if profiler is not None:
+                    try:
+                        profiler.enable()
+                    except ValueError:
+                        profiler = None  # Another profiler is active (one per process on Python 3.12+)
+                try:
+                    annotate(profile=usage.request_id)
+                    yield usage.request_id
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _active.reset(token)
+            _write(f"{time.strftime('%Y%m%d-%H%M%S')}-{usage.request_id}-{name}", sampler, profiler)
+
+
+def _write(stem: str, sampler: StackSampler, profiler: Optional[cProfile.Profile]):
+    directory = Path(Config.PROFILE_DIR)
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        # Entry calls sharing a request id (an API batch) each get their own files
+        base = stem
+        for n in itertools.count(2):
+            if not (directory / f"{stem}.folded").exists():
+                break
+            stem = f"{base}~{n}"
+        if profiler is not None:
+            profiler.dump_stats(directory / f"{stem}.prof")
+        elif sampler.samples:
+            import pstats
+            pstats.Stats(sampler).dump_stats(directory / f"{stem}.prof")
+        (directory / f"{stem}.folded").write_text("\n".join(sampler.folded()) + "\n", encoding='utf-8')
+    except OSError:
+        return  # Profiling never fails a request
+    _recent.append(stem)
+
+
+def recent_profiles() -> List[str]:
+    """File stems of this process's latest profiles, newest first"""
+    return list(reversed(_recent))
+
+
+def profiled(name: str) -> Callable:
+    """Decorator: run every call of the entry point (or coroutine function) in profile_scope(name)"""
+    def decorate(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with profile_scope(name, exact=False):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with profile_scope(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
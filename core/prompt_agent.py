@@ -3,13 +3,29 @@ AI Prompt Agent - The Brain of the Chatbot
 Automatically analyzes input, detects domain, selects templates, and generates optimized prompts
 Specialized for Research and Programming/Coding
 """
+import asyncio
 import json
 import re
+import threading
+from concurrent.futures import Future
 from typing import Dict, Optional, List, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import google.generativeai as genai
+from core.cascade import ModelCascade, fast_model
 from core.config import Config
+from core.deadline import Deadline, current_deadline, deadline_scope, request_options
+from core.llm import call_model, generate_hedged
+from core.local_classifier import local_labels, log_llm_labels
+from core.near_duplicate import get_near_duplicate_cache
+from core.profiling import profiled
+from core.singleflight import fingerprint, get_singleflight
+from core.tasks import submit_task
+from core.tracing import annotate, current_span, span, traced
+from core.usage import current_usage, usage_scope
+
+# Label source of this agent in the LLM label log / local classifier
+LABEL_SOURCE = 'prompt_agent'
 
 
 class Domain(Enum):
@@ -61,6 +77,22 @@ class PromptResult:
     template_used: str
     suggestions: List[str]
     metadata: Dict
+    # Deferred evaluation: until this resolves, quality_score is a heuristic
+    # estimate and suggestions are empty; it updates both, then returns them
+    evaluation: Optional[Future] = None
+
+    @property
+    def score_pending(self) -> bool:
+        return self.evaluation is not None and not self.evaluation.done()
+
+
+@dataclass
+class _CachedRun:
+    """A pipeline run as the near-duplicate cache keeps it"""
+    user_input: str
+    analysis: AnalysisResult
+    template_key: str
+    result: PromptResult
 
 
 class PromptAgent:
@@ -72,7 +104,23 @@ class PromptAgent:
     def __init__(self):
         """Initialize the Prompt Agent with Gemini"""
         genai.configure(api_key=Config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(Config.GEMINI_MODEL)
+        self.model = genai.GenerativeModel(Config.GEMINI_STRONG_MODEL)
+        self.fast_model = fast_model()
+
+        # Cheapest tier first: local classifier, keywords, fast model, strong model
+        analysis_stages = [('classifier', self._local_analysis)]
+        eval_stages = []
+        if Config.CASCADE_ENABLED:
+            analysis_stages.append(('heuristics', self._heuristic_analysis))
+        if self.fast_model is not None:
+            analysis_stages.append(('fast', lambda context: self._analyze_with_llm(
+                context, self.fast_model, min_confidence=Config.CASCADE_FAST_THRESHOLD
+            )))
+            eval_stages.append(('fast', lambda prompt: self._evaluate_with_llm(prompt, self.fast_model)))
+        analysis_stages.append(('strong', lambda context: self._analyze_with_llm(context)))
+        eval_stages.append(('strong', lambda prompt: self._evaluate_with_llm(prompt)))
+        self.analysis_cascade = ModelCascade(LABEL_SOURCE, analysis_stages)
+        self.eval_cascade = ModelCascade(f"{LABEL_SOURCE}.evaluate", eval_stages)
 
         # Prompt templates for different scenarios
         self.templates = self._load_templates()
@@ -279,10 +327,14 @@ class PromptAgent:
 **Output:** Comprehensive, helpful response."""
         }
 
+    @traced('prompt_agent.process_input')
+    @profiled('prompt_agent.process_input')
     async def process_input(self,
                            user_input: str,
                            file_content: Optional[str] = None,
-                           file_type: Optional[str] = None) -> PromptResult:
+                           file_type: Optional[str] = None,
+                           deadline: Optional[Deadline] = None,
+                           defer_evaluation: Optional[bool] = None) -> PromptResult:
         """
         Main entry point - process user input and generate optimized prompt
 
@@ -290,26 +342,72 @@ class PromptAgent:
             user_input: Text from user (could be from voice transcription)
             file_content: Optional content extracted from uploaded file
             file_type: Type of file (pdf, image, code, etc.)
+            deadline: Time budget for all stages (default: Config.REQUEST_DEADLINE_SECONDS);
+                stages that cannot finish in time use keyword heuristics
+            defer_evaluation: Return before the quality score is known and evaluate
+                in the background (default: Config.DEFER_EVALUATION); see
+                PromptResult.evaluation
 
         Returns:
             PromptResult with optimized prompt and hidden metrics
+            (metadata["degraded"] lists stages cut short by the deadline)
         """
+        # Near-duplicates of a recent request reuse its analysis and template
+        cache = get_near_duplicate_cache()
+        namespace = self._cache_namespace(file_content, file_type)
+        defer = self._defer(defer_evaluation)
+        run = cache.get(namespace, user_input) if cache is not None else None
+        annotate(cached=run is not None)
+        if run is not None and run.user_input == user_input:
+            result = run.result
+        elif run is not None:
+            # The prompt quotes the request, so it is rendered (and scored) for this one
+            with deadline_scope(deadline), usage_scope():
+                result = (await self._process_input(user_input, file_content, file_type, defer, reuse=run)).result
+        else:
+            # Identical requests in flight (from coroutines or threads) share one run
+            with deadline_scope(deadline), usage_scope():
+                run = await get_singleflight().do_async(
+                    fingerprint(namespace, user_input),
+                    self._process_input, user_input, file_content, file_type, defer
+                )
+            result = run.result
+            if cache is not None and not result.metadata.get("degraded"):
+                cache.put(namespace, user_input, run)
+
+        if not defer and result.evaluation is not None:
+            await asyncio.wrap_future(result.evaluation)  # Shared with a caller that deferred it
+        return result
+
+    async def _process_input(self,
+                             user_input: str,
+                             file_content: Optional[str],
+                             file_type: Optional[str],
+                             defer_evaluation: bool = False,
+                             reuse: Optional[_CachedRun] = None) -> _CachedRun:
+        """Uncoalesced, uncached process_input() (steps 1-2 taken from `reuse` if given)"""
         # Combine inputs
         full_context = self._build_context(user_input, file_content, file_type)
 
-        # Step 1: Analyze the input
-        analysis = await self._analyze_input(full_context)
+        if reuse is not None:
+            analysis, template_key = reuse.analysis, reuse.template_key
+        else:
+            # Step 1: Analyze the input
+            analysis = await self._analyze_input(full_context)
 
-        # Step 2: Select best template
-        template_key = self._select_template(analysis)
+            # Step 2: Select best template
+            template_key = self._select_template(analysis)
 
         # Step 3: Generate optimized prompt
         optimized_prompt = self._generate_prompt(analysis, template_key, user_input, full_context)
 
-        # Step 4: Score the prompt (hidden from user by default)
-        quality_score, suggestions = await self._evaluate_prompt(optimized_prompt, analysis)
+        # Step 4: Score the prompt (hidden from user by default), or leave it to the background
+        if defer_evaluation:
+            quality_score, suggestions = self._heuristic_score(optimized_prompt, analysis), []
+        else:
+            quality_score, suggestions = await self._evaluate_prompt(optimized_prompt, analysis)
 
-        return PromptResult(
+        result = PromptResult(
             optimized_prompt=optimized_prompt,
             quality_score=quality_score,
             domain=analysis.domain.value,
@@ -320,31 +418,80 @@ class PromptAgent:
                 "complexity": analysis.complexity,
                 "confidence": analysis.confidence,
                 "key_topics": analysis.key_topics,
-                "detected_language": analysis.detected_language
+                "detected_language": analysis.detected_language,
+                "degraded": self._degraded_stages()
             }
         )
+        if defer_evaluation:
+            result.evaluation = submit_task(
+                self._evaluate_deferred, result, analysis, current_span(), current_usage(),
+                queue='evaluation', retries=0
+            )
+        return _CachedRun(user_input, analysis, template_key, result)
 
+    @traced('prompt_agent.process_input')
+    @profiled('prompt_agent.process_input')
     def process_input_sync(self,
                           user_input: str,
                           file_content: Optional[str] = None,
-                          file_type: Optional[str] = None) -> PromptResult:
+                          file_type: Optional[str] = None,
+                          deadline: Optional[Deadline] = None,
+                          defer_evaluation: Optional[bool] = None) -> PromptResult:
         """Synchronous version of process_input for Streamlit compatibility"""
+        cache = get_near_duplicate_cache()
+        namespace = self._cache_namespace(file_content, file_type)
+        defer = self._defer(defer_evaluation)
+        run = cache.get(namespace, user_input) if cache is not None else None
+        annotate(cached=run is not None)
+        if run is not None and run.user_input == user_input:
+            result = run.result
+        elif run is not None:
+            with deadline_scope(deadline), usage_scope():
+                result = self._process_input_sync(user_input, file_content, file_type, defer, reuse=run).result
+        else:
+            with deadline_scope(deadline), usage_scope():
+                run = get_singleflight().do(
+                    fingerprint(namespace, user_input),
+                    self._process_input_sync, user_input, file_content, file_type, defer
+                )
+            result = run.result
+            # Heuristic answers forced by the deadline are not worth reusing
+            if cache is not None and not result.metadata.get("degraded"):
+                cache.put(namespace, user_input, run)
+
+        if not defer and result.evaluation is not None:
+            result.evaluation.result()  # Shared with a caller that deferred it
+        return result
+
+    def _process_input_sync(self,
+                            user_input: str,
+                            file_content: Optional[str],
+                            file_type: Optional[str],
+                            defer_evaluation: bool = False,
+                            reuse: Optional[_CachedRun] = None) -> _CachedRun:
+        """Uncoalesced, uncached process_input_sync() (steps 1-2 taken from `reuse` if given)"""
         # Combine inputs
         full_context = self._build_context(user_input, file_content, file_type)
 
-        # Step 1: Analyze the input
-        analysis = self._analyze_input_sync(full_context)
+        if reuse is not None:
+            analysis, template_key = reuse.analysis, reuse.template_key
+        else:
+            # Step 1: Analyze the input
+            analysis = self._analyze_input_sync(full_context)
 
-        # Step 2: Select best template
-        template_key = self._select_template(analysis)
+            # Step 2: Select best template
+            template_key = self._select_template(analysis)
 
         # Step 3: Generate optimized prompt
         optimized_prompt = self._generate_prompt(analysis, template_key, user_input, full_context)
 
-        # Step 4: Score the prompt (hidden from user by default)
-        quality_score, suggestions = self._evaluate_prompt_sync(optimized_prompt, analysis)
+        # Step 4: Score the prompt (hidden from user by default), or leave it to the background
+        if defer_evaluation:
+            quality_score, suggestions = self._heuristic_score(optimized_prompt, analysis), []
+        else:
+            quality_score, suggestions = self._evaluate_prompt_sync(optimized_prompt, analysis)
 
-        return PromptResult(
+        result = PromptResult(
             optimized_prompt=optimized_prompt,
             quality_score=quality_score,
             domain=analysis.domain.value,
@@ -355,9 +502,58 @@ class PromptAgent:
                 "complexity": analysis.complexity,
                 "confidence": analysis.confidence,
                 "key_topics": analysis.key_topics,
-                "detected_language": analysis.detected_language
+                "detected_language": analysis.detected_language,
+                "degraded": self._degraded_stages()
             }
         )
+        if defer_evaluation:
+            result.evaluation = submit_task(
+                self._evaluate_deferred, result, analysis, current_span(), current_usage(),
+                queue='evaluation', retries=0
+            )
+        return _CachedRun(user_input, analysis, template_key, result)
+
+    def _generate(self, prompt: str, stage: str, model=None) -> str:
+        """
+        Text of a Gemini answer, its tokens accounted to `stage`
+
+        Strong-model calls (no `model` given) are hedged when Config.HEDGE_ENABLED,
+        so one slow response does not hold up the chat. The request's deadline
+        sets the HTTP timeout (DeadlineExceeded if it is too close).
+        """
+        options = request_options()
+        if model is not None:
+            return call_model(stage, model, prompt, **options).text
+        return generate_hedged(
+            f"gemini:{Config.GEMINI_STRONG_MODEL}", prompt,
+            primary=lambda: call_model(stage, self.model, prompt, **options).text,
+            stage=stage
+        )
+
+    @staticmethod
+    def _defer(defer_evaluation: Optional[bool]) -> bool:
+        return Config.DEFER_EVALUATION if defer_evaluation is None else defer_evaluation
+
+    def _evaluate_deferred(self, result: PromptResult, analysis: AnalysisResult,
+                           parent=None, usage=None) -> Tuple[int, List[str]]:
+        """Background evaluation: fill in the real score and suggestions (for the request of `parent`, `usage`)"""
+        # Off the critical path, so with a budget of its own
+        with deadline_scope(), usage_scope(usage), span('prompt_agent.evaluate_deferred', parent=parent):
+            quality_score, suggestions = self._evaluate_prompt_sync(result.optimized_prompt, analysis)
+        result.quality_score, result.suggestions = quality_score, suggestions
+        return quality_score, suggestions
+
+    @staticmethod
+    def _degraded_stages() -> List[str]:
+        """Stages of the current request that fell back for lack of time"""
+        deadline = current_deadline()
+        return list(deadline.degraded) if deadline is not None else []
+
+    def _cache_namespace(self, file_content: Optional[str], file_type: Optional[str]) -> str:
+        """Fingerprint of everything but the user's text: requests only match within it"""
+        return fingerprint(
+            'process_input', Config.GEMINI_FAST_MODEL, Config.GEMINI_STRONG_MODEL, file_content, file_type
+        )
 
     def _build_context(self, user_input: str, file_content: Optional[str], file_type: Optional[str]) -> str:
         """Build full context from all inputs"""
@@ -375,9 +571,26 @@ class PromptAgent:
 
         return "\n".join(context_parts)
 
+    @traced('prompt_agent.analyze')
     def _analyze_input_sync(self, full_context: str) -> AnalysisResult:
         """Analyze user input to detect domain, task type, and complexity"""
+        analysis, _ = self.analysis_cascade.run(full_context)
+
+        # Fallback to keyword-based detection
+        return analysis or self._fallback_analysis(full_context)
 
+    def _analyze_with_llm(
+        self,
+        full_context: str,
+        model=None,
+        min_confidence: Optional[float] = None
+    ) -> Optional[AnalysisResult]:
+        """
+        Ask Gemini (the strong model unless `model` is given) for the analysis
+
+        Returns None on API errors, invalid JSON or unknown labels, and below
+        `min_confidence` if set, so the cascade escalates.
+        """
         analysis_prompt = f"""Analyze this user request and return ONLY valid JSON (no markdown, no explanation).
 
 User Request: "{full_context[:2000]}"
@@ -398,8 +611,7 @@ Return ONLY this JSON:
 {{"domain": "...", "task_type": "...", "complexity": "...", "key_topics": [...], "detected_language": null, "confidence": 0.9, "context_summary": "..."}}"""
 
         try:
-            response = self.model.generate_content(analysis_prompt)
-            response_text = response.text.strip()
+            response_text = self._generate(analysis_prompt, 'prompt_agent.analyze', model).strip()
 
             # Clean response
             if response_text.startswith('```'):
@@ -409,28 +621,77 @@ Return ONLY this JSON:
 
             data = json.loads(response_text)
 
-            return AnalysisResult(
+            result = AnalysisResult(
                 domain=Domain(data.get("domain", "general")),
                 task_type=TaskType(data.get("task_type", "general_query")),
                 complexity=data.get("complexity", "medium"),
                 key_topics=data.get("key_topics", []),
                 detected_language=data.get("detected_language"),
-                confidence=data.get("confidence", 0.8),
+                confidence=float(data.get("confidence", 0.8)),
                 context_summary=data.get("context_summary", "")
             )
-        except Exception as e:
-            # Fallback to keyword-based detection
-            return self._fallback_analysis(full_context)
+            if min_confidence is not None and result.confidence < min_confidence:
+                return None
+            log_llm_labels(LABEL_SOURCE, full_context[:2000], {
+                'domain': result.domain.value,
+                'task_type': result.task_type.value,
+                'complexity': result.complexity
+            }, background=True)
+            return result
+        except Exception:
+            return None
 
     async def _analyze_input(self, full_context: str) -> AnalysisResult:
-        """Async version of analysis"""
-        return self._analyze_input_sync(full_context)
+        """Async version of analysis (on a worker thread, so LLM calls don't block the event loop)"""
+        return await asyncio.to_thread(self._analyze_input_sync, full_context)
 
-    def _fallback_analysis(self, text: str) -> AnalysisResult:
-        """Fallback keyword-based analysis when AI fails"""
-        text_lower = text.lower()
+    def _local_analysis(self, full_context: str) -> Optional[AnalysisResult]:
+        """
+        Domain, task type and complexity from the local classifier
 
-        # Detect domain
+        Topics, language and summary come from the keyword fallback, since
+        the classifier only predicts labels. Returns None when no model is
+        trained or it is unsure, so the LLM is asked instead.
+        """
+        try:
+            prediction = local_labels(LABEL_SOURCE, full_context[:2000])
+            if not prediction or not {'domain', 'task_type'} <= prediction.keys():
+                return None
+            domain = Domain(prediction['domain'][0].replace('-', '_'))
+            task_type = TaskType(prediction['task_type'][0].replace('-', '_'))
+        except Exception:
+            return None
+
+        result = self._fallback_analysis(full_context)
+        result.domain = domain
+        result.task_type = task_type
+        if 'complexity' in prediction:
+            result.complexity = prediction['complexity'][0]
+        result.confidence = min(prob for _, prob in prediction.values())
+        return result
+
+    def _heuristic_analysis(self, full_context: str) -> Optional[AnalysisResult]:
+        """
+        Keyword analysis, when one domain clearly wins
+
+        Confidence grows with the lead of the best domain over the runner-up;
+        below Config.CASCADE_HEURISTIC_THRESHOLD the cascade asks Gemini.
+        """
+        scores = self._keyword_scores(full_context.lower())
+        best, runner_up = sorted(scores.values(), reverse=True)[:2]
+        confidence = min(0.5 + 0.1 * (best - runner_up), 0.9)
+        if confidence < Config.CASCADE_HEURISTIC_THRESHOLD:
+            return None
+
+        result = self._fallback_analysis(full_context)
+        winner = {'coding': Domain.CODING, 'research': Domain.RESEARCH, 'data': Domain.DATA_SCIENCE}
+        if result.domain != winner[max(scores, key=scores.get)]:
+            return None  # The fallback's tie-breaking disagrees with the keyword lead
+        result.confidence = confidence
+        return result
+
+    def _keyword_scores(self, text_lower: str) -> Dict[str, int]:
+        """Keyword hits per domain"""
         coding_keywords = ['code', 'python', 'javascript', 'function', 'class', 'api', 'debug',
                           'error', 'bug', 'programming', 'develop', 'build', 'implement',
                           'java', 'rust', 'go', 'typescript', 'react', 'sql', 'database']
@@ -439,9 +700,19 @@ Return ONLY this JSON:
         data_keywords = ['data', 'dataset', 'machine learning', 'ml', 'ai', 'model',
                         'training', 'neural', 'statistics', 'visualization']
 
-        coding_score = sum(1 for k in coding_keywords if k in text_lower)
-        research_score = sum(1 for k in research_keywords if k in text_lower)
-        data_score = sum(1 for k in data_keywords if k in text_lower)
+        return {
+            'coding': sum(1 for k in coding_keywords if k in text_lower),
+            'research': sum(1 for k in research_keywords if k in text_lower),
+            'data': sum(1 for k in data_keywords if k in text_lower)
+        }
+
+    def _fallback_analysis(self, text: str) -> AnalysisResult:
+        """Fallback keyword-based analysis when AI fails"""
+        text_lower = text.lower()
+
+        # Detect domain
+        scores = self._keyword_scores(text_lower)
+        coding_score, research_score, data_score = scores['coding'], scores['research'], scores['data']
 
         if coding_score > research_score and coding_score > data_score:
             domain = Domain.CODING
@@ -502,6 +773,7 @@ Return ONLY this JSON:
 
         return task_to_template.get(analysis.task_type, "general_query")
 
+    @traced('prompt_agent.render')
     def _generate_prompt(self, analysis: AnalysisResult, template_key: str,
                         user_input: str, full_context: str) -> str:
         """Generate the optimized prompt using selected template"""
@@ -523,8 +795,29 @@ Return ONLY this JSON:
 
         return optimized
 
+    @traced('prompt_agent.evaluate')
     def _evaluate_prompt_sync(self, prompt: str, analysis: AnalysisResult) -> Tuple[int, List[str]]:
         """Evaluate prompt quality and generate suggestions"""
+        evaluation, _ = self.eval_cascade.run(prompt)
+        if evaluation:
+            return evaluation
+
+        return self._heuristic_score(prompt, analysis), []
+
+    def _heuristic_score(self, prompt: str, analysis: AnalysisResult) -> int:
+        """Quality score from prompt length and analysis confidence, without an LLM"""
+        score = 75
+        if len(prompt) > 500:
+            score += 10
+        if "instructions" in prompt.lower():
+            score += 5
+        if analysis.confidence > 0.8:
+            score += 5
+
+        return min(100, score)
+
+    def _evaluate_with_llm(self, prompt: str, model=None) -> Optional[Tuple[int, List[str]]]:
+        """Score and suggestions from Gemini, or None if its answer is unusable"""
 
         eval_prompt = f"""Rate this prompt on a scale of 0-100 and provide 2-3 brief improvement suggestions.
 
@@ -542,8 +835,7 @@ Return ONLY this JSON:
 {{"score": 85, "suggestions": ["suggestion 1", "suggestion 2"]}}"""
 
         try:
-            response = self.model.generate_content(eval_prompt)
-            response_text = response.text.strip()
+            response_text = self._generate(eval_prompt, 'prompt_agent.evaluate', model).strip()
 
             # Clean response
             if response_text.startswith('```'):
@@ -552,24 +844,30 @@ Return ONLY this JSON:
                 response_text = '\n'.join(json_lines)
 
             data = json.loads(response_text)
-            score = min(100, max(0, int(data.get("score", 75))))
+            score = min(100, max(0, int(data["score"])))
             suggestions = data.get("suggestions", [])
+            if not isinstance(suggestions, list):
+                return None
 
             return score, suggestions
         except Exception:
-            # Fallback scoring based on heuristics
-            score = 75
-            suggestions = []
+            return None
 
-            if len(prompt) > 500:
-                score += 10
-            if "instructions" in prompt.lower():
-                score += 5
-            if analysis.confidence > 0.8:
-                score += 5
+    async def _evaluate_prompt(self, prompt: str, analysis: AnalysisResult) -> Tuple[int, List[str]]:
+        """Async version of evaluation (on a worker thread)"""
+        return await asyncio.to_thread(self._evaluate_prompt_sync, prompt, analysis)
 
-            return min(100, score), suggestions
 
-    async def _evaluate_prompt(self, prompt: str, analysis: AnalysisResult) -> Tuple[int, List[str]]:
-        """Async version of evaluation"""
-        return self._evaluate_prompt_sync(prompt, analysis)
+_agent: Optional[PromptAgent] = None
+_agent_lock = threading.Lock()
+
+
+def get_prompt_agent() -> PromptAgent:
+    """Get or create the process-wide agent (shared model clients)"""
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = PromptAgent()
+    return _agent
+
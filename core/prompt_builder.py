@@ -5,7 +5,11 @@ Implements: 6-Step Framework + CRAFT Formula
 from typing import Dict, List, Optional
 from dataclasses import dataclass
 import google.generativeai as genai
+from core.cascade import ModelCascade, fast_model
 from core.config import Config
+from core.llm import call_model
+from core.metrics import count_fallback
+from core.tracing import traced
 import base64
 from PIL import Image
 import io
@@ -45,7 +49,15 @@ class PromptBuilder:
     def __init__(self):
         """Initialize prompt builder"""
         genai.configure(api_key=Config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(Config.GEMINI_MODEL)
+        self.model = genai.GenerativeModel(Config.GEMINI_STRONG_MODEL)
+        self.fast_model = fast_model()
+
+        # Validation asks the fast model first; malformed answers escalate
+        stages = []
+        if self.fast_model is not None:
+            stages.append(('fast', lambda prompt: self._validate_with_llm(prompt, self.fast_model)))
+        stages.append(('strong', lambda prompt: self._validate_with_llm(prompt, strict=False)))
+        self.validate_cascade = ModelCascade('prompt_builder.validate', stages)
 
     def build_from_6_step(self, components: PromptComponents) -> str:
         """
@@ -129,6 +141,7 @@ class PromptBuilder:
 
         return "\n".join(parts)
 
+    @traced('prompt_builder.image_context')
     def extract_context_from_image(self, image_bytes: bytes, user_query: str = "") -> str:
         """
         Extract context from uploaded image using Gemini Vision
@@ -158,13 +171,15 @@ Focus on:
 Provide a clear, structured description of the context from this image."""
 
             # Use Gemini Vision
-            response = self.model.generate_content([prompt, image])
+            response = call_model('prompt_builder.image_context', self.model, [prompt, image])
 
             return response.text
 
         except Exception as e:
+            count_fallback('prompt_builder.image_context')
             return f"Error extracting context from image: {str(e)}"
 
+    @traced('prompt_builder.document_context')
     def extract_context_from_document(self, text_content: str, user_query: str = "") -> str:
         """
         Extract key context from uploaded document
@@ -192,13 +207,15 @@ Provide:
 
 Keep it concise but informative."""
 
-            response = self.model.generate_content(prompt)
+            response = call_model('prompt_builder.document_context', self.model, prompt)
 
             return response.text
 
         except Exception as e:
+            count_fallback('prompt_builder.document_context')
             return f"Error extracting context from document: {str(e)}"
 
+    @traced('prompt_builder.suggest_improvements')
     def suggest_improvements(self, partial_prompt: str, framework: str = "6-step") -> Dict[str, List[str]]:
         """
         Suggest improvements for partially constructed prompt
@@ -251,7 +268,7 @@ Respond in JSON format:
   ...
 }}"""
 
-            response = self.model.generate_content(prompt)
+            response = call_model('prompt_builder.suggest_improvements', self.model, prompt)
 
             # Try to parse JSON (basic parsing, can be improved)
             import json
@@ -267,8 +284,10 @@ Respond in JSON format:
                 return {"suggestions": [response.text]}
 
         except Exception as e:
+            count_fallback('prompt_builder.suggest_improvements')
             return {"error": [f"Error generating suggestions: {str(e)}"]}
 
+    @traced('prompt_builder.template_suggestions')
     def get_template_suggestions(
         self,
         components: PromptComponents,
@@ -319,7 +338,7 @@ TEMPLATE:
 [The template with [placeholders]]
 ---"""
 
-            response = self.model.generate_content(prompt)
+            response = call_model('prompt_builder.template_suggestions', self.model, prompt)
 
             # Parse response into templates
             templates = []
@@ -347,8 +366,10 @@ TEMPLATE:
             return templates[:3]  # Return top 3
 
         except Exception as e:
+            count_fallback('prompt_builder.template_suggestions')
             return [{'name': 'Error', 'description': str(e), 'content': ''}]
 
+    @traced('prompt_builder.validate')
     def validate_prompt(self, prompt: str) -> Dict[str, any]:
         """
         Validate a constructed prompt and provide quality score
@@ -359,8 +380,30 @@ TEMPLATE:
         Returns:
             Dictionary with score, strengths, weaknesses, recommendations
         """
-        try:
-            validation_prompt = f"""Evaluate this prompt's quality and provide feedback:
+        result, _ = self.validate_cascade.run(prompt)
+        if result:
+            return result
+        return {
+            'score': 0,
+            'strengths': [],
+            'weaknesses': [],
+            'recommendations': ["Error validating prompt: Gemini did not return an evaluation"]
+        }
+
+    def _validate_with_llm(self, prompt: str, model=None, strict: bool = True) -> Optional[Dict[str, any]]:
+        """
+        Ask Gemini (the strong model unless `model` is given) to grade a prompt
+
+        Args:
+            prompt: The complete prompt to validate
+            model: Gemini model to ask
+            strict: Return None unless the answer has a score and recommendations,
+                instead of filling in defaults
+
+        Returns:
+            Dictionary with score, strengths, weaknesses, recommendations
+        """
+        validation_prompt = f"""Evaluate this prompt's quality and provide feedback:
 
 Prompt to evaluate:
 {prompt}
@@ -383,43 +426,39 @@ RECOMMENDATIONS:
 - [recommendation 1]
 - [recommendation 2]"""
 
-            response = self.model.generate_content(validation_prompt)
-
-            # Parse response
-            result = {
-                'score': 75,  # Default
-                'strengths': [],
-                'weaknesses': [],
-                'recommendations': []
-            }
-
-            lines = response.text.split('\n')
-            current_section = None
-
-            for line in lines:
-                if 'SCORE:' in line:
-                    try:
-                        result['score'] = int(''.join(filter(str.isdigit, line)))
-                    except:
-                        pass
-                elif 'STRENGTHS:' in line:
-                    current_section = 'strengths'
-                elif 'WEAKNESSES:' in line:
-                    current_section = 'weaknesses'
-                elif 'RECOMMENDATIONS:' in line:
-                    current_section = 'recommendations'
-                elif line.strip().startswith('-') and current_section:
-                    result[current_section].append(line.strip()[1:].strip())
-
-            return result
-
-        except Exception as e:
-            return {
-                'score': 0,
-                'strengths': [],
-                'weaknesses': [],
-                'recommendations': [f"Error validating prompt: {str(e)}"]
-            }
+        response = call_model('prompt_builder.validate', model or self.model, validation_prompt)
+
+        # Parse response
+        result = {
+            'score': 75,  # Default
+            'strengths': [],
+            'weaknesses': [],
+            'recommendations': []
+        }
+
+        lines = response.text.split('\n')
+        current_section = None
+        scored = False
+
+        for line in lines:
+            if 'SCORE:' in line:
+                try:
+                    result['score'] = int(''.join(filter(str.isdigit, line)))
+                    scored = True
+                except:
+                    pass
+            elif 'STRENGTHS:' in line:
+                current_section = 'strengths'
+            elif 'WEAKNESSES:' in line:
+                current_section = 'weaknesses'
+            elif 'RECOMMENDATIONS:' in line:
+                current_section = 'recommendations'
+            elif line.strip().startswith('-') and current_section:
+                result[current_section].append(line.strip()[1:].strip())
+
+        if strict and not (scored and 0 <= result['score'] <= 100 and result['recommendations']):
+            return None
+        return result
 
 
 # Framework examples and guides
@@ -4,11 +4,21 @@ The brain of the AI Prompt Optimizer
 Universal Technical & Academic Edition - Supporting 10 Domains
 """
 import json
+import threading
 from dataclasses import dataclass, asdict
 from typing import List, Dict, Optional
 import openai
 import google.generativeai as genai
 from .config import Config
+from .deadline import Deadline, deadline_scope, note_degraded
+from .llm import generate_hedged
+from .metrics import count_fallback
+from .near_duplicate import get_near_duplicate_cache, normalize
+from .profiling import profiled
+from .shared_cache import get_shared_cache
+from .singleflight import fingerprint, get_singleflight
+from .tracing import annotate, span, traced
+from .usage import usage_scope
 
 
 @dataclass
@@ -138,7 +148,8 @@ class PromptEngine:
         role: str,
         task_type: str,
         domain: str = "academic",
-        field: Optional[str] = None
+        field: Optional[str] = None,
+        deadline: Optional[Deadline] = None
     ) -> OptimizedPromptSet:
         """
         Generate domain-specific optimized versions of a prompt
@@ -150,10 +161,31 @@ class PromptEngine:
             task_type: Task type
             domain: Domain (academic, ml_ds, python_code, etc.)
             field: Specific field within domain
+            deadline: Time budget (default: the caller's, else Config.REQUEST_DEADLINE_SECONDS);
+                without enough time left the rule-based templates are used
 
         Returns:
             OptimizedPromptSet with domain-specific versions
         """
+        # Identical requests already in flight share one LLM call
+        key = fingerprint(
+            'optimize_prompt', self.provider, self.model, raw_prompt, asdict(analysis), role, task_type, domain, field
+        )
+        with deadline_scope(deadline), usage_scope():
+            return get_singleflight().do(
+                key, self._optimize_prompt, raw_prompt, analysis, role, task_type, domain, field
+            )
+
+    def _optimize_prompt(
+        self,
+        raw_prompt: str,
+        analysis: PromptAnalysis,
+        role: str,
+        task_type: str,
+        domain: str,
+        field: Optional[str]
+    ) -> OptimizedPromptSet:
+        """Uncoalesced optimize_prompt()"""
         # Get domain-specific version labels
         version_labels = Config.get_version_labels(domain)
 
@@ -176,54 +208,26 @@ class PromptEngine:
         )
 
         try:
-            if self.provider == "gemini":
-                # Use Google Gemini API
-                model = genai.GenerativeModel(self.model)
-
-                # Combine system prompt and user message for Gemini
-                full_prompt = f"""{system_prompt}
-
-Original prompt to optimize:
+            # Gemini gets system prompt and message as one text; OpenAI gets a
+            # system message. Hedged backups (Config.HEDGE_BACKUPS) may be either.
+            target = f"{'gemini' if self.provider == 'gemini' else 'openai'}:{self.model}"
+            response_text = generate_hedged(
+                target,
+                f"""Original prompt to optimize:
 
 {raw_prompt}
 
-Please respond with a JSON object containing the optimized versions."""
-
-                response = model.generate_content(
-                    full_prompt,
-                    generation_config={
-                        'temperature': 0.7,
-                        'max_output_tokens': 2000,
-                    }
-                )
-
-                # Extract JSON from response
-                response_text = response.text.strip()
-
-                # Remove markdown code blocks if present
-                if response_text.startswith('```json'):
-                    response_text = response_text[7:]
-                if response_text.startswith('```'):
-                    response_text = response_text[3:]
-                if response_text.endswith('```'):
-                    response_text = response_text[:-3]
-
-                result = json.loads(response_text.strip())
-
-            else:
-                # Use OpenAI API
-                response = openai.ChatCompletion.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"Original prompt to optimize:\n\n{raw_prompt}"}
-                    ],
-                    response_format={"type": "json_object"},
-                    temperature=0.7,
-                    max_tokens=2000
-                )
-
-                result = json.loads(response.choices[0].message.content)
+Please respond with a JSON object containing the optimized versions.""",
+                validate=self._is_json_object,
+                stage='prompt_engine.optimize',
+                system=system_prompt,
+                generation_config={
+                    'temperature': 0.7,
+                    'max_output_tokens': 2000,
+                },
+                json_mode=True
+            )
+            result = json.loads(self._strip_code_fence(response_text))
 
             # Extract versions dynamically based on domain
             versions = {}
@@ -238,42 +242,102 @@ Please respond with a JSON object containing the optimized versions."""
 
         except Exception as e:
             # Fallback to rule-based optimization
+            count_fallback('prompt_engine.optimize', 'deadline' if note_degraded('optimize_prompt') else 'error')
             return self._fallback_optimization(raw_prompt, analysis, role, task_type, domain)
 
-    def smart_optimize(self, raw_prompt: str) -> Dict:
+    @staticmethod
+    def _strip_code_fence(response_text: str) -> str:
+        """Response text without a surrounding markdown code block"""
+        response_text = response_text.strip()
+        if response_text.startswith('```json'):
+            response_text = response_text[7:]
+        if response_text.startswith('```'):
+            response_text = response_text[3:]
+        if response_text.endswith('```'):
+            response_text = response_text[:-3]
+        return response_text.strip()
+
+    @classmethod
+    def _is_json_object(cls, response_text: str) -> bool:
+        """Whether a response parses to the JSON object optimize_prompt expects"""
+        try:
+            return isinstance(json.loads(cls._strip_code_fence(response_text)), dict)
+        except (ValueError, AttributeError):
+            return False
+
+    @traced('prompt_engine.smart_optimize')
+    @profiled('prompt_engine.smart_optimize')
+    def smart_optimize(self, raw_prompt: str, deadline: Optional[Deadline] = None) -> Dict:
         """
         Quick optimization with auto-detection
         Analyzes and optimizes in one shot - perfect for Quick Mode!
 
         Args:
             raw_prompt: The user's original prompt
+            deadline: Time budget for detection and optimization together
+                (default: Config.REQUEST_DEADLINE_SECONDS)
 
         Returns:
             Dictionary with analysis, best version, all versions, and metadata
+            ('degraded' lists stages that fell back for lack of time)
         """
+        # Prompts differing only in case, punctuation or a word reuse a recent result
+        cache = get_near_duplicate_cache()
+        namespace = fingerprint('smart_optimize', self.provider, self.model)
+        if cache is not None:
+            cached = cache.get(namespace, raw_prompt)
+            if cached is not None:
+                annotate(cached='near_duplicate')
+                return dict(cached, raw_prompt=raw_prompt)
+
+        # Then the same prompt optimized by another worker process
+        shared = get_shared_cache()
+        if shared is not None:
+            cached = shared.get(namespace, normalize(raw_prompt))
+            if cached is not None:
+                annotate(cached='shared')
+                if cache is not None:
+                    cache.put(namespace, raw_prompt, cached)
+                return dict(cached, raw_prompt=raw_prompt)
+
+        with deadline_scope(deadline) as deadline, usage_scope():
+            result = self._smart_optimize(raw_prompt)
+            result['degraded'] = list(deadline.degraded) if deadline is not None else []
+        if not result['degraded']:
+            if cache is not None:
+                cache.put(namespace, raw_prompt, result)
+            if shared is not None:
+                shared.set(namespace, normalize(raw_prompt), result)
+        return result
+
+    def _smart_optimize(self, raw_prompt: str) -> Dict:
+        """Uncached smart_optimize()"""
         # Import here to avoid circular dependency
         from core.smart_analyzer import SmartAnalyzer
 
         # Step 1: Auto-detect context
-        analyzer = SmartAnalyzer()
-        detection = analyzer.analyze_prompt(raw_prompt)
+        with span('prompt_engine.detect'):
+            analyzer = SmartAnalyzer()
+            detection = analyzer.analyze_prompt(raw_prompt)
 
         # Step 2: Analyze with detected context
-        analysis = self.analyze_prompt(
-            raw_prompt=raw_prompt,
-            role=detection['role'],
-            task_type=detection['task'],
-            domain=detection['domain']
-        )
+        with span('prompt_engine.heuristics'):
+            analysis = self.analyze_prompt(
+                raw_prompt=raw_prompt,
+                role=detection['role'],
+                task_type=detection['task'],
+                domain=detection['domain']
+            )
 
         # Step 3: Optimize
-        optimized = self.optimize_prompt(
-            raw_prompt=raw_prompt,
-            analysis=analysis,
-            role=detection['role'],
-            task_type=detection['task'],
-            domain=detection['domain']
-        )
+        with span('prompt_engine.optimize', domain=detection['domain']):
+            optimized = self.optimize_prompt(
+                raw_prompt=raw_prompt,
+                analysis=analysis,
+                role=detection['role'],
+                task_type=detection['task'],
+                domain=detection['domain']
+            )
 
         # Step 4: Pick best version automatically
         best_version_key = analyzer.get_best_version_type(detection)
@@ -779,3 +843,17 @@ Please provide a comprehensive solution aligned with this focus."""
             versions=versions,
             analysis=analysis
         )
+
+
+_engine: Optional[PromptEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_prompt_engine() -> PromptEngine:
+    """Get or create the process-wide engine for the configured provider"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = PromptEngine()
+    return _engine
@@ -5,6 +5,12 @@ Implements: Quick Enhance, Iterative Refinement, Educational Feedback
 from typing import Dict, List, Optional, Tuple
 import google.generativeai as genai
 from core.config import Config
+from core.deadline import Deadline, deadline_scope, request_options
+from core.llm import call_model
+from core.metrics import count_fallback
+from core.profiling import profiled
+from core.tracing import traced
+from core.usage import usage_scope
 from dataclasses import dataclass
 
 
@@ -45,7 +51,9 @@ class PromptEnhancer:
         genai.configure(api_key=Config.GEMINI_API_KEY)
         self.model = genai.GenerativeModel(Config.GEMINI_MODEL)
 
-    def quick_enhance(self, raw_prompt: str) -> Enhancement:
+    @traced('prompt_enhancer.quick_enhance')
+    @profiled('prompt_enhancer.quick_enhance')
+    def quick_enhance(self, raw_prompt: str, deadline: Optional[Deadline] = None) -> Enhancement:
         """
         One-shot prompt enhancement using best practices
 
@@ -54,6 +62,7 @@ class PromptEnhancer:
 
         Args:
             raw_prompt: Original prompt to enhance
+            deadline: Time budget (default: Config.REQUEST_DEADLINE_SECONDS)
 
         Returns:
             Enhancement object with improved prompt and explanations
@@ -89,8 +98,7 @@ CHANGES:
 OVERALL EXPLANATION:
 [Brief explanation of how these changes improve the prompt]"""
 
-            response = self.model.generate_content(prompt)
-            result_text = response.text
+            result_text = self._generate(prompt, 'prompt_enhancer.quick_enhance', deadline)
 
             # Parse response
             enhanced_prompt = self._extract_section(result_text, "ENHANCED PROMPT:", "SCORE_BEFORE:")
@@ -110,6 +118,7 @@ OVERALL EXPLANATION:
 
         except Exception as e:
             # Fallback: simple enhancement
+            count_fallback('prompt_enhancer.quick_enhance')
             return Enhancement(
                 original=raw_prompt,
                 enhanced=f"As an expert, {raw_prompt}. Please provide a detailed response.",
@@ -122,7 +131,9 @@ OVERALL EXPLANATION:
                 explanation=f"Applied basic enhancements. Error: {str(e)}"
             )
 
-    def start_iterative_refinement(self, raw_prompt: str) -> RefinementStage:
+    @traced('prompt_enhancer.start_refinement')
+    @profiled('prompt_enhancer.start_refinement')
+    def start_iterative_refinement(self, raw_prompt: str, deadline: Optional[Deadline] = None) -> RefinementStage:
         """
         Start iterative refinement process (Stage 1)
 
@@ -130,6 +141,7 @@ OVERALL EXPLANATION:
 
         Args:
             raw_prompt: Initial prompt to refine
+            deadline: Time budget (default: Config.REQUEST_DEADLINE_SECONDS)
 
         Returns:
             RefinementStage with analysis and questions
@@ -163,8 +175,7 @@ SUGGESTIONS:
 - [Specific improvement 2]
 - [Specific improvement 3]"""
 
-            response = self.model.generate_content(prompt)
-            result_text = response.text
+            result_text = self._generate(prompt, 'prompt_enhancer.start_refinement', deadline)
 
             # Parse response
             score = self._extract_score(result_text, "SCORE:")
@@ -190,6 +201,7 @@ SUGGESTIONS:
 
         except Exception as e:
             # Fallback
+            count_fallback('prompt_enhancer.start_refinement')
             return RefinementStage(
                 stage_number=1,
                 prompt=raw_prompt,
@@ -199,12 +211,15 @@ SUGGESTIONS:
                 score=60
             )
 
+    @traced('prompt_enhancer.refine')
+    @profiled('prompt_enhancer.refine')
     def refine_with_answers(
         self,
         current_prompt: str,
         questions: List[str],
         answers: List[str],
-        stage_number: int
+        stage_number: int,
+        deadline: Optional[Deadline] = None
     ) -> RefinementStage:
         """
         Continue refinement with user answers
@@ -214,6 +229,7 @@ SUGGESTIONS:
             questions: Questions that were asked
             answers: User's answers to questions
             stage_number: Current stage number
+            deadline: Time budget (default: Config.REQUEST_DEADLINE_SECONDS)
 
         Returns:
             Next RefinementStage with improved prompt
@@ -249,8 +265,7 @@ NEXT QUESTIONS:
 SUGGESTIONS:
 - [Any final suggestions, or "None - prompt is optimal"]"""
 
-            response = self.model.generate_content(prompt)
-            result_text = response.text
+            result_text = self._generate(prompt, 'prompt_enhancer.refine', deadline)
 
             # Parse response
             refined_prompt = self._extract_section(result_text, "REFINED PROMPT:", "SCORE:")
@@ -276,6 +291,7 @@ SUGGESTIONS:
 
         except Exception as e:
             # Fallback: return current with no questions
+            count_fallback('prompt_enhancer.refine')
             return RefinementStage(
                 stage_number=stage_number + 1,
                 prompt=current_prompt,
@@ -285,7 +301,9 @@ SUGGESTIONS:
                 score=75
             )
 
-    def explain_improvement(self, original: str, enhanced: str) -> Dict[str, any]:
+    @traced('prompt_enhancer.explain')
+    @profiled('prompt_enhancer.explain')
+    def explain_improvement(self, original: str, enhanced: str, deadline: Optional[Deadline] = None) -> Dict[str, any]:
         """
         Explain how the enhanced prompt is better
 
@@ -294,6 +312,7 @@ SUGGESTIONS:
         Args:
             original: Original prompt
             enhanced: Enhanced prompt
+            deadline: Time budget (default: Config.REQUEST_DEADLINE_SECONDS)
 
         Returns:
             Dictionary with detailed explanation
@@ -324,8 +343,7 @@ EXPECTED IMPACT:
 LEARNING TAKEAWAY:
 [One key lesson the user can apply to future prompts]"""
 
-            response = self.model.generate_content(prompt)
-            result_text = response.text
+            result_text = self._generate(prompt, 'prompt_enhancer.explain', deadline)
 
             improvements = self._extract_numbered_list(result_text, "KEY IMPROVEMENTS:")
             techniques = self._extract_list(result_text, "TECHNIQUES USED:", "EXPECTED IMPACT:")
@@ -340,6 +358,7 @@ LEARNING TAKEAWAY:
             }
 
         except Exception as e:
+            count_fallback('prompt_enhancer.explain')
             return {
                 'improvements': ['Enhanced clarity', 'Added structure', 'Improved specificity'],
                 'techniques': ['Added role definition', 'Included constraints'],
@@ -347,6 +366,11 @@ LEARNING TAKEAWAY:
                 'takeaway': 'Always be specific and provide context in your prompts.'
             }
 
+    def _generate(self, prompt: str, stage: str, deadline: Optional[Deadline]) -> str:
+        """Gemini's answer within the deadline (the fallbacks apply if it runs out)"""
+        with deadline_scope(deadline), usage_scope():
+            return call_model(stage, self.model, prompt, **request_options()).text
+
     # Helper methods for parsing AI responses
 
     def _extract_section(self, text: str, start_marker: str, end_marker: Optional[str]) -> str:
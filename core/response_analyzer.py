@@ -5,6 +5,9 @@ Analyzes and scores AI responses to prove optimized prompts work better
 from dataclasses import dataclass
 from typing import List
 
+from core.profiling import profiled
+from core.tracing import traced
+
 
 @dataclass
 class ResponseQuality:
@@ -22,6 +25,8 @@ class ResponseAnalyzer:
     """Analyzes AI responses to compare quality"""
 
     @staticmethod
+    @traced('response_analyzer.analyze')
+    @profiled('response_analyzer.analyze')
     def analyze_response(response_text: str, prompt: str) -> ResponseQuality:
         """
         Analyze the quality of an AI response
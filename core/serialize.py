@@ -0,0 +1,32 @@
+"""
+Pipeline results as plain JSON values, for the HTTP API and the batch CLI
+"""
+from dataclasses import asdict, fields, is_dataclass
+from datetime import datetime
+from enum import Enum
+
+from core.prompt_agent import PromptResult
+
+
+def to_json(value):
+    """Pipeline results (dataclasses, enums, datetimes) as plain JSON values"""
+    if isinstance(value, PromptResult):
+        data = {f.name: to_json(getattr(value, f.name)) for f in fields(value) if f.name != 'evaluation'}
+        data['score_pending'] = value.score_pending
+        return data
+    if is_dataclass(value):
+        return to_json(asdict(value))
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {k: to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    return value
+
+
+def optimize_result_json(result: dict) -> dict:
+    """smart_optimize() result as JSON (the OptimizedPromptSet only repeats 'analysis' and 'all_versions')"""
+    return to_json({k: v for k, v in result.items() if k != 'optimized'})
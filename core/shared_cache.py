@@ -0,0 +1,193 @@
+"""
+Shared Cache - One result cache for every worker process on the box
+A SQLite file in WAL mode: readers never block, each get or set is a single
+atomic statement, and every Streamlit, API or job worker process opening the
+same file sees the others' entries. Entries expire after their TTL; once the
+file holds more than max_entries or max_bytes, the entries closest to
+expiry are evicted first.
+
+Values are pickled, so only point it at a file this application owns.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+from core.config import Config
+from core.metrics import count_cache, observe_db_write
+from core.singleflight import fingerprint
+
+# Eviction runs on about one set in this many (per process)
+_EVICT_EVERY = 64
+# Eviction trims to this share of the limits, so it doesn't run on every set
+_EVICT_TO = 0.9
+
+
+class SharedCache:
+    """
+    Cross-process key-value cache with TTL and size-based eviction
+
+    Keys are (namespace, key) pairs; key may be any JSON-serializable value
+    and is hashed. Each thread keeps its own connection.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None
+    ):
+        """
+        Initialize the cache (creating the file if needed)
+
+        Args:
+            path: SQLite file shared by the processes
+            ttl: Default seconds an entry lives (default: Config.SHARED_CACHE_TTL_SECONDS)
+            max_entries: Entry limit (default: Config.SHARED_CACHE_MAX_ENTRIES)
+            max_bytes: Limit on the summed size of the values (default: Config.SHARED_CACHE_MAX_MB)
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl or Config.SHARED_CACHE_TTL_SECONDS
+        self.max_entries = max_entries or Config.SHARED_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or Config.SHARED_CACHE_MAX_MB * 1024 * 1024
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sets = 0
+        self.stats = {'hits': 0, 'misses': 0, 'sets': 0, 'evicted': 0}
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_expires_at ON cache (expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_namespace ON cache (namespace)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """This thread's connection (autocommit: every statement is its own transaction)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL: durable up to the last checkpoint
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _key(namespace: str, key: Any) -> str:
+        return fingerprint(namespace, key)
+
+    def get(self, namespace: str, key: Any) -> Optional[Any]:
+        """The live value stored under (namespace, key), or None"""
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (self._key(namespace, key), time.time())
+        ).fetchone()
+        with self._lock:
+            self.stats['hits' if row else 'misses'] += 1
+        count_cache('shared', 'hit' if row else 'miss')
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0])
+        except Exception:
+            return None  # Written by an incompatible version of the code
+
+    def set(self, namespace: str, key: Any, value: Any, ttl: Optional[float] = None) -> bool:
+        """Store a value (replacing any other); False if it is too large to cache"""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes * (1 - _EVICT_TO):
+            return False
+        start = time.perf_counter()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (key, namespace, value, size, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (self._key(namespace, key), namespace, data, len(data), time.time() + (ttl or self.ttl))
+        )
+        observe_db_write('shared_cache', 'insert', time.perf_counter() - start)
+        with self._lock:
+            self.stats['sets'] += 1
+            self._sets += 1
+            evict = self._sets % _EVICT_EVERY == 0
+        if evict:
+            self.evict()
+        return True
+
+    def get_or_compute(self, namespace: str, key: Any, compute: Callable[[], Any],
+                       ttl: Optional[float] = None) -> Any:
+        """Cached value, or compute() stored for the other processes (None is not cached)"""
+        value = self.get(namespace, key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.set(namespace, key, value, ttl)
+        return value
+
+    def delete(self, namespace: str, key: Any):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (self._key(namespace, key),))
+
+    def clear(self, namespace: Optional[str] = None):
+        """Remove every entry, or those of one namespace"""
+        if namespace is None:
+            self._conn().execute("DELETE FROM cache")
+        else:
+            self._conn().execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+
+    def evict(self) -> int:
+        """Drop expired entries, then the ones closest to expiry while over a limit"""
+        conn = self._conn()
+        removed = conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        count, size = conn.execute("SELECT count(*), total(size) FROM cache").fetchone()
+        if count > self.max_entries or size > self.max_bytes:
+            # Walk entries soonest-expiring first until both limits are met with headroom
+            excess_count = max(0, count - int(self.max_entries * _EVICT_TO))
+            excess_bytes = max(0, size - self.max_bytes * _EVICT_TO)
+            cutoff, dropped_bytes = None, 0
+            for n, (expires_at, entry_size) in enumerate(
+                conn.execute("SELECT expires_at, size FROM cache ORDER BY expires_at"), 1
+            ):
+                dropped_bytes += entry_size
+                cutoff = expires_at
+                if n >= excess_count and dropped_bytes >= excess_bytes:
+                    break
+            if cutoff is not None:
+                removed += conn.execute("DELETE FROM cache WHERE expires_at <= ?", (cutoff,)).rowcount
+        with self._lock:
+            self.stats['evicted'] += removed
+        return removed
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT count(*) FROM cache WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+
+    def report(self) -> Dict[str, Any]:
+        """This process's hit rate and the shared file's size"""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+        stats['entries'] = len(self)
+        return stats
+
+
+_shared_cache: Optional[SharedCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """Get the process-wide handle on the shared cache, or None when Config.SHARED_CACHE_ENABLED is off"""
+    global _shared_cache
+    if not Config.SHARED_CACHE_ENABLED:
+        return None
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = SharedCache(Config.SHARED_CACHE_PATH)
+    return _shared_cache
@@ -0,0 +1,126 @@
+"""
+Single Flight - Coalesce identical in-flight calls
+Concurrent calls with the same fingerprint (a double-clicked send button, a
+classroom submitting the same assignment prompt) share one LLM call: the first
+caller runs it and every other caller waits for its result, from threads or asyncio
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+def fingerprint(*parts) -> str:
+    """
+    Stable key for a request
+
+    Args:
+        parts: JSON-serializable request fields (anything else is str()-ed)
+
+    Returns:
+        Hex SHA-256 of the parts
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SingleFlight:
+    """
+    At most one execution per key at a time
+
+    Only calls that overlap are coalesced; once the leader finishes, the key
+    is free and the next call runs again (this is not a cache). Waiters get
+    the leader's result object itself, so treat results as read-only. If the
+    leader raises, every waiter gets the same exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.executions = 0  # Calls that actually ran
+        self.shared = 0      # Calls answered by another caller's execution
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs), or wait for the identical call already running
+
+        Args:
+            key: Request fingerprint
+            fn: Function producing the result
+
+        Returns:
+            The result of the one execution for this key
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def do_async(self, key: str, fn: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """
+        Async version of do(): awaits fn(*args, **kwargs), or the identical call in flight
+
+        Coroutines and threads share the same keys, so an async caller can
+        wait on a thread's call and vice versa.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    def in_flight(self) -> int:
+        """Number of keys currently executing"""
+        with self._lock:
+            return len(self._calls)
+
+    def _join(self, key: str):
+        """(future for key, whether this caller runs the call)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.executions += 1
+            return future, True
+
+    def _finish(self, key: str, future: Future, result: Any = None, error: Optional[BaseException] = None):
+        # Free the key before resolving, so a waiter retrying starts a new call
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+
+# Global instance
+_singleflight: Optional[SingleFlight] = None
+_singleflight_lock = threading.Lock()
+
+
+def get_singleflight() -> SingleFlight:
+    """Get or create the process-wide single-flight group"""
+    global _singleflight
+    if _singleflight is None:
+        # Two groups created by racing first callers would not coalesce
+        with _singleflight_lock:
+            if _singleflight is None:
+                _singleflight = SingleFlight()
+    return _singleflight
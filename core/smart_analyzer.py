@@ -1,12 +1,26 @@
 """
 Smart Analyzer - AI-powered prompt analysis
 Automatically detects domain, role, and task from raw prompts using Gemini
+(or a local classifier trained on earlier Gemini labels, when it is confident)
+Calls go through a model cascade: classifier, keyword heuristics, fast model, strong model
 """
 import json
 import google.generativeai as genai
+from core.cascade import LLM_TIERS, ModelCascade, fast_model
 from core.config import Config
+from core.deadline import request_options
+from core.local_classifier import local_labels, log_llm_labels, normalize_label
+from core.near_duplicate import normalize
+from core.shared_cache import get_shared_cache
+from core.llm import call_model
+from core.tracing import annotate
 from typing import Dict, Optional
 
+# Label source of this analyzer in the LLM label log / local classifier
+LABEL_SOURCE = 'smart_analyzer'
+
+VALID_DOMAINS = ['academic', 'ml-data-science', 'python-development']
+
 
 class SmartAnalyzer:
     """Uses Gemini to auto-detect prompt context and characteristics"""
@@ -14,7 +28,18 @@ class SmartAnalyzer:
     def __init__(self):
         """Initialize Gemini"""
         genai.configure(api_key=Config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(Config.GEMINI_MODEL)
+        self.model = genai.GenerativeModel(Config.GEMINI_STRONG_MODEL)
+        self.fast_model = fast_model()
+
+        stages = [('classifier', self._local_analysis)]
+        if Config.CASCADE_ENABLED:
+            stages.append(('heuristics', self._heuristic_analysis))
+        if self.fast_model is not None:
+            stages.append(('fast', lambda prompt: self._analyze_with_llm(
+                prompt, self.fast_model, min_confidence=Config.CASCADE_FAST_THRESHOLD
+            )))
+        stages.append(('strong', lambda prompt: self._analyze_with_llm(prompt)))
+        self.cascade = ModelCascade(LABEL_SOURCE, stages)
 
     def analyze_prompt(self, raw_prompt: str) -> Dict[str, any]:
         """
@@ -36,6 +61,40 @@ class SmartAnalyzer:
                 'detected': False
             }
 
+        # Gemini's labels for this prompt, if another worker process already asked
+        shared = get_shared_cache()
+        if shared is not None:
+            cached = shared.get(LABEL_SOURCE, normalize(raw_prompt))
+            if cached is not None:
+                annotate(cached='shared')
+                return cached
+
+        analysis, tier = self.cascade.run(raw_prompt)
+        if shared is not None and tier in LLM_TIERS:
+            shared.set(LABEL_SOURCE, normalize(raw_prompt), analysis)
+
+        # Fallback to keyword-based detection if Gemini fails
+        return analysis or self._fallback_analysis(raw_prompt)
+
+    def _analyze_with_llm(
+        self,
+        raw_prompt: str,
+        model=None,
+        min_confidence: Optional[float] = None
+    ) -> Optional[Dict[str, any]]:
+        """
+        Ask Gemini for the labels (and log them as classifier training data)
+
+        Args:
+            raw_prompt: The user's prompt
+            model: Gemini model to ask (defaults to the strong model)
+            min_confidence: If set, reject answers below this confidence or with
+                an unknown domain instead of repairing them, so the cascade escalates
+
+        Returns:
+            Analysis dictionary, or None if Gemini failed, returned invalid JSON
+            or was not confident enough
+        """
         try:
             # Craft analysis prompt
             analysis_request = f"""Analyze this user prompt and return ONLY valid JSON (no markdown, no code blocks, no explanation).
@@ -58,8 +117,8 @@ Rules:
 Return format:
 {{"domain": "academic", "role": "student", "task": "learning", "confidence": 0.9}}"""
 
-            # Get response from Gemini
-            response = self.model.generate_content(analysis_request)
+            # Get response from Gemini, within the request's deadline if any
+            response = call_model('smart_analyzer.detect', model or self.model, analysis_request, **request_options())
             response_text = response.text.strip()
 
             # Remove markdown code blocks if present
@@ -73,22 +132,61 @@ Return format:
             analysis = json.loads(response_text)
 
             # Validate domain
-            valid_domains = ['academic', 'ml-data-science', 'python-development']
-            if analysis.get('domain') not in valid_domains:
+            if min_confidence is not None and (
+                analysis.get('domain') not in VALID_DOMAINS
+                or float(analysis.get('confidence', 0)) < min_confidence
+            ):
+                return None
+            if analysis.get('domain') not in VALID_DOMAINS:
                 # Default to academic if invalid
                 analysis['domain'] = 'academic'
 
+            # Same label form as the classifier tier ("Data Scientist" -> "data-scientist")
+            for key in ('role', 'task'):
+                label = normalize_label(analysis.get(key))
+                if label:
+                    analysis[key] = label
+
             # Add detected flag
             analysis['detected'] = True
 
+            log_llm_labels(LABEL_SOURCE, raw_prompt, {
+                key: analysis.get(key) for key in ('domain', 'role', 'task')
+            }, background=True)
             return analysis
 
-        except json.JSONDecodeError as e:
-            # Fallback to keyword-based detection
-            return self._fallback_analysis(raw_prompt)
-        except Exception as e:
-            # Fallback on any error
-            return self._fallback_analysis(raw_prompt)
+        except Exception:
+            return None  # Invalid JSON or API error
+
+    def _local_analysis(self, raw_prompt: str) -> Optional[Dict[str, any]]:
+        """
+        Labels from the local classifier, skipping the Gemini round trip
+
+        Returns:
+            Analysis dictionary, or None when no model is trained or it is unsure
+        """
+        try:
+            prediction = local_labels(LABEL_SOURCE, raw_prompt)
+        except Exception:
+            return None
+        if not prediction or not {'domain', 'role', 'task'} <= prediction.keys():
+            return None
+
+        return {
+            'domain': prediction['domain'][0],
+            'role': prediction['role'][0],
+            'task': prediction['task'][0],
+            'confidence': min(prob for _, prob in prediction.values()),
+            'detected': True,
+            'source': 'local'
+        }
+
+    def _heuristic_analysis(self, raw_prompt: str) -> Optional[Dict[str, any]]:
+        """Keyword detection, when enough keywords agree to skip Gemini"""
+        analysis = self._fallback_analysis(raw_prompt)
+        if analysis['confidence'] < Config.CASCADE_HEURISTIC_THRESHOLD:
+            return None
+        return analysis
 
     def _fallback_analysis(self, raw_prompt: str) -> Dict[str, any]:
         """
@@ -0,0 +1,592 @@
+"""
+Background Tasks - Fire-and-forget work off Streamlit's script thread
+Named queues with their own worker threads run tasks by priority, retry
+failures with exponential backoff, and drain on shutdown. Tasks submitted as
+durable are also written to a small SQLite queue, so work accepted before a
+restart or crash is run after it.
+"""
+import atexit
+import heapq
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from core.config import Config
+from core.hedging import LatencyHistogram
+
+# Durable tasks refer to their function by name, so it can be found after a restart
+_registry: Dict[str, Callable] = {}
+
+# Completions kept per queue for the throughput window
+_THROUGHPUT_WINDOW_SECONDS = 60
+
+
+def task(name: str) -> Callable[[Callable], Callable]:
+    """
+    Register a function under `name` so it can be submitted durably
+
+        @task('llm_labels.log')
+        def store_labels(source, text, labels): ...
+    """
+    def register(fn: Callable) -> Callable:
+        _registry[name] = fn
+        if _task_runner is not None:
+            _task_runner.recover(name)  # Its tasks left over from a previous run
+        return fn
+    return register
+
+
+class _Task:
+    """One submission; `ready_at` is when it may (next) run"""
+
+    __slots__ = ('fn', 'name', 'args', 'kwargs', 'queue', 'priority', 'retries_left',
+                 'attempts', 'ready_at', 'future', 'store_id')
+
+    def __init__(self, fn, name, args, kwargs, queue, priority, retries, ready_at, store_id=None):
+        self.fn, self.name, self.args, self.kwargs = fn, name, args, kwargs
+        self.queue, self.priority, self.retries_left = queue, priority, retries
+        self.attempts = 0
+        self.ready_at = ready_at
+        self.future: Future = Future()
+        self.store_id = store_id
+
+
+class _Queue:
+    """Ready heap (highest priority, then oldest first), delayed heap, workers and stats"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.cond = threading.Condition()
+        self.ready: List[Tuple] = []
+        self.delayed: List[Tuple] = []
+        self.running = 0
+        self.threads: List[threading.Thread] = []
+        self.latency = LatencyHistogram()  # Ready -> started
+        self.finished = deque()            # Completion times within the throughput window
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'retried': 0}
+
+    def idle(self) -> bool:
+        return not self.ready and not self.delayed and not self.running
+
+
+class TaskStore:
+    """
+    SQLite queue of durable tasks not yet finished
+
+    A row is added when a durable task is submitted and deleted when it
+    succeeds; tasks out of retries are kept with status 'failed' and the
+    error for inspection.
+
+    Several processes (API and job workers, the app) may share one file.
+    Each pending row is leased by the store that added or claimed it, and
+    its runner renews the lease while it lives: other stores only claim
+    rows whose lease expired (their process died or shut down).
+    """
+
+    def __init__(self, path: Union[str, Path], owner: Optional[str] = None,
+                 lease_seconds: Optional[float] = None):
+        """
+        Initialize the store
+
+        Args:
+            path: SQLite file
+            owner: Id of this store's leases (default: host, pid and a random suffix)
+            lease_seconds: How long a lease lasts unless renewed (default: Config.TASK_LEASE_SECONDS)
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds or Config.TASK_LEASE_SECONDS
+        self._lock = threading.Lock()
+        self._execute("PRAGMA journal_mode=WAL")
+        self._execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL,
+                name TEXT NOT NULL,
+                args TEXT NOT NULL,
+                kwargs TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                retries_left INTEGER NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                error TEXT,
+                created_at REAL NOT NULL,
+                owner TEXT,
+                lease_expires_at REAL
+            )
+        """)
+        # Files from before leases: their rows count as expired
+        conn = self._connect()
+        try:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+        finally:
+            conn.close()
+        for column, kind in (('owner', 'TEXT'), ('lease_expires_at', 'REAL')):
+            if column not in columns:
+                self._execute(f"ALTER TABLE tasks ADD COLUMN {column} {kind}")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _execute(self, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            conn = self._connect()
+            try:
+                return conn.execute(sql, params)
+            finally:
+                conn.close()
+
+    def add(self, t: _Task) -> int:
+        now = time.time()
+        return self._execute(
+            "INSERT INTO tasks (queue, name, args, kwargs, priority, retries_left, created_at, "
+            "owner, lease_expires_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (t.queue, t.name, json.dumps(t.args), json.dumps(t.kwargs), t.priority, t.retries_left, now,
+             self.owner, now + self.lease_seconds)
+        ).lastrowid
+
+    def claim(self, names: List[str]) -> List[Dict]:
+        """
+        Lease the pending tasks of other stores whose lease expired
+
+        Args:
+            names: Only tasks registered under these names
+
+        Returns:
+            The claimed rows, oldest first
+        """
+        if not names:
+            return []
+        now = time.time()
+        marks = ", ".join("?" * len(names))
+        with self._lock:
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            try:
+                conn.execute("BEGIN IMMEDIATE")  # No other store claims between our read and write
+                rows = conn.execute(
+                    f"SELECT * FROM tasks WHERE status = 'pending' AND name IN ({marks}) "
+                    "AND coalesce(owner, '') != ? AND coalesce(lease_expires_at, 0) < ? ORDER BY id",
+                    (*names, self.owner, now)
+                ).fetchall()
+                conn.executemany("UPDATE tasks SET owner = ?, lease_expires_at = ? WHERE id = ?",
+                                 [(self.owner, now + self.lease_seconds, row['id']) for row in rows])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+        return [dict(row) for row in rows]
+
+    def renew(self):
+        """Extend the leases of this store's pending tasks"""
+        self._execute("UPDATE tasks SET lease_expires_at = ? WHERE owner = ? AND status = 'pending'",
+                      (time.time() + self.lease_seconds, self.owner))
+
+    def release(self):
+        """Give up this store's leases, so another process takes its pending tasks right away"""
+        self._execute("UPDATE tasks SET lease_expires_at = 0 WHERE owner = ? AND status = 'pending'",
+                      (self.owner,))
+
+    def retrying(self, t: _Task, error: str):
+        self._execute("UPDATE tasks SET attempts = ?, retries_left = ?, error = ? WHERE id = ?",
+                      (t.attempts, t.retries_left, error, t.store_id))
+
+    def done(self, t: _Task):
+        self._execute("DELETE FROM tasks WHERE id = ?", (t.store_id,))
+
+    def failed(self, t: _Task, error: str):
+        self._execute("UPDATE tasks SET status = 'failed', attempts = ?, error = ? WHERE id = ?",
+                      (t.attempts, error, t.store_id))
+
+    def pending(self) -> List[Dict]:
+        """Unfinished tasks, oldest first"""
+        with self._lock:
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            try:
+                rows = conn.execute("SELECT * FROM tasks WHERE status = 'pending' ORDER BY id").fetchall()
+            finally:
+                conn.close()
+        return [dict(row) for row in rows]
+
+    def failures(self, limit: int = 20) -> List[Dict]:
+        """Most recent tasks that ran out of retries"""
+        with self._lock:
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            try:
+                rows = conn.execute(
+                    "SELECT * FROM tasks WHERE status = 'failed' ORDER BY id DESC LIMIT ?", (limit,)
+                ).fetchall()
+            finally:
+                conn.close()
+        return [dict(row) for row in rows]
+
+
+class TaskRunner:
+    """
+    In-process task runner with named queues
+
+    Each queue gets its own worker threads, so slow evaluations cannot hold
+    up persistence. Within a queue, higher `priority` runs first, ties in
+    submission order. A task that raises is retried after
+    Config.TASK_RETRY_BACKOFF_SECONDS, doubling per attempt.
+
+    submit() returns a Future. After shutdown(), submissions run inline in
+    the caller, so late work (e.g. atexit flushes) is not lost.
+    """
+
+    def __init__(
+        self,
+        queues: Optional[Dict[str, int]] = None,
+        default_workers: Optional[int] = None,
+        store: Optional[TaskStore] = None
+    ):
+        """
+        Initialize the runner
+
+        Args:
+            queues: Worker threads per queue name; other queues are created on
+                first use with `default_workers`
+            default_workers: Worker threads of queues not listed
+            store: Durable queue; durable submissions are kept in memory only without it
+        """
+        self.default_workers = default_workers or Config.TASK_DEFAULT_WORKERS
+        self.store = store
+        self._lock = threading.Lock()
+        self._queues: Dict[str, _Queue] = {}
+        self._workers_by_queue = dict(queues or {})
+        self._seq = itertools.count()
+        self._accepting = True
+        self._stopping = False
+        self._recovered = set()
+        self._stop_leases = threading.Event()
+        if store is not None:
+            self.recover()
+            threading.Thread(target=self._keep_leases, name="task-leases", daemon=True).start()
+
+    # ==================== SUBMITTING ====================
+
+    def submit(
+        self,
+        fn: Union[str, Callable],
+        *args,
+        queue: str = "default",
+        priority: int = 0,
+        retries: Optional[int] = None,
+        delay: float = 0,
+        durable: bool = False,
+        **kwargs
+    ) -> Future:
+        """
+        Queue fn(*args, **kwargs)
+
+        Args:
+            fn: Function, or the name it was registered under with @task
+            queue: Queue name
+            priority: Higher runs first within the queue
+            retries: Retries after a failure (default: Config.TASK_MAX_RETRIES)
+            delay: Seconds before the task may start
+            durable: Persist the task until it succeeds (needs a registered
+                name and JSON-serializable arguments)
+
+        Returns:
+            Future of the task's result
+        """
+        if isinstance(fn, str):
+            name, fn = fn, _registry[fn]
+        else:
+            name = getattr(fn, '__qualname__', repr(fn))
+            if durable:
+                raise ValueError("Durable tasks must be submitted by their registered @task name")
+        retries = Config.TASK_MAX_RETRIES if retries is None else retries
+        t = _Task(fn, name, args, kwargs, queue, priority, retries, time.monotonic() + delay)
+
+        if not self._accepting:
+            self._run_inline(t)
+            return t.future
+        if durable and self.store is not None:
+            t.store_id = self.store.add(t)
+        self._enqueue(t)
+        return t.future
+
+    def _enqueue(self, t: _Task):
+        q = self._queue(t.queue)
+        with q.cond:
+            q.stats['submitted'] += 1
+            self._push(q, t)
+            q.cond.notify()
+
+    def _push(self, q: _Queue, t: _Task):
+        if t.ready_at > time.monotonic():
+            heapq.heappush(q.delayed, (t.ready_at, next(self._seq), t))
+        else:
+            heapq.heappush(q.ready, (-t.priority, next(self._seq), t))
+
+    def _queue(self, name: str) -> _Queue:
+        with self._lock:
+            q = self._queues.get(name)
+            if q is None:
+                q = self._queues[name] = _Queue(name, self._workers_by_queue.get(name, self.default_workers))
+                for i in range(q.workers):
+                    thread = threading.Thread(target=self._work, args=(q,), name=f"task-{name}-{i}", daemon=True)
+                    q.threads.append(thread)
+                    thread.start()
+            return q
+
+    def recover(self, name: Optional[str] = None):
+        """
+        Re-queue durable tasks another run accepted but did not finish
+
+        Only tasks whose lease expired are taken, so tasks of live processes
+        sharing the store are left to them. Tasks whose function is not
+        registered yet are skipped; @task calls this again for its name once
+        the defining module is imported.
+        """
+        if self.store is None or not self._accepting:
+            return
+        names = [n for n in _registry if name in (None, n)]
+        for row in self.store.claim(names):
+            if row['id'] in self._recovered:
+                continue
+            self._recovered.add(row['id'])
+            fn = _registry[row['name']]
+            t = _Task(fn, row['name'], tuple(json.loads(row['args'])), json.loads(row['kwargs']),
+                      row['queue'], row['priority'], row['retries_left'], time.monotonic(), store_id=row['id'])
+            t.attempts = row['attempts']
+            self._enqueue(t)
+
+    def _keep_leases(self):
+        """Renew this runner's leases, and take over tasks of processes that stopped renewing theirs"""
+        while not self._stop_leases.wait(self.store.lease_seconds / 3):
+            try:
+                self.store.renew()
+                self.recover()
+            except sqlite3.Error:
+                pass  # Busy or locked: retried on the next round, well within the lease
+
+    # ==================== RUNNING ====================
+
+    def _work(self, q: _Queue):
+        while True:
+            with q.cond:
+                t = self._next(q)
+                if t is None:
+                    return
+                q.running += 1
+            try:
+                self._run(q, t)
+            finally:
+                with q.cond:
+                    q.running -= 1
+                    q.cond.notify_all()
+
+    def _next(self, q: _Queue) -> Optional[_Task]:
+        """Wait for the next runnable task (None once stopping and drained)"""
+        while True:
+            now = time.monotonic()
+            while q.delayed and (q.delayed[0][0] <= now or self._stopping):
+                _, seq, t = heapq.heappop(q.delayed)
+                heapq.heappush(q.ready, (-t.priority, seq, t))
+            if q.ready:
+                return heapq.heappop(q.ready)[2]
+            if self._stopping:
+                return None
+            q.cond.wait(timeout=q.delayed[0][0] - now if q.delayed else None)
+
+    def _run(self, q: _Queue, t: _Task):
+        start = time.monotonic()
+        q.latency.record(max(start - t.ready_at, 0))
+        t.attempts += 1
+        try:
+            result = t.fn(*t.args, **t.kwargs)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if t.retries_left > 0:
+                t.retries_left -= 1
+                if t.store_id is not None:
+                    self.store.retrying(t, error)
+                if not self._stopping:
+                    t.ready_at = time.monotonic() + Config.TASK_RETRY_BACKOFF_SECONDS * 2 ** (t.attempts - 1)
+                    with q.cond:
+                        q.stats['retried'] += 1
+                        self._push(q, t)
+                        q.cond.notify()
+                    return
+                # Shutting down: a durable task stays pending for the next run
+            elif t.store_id is not None:
+                self.store.failed(t, error + "\n" + traceback.format_exc(limit=5))
+            with q.cond:
+                q.stats['failed'] += 1
+                self._finished(q)
+            t.future.set_exception(e)
+            return
+
+        if t.store_id is not None:
+            self.store.done(t)
+        with q.cond:
+            q.stats['completed'] += 1
+            self._finished(q)
+        t.future.set_result(result)
+
+    @staticmethod
+    def _finished(q: _Queue):
+        now = time.monotonic()
+        q.finished.append(now)
+        while q.finished and q.finished[0] < now - _THROUGHPUT_WINDOW_SECONDS:
+            q.finished.popleft()
+
+    def _run_inline(self, t: _Task):
+        try:
+            t.future.set_result(t.fn(*t.args, **t.kwargs))
+        except Exception as e:
+            t.future.set_exception(e)
+
+    # ==================== LIFECYCLE ====================
+
+    def join(self, queue: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until a queue (or every queue) has nothing ready, delayed or running
+
+        Returns:
+            False if the timeout passed first
+        """
+        give_up = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            if queue is None:
+                queues = list(self._queues.values())
+            else:
+                queues = [self._queues[queue]] if queue in self._queues else []
+        for q in queues:
+            with q.cond:
+                while not q.idle():
+                    remaining = None if give_up is None else give_up - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    q.cond.wait(timeout=remaining)
+        return True
+
+    def shutdown(self, drain: bool = True, timeout: Optional[float] = None):
+        """
+        Stop the workers
+
+        Args:
+            drain: Run everything queued first (delayed tasks start right
+                away, failures are not retried); otherwise queued tasks are
+                cancelled, durable ones stay in the store for the next run
+            timeout: Seconds to wait for the workers
+        """
+        with self._lock:
+            self._accepting = False
+            queues = list(self._queues.values())
+
+        for q in queues:
+            with q.cond:
+                if not drain:
+                    for _, _, t in q.ready + q.delayed:
+                        t.future.cancel()
+                    q.ready.clear()
+                    q.delayed.clear()
+        self._stopping = True
+        for q in queues:
+            with q.cond:
+                q.cond.notify_all()
+
+        give_up = None if timeout is None else time.monotonic() + timeout
+        for q in queues:
+            for thread in q.threads:
+                thread.join(None if give_up is None else max(give_up - time.monotonic(), 0))
+
+        if self.store is not None:
+            # Durable tasks left pending go to the next process (or run) right away
+            self._stop_leases.set()
+            self.store.release()
+
+    # ==================== METRICS ====================
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-queue numbers
+
+        Returns:
+            queue -> {workers, queued (ready + delayed), running, submitted,
+            completed, failed, retried, throughput_per_min (last minute),
+            wait_p50_s / wait_p95_s (ready to started)}
+        """
+        with self._lock:
+            queues = list(self._queues.values())
+        now = time.monotonic()
+        result = {}
+        for q in queues:
+            with q.cond:
+                recent = sum(1 for at in q.finished if at >= now - _THROUGHPUT_WINDOW_SECONDS)
+                result[q.name] = dict(
+                    q.stats,
+                    workers=q.workers,
+                    queued=len(q.ready) + len(q.delayed),
+                    running=q.running,
+                    throughput_per_min=recent * 60 / _THROUGHPUT_WINDOW_SECONDS,
+                    wait_p50_s=q.latency.percentile(50),
+                    wait_p95_s=q.latency.percentile(95)
+                )
+        return result
+
+    def report(self) -> str:
+        """Plain-text table of stats()"""
+        lines = []
+        for name, s in sorted(self.stats().items()):
+            wait = (f"  wait p50 {s['wait_p50_s'] * 1000:7.1f} ms  p95 {s['wait_p95_s'] * 1000:7.1f} ms"
+                    if s['wait_p50_s'] is not None else "")
+            lines.append(
+                f"{name:<12} queued {s['queued']:>4}  running {s['running']:>2}  done {s['completed']:>6}  "
+                f"{s['throughput_per_min']:>6.1f}/min{wait}"
+                + (f"  failed {s['failed']}" if s['failed'] else "")
+                + (f"  retried {s['retried']}" if s['retried'] else "")
+            )
+        return "\n".join(lines)
+
+
+def parse_queue_workers(spec: str) -> Dict[str, int]:
+    """Worker counts from "name=n,name=n" (Config.TASK_QUEUES)"""
+    workers = {}
+    for item in spec.split(","):
+        name, _, count = item.partition("=")
+        if name.strip() and count.strip():
+            workers[name.strip()] = int(count)
+    return workers
+
+
+# Global runner instance
+_task_runner: Optional[TaskRunner] = None
+_task_runner_lock = threading.Lock()
+
+
+def get_task_runner() -> TaskRunner:
+    """Get or create the process-wide task runner (drained on interpreter exit)"""
+    global _task_runner
+    if _task_runner is None:
+        with _task_runner_lock:
+            if _task_runner is None:
+                store = TaskStore(Config.TASK_STORE_PATH) if Config.TASK_DURABLE else None
+                _task_runner = TaskRunner(parse_queue_workers(Config.TASK_QUEUES), store=store)
+                atexit.register(_task_runner.shutdown, timeout=Config.TASK_SHUTDOWN_SECONDS)
+    return _task_runner
+
+
+def submit_task(fn: Union[str, Callable], *args, **kwargs) -> Future:
+    """get_task_runner().submit(...)"""
+    return get_task_runner().submit(fn, *args, **kwargs)
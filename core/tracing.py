@@ -0,0 +1,328 @@
+"""
+Tracing - Where the time of a request goes, stage by stage
+Pipeline stages and LLM calls open nested spans. When a request's outermost
+span ends, its spans are appended to Config.TRACE_PATH as JSONL (one span
+per line, shared by every process) and kept in memory for the sidebar's
+waterfall view.
+
+    with span("prompt_agent.analyze", chars=len(text)):
+        ...
+
+    @traced("file_processor.process_file")
+    def process_file(self, uploaded_file): ...
+
+With Config.TRACING_ENABLED off, span() only times the stage for the
+metrics (core.metrics), and with metrics off too it returns a shared no-op
+and traced functions are called directly. Either way, a span with no parent
+is a request.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from core.config import Config
+from core.metrics import observe_stage
+
+_current: contextvars.ContextVar = contextvars.ContextVar('span', default=None)
+
+# Waterfall bar width in characters
+_BAR_WIDTH = 40
+
+
+class Span:
+    """
+    One timed stage of a trace
+
+    Spans nest through a context variable: threads started with
+    asyncio.to_thread inherit it, plain threads and task queues do not (pass
+    `parent` to span() there).
+    """
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'start', 'duration_ms', 'error',
+                 '_started', '_token')
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(8).hex()
+        self.span_id = os.urandom(4).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes or {}
+        self.start = 0.0
+        self.duration_ms = None
+        self.error = None
+
+    def set(self, **attributes):
+        """Add attributes (shown in the waterfall and the export)"""
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = _current.set(self)
+        if self.parent_id is None:
+            get_tracer().open(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current.reset(self._token)
+        get_tracer().close(self)
+        observe_stage(self.name, self.duration_ms / 1000, self.parent_id is None, exc_type is not None)
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': round(self.start, 6),
+            'duration_ms': round(self.duration_ms, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class _NoopSpan:
+    """What span() returns while tracing and metrics are off"""
+
+    __slots__ = ()
+    trace_id = span_id = parent_id = None
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _StageTimer(_NoopSpan):
+    """What span() returns while only metrics are on: times the stage, records nothing else"""
+
+    __slots__ = ('name', '_root', '_started', '_token')
+
+    def __init__(self, name: str, root: bool):
+        self.name = name
+        self._root = root
+
+    def __enter__(self) -> "_StageTimer":
+        self._started = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        _current.reset(self._token)
+        observe_stage(self.name, time.perf_counter() - self._started, self._root, exc_type is not None)
+        return False
+
+
+def span(name: str, parent: Optional[Span] = None, **attributes) -> Union[Span, _NoopSpan]:
+    """
+    Context manager timing the block as a span
+
+    Args:
+        name: Stage name, "<component>.<stage>"
+        parent: Span to nest under (default: the current one; none starts a trace)
+        attributes: Shown in the waterfall and the export
+
+    Returns:
+        The span (a stage timer when tracing is off, a no-op with metrics off too)
+    """
+    if parent is None:
+        parent = _current.get()
+    if not Config.TRACING_ENABLED:
+        return _StageTimer(name, parent is None) if Config.METRICS_ENABLED else _NOOP
+    # Spans opened inside a stage timer (tracing was just switched on) start a trace
+    return Span(name, parent if isinstance(parent, Span) else None, attributes)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator: run every call of the function (or coroutine function) in a span"""
+    def decorate(fn: Callable) -> Callable:
+        span_name = name or fn.__qualname__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not (Config.TRACING_ENABLED or Config.METRICS_ENABLED):
+                    return await fn(*args, **kwargs)
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not (Config.TRACING_ENABLED or Config.METRICS_ENABLED):
+                return fn(*args, **kwargs)
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def current_span() -> Optional[Span]:
+    """Innermost span open in this context, if any"""
+    return _current.get()
+
+
+def annotate(**attributes):
+    """Add attributes to the current span (nothing when not tracing)"""
+    current = _current.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+class Tracer:
+    """
+    Collects the spans of running traces and exports finished ones
+
+    A trace is exported when its root span ends. Spans ending later (work
+    handed to a background queue) are appended on their own as they end.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, recent: Optional[int] = None):
+        """
+        Initialize the tracer
+
+        Args:
+            path: JSONL file (default: Config.TRACE_PATH)
+            recent: Finished traces kept in memory (default: Config.TRACE_RECENT)
+        """
+        self.path = Path(path) if path else Path(Config.TRACE_PATH)
+        self.recent_limit = Config.TRACE_RECENT if recent is None else recent
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._open: Dict[str, List[Dict[str, Any]]] = {}
+        self._recent: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self.write_errors = 0
+
+    def open(self, root: Span):
+        with self._lock:
+            self._open[root.trace_id] = []
+
+    def close(self, finished: Span):
+        record = finished.to_dict()
+        with self._lock:
+            spans = self._open.get(finished.trace_id)
+            if finished.parent_id is None:
+                spans = self._open.pop(finished.trace_id, None) or []
+                spans.append(record)
+                self._recent[finished.trace_id] = spans
+                while len(self._recent) > self.recent_limit:
+                    self._recent.popitem(last=False)
+                export = list(spans)
+            elif spans is not None:
+                spans.append(record)
+                return
+            else:
+                # The trace was exported already
+                if finished.trace_id in self._recent:
+                    self._recent[finished.trace_id].append(record)
+                export = [record]
+        self._export(export)
+
+    def _export(self, records: List[Dict[str, Any]]):
+        lines = "".join(json.dumps(record, default=str) + "\n" for record in records)
+        try:
+            with self._write_lock:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(lines)
+        except OSError:
+            self.write_errors += 1  # Tracing never fails a request
+
+    def recent(self) -> List[List[Dict[str, Any]]]:
+        """Spans of the finished traces kept in memory, newest first"""
+        with self._lock:
+            return [list(spans) for spans in reversed(self._recent.values())]
+
+
+def read_traces(path: Optional[Union[str, Path]] = None, last: int = 20) -> List[List[Dict[str, Any]]]:
+    """Spans of the last `last` traces in a JSONL export (any process's), newest first"""
+    traces: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+    try:
+        with open(path or Config.TRACE_PATH, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by a crash
+                traces.setdefault(record['trace_id'], []).append(record)
+                traces.move_to_end(record['trace_id'])
+                while len(traces) > last:
+                    traces.popitem(last=False)
+    except FileNotFoundError:
+        return []
+    return list(reversed(traces.values()))
+
+
+def waterfall(spans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Spans of one trace in display order: depth first, children by start time
+
+    Returns:
+        Span dicts with 'depth' and 'offset_ms' (from the trace's start) added
+    """
+    if not spans:
+        return []
+    ids = {s['span_id'] for s in spans}
+    children: Dict[Optional[str], List[Dict]] = {}
+    for s in spans:
+        parent = s['parent_id'] if s['parent_id'] in ids else None
+        children.setdefault(parent, []).append(s)
+    origin = min(s['start'] for s in spans)
+
+    rows: List[Dict[str, Any]] = []
+
+    def visit(parent: Optional[str], depth: int):
+        for s in sorted(children.get(parent, []), key=lambda s: s['start']):
+            rows.append(dict(s, depth=depth, offset_ms=(s['start'] - origin) * 1000))
+            visit(s['span_id'], depth + 1)
+
+    visit(None, 0)
+    return rows
+
+
+def format_waterfall(spans: List[Dict[str, Any]]) -> str:
+    """Plain-text waterfall of one trace: indented names, durations and time bars"""
+    rows = waterfall(spans)
+    if not rows:
+        return ""
+    total = max(r['offset_ms'] + r['duration_ms'] for r in rows) or 1.0
+    lines = []
+    for r in rows:
+        details = ", ".join(f"{k}={v}" for k, v in r['attributes'].items())
+        label = ("  " * r['depth'] + r['name'] + (f" [{details}]" if details else ""))[:56]
+        begin = int(r['offset_ms'] / total * _BAR_WIDTH)
+        width = max(1, round(r['duration_ms'] / total * _BAR_WIDTH))
+        bar = " " * begin + ("!" if r['error'] else "█") * min(width, _BAR_WIDTH - begin)
+        lines.append(f"{label:<56} {r['duration_ms']:>9.1f} ms |{bar:<{_BAR_WIDTH}}|")
+    return "\n".join(lines)
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Get or create the process-wide tracer"""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer()
+    return _tracer
@@ -0,0 +1,302 @@
+"""
+Token Usage - What each LLM call costs, by request, session, stage and model
+Every call records the prompt and completion tokens its provider reports
+(Gemini usage_metadata, OpenAI usage), or an estimate from the text length
+when it reports none, priced with Config.LLM_PRICES. Totals per stage and
+model are kept in memory for the sidebar; the calls themselves are buffered
+and written to the llm_usage table from the "persistence" task queue.
+
+A request's calls share the RequestUsage of the innermost usage_scope(),
+which also carries the session and user they are billed to.
+"""
+import atexit
+import contextvars
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from core.config import Config
+from core.tasks import submit_task
+
+_current: contextvars.ContextVar = contextvars.ContextVar('usage', default=None)
+
+
+class UsageRecord(NamedTuple):
+    """Tokens of one LLM call"""
+    created_at: datetime
+    request_id: Optional[str]
+    session_id: Optional[str]
+    user_id: Optional[int]
+    stage: str
+    model: str  # "provider:model"
+    prompt_tokens: int
+    completion_tokens: int
+    cost_usd: Optional[float]  # None for models without a price
+    estimated: bool  # The provider reported no counts
+
+
+class RequestUsage:
+    """Running totals of one request's LLM calls"""
+
+    def __init__(self, session_id: Optional[str] = None, user_id: Optional[int] = None):
+        self.request_id = uuid.uuid4().hex[:16]
+        self.session_id = session_id
+        self.user_id = user_id
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+        self._lock = threading.Lock()  # Hedged attempts and deferred evaluations add concurrently
+
+    def add(self, record: UsageRecord):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += record.prompt_tokens
+            self.completion_tokens += record.completion_tokens
+            self.cost_usd += record.cost_usd or 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'request_id': self.request_id,
+                'calls': self.calls,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'cost_usd': round(self.cost_usd, 6),
+            }
+
+
+@contextmanager
+def usage_scope(usage: Optional[RequestUsage] = None, session_id: Optional[str] = None,
+                user_id: Optional[int] = None) -> Iterator[RequestUsage]:
+    """
+    Bill the LLM calls inside the block to one request
+
+    Nested scopes keep the outer request, so pipeline entry points can open
+    one whether or not their caller did. Pass `usage` to continue a request
+    on another thread (e.g. a deferred evaluation).
+
+    Yields:
+        The request's usage
+    """
+    if usage is None:
+        usage = _current.get() or RequestUsage(session_id, user_id)
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+
+
+def current_usage() -> Optional[RequestUsage]:
+    """Usage of the request running in this context, if any"""
+    return _current.get()
+
+
+def estimate_tokens(content: Any) -> int:
+    """Tokens in the text of a prompt or response (parts that are not text are not counted)"""
+    if isinstance(content, (list, tuple)):
+        return sum(estimate_tokens(part) for part in content)
+    if not isinstance(content, str) or not content:
+        return 0
+    return max(1, round(len(content) / Config.USAGE_CHARS_PER_TOKEN))
+
+
+def reported_tokens(response: Any) -> Optional[Tuple[int, int]]:
+    """(prompt, completion) tokens a Gemini or OpenAI response reports, if any"""
+    metadata = getattr(response, 'usage_metadata', None)
+    if metadata is not None and getattr(metadata, 'prompt_token_count', None):
+        return int(metadata.prompt_token_count), int(getattr(metadata, 'candidates_token_count', 0) or 0)
+    usage = getattr(response, 'usage', None)
+    if usage is not None and getattr(usage, 'prompt_tokens', None):
+        return int(usage.prompt_tokens), int(getattr(usage, 'completion_tokens', 0) or 0)
+    return None
+
+
+def price(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """USD for the tokens at Config.LLM_PRICES ("provider:model" or bare model name)"""
+    prices = Config.LLM_PRICES.get(model.partition(':')[2] or model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+def record_usage(stage: str, model: str, prompt: Any, response: Any = None,
+                 completion: Optional[str] = None) -> Optional[UsageRecord]:
+    """
+    Account one LLM call to the current request and the usage totals
+
+    Args:
+        stage: Pipeline stage that made the call, "<component>.<stage>"
+        model: "provider:model" target
+        prompt: What was sent (text, or Gemini content parts)
+        response: The provider's response (its token counts are used if reported)
+        completion: Response text, for the estimate (default: response.text)
+
+    Returns:
+        The record, or None when Config.USAGE_TRACKING_ENABLED is off
+    """
+    if not Config.USAGE_TRACKING_ENABLED:
+        return None
+    tokens = reported_tokens(response)
+    estimated = tokens is None
+    if estimated:
+        if completion is None:
+            try:
+                completion = response.text
+            except Exception:
+                completion = ""  # Blocked or empty answer
+        tokens = (estimate_tokens(prompt), estimate_tokens(completion))
+
+    request = _current.get()
+    record = UsageRecord(
+        created_at=datetime.utcnow(),
+        request_id=request.request_id if request is not None else None,
+        session_id=request.session_id if request is not None else None,
+        user_id=request.user_id if request is not None else None,
+        stage=stage,
+        model=model,
+        prompt_tokens=tokens[0],
+        completion_tokens=tokens[1],
+        cost_usd=price(model, *tokens),
+        estimated=estimated,
+    )
+    if request is not None:
+        request.add(record)
+    get_usage_tracker().record(record)
+    return record
+
+
+class UsageTracker:
+    """
+    Per stage and model totals of this process, and the buffer of records to store
+
+    Records are written in batches: every flush_interval seconds, or at
+    once (on the task queue) when max_pending are waiting.
+    """
+
+    def __init__(self, flush_interval: Optional[float] = None, max_pending: Optional[int] = None):
+        """
+        Initialize the tracker
+
+        Args:
+            flush_interval: Seconds between automatic flushes
+            max_pending: Flush immediately once this many records are buffered
+        """
+        self.flush_interval = Config.USAGE_FLUSH_SECONDS if flush_interval is None else flush_interval
+        self.max_pending = Config.USAGE_MAX_PENDING if max_pending is None else max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_queued = False
+        self._pending: List[UsageRecord] = []
+        self._totals: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def record(self, record: UsageRecord):
+        with self._lock:
+            totals = self._totals.get((record.stage, record.model))
+            if totals is None:
+                totals = self._totals[(record.stage, record.model)] = {
+                    'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost_usd': 0.0, 'estimated': 0
+                }
+            totals['calls'] += 1
+            totals['prompt_tokens'] += record.prompt_tokens
+            totals['completion_tokens'] += record.completion_tokens
+            totals['cost_usd'] += record.cost_usd or 0.0
+            totals['estimated'] += record.estimated
+            self._pending.append(record)
+            full = len(self._pending) >= self.max_pending
+        if full:
+            # Flush now, but on the task queue rather than the caller's thread
+            submit_task(self._flush_quietly, queue='persistence', priority=1, retries=0)
+        else:
+            self._schedule()
+
+    def pending(self) -> int:
+        """Number of records not written yet"""
+        return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        Write buffered records to the llm_usage table
+
+        Returns:
+            Number of records written
+        """
+        with self._flush_lock:
+            with self._lock:
+                records, self._pending = self._pending, []
+            if not records:
+                return 0
+
+            from core.database import DatabaseManager
+            try:
+                DatabaseManager.record_llm_usage(records)
+            except Exception:
+                with self._lock:
+                    # The next flush retries them (the oldest are dropped if the database stays down)
+                    self._pending[:0] = records
+                    del self._pending[:-self.max_pending * 10]
+                raise
+            return len(records)
+
+    def _schedule(self):
+        """Queue a delayed flush on the persistence task queue unless one is queued"""
+        with self._lock:
+            if self._flush_queued:
+                return
+            self._flush_queued = True
+        submit_task(self._on_timer, queue='persistence', delay=self.flush_interval, retries=0)
+
+    def _on_timer(self):
+        with self._lock:
+            self._flush_queued = False
+        self._flush_quietly()
+        if self._pending:
+            self._schedule()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            pass  # Records were put back; the next flush retries them
+
+    def snapshot(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """(stage, model) -> {calls, prompt_tokens, completion_tokens, cost_usd, estimated} since start"""
+        with self._lock:
+            return {key: dict(totals) for key, totals in self._totals.items()}
+
+    def report(self) -> str:
+        """Plain-text table of snapshot(), most expensive first"""
+        rows = sorted(self.snapshot().items(),
+                      key=lambda item: (-item[1]['cost_usd'], -item[1]['prompt_tokens'] - item[1]['completion_tokens']))
+        lines = []
+        for (stage, model), t in rows:
+            lines.append(
+                f"{stage:<28} {model:<32} calls {t['calls']:>5}  in {t['prompt_tokens']:>8}  "
+                f"out {t['completion_tokens']:>7}  ${t['cost_usd']:.4f}"
+                + (f"  ({t['estimated']} estimated)" if t['estimated'] else "")
+            )
+        if rows:
+            lines.append(f"Total ${sum(t['cost_usd'] for _, t in rows):.4f}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+
+
+_tracker: Optional[UsageTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_usage_tracker() -> UsageTracker:
+    """Get the process-wide usage tracker (flushed on interpreter exit)"""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = UsageTracker()
+                atexit.register(_tracker._flush_quietly)
+    return _tracker
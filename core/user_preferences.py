@@ -2,10 +2,96 @@
 User Preferences - Smart learning from user behavior
 Tracks preferences and provides smart defaults based on usage patterns
 """
-from typing import Dict, Optional, List
-from collections import Counter
+from typing import Dict, Hashable, Optional, List, Tuple
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta
+import atexit
 import json
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from core.config import Config
+from core.tasks import submit_task
+
+# Counter groups tracked per profile (also the `kind` of stored counters)
+COUNTER_KINDS = ('version_usage', 'domain_usage', 'role_usage', 'task_usage', 'combinations')
+
+# Decay weights are renormalized before they can lose float precision
+_MAX_DECAY_WEIGHT = 1e12
+
+# Persisting instances, flushed once at interpreter exit (weak: evicted ones can be collected)
+_persisting = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all_at_exit():
+    for prefs in list(_persisting):
+        prefs._flush_quietly()
+
+
+class RankedIndex:
+    """
+    Scores per key with the top-k kept current on every add
+
+    Scores only ever grow (decay is applied by growing the weight of new
+    events instead), so a key can only enter or climb the top-k when it is
+    itself incremented: each add is O(k) and the leader is always at hand.
+    Ties rank by first appearance, matching Counter.most_common().
+    """
+
+    __slots__ = ('k', 'scores', '_order', '_top')
+
+    def __init__(self, k: int = 5):
+        self.k = k
+        self.scores: Dict[Hashable, float] = {}
+        self._order: Dict[Hashable, int] = {}
+        self._top: List[Hashable] = []
+
+    def add(self, key: Hashable, amount: float = 1.0):
+        """Increase key's score and update the top-k"""
+        score = self.scores.get(key)
+        if score is None:
+            self._order[key] = len(self._order)
+            score = 0.0
+        self.scores[key] = score + amount
+
+        top = self._top
+        if top and top[0] == key:
+            return
+        if key in top:
+            i = top.index(key)
+        elif len(top) < self.k:
+            top.append(key)
+            i = len(top) - 1
+        elif self._outranks(key, top[-1]):
+            i = len(top) - 1
+            top[i] = key
+        else:
+            return
+
+        # The key's score only rose, so it can only move up
+        while i > 0 and self._outranks(key, top[i - 1]):
+            top[i], top[i - 1] = top[i - 1], key
+            i -= 1
+
+    def scale(self, factor: float):
+        """Multiply every score by factor (order is unchanged)"""
+        for key in self.scores:
+            self.scores[key] *= factor
+
+    def leader(self) -> Optional[Hashable]:
+        """Highest-scoring key, or None when empty"""
+        return self._top[0] if self._top else None
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[Hashable, float]]:
+        """Up to n (default k) best (key, score) pairs"""
+        return [(key, self.scores[key]) for key in self._top[:n]]
+
+    def _outranks(self, key: Hashable, other: Hashable) -> bool:
+        score, other_score = self.scores[key], self.scores[other]
+        return score > other_score or (score == other_score and self._order[key] < self._order[other])
 
 
 class UserPreferences:
@@ -17,16 +103,39 @@ class UserPreferences:
     - Common domain/role/task combinations
     - Copy/usage patterns
     - Time-based patterns
+
+    With a db_manager, tracking records small counter deltas that are
+    flushed in the background (debounced) as upserts, and stored counters
+    are loaded lazily on the first read.
+
+    Preferred-X queries read RankedIndex leaders kept up to date on every
+    track call (overall and per domain / role), so they are O(1). With a
+    half-life, newer events weigh more and stale habits fade; raw counts
+    used for stats and persistence are never decayed.
     """
 
-    def __init__(self, db_manager=None):
+    def __init__(
+        self,
+        db_manager=None,
+        session_key: str = "default",
+        flush_interval: Optional[float] = None,
+        half_life_days: Optional[float] = None
+    ):
         """
         Initialize preferences tracker
 
         Args:
             db_manager: Optional DatabaseManager instance for persistence
+            session_key: Profile the counters are stored under
+            flush_interval: Seconds to coalesce deltas before writing them
+            half_life_days: Age at which an event counts half in preferred-X
+                rankings (0 disables decay)
         """
         self.db = db_manager
+        self.session_key = session_key
+        self.flush_interval = Config.PREFERENCES_FLUSH_SECONDS if flush_interval is None else flush_interval
+        half_life_days = Config.PREFERENCE_HALF_LIFE_DAYS if half_life_days is None else half_life_days
+        self._half_life = half_life_days * 86400
         self._cache = {
             'version_usage': Counter(),
             'domain_usage': Counter(),
@@ -36,6 +145,14 @@ class UserPreferences:
             'last_updated': None
         }
 
+        self._lock = threading.Lock()
+        self._pending: Counter = Counter()  # (kind, key) -> delta not yet persisted
+        self._flush_queued = False
+        self._loaded = db_manager is None
+        if db_manager is not None:
+            _persisting.add(self)
+        self._rebuild_indexes()
+
     def track_optimization(
         self,
         domain: str,
@@ -53,13 +170,13 @@ class UserPreferences:
             selected_version: Which version was copied/used (if known)
         """
         # Update counters
-        self._cache['domain_usage'][domain] += 1
-        self._cache['role_usage'][role] += 1
-        self._cache['task_usage'][task_type] += 1
-        self._cache['combinations'][(domain, role, task_type)] += 1
+        self._increment('domain_usage', domain)
+        self._increment('role_usage', role)
+        self._increment('task_usage', task_type)
+        self._increment('combinations', (domain, role, task_type))
 
         if selected_version:
-            self._cache['version_usage'][selected_version] += 1
+            self._increment('version_usage', selected_version)
 
         self._cache['last_updated'] = datetime.now()
 
@@ -75,7 +192,7 @@ class UserPreferences:
             version_type: Version used (basic, critical, tutor, safe)
             action: Type of action (copy, view, test)
         """
-        self._cache['version_usage'][version_type] += 1
+        self._increment('version_usage', version_type)
         self._cache['last_updated'] = datetime.now()
 
         if self.db:
@@ -88,10 +205,8 @@ class UserPreferences:
         Returns:
             Most common version type, or None if no data
         """
-        if not self._cache['version_usage']:
-            return None
-
-        return self._cache['version_usage'].most_common(1)[0][0]
+        self._load_from_db()
+        return self._index['version_usage'].leader()
 
     def get_preferred_domain(self) -> Optional[str]:
         """
@@ -100,10 +215,8 @@ class UserPreferences:
         Returns:
             Most common domain, or None if no data
         """
-        if not self._cache['domain_usage']:
-            return None
-
-        return self._cache['domain_usage'].most_common(1)[0][0]
+        self._load_from_db()
+        return self._index['domain_usage'].leader()
 
     def get_preferred_role(self, domain: Optional[str] = None) -> Optional[str]:
         """
@@ -115,20 +228,13 @@ class UserPreferences:
         Returns:
             Most common role, or None if no data
         """
-        if domain:
-            # Filter combinations by domain
-            domain_roles = [
-                role for (d, role, _), count in self._cache['combinations'].items()
-                if d == domain
-            ]
-            if not domain_roles:
-                return None
-            return Counter(domain_roles).most_common(1)[0][0]
+        self._load_from_db()
 
-        if not self._cache['role_usage']:
-            return None
+        if domain:
+            index = self._roles_by_domain.get(domain)
+            return index.leader() if index else None
 
-        return self._cache['role_usage'].most_common(1)[0][0]
+        return self._index['role_usage'].leader()
 
     def get_preferred_task(
         self,
@@ -145,20 +251,17 @@ class UserPreferences:
         Returns:
             Most common task type, or None if no data
         """
-        if domain or role:
-            # Filter combinations
-            filtered_tasks = [
-                task for (d, r, task), count in self._cache['combinations'].items()
-                if (domain is None or d == domain) and (role is None or r == role)
-            ]
-            if not filtered_tasks:
-                return None
-            return Counter(filtered_tasks).most_common(1)[0][0]
-
-        if not self._cache['task_usage']:
-            return None
-
-        return self._cache['task_usage'].most_common(1)[0][0]
+        self._load_from_db()
+
+        if domain and role:
+            index = self._tasks_by_domain_role.get((domain, role))
+        elif domain:
+            index = self._tasks_by_domain.get(domain)
+        elif role:
+            index = self._tasks_by_role.get(role)
+        else:
+            index = self._index['task_usage']
+        return index.leader() if index else None
 
     def get_smart_defaults(self) -> Dict[str, Optional[str]]:
         """
@@ -186,6 +289,8 @@ class UserPreferences:
         Returns:
             Dictionary with usage patterns and statistics
         """
+        self._load_from_db()
+
         total_optimizations = sum(self._cache['domain_usage'].values())
 
         stats = {
@@ -289,19 +394,152 @@ class UserPreferences:
 
         return suggestions
 
+    def _increment(self, kind: str, key):
+        """Bump an in-memory counter, its ranking indexes and pending delta"""
+        with self._lock:
+            self._cache[kind][key] += 1
+            self._index_add(kind, key, 1, self._decay_weight())
+            if self.db:
+                stored_key = '|'.join(map(str, key)) if kind == 'combinations' else str(key)
+                self._pending[(kind, stored_key)] += 1
+
+    def _index_add(self, kind: str, key, count: float, weight: float):
+        if kind != 'combinations':
+            self._index[kind].add(key, count * weight)
+            return
+        domain, role, task = key
+        self._roles_by_domain[domain].add(role, count * weight)
+        self._tasks_by_domain[domain].add(task, count * weight)
+        self._tasks_by_role[role].add(task, count * weight)
+        self._tasks_by_domain_role[(domain, role)].add(task, count * weight)
+
+    def _decay_weight(self) -> float:
+        """Weight of an event happening now, relative to the decay epoch"""
+        if not self._half_life:
+            return 1.0
+        weight = 2.0 ** ((time.time() - self._epoch) / self._half_life)
+        if weight > _MAX_DECAY_WEIGHT:
+            # Move the epoch to now; rescaling keeps every ranking intact
+            for index in self._all_indexes():
+                index.scale(1.0 / weight)
+            self._epoch = time.time()
+            weight = 1.0
+        return weight
+
+    def _all_indexes(self):
+        yield from self._index.values()
+        for group in (self._roles_by_domain, self._tasks_by_domain, self._tasks_by_role, self._tasks_by_domain_role):
+            yield from group.values()
+
+    def _rebuild_indexes(self, weighted: Optional[Dict[str, Dict]] = None):
+        """
+        Recreate ranking indexes from the counters
+
+        Args:
+            weighted: Decayed counts per kind to rank by (default: the raw
+                counters, all history counting as current)
+        """
+        self._epoch = time.time()
+        self._index = {kind: RankedIndex() for kind in COUNTER_KINDS if kind != 'combinations'}
+        self._roles_by_domain: Dict[str, RankedIndex] = defaultdict(RankedIndex)
+        self._tasks_by_domain: Dict[str, RankedIndex] = defaultdict(RankedIndex)
+        self._tasks_by_role: Dict[str, RankedIndex] = defaultdict(RankedIndex)
+        self._tasks_by_domain_role: Dict[Tuple[str, str], RankedIndex] = defaultdict(RankedIndex)
+        counts = self._cache if weighted is None else weighted
+        for kind in COUNTER_KINDS:
+            for key, count in counts[kind].items():
+                self._index_add(kind, key, count, 1.0)
+
+    def _age_weight(self, at: Optional[datetime]) -> float:
+        """Weight now of an event stored at `at` (UTC)"""
+        if not self._half_life or at is None:
+            return 1.0
+        age = max((datetime.utcnow() - at).total_seconds(), 0.0)
+        return 2.0 ** (-age / self._half_life)
+
     def _save_to_db(self):
-        """Save preferences to database"""
-        # TODO: Implement database persistence
-        # This will be implemented when we add the database schema
-        pass
+        """Schedule a debounced flush of pending deltas on the persistence task queue"""
+        with self._lock:
+            if self._flush_queued:
+                return
+            self._flush_queued = True
+        submit_task(self._on_timer, queue='persistence', delay=self.flush_interval, retries=0)
+
+    def _on_timer(self):
+        with self._lock:
+            self._flush_queued = False
+        self._flush_quietly()
+
+    def flush(self) -> int:
+        """
+        Write pending counter deltas to the database now
+
+        Returns:
+            Number of counters updated
+        """
+        with self._lock:
+            deltas, self._pending = self._pending, Counter()
+        if not deltas:
+            return 0
+
+        try:
+            self.db.apply_preference_deltas(self.session_key, dict(deltas), half_life_days=self._half_life / 86400)
+        except Exception:
+            with self._lock:
+                self._pending.update(deltas)  # Retried on the next flush
+            raise
+        return len(deltas)
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            pass  # Deltas were kept for the next flush
 
     def _load_from_db(self):
-        """Load preferences from database"""
-        # TODO: Implement database loading
-        pass
+        """Hydrate counters from the database on first read (stored + pending)"""
+        if self._loaded:
+            return
+
+        stored = self.db.load_preference_counters(self.session_key) or {'counters': {}, 'last_updated': None}
+        scores = stored.get('scores', stored['counters']) if self._half_life else stored['counters']
+        stored_at = stored.get('updated_at', {})
+        with self._lock:
+            if self._loaded:
+                return
+            # Stored counts already include flushed deltas; add what is still pending.
+            # Rankings use the stored decayed scores (current as of each counter's
+            # last update, so decayed on from there); stats keep the raw counts
+            counters = {kind: Counter(stored['counters'].get(kind, {})) for kind in COUNTER_KINDS}
+            weighted = {
+                kind: Counter({
+                    key: score * self._age_weight(stored_at.get(kind, {}).get(key))
+                    for key, score in scores.get(kind, {}).items()
+                })
+                for kind in COUNTER_KINDS
+            }
+            for (kind, key), delta in self._pending.items():
+                counters[kind][key] += delta
+                weighted[kind][key] += delta
+            for group in (counters, weighted):
+                group['combinations'] = Counter({
+                    tuple(key.split('|')): count for key, count in group['combinations'].items()
+                })
+
+            self._cache.update(counters)
+            if self._cache['last_updated'] is None:
+                self._cache['last_updated'] = stored['last_updated']
+            self._rebuild_indexes(weighted)
+            self._loaded = True
 
     def reset_preferences(self):
-        """Clear all preference data"""
+        """Clear all preference data (including stored counters)"""
+        if self.db:
+            with self._lock:
+                self._pending.clear()
+            self.db.clear_preference_counters(self.session_key)
+            self._loaded = True
+
         self._cache = {
             'version_usage': Counter(),
             'domain_usage': Counter(),
@@ -310,6 +548,7 @@ class UserPreferences:
             'combinations': Counter(),
             'last_updated': None
         }
+        self._rebuild_indexes()
 
     def export_preferences(self) -> str:
         """
@@ -318,6 +557,8 @@ class UserPreferences:
         Returns:
             JSON string with all preference data
         """
+        self._load_from_db()
+
         data = {
             'version_usage': dict(self._cache['version_usage']),
             'domain_usage': dict(self._cache['domain_usage']),
@@ -340,6 +581,7 @@ class UserPreferences:
             json_str: JSON string with preference data
         """
         data = json.loads(json_str)
+        self._loaded = True  # Imported data replaces anything stored
 
         self._cache['version_usage'] = Counter(data.get('version_usage', {}))
         self._cache['domain_usage'] = Counter(data.get('domain_usage', {}))
@@ -356,27 +598,144 @@ class UserPreferences:
         if data.get('last_updated'):
             self._cache['last_updated'] = datetime.fromisoformat(data['last_updated'])
 
+        self._rebuild_indexes()
 
-# Global instance for session-based preferences
-_session_preferences = None
 
+class PreferenceStore:
+    """
+    Per-session UserPreferences with bounded memory for multi-user servers
+
+    Sessions are spread over lock-striped shards, so concurrent users only
+    contend when they hash to the same shard. Each shard is an LRU; entries
+    beyond its capacity or idle longer than idle_seconds are evicted and
+    their pending counter deltas written back. Evicted sessions are
+    re-hydrated lazily from the database on their next request, unless the
+    evicted instance is still referenced (a request in flight, a pending
+    flush): then it is revived, so there is never more than one live
+    instance per session.
+    """
+
+    def __init__(
+        self,
+        db_manager=None,
+        shards: Optional[int] = None,
+        max_sessions: Optional[int] = None,
+        idle_seconds: Optional[float] = None
+    ):
+        """
+        Initialize the store
 
-def get_preferences() -> UserPreferences:
+        Args:
+            db_manager: DatabaseManager used to persist each session's counters
+            shards: Number of independently locked shards
+            max_sessions: Sessions kept in memory across all shards
+            idle_seconds: Evict sessions untouched for this long
+        """
+        self.db = db_manager
+        shards = shards or Config.PREFERENCE_STORE_SHARDS
+        max_sessions = max_sessions or Config.PREFERENCE_STORE_MAX_SESSIONS
+        self.idle_seconds = Config.PREFERENCE_STORE_IDLE_SECONDS if idle_seconds is None else idle_seconds
+        self._capacity = max(1, -(-max_sessions // shards))
+        self._shards = [(threading.Lock(), OrderedDict(), weakref.WeakValueDictionary()) for _ in range(shards)]
+
+    def get(self, session_key: str) -> UserPreferences:
+        """Get (or create) the preferences of one session"""
+        lock, entries, evicted_refs = self._shard(session_key)
+        now = time.monotonic()
+        evicted = []
+        with lock:
+            entry = entries.get(session_key)
+            if entry is not None:
+                entries.move_to_end(session_key)
+                entry[1] = now
+            else:
+                prefs = evicted_refs.pop(session_key, None) or UserPreferences(self.db, session_key=session_key)
+                entry = entries[session_key] = [prefs, now]
+
+            # Least recently used first, while over capacity or idle. An evicted
+            # session still referenced elsewhere is revived from evicted_refs
+            while len(entries) > self._capacity or (
+                self.idle_seconds and now - next(iter(entries.values()))[1] > self.idle_seconds
+            ):
+                key, (prefs, _) = entries.popitem(last=False)
+                evicted_refs[key] = prefs
+                evicted.append(prefs)
+
+        for prefs in evicted:
+            self._write_back(prefs)
+        return entry[0]
+
+    def evict(self, session_key: str) -> bool:
+        """Drop a session from memory, writing back its pending counters"""
+        lock, entries, evicted_refs = self._shard(session_key)
+        with lock:
+            entry = entries.pop(session_key, None)
+            if entry is not None:
+                evicted_refs[session_key] = entry[0]
+        if entry is None:
+            return False
+        self._write_back(entry[0])
+        return True
+
+    def flush(self):
+        """Write back pending counters of every cached session"""
+        for lock, entries, _ in self._shards:
+            with lock:
+                sessions = [entry[0] for entry in entries.values()]
+            for prefs in sessions:
+                self._write_back(prefs)
+
+    def clear(self):
+        """Write back and drop every cached session"""
+        for lock, entries, evicted_refs in self._shards:
+            with lock:
+                sessions = [entry[0] for entry in entries.values()]
+                entries.clear()
+                evicted_refs.clear()
+            for prefs in sessions:
+                self._write_back(prefs)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for _, entries, _ in self._shards)
+
+    def _shard(self, session_key: str):
+        return self._shards[hash(session_key) % len(self._shards)]
+
+    @staticmethod
+    def _write_back(prefs: UserPreferences):
+        if prefs.db:
+            prefs._flush_quietly()
+
+
+# Global store of per-session preferences
+_preference_store = None
+
+
+def get_preference_store() -> PreferenceStore:
+    """Get global preference store (persisted to the database)"""
+    global _preference_store
+    if _preference_store is None:
+        from core.database import DatabaseManager
+        _preference_store = PreferenceStore(db_manager=DatabaseManager)
+    return _preference_store
+
+
+def get_preferences(session_key: Optional[str] = None) -> UserPreferences:
     """
-    Get or create the global preferences instance
+    Get the preferences of a session or user
+
+    Args:
+        session_key: Session or user id (the shared "default" profile if None)
 
     Returns:
         UserPreferences instance
     """
-    global _session_preferences
-
-    if _session_preferences is None:
-        _session_preferences = UserPreferences()
-
-    return _session_preferences
+    return get_preference_store().get(session_key or "default")
 
 
-def reset_session_preferences():
-    """Reset the global preferences instance"""
-    global _session_preferences
-    _session_preferences = None
+def reset_session_preferences(session_key: Optional[str] = None):
+    """Reset the preferences of one session, stored counters included (the "default" profile if None)"""
+    session_key = session_key or "default"
+    store = get_preference_store()
+    store.get(session_key).reset_preferences()
+    store.evict(session_key)
@@ -3,10 +3,14 @@ LUKTHAN - AI Prompt Agent
 Transform rough ideas into powerful, optimized prompts
 Specialized for Research and Coding workflows
 """
+import time
+import uuid
 import streamlit as st
 from datetime import datetime
 from typing import Optional
 from core.config import Config
+from core.profiling import recent_profiles, request_profiles, wants_profile
+from core.usage import usage_scope
 
 # ==================== PAGE CONFIG ====================
 
@@ -54,6 +58,10 @@ if not Config.GEMINI_API_KEY or Config.GEMINI_API_KEY == "":
     """)
     st.stop()
 
+# Prometheus scrape endpoint when METRICS_PORT is set (started once per process)
+from core.metrics import start_metrics_server
+start_metrics_server()
+
 # ==================== SESSION STATE ====================
 
 if 'chat_history' not in st.session_state:
@@ -77,6 +85,51 @@ if 'pending_input' not in st.session_state:
 if 'show_chat' not in st.session_state:
     st.session_state.show_chat = False
 
+# (agent message, insights dict, PromptResult) whose quality score is still being computed
+if 'pending_evaluations' not in st.session_state:
+    st.session_state.pending_evaluations = []
+
+# LLM tokens this browser session spends are recorded under this id
+if 'usage_session_id' not in st.session_state:
+    st.session_state.usage_session_id = uuid.uuid4().hex
+
+
+@st.cache_resource
+def chat_latency():
+    """End-to-end chat latency of this process (apart from the hedger's per-call histograms)"""
+    from core.hedging import LatencyHistogram
+    return LatencyHistogram()
+
+
+def score_metrics(base_score: int) -> dict:
+    """Insights metrics derived from the quality score"""
+    return {
+        "Clarity": min(100, base_score + 5),
+        "Specificity": max(0, base_score - 3),
+        "Structure": min(100, base_score + 2),
+        "Completeness": max(0, base_score - 5)
+    }
+
+
+@st.fragment(run_every=1)
+def apply_late_scores():
+    """Copy deferred evaluation scores into their chat message and insights once they arrive"""
+    pending = st.session_state.pending_evaluations
+    arrived = [entry for entry in pending if not entry[2].score_pending]
+    if not arrived:
+        return
+
+    for message, insights, result in arrived:
+        # A failed or cancelled (shutdown) evaluation leaves the estimate in place
+        evaluation = result.evaluation
+        if not evaluation.cancelled() and evaluation.exception() is None:
+            message['quality_score'] = insights['quality_score'] = result.quality_score
+            message['suggestions'] = insights['suggestions'] = result.suggestions
+            insights['metrics'] = score_metrics(result.quality_score)
+        message['score_pending'] = False
+    st.session_state.pending_evaluations = [entry for entry in pending if entry[2].score_pending]
+    st.rerun()
+
 # ==================== SIDEBAR ====================
 
 with st.sidebar:
@@ -157,6 +210,53 @@ with st.sidebar:
 
     st.markdown("<br>", unsafe_allow_html=True)
 
+    # Which model tier answered analysis/evaluation calls in this process
+    from core.cascade import get_cascade_stats
+    cascade_report = get_cascade_stats().report()
+    if cascade_report:
+        with st.expander("Model cascade"):
+            st.code(cascade_report, language=None)
+
+    # Chat and per-model latency percentiles (hedging counts when enabled)
+    from core.hedging import get_hedger
+    latency_report = get_hedger().report(extra={"chat (end to end)": chat_latency()})
+    if latency_report:
+        with st.expander("Latency"):
+            st.code(latency_report, language=None)
+
+    # Background queues: backlog, throughput and wait before a task starts
+    from core.tasks import get_task_runner
+    tasks_report = get_task_runner().report()
+    if tasks_report:
+        with st.expander("Background tasks"):
+            st.code(tasks_report, language=None)
+
+    # Tokens and cost per pipeline stage and model in this process
+    from core.usage import get_usage_tracker
+    usage_report = get_usage_tracker().report()
+    if usage_report:
+        with st.expander("Token usage"):
+            st.code(usage_report, language=None)
+
+    # Profiles written by this process (?profile=1 or PROFILE_SAMPLE_EVERY)
+    profiles = recent_profiles()
+    if profiles:
+        with st.expander("Profiles"):
+            st.caption(f"In {Config.PROFILE_DIR}")
+            st.code("\n".join(profiles), language=None)
+
+    # Stage-by-stage waterfall of this process's latest requests (TRACING_ENABLED)
+    from core.tracing import format_waterfall, get_tracer, waterfall
+    traces = get_tracer().recent() if Config.TRACING_ENABLED else []
+    if traces:
+        with st.expander("Traces"):
+            roots = [waterfall(spans)[0] for spans in traces]
+            choice = st.selectbox(
+                "Request", range(len(traces)), key="trace_choice",
+                format_func=lambda i: f"{roots[i]['name']} ({roots[i]['duration_ms']:.0f} ms)"
+            )
+            st.code(format_waterfall(traces[choice]), language=None)
+
     # Footer in sidebar
     st.markdown("""
     <div style="text-align: center; color: #6E7681; font-size: 0.75rem; padding-top: 1rem;">
@@ -190,6 +290,7 @@ with col_actions:
             st.session_state.uploaded_file_type = None
             st.session_state.uploaded_file_name = None
             st.session_state.last_result = None
+            st.session_state.pending_evaluations = []
             st.session_state.show_chat = False
             st.rerun()
 
@@ -304,10 +405,14 @@ with tab_chat:
                             quality_score=message.get('quality_score', 75),
                             suggestions=message.get('suggestions', [])
                         )
+                        if message.get('score_pending'):
+                            st.caption("⏳ Scoring this prompt...")
                         if action == "regenerate":
                             st.session_state.regenerate_last = True
                             st.rerun()
 
+                apply_late_scores()
+
         # ==================== INPUT AREA ====================
 
         # Add spacing before input
@@ -511,7 +616,9 @@ with tab_chat:
                         try:
                             from core.file_processor import FileProcessor
                             processor = FileProcessor()
-                            content, file_type = processor.process_file(uploaded_file)
+                            with usage_scope(session_id=st.session_state.usage_session_id), \
+                                    request_profiles(wants_profile({}, st.query_params)):
+                                content, file_type = processor.process_file(uploaded_file)
                             st.session_state.uploaded_file_content = content
                             st.session_state.uploaded_file_type = file_type
                             st.success(f"✓ {uploaded_file.name}")
@@ -623,21 +730,21 @@ if send_clicked and user_input.strip():
                     if selected != "🔮 Auto Detect":
                         domain_override = domain_map.get(selected)
 
+                started = time.perf_counter()
+
                 agent = PromptAgent()
-                result = agent.process_input_sync(
-                    user_input=user_input,
-                    file_content=st.session_state.uploaded_file_content,
-                    file_type=st.session_state.uploaded_file_type
-                )
+                # Open the app with ?profile=1 to profile every message (see core/profiling.py)
+                with usage_scope(session_id=st.session_state.usage_session_id), \
+                        request_profiles(wants_profile({}, st.query_params)):
+                    result = agent.process_input_sync(
+                        user_input=user_input,
+                        file_content=st.session_state.uploaded_file_content,
+                        file_type=st.session_state.uploaded_file_type
+                    )
+                chat_latency().record(time.perf_counter() - started)
 
-                # Calculate metrics
-                base_score = result.quality_score
-                metrics = {
-                    "Clarity": min(100, base_score + 5),
-                    "Specificity": max(0, base_score - 3),
-                    "Structure": min(100, base_score + 2),
-                    "Completeness": max(0, base_score - 5)
-                }
+                # Calculate metrics (from a provisional score while evaluation is deferred)
+                metrics = score_metrics(result.quality_score)
 
                 # Add agent response
                 agent_message = {
@@ -647,6 +754,7 @@ if send_clicked and user_input.strip():
                     'task_type': result.task_type,
                     'quality_score': result.quality_score,
                     'suggestions': result.suggestions,
+                    'score_pending': result.score_pending,
                     'timestamp': datetime.now().strftime("%H:%M")
                 }
                 st.session_state.chat_history.append(agent_message)
@@ -659,6 +767,10 @@ if send_clicked and user_input.strip():
                     'metrics': metrics,
                     'suggestions': result.suggestions
                 }
+                if result.evaluation is not None:
+                    st.session_state.pending_evaluations.append(
+                        (agent_message, st.session_state.last_result, result)
+                    )
 
                 # Clear file uploads
                 st.session_state.uploaded_file_content = None
@@ -0,0 +1,104 @@
+"""
+Run and manage background optimization jobs
+
+Jobs live in the jobs table, so they survive the app and the workers
+restarting; start more worker processes (here or in another terminal) to
+work through the queue faster.
+
+Usage:
+    python job_worker.py run [--processes 4] [--kind optimize]
+    python job_worker.py enqueue prompts.jsonl [--kind agent] [--priority 5]
+    python job_worker.py status [JOB_ID]
+    python job_worker.py results JOB_ID [--offset 0] [--limit 100]
+    python job_worker.py cancel JOB_ID
+"""
+import argparse
+import json
+import sys
+
+from batch_optimize import MIN_PROMPT_CHARS, read_records
+from core.config import Config
+from core.database import DatabaseManager
+from core.jobs import enqueue, run_workers
+
+
+def cmd_run(args):
+    print(f"Starting {args.processes} job worker processes (Ctrl-C to stop)", file=sys.stderr)
+    run_workers(args.processes, args.kind)
+
+
+def cmd_enqueue(args):
+    stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    try:
+        prompts = [prompt for _, _, prompt in read_records(stream, args.format) if len(prompt) >= MIN_PROMPT_CHARS]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    options = {'deadline_seconds': args.deadline} if args.deadline else {}
+    job_id = enqueue(args.kind, prompts, options=options, priority=args.priority)
+    print(f"Queued job {job_id}: {len(prompts)} prompts ({args.kind})")
+
+
+def cmd_status(args):
+    jobs = [DatabaseManager.get_job(args.job_id)] if args.job_id else DatabaseManager.get_jobs(limit=args.limit)
+    for job in jobs:
+        if job is None:
+            sys.exit(f"No job {args.job_id}")
+        line = (f"#{job.id} {job.kind:<8} {job.status:<9} {job.progress_done}/{job.progress_total}"
+                f" ({job.failed_items} failed), attempt {job.attempts}/{job.max_attempts}")
+        if job.lease_owner:
+            line += f", leased by {job.lease_owner} until {job.lease_expires_at:%H:%M:%S}"
+        print(line)
+        if args.job_id and (job.result or job.error):
+            print(json.dumps({'result': job.result, 'error': job.error}, indent=2))
+
+
+def cmd_results(args):
+    for item in DatabaseManager.get_job_results(args.job_id, args.offset, args.limit):
+        print(json.dumps(item._asdict()))
+
+
+def cmd_cancel(args):
+    if not DatabaseManager.cancel_job(args.job_id):
+        sys.exit(f"Job {args.job_id} is not queued or running")
+    print(f"Cancelled job {args.job_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background optimization jobs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="run worker processes")
+    p.add_argument("--processes", type=int, default=Config.JOB_WORKERS)
+    p.add_argument("--kind", action="append", help="only run jobs of this kind (repeatable)")
+    p.set_defaults(fn=cmd_run)
+
+    p = sub.add_parser("enqueue", help="queue prompts (JSONL or ---separated text) as one job")
+    p.add_argument("input", nargs="?", default="-", help="input file (default: stdin)")
+    p.add_argument("--format", choices=["auto", "jsonl", "text"], default="auto")
+    p.add_argument("--kind", choices=["optimize", "agent"], default="optimize")
+    p.add_argument("--priority", type=int, default=0)
+    p.add_argument("--deadline", type=float, default=None, help="seconds per prompt")
+    p.set_defaults(fn=cmd_enqueue)
+
+    p = sub.add_parser("status", help="show one job, or the most recent ones")
+    p.add_argument("job_id", type=int, nargs="?")
+    p.add_argument("--limit", type=int, default=20)
+    p.set_defaults(fn=cmd_status)
+
+    p = sub.add_parser("results", help="print a job's sessions and versions as JSONL")
+    p.add_argument("job_id", type=int)
+    p.add_argument("--offset", type=int, default=0)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(fn=cmd_results)
+
+    p = sub.add_parser("cancel", help="cancel a queued or running job")
+    p.add_argument("job_id", type=int)
+    p.set_defaults(fn=cmd_cancel)
+
+    args = parser.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
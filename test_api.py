@@ -0,0 +1,143 @@
+"""
+Test script for the headless HTTP API
+Tests request validation, the JSON endpoints, and the streamed process and
+batch responses against fake models
+"""
+import json
+import os
+import sys
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from starlette.testclient import TestClient
+
+from api import app
+from core.config import Config
+from core.database import DatabaseManager
+from core.prompt_agent import get_prompt_agent
+from core.prompt_enhancer import get_enhancer
+
+ANALYSIS = ('{"domain": "coding", "task_type": "debugging", "complexity": "medium", '
+            '"key_topics": ["sorting"], "detected_language": "python", "confidence": 0.9, '
+            '"context_summary": "Fix a sorting bug"}')
+EVALUATION = '{"score": 88, "suggestions": ["Include the input list"]}'
+ENHANCEMENT = """ENHANCED PROMPT:
+Act as a Python expert and explain why my merge sort drops duplicates.
+
+SCORE_BEFORE: 40
+
+SCORE_AFTER: 85
+
+CHANGES:
+- Change 1: Added a role | Why: Sets the expertise level
+
+OVERALL EXPLANATION:
+Clearer and more specific."""
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for Gemini: evaluations take `eval_delay` seconds"""
+
+    def __init__(self, eval_delay: float = 0):
+        self.eval_delay = eval_delay
+
+    def generate_content(self, prompt: str, request_options=None) -> FakeResponse:
+        if prompt.startswith("Rate this prompt"):
+            time.sleep(self.eval_delay)
+            return FakeResponse(EVALUATION)
+        if prompt.startswith("You are an expert prompt engineer"):
+            return FakeResponse(ENHANCEMENT)
+        return FakeResponse(ANALYSIS)
+
+
+def test_validation_and_endpoints():
+    """Test that bad bodies are rejected and the JSON endpoints answer"""
+    print("\n" + "="*60)
+    print("TEST 1: Validation and Endpoints")
+    print("="*60)
+
+    with TestClient(app) as client:
+        get_enhancer().model = FakeModel()
+
+        assert client.get("/health").json() == {"status": "ok"}
+        assert client.post("/v1/optimize", content=b"not json").status_code == 400
+        response = client.post("/v1/optimize", json={"prompt": ""})
+        assert response.status_code == 422 and response.json()["detail"][0]["loc"] == ["prompt"]
+        response = client.post("/v1/batch", json={"operation": "translate", "prompts": ["x"]})
+        assert response.status_code == 422
+        print("[OK] Invalid requests rejected with 400/422")
+
+        response = client.post("/v1/analyze-response", json={
+            "prompt": "How do I reverse a list in Python?",
+            "response": "Use `my_list.reverse()` to reverse in place, or `my_list[::-1]` for a copy.\n"
+                        "1. reverse() returns None\n2. Slicing works on any sequence"
+        })
+        assert response.status_code == 200 and 0 <= response.json()["overall_score"] <= 100
+        print(f"[OK] analyze-response: {response.json()['overall_score']}")
+
+        response = client.post("/v1/enhance", json={"prompt": "why does my merge sort drop duplicates"})
+        assert response.json()["score_after"] == 85 and "Python expert" in response.json()["enhanced"]
+        print("[OK] enhance")
+
+        response = client.post("/v1/jobs", json={"prompts": ["summarize this paper for me"], "priority": -100})
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+        DatabaseManager.cancel_job(job_id)  # Not for real workers
+        job = client.get(f"/v1/jobs/{job_id}").json()
+        assert (job["kind"], job["status"], job["progress_total"]) == ("optimize", "cancelled", 1)
+        assert client.get(f"/v1/jobs/{job_id}/results").json() == []
+        assert client.get("/v1/jobs/999999999").status_code == 404
+        print(f"[OK] Job {job_id} queued and inspected")
+
+
+def test_streaming():
+    """Test the streamed score of /v1/process and the streamed batch"""
+    print("\n" + "="*60)
+    print("TEST 2: Streaming")
+    print("="*60)
+
+    original = Config.LOG_LLM_LABELS
+    Config.LOG_LLM_LABELS = False  # Fake answers are no training data
+    try:
+        check_streaming()
+    finally:
+        Config.LOG_LLM_LABELS = original
+
+
+def check_streaming():
+    with TestClient(app) as client:
+        agent = get_prompt_agent()
+        agent.fast_model = agent.model = FakeModel(eval_delay=0.3)
+
+        response = client.post("/v1/process", json={"user_input": "my bubble sort in python loops forever, why?"})
+        assert response.json()["quality_score"] == 88 and not response.json()["score_pending"]
+        print("[OK] process returns the scored prompt")
+
+        response = client.post("/v1/process", json={
+            "user_input": "my insertion sort in python skips the last item, why?", "stream": True
+        })
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        first, second = [json.loads(line) for line in response.text.splitlines()]
+        assert first["event"] == "result" and first["score_pending"] and first["domain"] == "coding"
+        assert second == {"event": "evaluation", "quality_score": 88, "suggestions": ["Include the input list"]}
+        print("[OK] Streamed prompt first, score second")
+
+        prompts = [f"my python heap sort fails on input number {i}, why?" for i in range(5)]
+        response = client.post("/v1/batch", json={"operation": "process", "prompts": prompts})
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(line["index"] for line in lines) == list(range(5))
+        assert all(line["result"]["quality_score"] == 88 for line in lines)
+        print(f"[OK] Batch streamed {len(lines)} results")
+
+
+if __name__ == "__main__":
+    test_validation_and_endpoints()
+    test_streaming()
+    print("\n[SUCCESS] All API tests passed!")
@@ -0,0 +1,106 @@
+"""
+Test script for the batch CLI
+Tests streaming input parsing, deduplication, fallback counting and the
+resume offset after an interruption
+"""
+import io
+import json
+import os
+import sys
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from batch_optimize import BatchRun, format_summary, read_records
+
+
+def fake_process(prompt: str):
+    """Stands in for smart_optimize: later prompts finish first, 'fail' raises, 'slow' degrades"""
+    if "fail" in prompt:
+        raise RuntimeError("provider error")
+    time.sleep(0.05 if "first" in prompt else 0.001)
+    return {"best_version": prompt.upper()}, (["optimize_prompt"] if "slow" in prompt else [])
+
+
+def test_read_records():
+    """Test JSONL and ---separated input"""
+    print("\n" + "="*60)
+    print("TEST 1: Reading Records")
+    print("="*60)
+
+    text = "Explain machine learning to me\n---\nx\n---\nHelp me write a Python\nsorting function---Last one here"
+    records = list(read_records(io.StringIO(text)))
+    assert [r[2] for r in records] == [
+        "Explain machine learning to me", "x", "Help me write a Python\nsorting function", "Last one here"
+    ]
+    print(f"[OK] {len(records)} text blocks")
+
+    jsonl = '{"id": 7, "prompt": "Explain recursion"}\n\n"Write a haiku"\nnot json\n'
+    records = list(read_records(io.StringIO(jsonl)))
+    assert records == [(0, "7", "Explain recursion"), (1, None, "Write a haiku"), (2, None, "")]
+    print("[OK] JSONL records with ids; unparseable lines are empty")
+
+    assert list(read_records(io.StringIO("42\n---\nsecond prompt")))[0][2] == "42"
+    print("[OK] A number on the first line is text, not JSONL")
+
+
+def test_batch_run():
+    """Test completion-order output, dedup, failures and fallbacks"""
+    print("\n" + "="*60)
+    print("TEST 2: Batch Run")
+    print("="*60)
+
+    prompts = ["first prompt here", "second prompt", "Second  PROMPT", "please fail now",
+               "slow prompt here", "no", "last prompt here"]
+    records = [(i, None, p) for i, p in enumerate(prompts)]
+    out = io.StringIO()
+    summary = BatchRun(fake_process, out, concurrency=3).run(records)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    by_offset = {line["offset"]: line for line in lines}
+    assert sorted(by_offset) == [0, 1, 2, 3, 4, 6]
+    assert lines[-1]["offset"] == 0, "Slowest prompt is written last"
+    assert by_offset[2] == {"offset": 2, "duplicate_of": 1}
+    assert by_offset[3]["error"] == "RuntimeError: provider error"
+    assert by_offset[6]["result"] == {"best_version": "LAST PROMPT HERE"}
+    assert (summary['processed'], summary['failed'], summary['duplicates'], summary['skipped']) == (4, 1, 1, 1)
+    assert summary['fallbacks'] == 1 and summary['fallback_stages'] == {"optimize_prompt": 1}
+    assert summary['resume_offset'] == 7 and summary['latency_s']['count'] == 4
+    print(format_summary(summary))
+
+
+def test_resume_after_interrupt():
+    """Test that every record below the resume offset has been written"""
+    print("\n" + "="*60)
+    print("TEST 3: Resume After Interrupt")
+    print("="*60)
+
+    def interrupted():
+        yield 0, None, "first prompt here"
+        for i in range(1, 5):
+            yield i, None, f"prompt number {i}"
+        time.sleep(0.01)
+        raise KeyboardInterrupt
+
+    out = io.StringIO()
+    summary = BatchRun(fake_process, out, concurrency=2).run(interrupted())
+    written = {json.loads(line)["offset"] for line in out.getvalue().splitlines()}
+    assert summary['interrupted']
+    assert set(range(summary['resume_offset'])) <= written
+    assert summary['resume_offset'] == 5, "Prompts already running are finished and written"
+    print(f"[OK] Interrupted with {sorted(written)} written; resume from {summary['resume_offset']}")
+
+    out = io.StringIO()
+    records = [(i, None, f"prompt number {i}") for i in range(6)]
+    summary = BatchRun(fake_process, out, concurrency=2).run(records, resume_from=4)
+    assert sorted(json.loads(line)["offset"] for line in out.getvalue().splitlines()) == [4, 5]
+    assert summary['resume_offset'] == 6
+    print("[OK] --resume-from skips earlier records")
+
+
+if __name__ == "__main__":
+    test_read_records()
+    test_batch_run()
+    test_resume_after_interrupt()
+    print("\n[SUCCESS] All batch CLI tests passed!")
@@ -0,0 +1,135 @@
+"""
+Test script for the model cascade
+Tests that cheap tiers answer confident requests, that unsure or malformed
+answers escalate to the strong model, and the per-tier stats
+"""
+import os
+import sys
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.cascade import CascadeStats, ModelCascade, get_cascade_stats
+from core.config import Config
+from core.prompt_builder import PromptBuilder
+from core.smart_analyzer import SmartAnalyzer
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for a Gemini model: canned answer, counted calls"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.calls = 0
+
+    def generate_content(self, prompt: str) -> FakeResponse:
+        self.calls += 1
+        return FakeResponse(self.text)
+
+
+def test_cascade_order_and_stats():
+    """Test that stages run cheapest first and stats add up"""
+    print("\n" + "="*60)
+    print("TEST 1: Stage Order and Stats")
+    print("="*60)
+
+    stats = CascadeStats()
+
+    def broken(x):
+        raise RuntimeError("tier down")
+
+    cascade = ModelCascade('test', [
+        ('heuristics', lambda x: 'cheap' if x < 10 else None),
+        ('fast', broken),
+        ('strong', lambda x: 'strong')
+    ], stats=stats)
+
+    assert cascade.run(3) == ('cheap', 'heuristics')
+    assert cascade.run(50) == ('strong', 'strong')
+    assert cascade.run(1) == ('cheap', 'heuristics')
+
+    tiers = stats.snapshot()['test']['tiers']
+    assert stats.snapshot()['test']['requests'] == 3
+    assert tiers['heuristics']['calls'] == 3 and tiers['heuristics']['answered'] == 2
+    assert tiers['fast']['errors'] == 1
+    assert tiers['strong']['share'] == 1 / 3
+    print(stats.report())
+    print("[OK] Cheapest tier answers, failures escalate")
+
+
+def test_analyzer_escalation():
+    """Test that SmartAnalyzer only reaches the strong model when needed"""
+    print("\n" + "="*60)
+    print("TEST 2: SmartAnalyzer Escalation")
+    print("="*60)
+
+    original = Config.LOG_LLM_LABELS, Config.SHARED_CACHE_ENABLED
+    Config.LOG_LLM_LABELS = False  # Fake answers are no training data
+    Config.SHARED_CACHE_ENABLED = False  # ...nor answers for other processes, and must reach the fakes
+    try:
+        check_analyzer_escalation()
+    finally:
+        Config.LOG_LLM_LABELS, Config.SHARED_CACHE_ENABLED = original
+    print(get_cascade_stats().report())
+
+
+def check_analyzer_escalation():
+    analyzer = SmartAnalyzer()
+    analyzer.fast_model = FakeModel('{"domain": "academic", "role": "researcher", "task": "research", "confidence": 0.95}')
+    analyzer.model = FakeModel('{"domain": "python-development", "role": "developer", "task": "debugging", "confidence": 0.9}')
+
+    # Plenty of agreeing keywords: answered locally
+    result = analyzer.analyze_prompt("train a neural network model with pytorch on this dataset for classification")
+    assert result['domain'] == 'ml-data-science'
+    assert analyzer.fast_model.calls == 0 and analyzer.model.calls == 0
+    print("[OK] Keyword-rich prompt never reached Gemini")
+
+    # Ambiguous prompt, confident fast model: strong model not called
+    result = analyzer.analyze_prompt("help me with my thesis chapter")
+    assert (result['domain'], analyzer.fast_model.calls, analyzer.model.calls) == ('academic', 1, 0)
+    print("[OK] Confident fast model answered")
+
+    # Unsure fast model escalates
+    analyzer.fast_model.text = '{"domain": "academic", "role": "student", "task": "learning", "confidence": 0.4}'
+    result = analyzer.analyze_prompt("help me with my thesis chapter")
+    assert (result['domain'], analyzer.model.calls) == ('python-development', 1)
+    print("[OK] Unsure fast model escalated to the strong model")
+
+    # Gemini's free-form labels come back in the classifier's form
+    analyzer.model.text = '{"domain": "ml-data-science", "role": "Data Scientist", "task": "data_analysis", "confidence": 0.9}'
+    result = analyzer.analyze_prompt("help me with my survey chapter")
+    assert (result['role'], result['task']) == ('data-scientist', 'data-analysis'), result
+    print("[OK] LLM labels normalized like the classifier's")
+
+
+def test_validation_escalation():
+    """Test that malformed fast validations escalate"""
+    print("\n" + "="*60)
+    print("TEST 3: Prompt Validation Escalation")
+    print("="*60)
+
+    builder = PromptBuilder()
+    builder.model = FakeModel("SCORE: 82\nSTRENGTHS:\n- Clear role\nRECOMMENDATIONS:\n- Add an example")
+
+    builder.fast_model = FakeModel("SCORE: 64\nWEAKNESSES:\n- Vague task\nRECOMMENDATIONS:\n- Name the output format")
+    assert builder.validate_prompt("You are a tutor. Explain recursion.")['score'] == 64
+    assert builder.model.calls == 0
+    print("[OK] Well-formed fast answer kept")
+
+    builder.fast_model = FakeModel("Looks good to me!")
+    result = builder.validate_prompt("You are a tutor. Explain recursion.")
+    assert result['score'] == 82 and result['recommendations'] == ['Add an example']
+    assert builder.model.calls == 1
+    print("[OK] Malformed fast answer escalated")
+
+
+if __name__ == "__main__":
+    test_cascade_order_and_stats()
+    test_analyzer_escalation()
+    test_validation_escalation()
+    print("\n[SUCCESS] All cascade tests passed!")
@@ -0,0 +1,304 @@
+"""
+Test script for database read and write paths
+Tests row snapshots for list views, the template read cache, full-text search,
+batched usage counters, seeding and fleet usage rollups
+"""
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import update
+
+from core import database
+from core.config import Config
+from core.counters import CounterBuffer
+from core.database import DatabaseManager, CacheVersion, UsageRollup, Workflow, PromptTemplate, PromptVersion, TemplateRow, WorkflowRow, SessionRow
+
+
+def test_template_rows():
+    """Test that template listings come back as read-only rows"""
+    print("\n" + "="*60)
+    print("TEST 1: Template Rows")
+    print("="*60)
+
+    name = f"Row Test {uuid.uuid4().hex[:8]}"
+    created = DatabaseManager.create_template(
+        name=name,
+        description="Row snapshot test",
+        role="row_test_role",
+        task_type="row_test_task",
+        base_prompt="Explain [TOPIC]",
+        tags=["test"]
+    )
+
+    templates = DatabaseManager.get_templates(role="row_test_role", task_type="row_test_task")
+    match = [t for t in templates if t.id == created.id]
+
+    assert match, "Created template should be listed"
+    assert isinstance(match[0], TemplateRow)
+    assert match[0].name == name
+    assert match[0].tags == ["test"], "JSON columns should be decoded"
+
+    print(f"[OK] Listed {len(templates)} template rows")
+
+
+def test_workflow_and_session_rows():
+    """Test workflow and session listings"""
+    print("\n" + "="*60)
+    print("TEST 2: Workflow and Session Rows")
+    print("="*60)
+
+    workflows = DatabaseManager.get_workflows()
+    assert all(isinstance(w, WorkflowRow) for w in workflows)
+    print(f"[OK] Listed {len(workflows)} workflow rows")
+
+    user = DatabaseManager.create_user(username=f"rows_{uuid.uuid4().hex[:8]}")
+    DatabaseManager.create_session(
+        user_id=user.id,
+        role="phd",
+        task_type="summary",
+        raw_prompt="Summarize this paper",
+        analysis={'risks': ["vague"]}
+    )
+
+    sessions = DatabaseManager.get_user_sessions(user.id)
+    assert len(sessions) == 1
+    assert isinstance(sessions[0], SessionRow)
+    assert sessions[0].risks == ["vague"]
+    print("[OK] Session rows carry analysis fields")
+
+
+def test_template_cache_invalidation():
+    """Test that cached listings refresh after local and remote writes"""
+    print("\n" + "="*60)
+    print("TEST 3: Template Cache Invalidation")
+    print("="*60)
+
+    role = f"cache_{uuid.uuid4().hex[:8]}"
+    assert DatabaseManager.get_templates(role=role) == []
+
+    DatabaseManager.create_template(
+        name="Cached Template",
+        description="Cache test",
+        role=role,
+        task_type="summary",
+        base_prompt="Summarize [PAPER]"
+    )
+    assert len(DatabaseManager.get_templates(role=role)) == 1, "create_template should invalidate"
+    print("[OK] Local write invalidated the cache")
+
+    # Simulate another worker writing: change the row behind the cache's back
+    # and bump the shared version row the way that worker would.
+    with DatabaseManager.get_session() as session:
+        session.execute(
+            update(database.PromptTemplate)
+            .where(database.PromptTemplate.role == role)
+            .values(name="Renamed Elsewhere")
+        )
+    database._template_cache._checked_at = time.monotonic()
+    assert DatabaseManager.get_templates(role=role)[0].name == "Cached Template", "Should serve from cache"
+
+    with DatabaseManager.get_session() as session:
+        session.execute(
+            update(CacheVersion)
+            .where(CacheVersion.name == 'templates')
+            .values(version=CacheVersion.version + 1)
+        )
+    database._template_cache._checked_at = 0.0
+    assert DatabaseManager.get_templates(role=role)[0].name == "Renamed Elsewhere"
+    print("[OK] Shared version bump refreshed the cache")
+
+
+def test_full_text_search():
+    """Test FTS search over templates and prompt history"""
+    print("\n" + "="*60)
+    print("TEST 4: Full-Text Search")
+    print("="*60)
+
+    word = f"zq{uuid.uuid4().hex[:8]}"
+    template = DatabaseManager.create_template(
+        name=f"Searchable {word}",
+        description="Full-text search test",
+        role="phd",
+        task_type="summary",
+        base_prompt="Summarize the findings",
+        tags=["fts"]
+    )
+
+    hits = DatabaseManager.search_templates(word)
+    assert [h.id for h in hits] == [template.id]
+    assert f"**{word}**" in hits[0].snippet, "Snippet should highlight the match"
+    assert DatabaseManager.search_templates(word[:5])[0].id == template.id, "Last term is a prefix"
+    assert DatabaseManager.search_templates('" OR * NEAR(') == [], "FTS syntax should be neutralized"
+    print("[OK] Template search ranks and highlights matches")
+
+    session = DatabaseManager.create_session(
+        user_id=None,
+        role="phd",
+        task_type="summary",
+        raw_prompt=f"Help me outline the {word} chapter"
+    )
+    hits = DatabaseManager.search_history(f"outline {word}")
+    assert [h.id for h in hits] == [session.id]
+    assert DatabaseManager.search_history(word, since=datetime.utcnow() + timedelta(days=1)) == []
+    print("[OK] History search honours date filters")
+
+    # Newer matches outside the filter must not push filtered ones out of the rank window
+    crowded = f"zq{uuid.uuid4().hex[:8]}"
+    user = DatabaseManager.create_user(f"fts_{crowded}")
+    older_template = DatabaseManager.create_template(
+        name=f"Crowded {crowded}", description="Older match", role="phd",
+        task_type="email", base_prompt="Draft the email", tags=["fts"]
+    )
+    older_session = DatabaseManager.create_session(
+        user_id=user.id, role="phd", task_type="summary", raw_prompt=f"Outline the {crowded} chapter"
+    )
+    for i in range(3):
+        DatabaseManager.create_template(
+            name=f"Crowded {crowded} {i}", description="Newer match", role="phd",
+            task_type="summary", base_prompt="Summarize", tags=["fts"]
+        )
+        DatabaseManager.create_session(
+            user_id=None, role="phd", task_type="summary", raw_prompt=f"Outline the {crowded} chapter {i}"
+        )
+    window = Config.SEARCH_RANK_WINDOW
+    Config.SEARCH_RANK_WINDOW = 2
+    try:
+        assert len(DatabaseManager.search_templates(crowded)) == 2, "Unfiltered search ranks the window"
+        assert [h.id for h in DatabaseManager.search_templates(crowded, task_type="email")] == [older_template.id]
+        assert [h.id for h in DatabaseManager.search_history(crowded, user_id=user.id)] == [older_session.id]
+    finally:
+        Config.SEARCH_RANK_WINDOW = window
+    print("[OK] Filters apply inside the rank window")
+
+
+def test_usage_counters():
+    """Test coalesced usage and rating deltas"""
+    print("\n" + "="*60)
+    print("TEST 5: Batched Usage Counters")
+    print("="*60)
+
+    template = DatabaseManager.create_template(
+        name=f"Counter Test {uuid.uuid4().hex[:8]}",
+        description="Counter test",
+        role="phd",
+        task_type="summary",
+        base_prompt="Summarize [PAPER]"
+    )
+    session = DatabaseManager.create_session(user_id=None, role="phd", task_type="summary", raw_prompt="Counters")
+    version = DatabaseManager.create_version(session.id, "basic", "Optimized")
+
+    counters = CounterBuffer(flush_interval=60, max_pending=10_000)
+    for _ in range(1000):
+        counters.record_template_use(template.id)
+    counters.rate_template(template.id, 5)
+    counters.rate_template(template.id, 4)
+    counters.mark_version_copied(version.id)
+    counters.rate_version(version.id, 3)
+    for rate, target, stars in ((counters.rate_template, template.id, 0), (counters.rate_version, version.id, 6)):
+        try:
+            rate(target, stars)
+            raise AssertionError(f"{stars} stars accepted")
+        except ValueError:
+            pass
+    assert counters.pending() == 1004, "Rejected ratings are not buffered"
+
+    with DatabaseManager.get_session() as db:
+        assert db.get(PromptTemplate, template.id).uses_count == 0, "Nothing written before flush"
+
+    assert counters.flush() == 1004
+    counters.rate_template(template.id, 3)
+    counters.flush()
+
+    with DatabaseManager.get_session() as db:
+        stored = db.get(PromptTemplate, template.id)
+        assert stored.uses_count == 1000
+        assert stored.rating_count == 3
+        assert abs(stored.rating - 4.0) < 1e-9, "Running average of 5, 4, 3"
+        stored_version = db.get(PromptVersion, version.id)
+        assert stored_version.was_copied and stored_version.rating == 3
+
+    listed = [t for t in DatabaseManager.get_templates(role="phd", task_type="summary") if t.id == template.id]
+    assert listed[0].uses_count == 1000, "Flush should invalidate cached listings"
+    print("[OK] 1000 uses applied in one flush, rating average maintained incrementally")
+
+
+def test_seeding_is_idempotent():
+    """Test that re-running the bulk seed adds nothing"""
+    print("\n" + "="*60)
+    print("TEST 6: Idempotent Seeding")
+    print("="*60)
+
+    seed = database._load_seed_data()
+    with DatabaseManager.get_session() as session:
+        assert database.seed_database(session) == {'templates': 0, 'workflows': 0}
+
+    names = [t.name for t in DatabaseManager.get_templates()]
+    for template in seed['templates']:
+        assert names.count(template['name']) == 1, f"{template['name']} should be seeded once"
+
+    seeded = next(t for t in DatabaseManager.get_templates() if t.name == seed['templates'][0]['name'])
+    assert seeded.tags == seed['templates'][0]['tags'] and seeded.uses_count is not None
+
+    with DatabaseManager.get_session() as session:
+        assert session.query(Workflow).count() == len(seed['workflows'])
+    print(f"[OK] {len(seed['templates'])} templates and {len(seed['workflows'])} workflows seeded exactly once")
+
+
+def test_usage_rollups():
+    """Test that preference deltas roll up into fleet-wide hourly/daily stats"""
+    print("\n" + "="*60)
+    print("TEST 7: Fleet Usage Rollups")
+    print("="*60)
+
+    # A window in the past that only this test writes to
+    day = datetime(2001, 1, 1)
+    run = uuid.uuid4().hex[:8]
+    with DatabaseManager.get_session() as session:
+        session.query(UsageRollup).filter(UsageRollup.bucket < day + timedelta(days=1)).delete()
+
+    DatabaseManager.apply_preference_deltas(f"rollup_a_{run}", {
+        ('domain_usage', 'academic'): 3,
+        ('combinations', 'academic|phd|research'): 3,
+        ('version_usage', 'critical'): 2,
+    }, at=day + timedelta(hours=9, minutes=5))
+    DatabaseManager.apply_preference_deltas(f"rollup_b_{run}", {
+        ('domain_usage', 'academic'): 1,
+        ('domain_usage', 'ml-data-science'): 1,
+        ('version_usage', 'basic'): 2,
+    }, at=day + timedelta(hours=14))
+
+    stats = DatabaseManager.get_fleet_usage(since=day, until=day + timedelta(days=1))
+    assert stats['total_optimizations'] == 5
+    assert stats['domains'] == {'academic': 4, 'ml-data-science': 1}
+    assert stats['version_percentages'] == {'critical': 50.0, 'basic': 50.0}
+    assert stats['top_combinations'][0] == {'domain': 'academic', 'role': 'phd', 'task': 'research', 'count': 3}
+    print(f"[OK] Fleet stats summed across sessions: {stats['domains']}")
+
+    morning = DatabaseManager.get_fleet_usage(since=day, until=day + timedelta(hours=12), granularity='hour')
+    assert morning['domains'] == {'academic': 3}
+
+    series = DatabaseManager.get_usage_timeseries('domain_usage', 'hour', since=day, until=day + timedelta(days=1))
+    assert [(bucket.hour, key, count) for bucket, key, count in series] == [
+        (9, 'academic', 3), (14, 'academic', 1), (14, 'ml-data-science', 1)
+    ]
+    print("[OK] Hourly buckets and time series")
+
+    for key in (f"rollup_a_{run}", f"rollup_b_{run}"):
+        DatabaseManager.clear_preference_counters(key)
+
+
+if __name__ == "__main__":
+    test_template_rows()
+    test_workflow_and_session_rows()
+    test_template_cache_invalidation()
+    test_full_text_search()
+    test_usage_counters()
+    test_seeding_is_idempotent()
+    test_usage_rollups()
+    print("\n[SUCCESS] All database tests passed!")
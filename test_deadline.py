@@ -0,0 +1,140 @@
+"""
+Test script for request deadlines
+Tests the deadline budget and nesting, that a slow model cannot hold a request
+past its deadline, and that degraded results fall back to heuristics uncached
+"""
+import os
+import sys
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.config import Config
+from core.deadline import Deadline, DeadlineExceeded, current_deadline, deadline_scope, request_options
+from core.hedging import Hedger
+from core.near_duplicate import get_near_duplicate_cache
+from core.prompt_agent import PromptAgent
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class SlowModel:
+    """Stands in for a Gemini model that answers after `delay` seconds, honouring HTTP timeouts"""
+
+    def __init__(self, text: str, delay: float):
+        self.text = text
+        self.delay = delay
+        self.timeouts = []
+
+    def generate_content(self, prompt: str, request_options=None) -> FakeResponse:
+        timeout = (request_options or {}).get('timeout')
+        self.timeouts.append(timeout)
+        if timeout is not None and timeout < self.delay:
+            time.sleep(timeout)
+            raise TimeoutError("read timed out")
+        time.sleep(self.delay)
+        return FakeResponse(self.text)
+
+
+def test_deadline_budget():
+    """Test remaining time, minimum call budget and nested scopes"""
+    print("\n" + "="*60)
+    print("TEST 1: Deadline Budget")
+    print("="*60)
+
+    original = Config.DEADLINE_MIN_CALL_SECONDS
+    Config.DEADLINE_MIN_CALL_SECONDS = 0.5
+    try:
+        assert current_deadline() is None and request_options() == {}
+
+        with deadline_scope(Deadline(10)) as outer:
+            assert 9 < request_options()['request_options']['timeout'] <= 10
+            # An inner scope cannot extend its caller's budget
+            with deadline_scope(Deadline(60)) as inner:
+                assert inner is outer
+            with deadline_scope(Deadline(2)) as inner:
+                assert inner is not outer and inner.remaining() <= 2
+            assert current_deadline() is outer
+        print("[OK] Nested scopes keep the earlier deadline")
+
+        with deadline_scope(Deadline(0.3)):
+            try:
+                request_options()
+                assert False, "Expected DeadlineExceeded"
+            except DeadlineExceeded:
+                print("[OK] No call started with less than the minimum budget")
+    finally:
+        Config.DEADLINE_MIN_CALL_SECONDS = original
+
+
+def test_hedged_call_timeout():
+    """Test that a hedged race gives up at the deadline"""
+    print("\n" + "="*60)
+    print("TEST 2: Hedged Call Timeout")
+    print("="*60)
+
+    hedger = Hedger(max_workers=2)
+    start = time.perf_counter()
+    try:
+        hedger.call([("a", lambda: time.sleep(2) or "late")], timeout=0.2)
+        assert False, "Expected DeadlineExceeded"
+    except DeadlineExceeded:
+        elapsed = time.perf_counter() - start
+    assert elapsed < 1, elapsed
+    print(f"[OK] Gave up after {elapsed:.2f} s")
+
+
+def test_agent_meets_deadline():
+    """Test that a slow model degrades PromptAgent to heuristics within the budget"""
+    print("\n" + "="*60)
+    print("TEST 3: PromptAgent Under a Deadline")
+    print("="*60)
+
+    original = (Config.DEADLINE_MIN_CALL_SECONDS, Config.LOG_LLM_LABELS)
+    Config.DEADLINE_MIN_CALL_SECONDS, Config.LOG_LLM_LABELS = 0.5, False
+    try:
+        check_agent_meets_deadline()
+    finally:
+        Config.DEADLINE_MIN_CALL_SECONDS, Config.LOG_LLM_LABELS = original
+
+
+def check_agent_meets_deadline():
+    agent = PromptAgent()
+    analysis = ('{"domain": "research", "task_type": "literature_review", "complexity": "high", '
+                '"key_topics": ["sleep"], "detected_language": null, "confidence": 0.95, '
+                '"context_summary": "Review"}')
+    agent.fast_model = agent.model = SlowModel(analysis, delay=5)
+
+    user_input = "could you look at sleep and memory for my chapter on late night study habits"
+    start = time.perf_counter()
+    result = agent.process_input_sync(user_input, deadline=Deadline(1.5), defer_evaluation=False)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 2.5, elapsed
+    assert agent.model.timeouts and all(t <= 1.5 for t in agent.model.timeouts)
+    assert 'prompt_agent' in result.metadata['degraded']
+    assert 'prompt_agent.evaluate' in result.metadata['degraded']
+    assert 0 <= result.quality_score <= 100
+    print(f"[OK] Answered in {elapsed:.2f} s with heuristics for {result.metadata['degraded']}")
+
+    cache = get_near_duplicate_cache()
+    if cache is not None:
+        assert cache.get(agent._cache_namespace(None, None), user_input) is None
+        print("[OK] Degraded result not cached")
+
+    # With time to spare the model's answer is used
+    agent.fast_model = agent.model = SlowModel(analysis, delay=0)
+    result = agent.process_input_sync(user_input + " please", deadline=Deadline(10), defer_evaluation=False)
+    assert result.domain == "research" and result.metadata['degraded'] == []
+    print("[OK] Fast model answers within the budget")
+
+
+if __name__ == "__main__":
+    test_deadline_budget()
+    test_hedged_call_timeout()
+    test_agent_meets_deadline()
+    print("\n[SUCCESS] All deadline tests passed!")
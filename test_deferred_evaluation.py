@@ -0,0 +1,80 @@
+"""
+Test script for deferred evaluation
+Tests that chat prompts return before their quality score, that the score
+arrives on the result later, and that callers can still wait for it
+"""
+import os
+import sys
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.config import Config
+from core.prompt_agent import PromptAgent
+
+ANALYSIS = ('{"domain": "coding", "task_type": "debugging", "complexity": "medium", '
+            '"key_topics": ["recursion"], "detected_language": "python", "confidence": 0.9, '
+            '"context_summary": "Fix a recursion bug"}')
+EVALUATION = '{"score": 91, "suggestions": ["Show the failing input"]}'
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for Gemini: instant analysis, evaluation after `eval_delay` seconds"""
+
+    def __init__(self, eval_delay: float):
+        self.eval_delay = eval_delay
+
+    def generate_content(self, prompt: str, request_options=None) -> FakeResponse:
+        if prompt.startswith("Rate this prompt"):
+            time.sleep(self.eval_delay)
+            return FakeResponse(EVALUATION)
+        return FakeResponse(ANALYSIS)
+
+
+def test_deferred_evaluation():
+    """Test that the optimized prompt comes back before its score"""
+    print("\n" + "="*60)
+    print("TEST 1: Deferred Evaluation")
+    print("="*60)
+
+    original = Config.LOG_LLM_LABELS
+    Config.LOG_LLM_LABELS = False  # Fake answers are no training data
+    try:
+        check_deferred_evaluation()
+    finally:
+        Config.LOG_LLM_LABELS = original
+
+
+def check_deferred_evaluation():
+    agent = PromptAgent()
+    agent.fast_model = agent.model = FakeModel(eval_delay=0.5)
+
+    start = time.perf_counter()
+    result = agent.process_input_sync("my recursive fibonacci overflows, why?", defer_evaluation=True)
+    elapsed = time.perf_counter() - start
+    assert elapsed < 0.4, elapsed
+    assert result.score_pending and result.suggestions == []
+    assert result.optimized_prompt and result.domain == "coding"
+    print(f"[OK] Prompt returned after {elapsed:.2f} s with provisional score {result.quality_score}")
+
+    assert result.evaluation.result(timeout=5) == (91, ["Show the failing input"])
+    assert not result.score_pending
+    assert (result.quality_score, result.suggestions) == (91, ["Show the failing input"])
+    print("[OK] Late score and suggestions filled in on the result")
+
+    start = time.perf_counter()
+    result = agent.process_input_sync("my recursive quicksort never returns, why?", defer_evaluation=False)
+    assert time.perf_counter() - start >= 0.5
+    assert result.evaluation is None and result.quality_score == 91
+    print("[OK] Without deferral the score is part of the response")
+
+
+if __name__ == "__main__":
+    test_deferred_evaluation()
+    print("\n[SUCCESS] All deferred evaluation tests passed!")
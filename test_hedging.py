@@ -0,0 +1,139 @@
+"""
+Test script for hedged requests
+Tests latency histograms, the histogram-driven hedge delay, and that the first
+valid response wins the race between a slow primary and its backup
+"""
+import os
+import random
+import sys
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.config import Config
+from core.hedging import Hedger, LatencyHistogram, hedge_targets
+
+
+def with_config(**overrides):
+    """Temporarily override Config attributes"""
+    class _Override:
+        def __enter__(self):
+            self.saved = {name: getattr(Config, name) for name in overrides}
+            for name, value in overrides.items():
+                setattr(Config, name, value)
+
+        def __exit__(self, *exc):
+            for name, value in self.saved.items():
+                setattr(Config, name, value)
+    return _Override()
+
+
+def test_histogram():
+    """Test percentile accuracy of the log-bucketed histogram"""
+    print("\n" + "="*60)
+    print("TEST 1: Latency Histogram")
+    print("="*60)
+
+    rng = random.Random(3)
+    samples = [rng.lognormvariate(0, 0.6) for _ in range(5000)]
+    histogram = LatencyHistogram()
+    for s in samples:
+        histogram.record(s)
+
+    samples.sort()
+    for p in (50, 95, 99):
+        exact = samples[int(len(samples) * p / 100) - 1]
+        estimate = histogram.percentile(p)
+        assert exact <= estimate <= exact * 1.16, (p, exact, estimate)
+        print(f"[OK] p{p}: {estimate:.3f} s (exact {exact:.3f} s)")
+    assert LatencyHistogram().percentile(99) is None
+
+
+def test_backup_wins_slow_primary():
+    """Test that a backup is sent after the hedge delay and wins"""
+    print("\n" + "="*60)
+    print("TEST 2: Hedging a Slow Primary")
+    print("="*60)
+
+    hedger = Hedger(max_workers=4)
+
+    def slow():
+        time.sleep(1.0)
+        return "primary"
+
+    def fast():
+        time.sleep(0.05)
+        return "backup"
+
+    with with_config(HEDGE_MIN_SAMPLES=20, HEDGE_DEFAULT_DELAY_SECONDS=0.1):
+        start = time.perf_counter()
+        assert hedger.call([("gemini:a", slow), ("openai:b", fast)]) == "backup"
+        elapsed = time.perf_counter() - start
+    assert 0.1 <= elapsed < 0.5, elapsed
+    assert hedger.stats == {'calls': 1, 'hedged': 1, 'backup_wins': 1}
+    print(f"[OK] Backup answered after {elapsed:.2f} s instead of 1 s")
+
+    # A fast primary never triggers the hedge
+    with with_config(HEDGE_MIN_SAMPLES=20, HEDGE_DEFAULT_DELAY_SECONDS=0.5):
+        assert hedger.call([("gemini:a", fast), ("openai:b", slow)]) == "backup"
+    assert hedger.stats['hedged'] == 1
+    print("[OK] Fast primary not hedged")
+
+
+def test_failures_and_validation():
+    """Test that failed or invalid primaries hedge at once"""
+    print("\n" + "="*60)
+    print("TEST 3: Failures and Invalid Responses")
+    print("="*60)
+
+    hedger = Hedger(max_workers=4)
+
+    def broken():
+        raise ConnectionError("provider down")
+
+    with with_config(HEDGE_MIN_SAMPLES=20, HEDGE_DEFAULT_DELAY_SECONDS=5):
+        start = time.perf_counter()
+        assert hedger.call([("a", broken), ("b", lambda: "ok")]) == "ok"
+        assert time.perf_counter() - start < 1
+        print("[OK] Failed primary hedged without waiting for the delay")
+
+        assert hedger.call([("a", lambda: "not json"), ("b", lambda: '{"v": 1}')],
+                           validate=lambda text: text.startswith("{")) == '{"v": 1}'
+        print("[OK] Invalid primary response lost to the backup")
+
+        try:
+            hedger.call([("a", broken), ("b", broken)])
+            assert False, "Expected the last error"
+        except ConnectionError:
+            print("[OK] All attempts failing raises")
+
+
+def test_delay_from_histogram():
+    """Test that the hedge delay follows the target's percentile latency"""
+    print("\n" + "="*60)
+    print("TEST 4: Adaptive Hedge Delay")
+    print("="*60)
+
+    hedger = Hedger(max_workers=2)
+    with with_config(HEDGE_MIN_SAMPLES=20, HEDGE_DEFAULT_DELAY_SECONDS=8, HEDGE_PERCENTILE=95,
+                     HEDGE_MIN_DELAY_SECONDS=0.5, HEDGE_MAX_DELAY_SECONDS=30, HEDGE_BACKUPS=""):
+        assert hedger.hedge_delay("gemini:x") == 8
+        for i in range(100):
+            hedger.histogram("gemini:x").record(1.0 if i < 95 else 20.0)
+        delay = hedger.hedge_delay("gemini:x")
+        assert 1.0 <= delay <= 1.16, delay
+        print(f"[OK] Delay after 100 calls: {delay:.2f} s (p95)")
+
+        assert hedge_targets("gemini:x") == ["gemini:x", "gemini:x"]
+    with with_config(HEDGE_BACKUPS="openai:gpt-4o-mini, gemini:y"):
+        assert hedge_targets("gemini:x") == ["gemini:x", "openai:gpt-4o-mini", "gemini:y"]
+    print("[OK] Backups from HEDGE_BACKUPS, else the primary again")
+
+
+if __name__ == "__main__":
+    test_histogram()
+    test_backup_wins_slow_primary()
+    test_failures_and_validation()
+    test_delay_from_histogram()
+    print("\n[SUCCESS] All hedging tests passed!")
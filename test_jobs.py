@@ -0,0 +1,159 @@
+"""
+Test script for background jobs
+Tests leasing, results linked to sessions and versions, takeover of an
+expired lease with resume, cancellation, release on shutdown, and
+concurrent workers running every prompt exactly once
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.database import DatabaseManager, JobLeaseLost
+from core.jobs import JobWorker, enqueue, job_handler
+
+calls = []
+
+
+def echo(prompt, options):
+    """Stands in for the pipeline: one session and two versions per prompt"""
+    calls.append(prompt)
+    if prompt == "bad prompt":
+        raise ValueError("unparseable")
+    time.sleep(options.get('delay', 0))
+    session = {'role': 'phd', 'task_type': 'summary', 'raw_prompt': prompt, 'clarity_score': len(prompt)}
+    return session, {'basic': prompt.upper(), 'safe': f"Safely: {prompt}"}, (['optimize_prompt'] if 'slow' in prompt else [])
+
+
+def new_kind() -> str:
+    """A job kind only this test's workers lease (the database outlives test runs)"""
+    kind = f"test.echo.{uuid.uuid4().hex[:8]}"
+    job_handler(kind)(echo)
+    return kind
+
+
+def test_run_job():
+    """Test that a worker runs a job and links its results"""
+    print("\n" + "="*60)
+    print("TEST 1: Run a Job")
+    print("="*60)
+
+    kind = new_kind()
+    job_id = enqueue(kind, ["summarize the paper", "bad prompt", "slow summary please"])
+    assert DatabaseManager.get_job(job_id).status == 'queued'
+
+    worker = JobWorker(kinds=[kind])
+    assert worker.run_once() and not worker.run_once()
+
+    job = DatabaseManager.get_job(job_id)
+    assert (job.status, job.progress_done, job.progress_total, job.failed_items) == ('done', 3, 3, 1)
+    assert job.result['errors'] == [{'item': 1, 'error': 'ValueError: unparseable'}]
+    assert job.result['fallback_stages'] == {'optimize_prompt': 1}
+
+    results = DatabaseManager.get_job_results(job_id)
+    assert [r.job_item for r in results] == [0, 2]
+    assert results[0].raw_prompt == "summarize the paper"
+    assert results[0].versions == {'basic': "SUMMARIZE THE PAPER", 'safe': "Safely: summarize the paper"}
+    print(f"[OK] Job {job_id} done: 2 sessions with versions, 1 failed prompt")
+
+
+def test_lease_takeover():
+    """Test that an expired lease is taken over and the job resumes"""
+    print("\n" + "="*60)
+    print("TEST 2: Lease Takeover")
+    print("="*60)
+
+    kind = new_kind()
+    job_id = enqueue(kind, ["first prompt", "second prompt", "third prompt"])
+
+    crashed = JobWorker(kinds=[kind], lease_seconds=0.2)
+    lease = DatabaseManager.lease_job(crashed.owner, 0.2, [kind])
+    DatabaseManager.record_job_item(job_id, crashed.owner, 0, 0.2, *echo("first prompt", {})[:2])
+    assert DatabaseManager.lease_job("other", 60, [kind]) is None, "Leased jobs are invisible"
+    time.sleep(0.3)  # The worker "crashed": its lease expires
+
+    del calls[:]
+    survivor = JobWorker(kinds=[kind])
+    assert survivor.run_once()
+    assert calls == ["second prompt", "third prompt"], "Resumed after the finished prompt"
+    job = DatabaseManager.get_job(job_id)
+    assert job.status == 'done' and job.attempts == 2
+    assert [r.job_item for r in DatabaseManager.get_job_results(job_id)] == [0, 1, 2]
+    print("[OK] Second worker resumed at prompt 1")
+
+    try:
+        DatabaseManager.record_job_item(lease.id, crashed.owner, 1, 60, {'role': 'x', 'task_type': 'y', 'raw_prompt': 'late'})
+        assert False, "Expected JobLeaseLost"
+    except JobLeaseLost:
+        pass
+    assert len(DatabaseManager.get_job_results(job_id)) == 3
+    print("[OK] The old lease holder can no longer write")
+
+
+def test_cancel_and_release():
+    """Test cancellation, release on shutdown and giving up after max attempts"""
+    print("\n" + "="*60)
+    print("TEST 3: Cancel, Release and Max Attempts")
+    print("="*60)
+
+    kind = new_kind()
+    job_id = enqueue(kind, ["never runs"])
+    assert DatabaseManager.cancel_job(job_id) and not DatabaseManager.cancel_job(job_id)
+    assert not JobWorker(kinds=[kind]).run_once()
+    print("[OK] Cancelled job not leased")
+
+    job_id = enqueue(kind, ["stopping prompt"])
+    worker = JobWorker(kinds=[kind])
+    worker.stop.set()
+    assert worker.run_once()
+    job = DatabaseManager.get_job(job_id)
+    assert (job.status, job.attempts, job.progress_done) == ('queued', 0, 0)
+    print("[OK] Stopping worker released its job")
+
+    DatabaseManager.cancel_job(job_id)
+    job_id = DatabaseManager.enqueue_job(kind, ["doomed prompt"], max_attempts=1)
+    assert DatabaseManager.lease_job("crashes", 0.1, [kind]).id == job_id
+    time.sleep(0.2)
+    assert DatabaseManager.lease_job("next", 60, [kind]) is None
+    job = DatabaseManager.get_job(job_id)
+    assert job.status == 'failed' and 'Lease expired' in job.error
+    print("[OK] Failed after its only attempt's lease expired")
+
+
+def test_concurrent_workers():
+    """Test that concurrent workers split the queue without running anything twice"""
+    print("\n" + "="*60)
+    print("TEST 4: Concurrent Workers")
+    print("="*60)
+
+    kind = new_kind()
+    job_ids = [enqueue(kind, [f"job {j} prompt {i}" for i in range(5)], options={'delay': 0.01}) for j in range(6)]
+    del calls[:]
+
+    workers = [JobWorker(kinds=[kind], poll_seconds=0.05) for _ in range(3)]
+    threads = [threading.Thread(target=w.run) for w in workers]
+    for t in threads:
+        t.start()
+    deadline = time.time() + 30
+    while time.time() < deadline and any(DatabaseManager.get_job(j).status != 'done' for j in job_ids):
+        time.sleep(0.1)
+    for w in workers:
+        w.stop.set()
+    for t in threads:
+        t.join()
+
+    assert all(DatabaseManager.get_job(j).status == 'done' for j in job_ids)
+    assert len(calls) == len(set(calls)) == 30, "Every prompt ran exactly once"
+    print(f"[OK] 3 workers finished {len(job_ids)} jobs, 30 prompts, no duplicates")
+
+
+if __name__ == "__main__":
+    test_run_job()
+    test_lease_takeover()
+    test_cancel_and_release()
+    test_concurrent_workers()
+    print("\n[SUCCESS] All job tests passed!")
@@ -0,0 +1,130 @@
+"""
+Test script for the local hashed n-gram classifier
+Tests training, save/load, confidence gating in SmartAnalyzer and the label log
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core import local_classifier
+from core.config import Config
+from core.database import DatabaseManager
+from core.local_classifier import HashedNgramClassifier
+from core.smart_analyzer import SmartAnalyzer
+
+TOPICS = {
+    ('ml-data-science', 'data-scientist', 'analysis'): [
+        "train a random forest on this dataset", "tune hyperparameters for my neural network",
+        "feature engineering for churn prediction", "evaluate the classification model accuracy",
+    ],
+    ('python-development', 'developer', 'debugging'): [
+        "fix this python traceback in my flask app", "why does my function raise KeyError",
+        "debug the failing pytest fixture", "my script crashes with an import error",
+    ],
+    ('academic', 'researcher', 'research'): [
+        "write a literature review on climate policy", "design the methodology for my thesis",
+        "summarize recent papers about sleep research", "find gaps in the literature on education",
+    ],
+}
+
+
+def make_examples(n: int, seed: int):
+    """Synthetic prompts standing in for logged LLM labels"""
+    rng = random.Random(seed)
+    filler = ["please", "can you", "i need help to", "quickly", "for my project", "step by step"]
+    examples = []
+    for _ in range(n):
+        (domain, role, task), phrases = rng.choice(list(TOPICS.items()))
+        text = f"{rng.choice(filler)} {rng.choice(phrases)} {rng.choice(filler)}"
+        examples.append((text, {'domain': domain, 'role': role, 'task': task}))
+    return examples
+
+
+def train_model() -> HashedNgramClassifier:
+    train = make_examples(600, seed=1)
+    return HashedNgramClassifier.fit(
+        [t for t, _ in train], [l for _, l in train], ['domain', 'role', 'task'], n_features=2 ** 14
+    )
+
+
+def test_train_and_predict():
+    """Test that the classifier learns labels and answers quickly"""
+    print("\n" + "="*60)
+    print("TEST 1: Train, Evaluate, Save/Load")
+    print("="*60)
+
+    model = train_model()
+    holdout = make_examples(150, seed=2)
+
+    report = model.evaluate([t for t, _ in holdout], [l for _, l in holdout], threshold=0.85)
+    print(f"[OK] Holdout accuracy: {report['accuracy']}, coverage {report['coverage']:.0%}")
+    assert all(acc > 0.95 for acc in report['accuracy'].values())
+    assert report['coverage'] > 0.8
+
+    start = time.perf_counter()
+    for text, _ in holdout:
+        model.predict(text)
+    per_call = (time.perf_counter() - start) / len(holdout) * 1e6
+    print(f"[OK] {per_call:.0f} us per prediction")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model.npz")
+        model.save(path)
+        loaded = HashedNgramClassifier.load(path)
+    text = "debug the failing pytest fixture please"
+    assert loaded.predict(text) == model.predict(text)
+    print("[OK] Save/load round trip")
+
+
+def test_analyzer_gating():
+    """Test that SmartAnalyzer skips Gemini only when the model is confident"""
+    print("\n" + "="*60)
+    print("TEST 2: Confidence Gating")
+    print("="*60)
+
+    local_classifier._classifiers['smart_analyzer'] = train_model()
+    try:
+        analyzer = SmartAnalyzer()
+        analyzer.model = analyzer.fast_model = None  # Any Gemini call would raise
+
+        result = analyzer.analyze_prompt("can you train a random forest on this dataset for my project")
+        assert result['source'] == 'local'
+        assert (result['domain'], result['task']) == ('ml-data-science', 'analysis')
+        print(f"[OK] Confident prompt answered locally: {result}")
+
+        original = Config.LOCAL_CLASSIFIER_THRESHOLD
+        Config.LOCAL_CLASSIFIER_THRESHOLD = 1.01
+        try:
+            result = analyzer.analyze_prompt("can you train a random forest on this dataset for my project")
+        finally:
+            Config.LOCAL_CLASSIFIER_THRESHOLD = original
+        assert 'source' not in result, "Below the threshold the LLM path (here: keyword fallback) runs"
+        print("[OK] Unsure prompt falls through to the LLM path")
+    finally:
+        local_classifier._classifiers.pop('smart_analyzer', None)
+
+
+def test_label_log():
+    """Test that LLM labels are logged as training data"""
+    print("\n" + "="*60)
+    print("TEST 3: LLM Label Log")
+    print("="*60)
+
+    text = f"label log test {uuid.uuid4().hex}"
+    local_classifier.log_llm_labels('test_source', text, {'domain': 'academic', 'task': 'research'})
+    logged = dict(DatabaseManager.get_llm_labels('test_source'))
+    assert logged[text] == {'domain': 'academic', 'task': 'research'}
+    print("[OK] Labels stored for training")
+
+
+if __name__ == "__main__":
+    test_train_and_predict()
+    test_analyzer_gating()
+    test_label_log()
+    print("\n[SUCCESS] All local classifier tests passed!")
@@ -0,0 +1,131 @@
+"""
+Test script for Prometheus metrics
+Tests the text exposition format, request/stage/cache/fallback metrics of a
+chat request, rate-limit detection, and the HTTP endpoint
+"""
+import os
+import sys
+import uuid
+from urllib.request import urlopen
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.config import Config
+from core.metrics import (
+    CACHE_LOOKUPS, CONTENT_TYPE, FALLBACKS, RATE_LIMITED, REQUESTS, STAGE_SECONDS,
+    Counter, Histogram, MetricsRegistry, count_rate_limited, serve_metrics
+)
+from core.prompt_agent import PromptAgent
+
+ANALYSIS = ('{"domain": "coding", "task_type": "debugging", "complexity": "medium", '
+            '"key_topics": ["threads"], "detected_language": "python", "confidence": 0.9, '
+            '"context_summary": "Fix a deadlock"}')
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for Gemini: analyses fine, but never returns a valid evaluation"""
+
+    def generate_content(self, prompt: str, request_options=None) -> FakeResponse:
+        return FakeResponse("not json" if prompt.startswith("Rate this prompt") else ANALYSIS)
+
+
+class TooManyRequests(Exception):
+    code = 429
+
+
+def test_exposition():
+    """Test the text format of counters and histograms"""
+    print("\n" + "="*60)
+    print("TEST 1: Exposition Format")
+    print("="*60)
+
+    registry = MetricsRegistry()
+    calls = registry.register(Counter("test_calls_total", "Calls", ("path",)))
+    latency = registry.register(Histogram("test_latency_seconds", "Latency", (), buckets=(0.1, 1.0)))
+    calls.labels('say "hi"\n').inc()
+    calls.labels('say "hi"\n').inc(2)
+    for seconds in (0.05, 0.5, 5.0):
+        latency.observe(seconds)
+
+    text = registry.render()
+    print(text)
+    assert '# TYPE test_calls_total counter\ntest_calls_total{path="say \\"hi\\"\\n"} 3\n' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1\n' in text
+    assert 'test_latency_seconds_bucket{le="1"} 2\n' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3\n' in text
+    assert 'test_latency_seconds_sum 5.55\ntest_latency_seconds_count 3\n' in text
+
+    try:
+        calls.labels()
+        raise AssertionError("missing label accepted")
+    except ValueError:
+        pass
+    print("[OK] Counters and histograms rendered")
+
+
+def test_request_metrics():
+    """Test the metrics one chat request records, and rate-limit detection"""
+    print("\n" + "="*60)
+    print("TEST 2: Request Metrics")
+    print("="*60)
+
+    original = Config.LOG_LLM_LABELS, Config.TRACING_ENABLED
+    Config.LOG_LLM_LABELS = False  # Fake answers are no training data
+    Config.TRACING_ENABLED = False  # Stages are timed for the metrics anyway
+    try:
+        agent = PromptAgent()
+        agent.fast_model = agent.model = FakeModel()
+        entry = 'prompt_agent.process_input'
+        before = (REQUESTS.value(entry, 'ok'), STAGE_SECONDS.count('prompt_agent.analyze'),
+                  FALLBACKS.value(agent.eval_cascade.name, 'exhausted'),
+                  CACHE_LOOKUPS.value('near_duplicate', 'exact_hit'))
+
+        prompt = f"my python worker threads deadlock on a shared queue, why? ({uuid.uuid4().hex[:8]})"
+        first = agent.process_input_sync(prompt, defer_evaluation=False)
+        assert agent.process_input_sync(prompt, defer_evaluation=False) is first
+
+        after = (REQUESTS.value(entry, 'ok'), STAGE_SECONDS.count('prompt_agent.analyze'),
+                 FALLBACKS.value(agent.eval_cascade.name, 'exhausted'),
+                 CACHE_LOOKUPS.value('near_duplicate', 'exact_hit'))
+        assert [b - a for a, b in zip(before, after)] == [2, 1, 1, 1], (before, after)
+    finally:
+        Config.LOG_LLM_LABELS, Config.TRACING_ENABLED = original
+    print("[OK] Request, stage, fallback and cache hit counted")
+
+    limited = RATE_LIMITED.value('gemini:test')
+    assert count_rate_limited('gemini:test', TooManyRequests())
+    assert not count_rate_limited('gemini:test', ValueError("bad json"))
+    assert RATE_LIMITED.value('gemini:test') == limited + 1
+    print("[OK] Rate limits recognized")
+
+
+def test_endpoint():
+    """Test the /metrics HTTP endpoint"""
+    print("\n" + "="*60)
+    print("TEST 3: HTTP Endpoint")
+    print("="*60)
+
+    server = serve_metrics("127.0.0.1", 0)
+    try:
+        with urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5) as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert "# TYPE prompt_optimizer_requests_total counter" in body
+    assert "# TYPE prompt_optimizer_db_write_seconds histogram" in body
+    print(f"[OK] Served {len(body.splitlines())} lines")
+
+
+if __name__ == "__main__":
+    test_exposition()
+    test_request_metrics()
+    test_endpoint()
+    print("\n[SUCCESS] All metrics tests passed!")
@@ -0,0 +1,129 @@
+"""
+Test script for the near-duplicate cache
+Tests normalization, near-duplicate hits, misses for different prompts,
+namespaces, LRU / TTL eviction, and that chat near-hits render the new request
+"""
+import os
+import sys
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core import near_duplicate
+from core.config import Config
+from core.near_duplicate import NearDuplicateCache, normalize, simhash, similarity
+from core.prompt_agent import PromptAgent
+
+PROMPT = "Explain how transformers use attention to a masters student, with examples in Python"
+
+
+def test_near_duplicate_hits():
+    """Test that trivial edits hit and different prompts miss"""
+    print("\n" + "="*60)
+    print("TEST 1: Hits and Misses")
+    print("="*60)
+
+    assert normalize("  Explain   HOW,\ttransformers...work?! ") == "explain how transformers work"
+    assert similarity(simhash(normalize(PROMPT)), simhash(normalize(PROMPT.upper()))) == 1.0
+
+    cache = NearDuplicateCache(max_entries=100, ttl_seconds=0, threshold=0.8, min_tokens=8, max_word_edits=1)
+    cache.put("ns", PROMPT, "cached result")
+
+    assert cache.lookup("ns", PROMPT.lower() + "!!") == ("cached result", 1.0)
+    print("[OK] Case/punctuation variant is an exact hit")
+
+    match = cache.lookup("ns", PROMPT.replace("attention", "attnetion"))
+    assert match is not None and match[0] == "cached result"
+    print(f"[OK] Typo variant hit at similarity {match[1]:.2f}")
+
+    assert cache.get("ns", "Summarize recent papers on protein folding for a masters student in Python") is None
+    assert cache.get("ns", PROMPT.replace("transformers use attention", "random forests split nodes")) is None
+    print("[OK] Different prompts miss")
+
+    assert cache.get("other", PROMPT) is None
+    print("[OK] Namespaces are separate")
+
+    # Short prompts only match exactly
+    cache.put("ns", "fix my python bug", "short")
+    assert cache.get("ns", "Fix my python bug!") == "short"
+    assert cache.get("ns", "fix my python bugs") is None
+    print("[OK] Short prompts need an exact match")
+
+    assert cache.stats['exact_hits'] == 2 and cache.stats['near_hits'] == 1
+
+
+def test_eviction():
+    """Test LRU and TTL eviction, including the LSH index"""
+    print("\n" + "="*60)
+    print("TEST 2: Eviction")
+    print("="*60)
+
+    cache = NearDuplicateCache(max_entries=2, ttl_seconds=0, threshold=0.8, min_tokens=8, max_word_edits=1)
+    prompts = [PROMPT, "Summarize recent papers on protein folding and list the open questions", "Refactor my rust parser"]
+    for i, prompt in enumerate(prompts):
+        cache.put("ns", prompt, i)
+    assert len(cache) == 2 and cache.get("ns", PROMPT) is None
+    assert cache.get("ns", prompts[2]) == 2
+    assert all(key[1] != normalize(PROMPT) for bucket in cache._index.values() for key in bucket)
+    print("[OK] Least recently used entry evicted from entries and index")
+
+    cache = NearDuplicateCache(max_entries=10, ttl_seconds=0.05, threshold=0.8, min_tokens=8, max_word_edits=1)
+    cache.put("ns", PROMPT, "stale")
+    time.sleep(0.1)
+    assert cache.get("ns", PROMPT) is None and len(cache) == 0
+    print("[OK] Expired entries are not returned")
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for Gemini, counting analysis requests"""
+
+    def __init__(self):
+        self.analyses = 0
+
+    def generate_content(self, prompt: str, request_options=None) -> FakeResponse:
+        if prompt.startswith("Rate this prompt"):
+            return FakeResponse('{"score": 80, "suggestions": []}')
+        self.analyses += 1
+        return FakeResponse('{"domain": "education", "task_type": "explanation", "complexity": "medium", '
+                            '"key_topics": ["attention"], "detected_language": null, "confidence": 0.9, '
+                            '"context_summary": "Explain attention"}')
+
+
+def test_agent_near_hit():
+    """Test that an agent near-hit reuses the analysis but renders the new request"""
+    print("\n" + "="*60)
+    print("TEST 3: Agent Near-Duplicate Hit")
+    print("="*60)
+
+    original = near_duplicate._near_duplicate_cache, Config.NEAR_DUP_CACHE_ENABLED, Config.LOG_LLM_LABELS
+    near_duplicate._near_duplicate_cache = NearDuplicateCache(threshold=0.8, min_tokens=8, max_word_edits=1)
+    Config.NEAR_DUP_CACHE_ENABLED = True
+    Config.LOG_LLM_LABELS = False  # Fake answers are no training data
+    try:
+        agent = PromptAgent()
+        agent.fast_model = agent.model = FakeModel()
+        first = agent.process_input_sync(PROMPT, defer_evaluation=False)
+        analyses = agent.model.analyses
+
+        edited = PROMPT.replace("attention", "attnetion")
+        result = agent.process_input_sync(edited, defer_evaluation=False)
+        assert agent.model.analyses == analyses, "Near hit should reuse the analysis"
+        assert result.template_used == first.template_used
+        assert edited in result.optimized_prompt and PROMPT not in result.optimized_prompt
+        assert agent.process_input_sync(PROMPT, defer_evaluation=False) is first
+    finally:
+        near_duplicate._near_duplicate_cache, Config.NEAR_DUP_CACHE_ENABLED, Config.LOG_LLM_LABELS = original
+    print("[OK] Near hit rendered the new request with the cached analysis")
+
+
+if __name__ == "__main__":
+    test_near_duplicate_hits()
+    test_eviction()
+    test_agent_near_hit()
+    print("\n[SUCCESS] All near-duplicate cache tests passed!")
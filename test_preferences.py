@@ -4,11 +4,13 @@ Tests preference tracking, smart defaults, and database persistence
 """
 import os
 import sys
+import uuid
+from datetime import datetime, timedelta
 
 # Add project root to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from core.user_preferences import UserPreferences, get_preferences
+from core.user_preferences import UserPreferences, PreferenceStore, get_preferences, reset_session_preferences
 from core.database import DatabaseManager
 
 def test_preference_tracking():
@@ -220,6 +222,154 @@ def test_export_import():
     print("[OK] Export/import working correctly!")
     return True
 
+def test_incremental_persistence():
+    """Test debounced delta persistence and lazy hydration"""
+    print("\n" + "="*60)
+    print("TEST 6: Incremental Persistence")
+    print("="*60)
+
+    key = f"incremental_{uuid.uuid4().hex[:8]}"
+    prefs = UserPreferences(db_manager=DatabaseManager, session_key=key, flush_interval=60)
+
+    for i in range(3):
+        prefs.track_optimization(
+            domain='academic',
+            role='phd',
+            task_type='research',
+            selected_version='critical'
+        )
+    prefs.track_version_usage('basic', 'copy')
+    assert DatabaseManager.load_preference_counters(key) is None, "Deltas should be debounced"
+
+    assert prefs.flush() == 6, "One delta per changed counter"
+    prefs.track_optimization(domain='academic', role='phd', task_type='writing')
+    prefs.flush()
+
+    stored = DatabaseManager.load_preference_counters(key)['counters']
+    assert stored['domain_usage'] == {'academic': 4}
+    assert stored['combinations']['academic|phd|research'] == 3
+    print(f"[OK] Stored counters: {stored['domain_usage']}, {stored['version_usage']}")
+
+    # A new instance (next run) hydrates lazily and keeps its own unflushed deltas
+    restarted = UserPreferences(db_manager=DatabaseManager, session_key=key, flush_interval=60)
+    restarted.track_version_usage('basic', 'copy')
+    stats = restarted.get_usage_stats()
+    assert stats['total_optimizations'] == 4
+    assert stats['versions'] == {'critical': 3, 'basic': 2}
+    assert restarted.get_preferred_task('academic', 'phd') == 'research'
+    print("[OK] Restarted instance hydrated stored + pending counters")
+
+    restarted.reset_preferences()
+    assert DatabaseManager.load_preference_counters(key) is None
+    print("[OK] Reset cleared stored counters")
+    return True
+
+
+def test_ranked_indexes_and_decay():
+    """Test per-domain rankings and time decay of smart defaults"""
+    print("\n" + "="*60)
+    print("TEST 7: Ranked Indexes and Decay")
+    print("="*60)
+
+    prefs = UserPreferences()
+    for _ in range(3):
+        prefs.track_optimization(domain='academic', role='phd', task_type='research')
+    prefs.track_optimization(domain='academic', role='professor', task_type='teaching')
+    prefs.track_optimization(domain='academic', role='professor', task_type='writing')
+
+    # Rankings weigh how often a combination was used, not how many exist
+    assert prefs.get_preferred_role('academic') == 'phd'
+    assert prefs.get_preferred_task(role='professor') == 'teaching', "Ties keep first-seen order"
+    assert prefs.get_preferred_role('unknown-domain') is None
+    print("[OK] Per-domain and per-role leaders are usage-weighted")
+
+    decaying = UserPreferences(half_life_days=30)
+    for _ in range(5):
+        decaying.track_optimization(domain='academic', role='phd', task_type='research')
+    decaying._epoch -= 10 * decaying._half_life  # Those five events are now ~10 half-lives old
+    decaying.track_optimization(domain='ml-data-science', role='data_scientist', task_type='analysis')
+
+    assert decaying.get_preferred_domain() == 'ml-data-science', "Stale habits should fade"
+    assert decaying.get_usage_stats()['domains'] == {'academic': 5, 'ml-data-science': 1}, "Raw counts are kept"
+    print("[OK] Decay favours recent choices while stats keep raw counts")
+
+    # Each event decays from when it happened: a fresh click on an old favourite
+    # must not make its whole history current again
+    key = f"decay_{uuid.uuid4().hex[:8]}"
+    DatabaseManager.apply_preference_deltas(
+        key, {('domain_usage', 'academic'): 5}, at=datetime.utcnow() - timedelta(days=300), half_life_days=30
+    )
+    DatabaseManager.apply_preference_deltas(
+        key, {('domain_usage', 'academic'): 1, ('domain_usage', 'ml-data-science'): 2}, half_life_days=30
+    )
+    try:
+        reloaded = UserPreferences(db_manager=DatabaseManager, session_key=key, half_life_days=30)
+        assert reloaded.get_preferred_domain() == 'ml-data-science', "Reload should not reset decay"
+        assert reloaded.get_usage_stats()['domains'] == {'academic': 6, 'ml-data-science': 2}
+        undecayed = UserPreferences(db_manager=DatabaseManager, session_key=key, half_life_days=0)
+        assert undecayed.get_preferred_domain() == 'academic'
+    finally:
+        DatabaseManager.clear_preference_counters(key)
+    print("[OK] Reloaded counters keep their age")
+    return True
+
+
+def test_preference_store():
+    """Test per-session isolation, LRU eviction and write-back"""
+    print("\n" + "="*60)
+    print("TEST 8: Per-Session Preference Store")
+    print("="*60)
+
+    import threading
+
+    store = PreferenceStore(db_manager=DatabaseManager, shards=4, max_sessions=8, idle_seconds=0)
+    run = uuid.uuid4().hex[:8]
+    keys = [f"store_{run}_{i}" for i in range(40)]
+
+    def worker(offset):
+        for i in range(offset, len(keys), 4):
+            prefs = store.get(keys[i])
+            prefs.track_optimization(domain=f"domain{i}", role='phd', task_type='research')
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(store) <= 8, "Memory stays bounded"
+    print(f"[OK] {len(keys)} sessions tracked, {len(store)} kept in memory")
+
+    # Sessions are isolated and evicted ones were written back
+    store.flush()
+    for i in (0, 17, 39):
+        assert store.get(keys[i]).get_smart_defaults()['domain'] == f"domain{i}"
+    print("[OK] Evicted sessions re-hydrate their own counters")
+
+    import core.user_preferences as user_preferences
+    original = user_preferences._preference_store
+    user_preferences._preference_store = store
+    try:
+        reset_session_preferences(keys[0])
+        assert DatabaseManager.load_preference_counters(keys[0]) is None
+        assert get_preferences(keys[0]).get_usage_stats()['total_optimizations'] == 0
+        assert get_preferences(keys[17]).get_smart_defaults()['domain'] == "domain17"
+        shared = get_preferences()
+        assert shared is get_preferences("default") and shared.db is not None, "The shared profile persists"
+        shared.track_optimization(domain='academic', role='phd', task_type='research')
+        shared.flush()
+        reset_session_preferences()
+        assert DatabaseManager.load_preference_counters("default") is None
+        assert get_preferences().get_usage_stats()['total_optimizations'] == 0
+    finally:
+        user_preferences._preference_store = original
+    print("[OK] Reset clears a session's stored counters")
+
+    for key in keys:
+        DatabaseManager.clear_preference_counters(key)
+    return True
+
+
 if __name__ == "__main__":
     print("\n" + "="*60)
     print("USER PREFERENCES - COMPREHENSIVE TESTING")
@@ -270,6 +420,33 @@ if __name__ == "__main__":
         traceback.print_exc()
         all_passed = False
 
+    # Test 6: Incremental persistence
+    try:
+        test_incremental_persistence()
+    except Exception as e:
+        print(f"\n[ERROR] Incremental persistence test failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+
+    # Test 7: Ranked indexes and decay
+    try:
+        test_ranked_indexes_and_decay()
+    except Exception as e:
+        print(f"\n[ERROR] Ranked index test failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+
+    # Test 8: Per-session store
+    try:
+        test_preference_store()
+    except Exception as e:
+        print(f"\n[ERROR] Preference store test failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        all_passed = False
+
     # Summary
     print("\n" + "="*60)
     if all_passed:
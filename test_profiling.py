@@ -0,0 +1,134 @@
+"""
+Test script for request profiling
+Tests that requests are only profiled when asked or sampled, that a
+profiled chat request writes pstats and collapsed-stack files named after
+its request id, and cProfile mode's exact call counts
+"""
+import os
+import pstats
+import sys
+import tempfile
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.config import Config
+from core.profiling import profiled, recent_profiles, request_profiles
+from core.prompt_agent import PromptAgent
+from core.usage import current_usage
+
+ANALYSIS = ('{"domain": "research", "task_type": "analysis", "complexity": "medium", '
+            '"key_topics": ["survey"], "detected_language": null, "confidence": 0.9, '
+            '"context_summary": "Analyze a survey"}')
+EVALUATION = '{"score": 70, "suggestions": ["Name the population"]}'
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class SlowModel:
+    """Stands in for Gemini, spending CPU time the profiles can see"""
+
+    calls = 0
+
+    def generate_content(self, prompt: str, request_options=None) -> FakeResponse:
+        SlowModel.calls += 1
+        busy_parse(0.05)
+        return FakeResponse(EVALUATION if prompt.startswith("Rate this prompt") else ANALYSIS)
+
+
+def busy_parse(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+
+@profiled('test.entry')
+def entry():
+    return current_usage().request_id if current_usage() else None
+
+
+def run_profiled(check):
+    original = (Config.PROFILE_DIR, Config.PROFILE_MODE, Config.PROFILE_SAMPLE_EVERY,
+                Config.LOG_LLM_LABELS, Config.TRACING_ENABLED)
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.PROFILE_DIR = tmp
+        Config.LOG_LLM_LABELS = False  # Fake answers are no training data
+        Config.TRACING_ENABLED = False
+        try:
+            check(tmp)
+        finally:
+            (Config.PROFILE_DIR, Config.PROFILE_MODE, Config.PROFILE_SAMPLE_EVERY,
+             Config.LOG_LLM_LABELS, Config.TRACING_ENABLED) = original
+
+
+def test_switches():
+    """Test that only requested or sampled requests are profiled"""
+    print("\n" + "="*60)
+    print("TEST 1: Profiling Switches")
+    print("="*60)
+
+    def check(tmp):
+        Config.PROFILE_SAMPLE_EVERY = 0
+        assert entry() is None and os.listdir(tmp) == []
+
+        with request_profiles():
+            request_id = entry()
+        assert request_id and recent_profiles()[0].endswith(f"-{request_id}-test.entry")
+        assert os.path.exists(os.path.join(tmp, recent_profiles()[0] + ".folded"))
+
+        with request_profiles(False):
+            entry()
+        Config.PROFILE_SAMPLE_EVERY = 3
+        sampled = sum(entry() is not None for _ in range(6))
+        assert sampled == 2, sampled
+        assert len([f for f in os.listdir(tmp) if f.endswith(".folded")]) == 3
+
+    run_profiled(check)
+    print("[OK] Profiled on request and one in N")
+
+
+def test_agent_profile():
+    """Test the files of a profiled chat request, sampled and with cProfile"""
+    print("\n" + "="*60)
+    print("TEST 2: Chat Request Profile")
+    print("="*60)
+
+    def check(tmp):
+        agent = PromptAgent()
+        agent.fast_model = agent.model = SlowModel()
+
+        Config.PROFILE_MODE = "sampling"
+        with request_profiles():
+            agent.process_input_sync("compare the response rates of two online survey designs",
+                                     defer_evaluation=False)
+        stem = os.path.join(tmp, recent_profiles()[0])
+        assert "-prompt_agent.process_input" in stem
+        with open(stem + ".folded", encoding="utf-8") as f:
+            folded = f.read()
+        print(folded.splitlines()[0][-160:])
+        assert "busy_parse (test_profiling.py:" in folded
+        stats = pstats.Stats(stem + ".prof")
+        assert any(name == "busy_parse" for _, _, name in stats.stats)
+        print("[OK] Sampled profile written")
+
+        Config.PROFILE_MODE = "cprofile"
+        SlowModel.calls = 0
+        with request_profiles():
+            agent.process_input_sync("which statistical test suits paired ordinal survey answers",
+                                     defer_evaluation=False)
+        stats = pstats.Stats(os.path.join(tmp, recent_profiles()[0] + ".prof"))
+        calls = {name: nc for (_, _, name), (_, nc, *_) in stats.stats.items()}
+        assert SlowModel.calls and calls["generate_content"] == SlowModel.calls
+        print("[OK] cProfile counts exact calls")
+
+    run_profiled(check)
+
+
+if __name__ == "__main__":
+    test_switches()
+    test_agent_profile()
+    print("\n[SUCCESS] All profiling tests passed!")
@@ -0,0 +1,101 @@
+"""
+Test script for the shared cross-process cache
+Tests get/set with namespaces, TTL expiry, entry and size eviction, and
+entries written by one process being read by another
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.shared_cache import SharedCache
+
+
+def write_from_child(path: str):
+    SharedCache(path).set('child', 'greeting', {'text': 'hello from a child', 'pid': os.getpid()})
+
+
+def test_get_set_and_ttl():
+    """Test namespaces, replacement and expiry"""
+    print("\n" + "="*60)
+    print("TEST 1: Get, Set and TTL")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SharedCache(os.path.join(tmp, "cache.db"), ttl=60)
+        assert cache.get('a', 'key') is None
+        cache.set('a', 'key', {'value': 1})
+        cache.set('b', 'key', [1, 2, 3])
+        assert cache.get('a', 'key') == {'value': 1} and cache.get('b', 'key') == [1, 2, 3]
+        cache.set('a', 'key', {'value': 2})
+        assert cache.get('a', 'key') == {'value': 2}, "Set replaces"
+        print("[OK] Namespaced values round-trip")
+
+        cache.set('a', 'short', 'gone soon', ttl=0.1)
+        time.sleep(0.15)
+        assert cache.get('a', 'short') is None
+        print("[OK] Expired entries are misses")
+
+        calls = []
+        compute = lambda: calls.append(1) or "computed"
+        assert cache.get_or_compute('a', 'lazy', compute) == cache.get_or_compute('a', 'lazy', compute) == "computed"
+        assert len(calls) == 1
+
+        cache.clear('b')
+        assert cache.get('b', 'key') is None and cache.get('a', 'key') == {'value': 2}
+        report = cache.report()
+        assert report['hits'] >= 4 and report['misses'] >= 3
+        print(f"[OK] {report}")
+
+
+def test_eviction():
+    """Test that the entry and size limits hold, soonest-expiring first"""
+    print("\n" + "="*60)
+    print("TEST 2: Eviction")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SharedCache(os.path.join(tmp, "cache.db"), ttl=60, max_entries=100, max_bytes=10**9)
+        for i in range(150):
+            cache.set('n', i, 'x', ttl=1000 + i)  # Later keys live longer
+        cache.evict()
+        assert len(cache) <= 90
+        assert cache.get('n', 149) == 'x' and cache.get('n', 0) is None
+        print(f"[OK] Entry limit: {len(cache)} of 150 kept, soonest-expiring evicted")
+
+        cache = SharedCache(os.path.join(tmp, "sized.db"), ttl=60, max_entries=10**6, max_bytes=100_000)
+        for i in range(50):
+            cache.set('s', i, b'y' * 5000)
+        cache.evict()
+        _, size = cache._conn().execute("SELECT count(*), total(size) FROM cache").fetchone()
+        assert size <= 90_000, size
+        assert not cache.set('s', 'huge', b'z' * 50_000), "Values over a tenth of the limit are not cached"
+        print(f"[OK] Size limit: {size:.0f} bytes kept")
+
+
+def test_cross_process():
+    """Test that an entry written by another process is visible"""
+    print("\n" + "="*60)
+    print("TEST 3: Cross-Process")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.db")
+        cache = SharedCache(path)
+        child = multiprocessing.get_context('spawn').Process(target=write_from_child, args=(path,))
+        child.start()
+        child.join(timeout=60)
+        value = cache.get('child', 'greeting')
+        assert value['text'] == 'hello from a child' and value['pid'] != os.getpid()
+        print(f"[OK] Read what process {value['pid']} wrote")
+
+
+if __name__ == "__main__":
+    test_get_set_and_ttl()
+    test_eviction()
+    test_cross_process()
+    print("\n[SUCCESS] All shared cache tests passed!")
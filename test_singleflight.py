@@ -0,0 +1,122 @@
+"""
+Test script for single-flight request coalescing
+Tests that concurrent identical calls share one execution across threads and
+asyncio, that errors reach every waiter, and that finished keys run again
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.singleflight import SingleFlight, fingerprint
+
+
+def test_threads_share_one_call():
+    """Test that concurrent threads with the same key run the function once"""
+    print("\n" + "="*60)
+    print("TEST 1: Threads")
+    print("="*60)
+
+    group = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def slow_llm_call(prompt):
+        calls.append(prompt)
+        release.wait(5)
+        return {'optimized': prompt.upper()}
+
+    key = fingerprint('optimize', 'explain recursion')
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(group.do, key, slow_llm_call, 'explain recursion') for _ in range(8)]
+        while group.shared < 7:
+            time.sleep(0.01)
+        release.set()
+        results = [f.result() for f in futures]
+
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert (group.executions, group.shared, group.in_flight()) == (1, 7, 0)
+    print("[OK] 8 concurrent calls, 1 execution")
+
+    # Not a cache: the next call after completion runs again
+    release.set()
+    group.do(key, slow_llm_call, 'explain recursion')
+    assert len(calls) == 2
+    print("[OK] Completed keys run again")
+
+
+def test_errors_reach_every_waiter():
+    """Test that the leader's exception is raised in every waiter"""
+    print("\n" + "="*60)
+    print("TEST 2: Shared Errors")
+    print("="*60)
+
+    group = SingleFlight()
+    started = threading.Event()
+
+    def failing_call():
+        started.set()
+        time.sleep(0.2)
+        raise TimeoutError("model timed out")
+
+    def call():
+        try:
+            group.do('same-key', failing_call)
+        except TimeoutError as e:
+            return str(e)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        leader = pool.submit(call)
+        started.wait(5)
+        waiters = [pool.submit(call) for _ in range(3)]
+        errors = [leader.result()] + [w.result() for w in waiters]
+
+    assert errors == ["model timed out"] * 4
+    print("[OK] All 4 callers saw the timeout")
+
+
+def test_asyncio_and_threads():
+    """Test coalescing among coroutines, and between a coroutine and a thread"""
+    print("\n" + "="*60)
+    print("TEST 3: Asyncio")
+    print("="*60)
+
+    group = SingleFlight()
+    calls = []
+
+    async def slow_async_call(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.2)
+        return prompt[::-1]
+
+    async def main():
+        return await asyncio.gather(*[group.do_async('k', slow_async_call, 'abc') for _ in range(5)])
+
+    assert asyncio.run(main()) == ['cba'] * 5
+    assert len(calls) == 1
+    print("[OK] 5 coroutines, 1 execution")
+
+    # A thread joins a call a coroutine leads
+    async def mixed():
+        leader = asyncio.ensure_future(group.do_async('k2', slow_async_call, 'xyz'))
+        await asyncio.sleep(0.05)
+        in_thread = await asyncio.get_running_loop().run_in_executor(
+            None, group.do, 'k2', lambda: 'thread ran it'
+        )
+        return await leader, in_thread
+
+    assert asyncio.run(mixed()) == ('zyx', 'zyx')
+    print("[OK] Thread waited on the coroutine's call")
+
+
+if __name__ == "__main__":
+    test_threads_share_one_call()
+    test_errors_reach_every_waiter()
+    test_asyncio_and_threads()
+    print("\n[SUCCESS] All single-flight tests passed!")
@@ -0,0 +1,180 @@
+"""
+Test script for the background task runner
+Tests priorities, retries, durable tasks surviving a restart, draining on
+shutdown, the queue metrics, and processes sharing one durable store
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.config import Config
+from core.tasks import TaskRunner, TaskStore, task
+
+recorded = []
+
+
+@task('test.record')
+def record(value):
+    recorded.append(value)
+
+
+def test_priorities_and_metrics():
+    """Test that higher priorities run first and metrics add up"""
+    print("\n" + "="*60)
+    print("TEST 1: Priorities and Metrics")
+    print("="*60)
+
+    runner = TaskRunner(queues={'single': 1})
+    order = []
+    gate = threading.Event()
+    runner.submit(gate.wait, queue='single')  # Hold the only worker
+    for priority in (0, 5, 1):
+        runner.submit(order.append, priority, queue='single', priority=priority)
+    gate.set()
+    assert runner.join('single', timeout=5)
+    assert order == [5, 1, 0], order
+    print("[OK] Higher priority ran first")
+
+    futures = [runner.submit(lambda x: x * x, i, queue='math') for i in range(20)]
+    assert [f.result(timeout=5) for f in futures] == [i * i for i in range(20)]
+    stats = runner.stats()
+    assert stats['math']['completed'] == 20 and stats['math']['workers'] == Config.TASK_DEFAULT_WORKERS
+    assert stats['math']['throughput_per_min'] == 20 and stats['math']['wait_p95_s'] is not None
+    print(runner.report())
+    runner.shutdown()
+
+
+def test_retries():
+    """Test retries with backoff, and failure once they run out"""
+    print("\n" + "="*60)
+    print("TEST 2: Retries")
+    print("="*60)
+
+    original = Config.TASK_RETRY_BACKOFF_SECONDS
+    Config.TASK_RETRY_BACKOFF_SECONDS = 0.01
+    try:
+        runner = TaskRunner()
+        attempts = []
+
+        def flaky():
+            attempts.append(time.monotonic())
+            if len(attempts) < 3:
+                raise ConnectionError("database is locked")
+            return "ok"
+
+        assert runner.submit(flaky, retries=3).result(timeout=5) == "ok"
+        assert len(attempts) == 3 and attempts[2] - attempts[1] >= 0.02, "Backoff doubles"
+        print("[OK] Succeeded on the third attempt")
+
+        failing = runner.submit(lambda: 1 / 0, retries=1)
+        try:
+            failing.result(timeout=5)
+            assert False, "Expected the task's exception"
+        except ZeroDivisionError:
+            pass
+        stats = runner.stats()['default']
+        assert stats['retried'] == 3 and stats['failed'] == 1
+        print("[OK] Out of retries: the future carries the exception")
+        runner.shutdown()
+    finally:
+        Config.TASK_RETRY_BACKOFF_SECONDS = original
+
+
+def test_durable_and_shutdown():
+    """Test that durable tasks survive a restart and shutdown drains queues"""
+    print("\n" + "="*60)
+    print("TEST 3: Durable Tasks and Shutdown")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TaskStore(os.path.join(tmp, "tasks.db"))
+        runner = TaskRunner(store=store)
+        runner.submit('test.record', 'later', durable=True, delay=60)
+        runner.shutdown(drain=False)  # Simulated crash: the delayed task never ran
+        assert recorded == [] and len(store.pending()) == 1
+
+        restarted = TaskRunner(store=TaskStore(os.path.join(tmp, "tasks.db")))
+        assert restarted.join(timeout=5)
+        assert recorded == ['later'] and store.pending() == []
+        print("[OK] Durable task ran after a restart")
+
+        try:
+            restarted.submit(record, 'x', durable=True)
+            assert False, "Durable tasks need a registered name"
+        except ValueError:
+            pass
+
+        restarted.submit('test.record', 'delayed', delay=60)
+        restarted.shutdown()
+        assert recorded[-1] == 'delayed'
+        print("[OK] Shutdown drained the delayed task")
+
+        restarted.submit('test.record', 'after shutdown').result(timeout=1)
+        assert recorded[-1] == 'after shutdown'
+        print("[OK] Submissions after shutdown run inline")
+
+
+# A second process: leases a durable task, then keeps it pending until killed
+PEER = """
+import sys, time
+from core.config import Config
+Config.TASK_LEASE_SECONDS = 1.0
+from core.tasks import TaskRunner, TaskStore, task
+task('test.record')(print)
+runner = TaskRunner(store=TaskStore(sys.argv[1]))
+runner.submit('test.record', 'peer', durable=True, delay=600)
+print('ready', flush=True)
+time.sleep(600)
+"""
+
+
+def test_shared_store():
+    """Test that a live process keeps its durable tasks, and a dead one's are taken over"""
+    print("\n" + "="*60)
+    print("TEST 4: Store Shared by Processes")
+    print("="*60)
+
+    original = Config.TASK_LEASE_SECONDS
+    Config.TASK_LEASE_SECONDS = 1.0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tasks.db")
+        peer = subprocess.Popen([sys.executable, "-c", PEER, path], stdout=subprocess.PIPE, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        runner = None
+        try:
+            assert peer.stdout.readline().strip() == 'ready'
+            runner = TaskRunner(store=TaskStore(path))
+            time.sleep(2.5)  # Over two lease lengths, renewed by the peer all along
+            assert 'peer' not in recorded, "A live process's task was recovered"
+            print("[OK] Tasks of a live process are left alone")
+
+            peer.kill()
+            peer.wait()
+            deadline = time.monotonic() + 10
+            while 'peer' not in recorded and time.monotonic() < deadline:
+                time.sleep(0.1)
+            assert recorded.count('peer') == 1
+            assert runner.join(timeout=5) and runner.store.pending() == []
+            print("[OK] Tasks of a dead process are taken over once")
+        finally:
+            Config.TASK_LEASE_SECONDS = original
+            if peer.poll() is None:
+                peer.kill()
+                peer.wait()
+            peer.stdout.close()
+            if runner is not None:
+                runner.shutdown()
+
+
+if __name__ == "__main__":
+    test_priorities_and_metrics()
+    test_retries()
+    test_durable_and_shutdown()
+    test_shared_store()
+    print("\n[SUCCESS] All task runner tests passed!")
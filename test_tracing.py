@@ -0,0 +1,122 @@
+"""
+Test script for request tracing
+Tests that spans are free no-ops while disabled, and that a chat request
+exports nested stage and LLM spans (including its deferred evaluation)
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core import tracing
+from core.config import Config
+from core.prompt_agent import PromptAgent
+from core.tracing import annotate, format_waterfall, read_traces, span, traced
+
+ANALYSIS = ('{"domain": "coding", "task_type": "debugging", "complexity": "medium", '
+            '"key_topics": ["hashing"], "detected_language": "python", "confidence": 0.9, '
+            '"context_summary": "Fix a hashing bug"}')
+EVALUATION = '{"score": 77, "suggestions": ["Show the colliding keys"]}'
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for Gemini"""
+
+    def generate_content(self, prompt: str, request_options=None) -> FakeResponse:
+        return FakeResponse(EVALUATION if prompt.startswith("Rate this prompt") else ANALYSIS)
+
+
+@traced("test.double")
+def double(x):
+    return 2 * x
+
+
+def test_disabled():
+    """Test that nothing is recorded or written while tracing is off"""
+    print("\n" + "="*60)
+    print("TEST 1: Tracing Disabled")
+    print("="*60)
+
+    original = Config.TRACING_ENABLED, Config.METRICS_ENABLED
+    Config.TRACING_ENABLED = Config.METRICS_ENABLED = False
+    try:
+        with span("test.outer", answer=42) as outer:
+            outer.set(more=1)
+            annotate(ignored=True)
+            assert double(21) == 42
+        assert outer is span("test.other")  # The shared no-op
+        assert tracing.current_span() is None
+    finally:
+        Config.TRACING_ENABLED, Config.METRICS_ENABLED = original
+    print("[OK] Spans are no-ops")
+
+
+def test_agent_trace():
+    """Test the spans of a chat request, from the export file"""
+    print("\n" + "="*60)
+    print("TEST 2: Chat Request Trace")
+    print("="*60)
+
+    original = Config.TRACING_ENABLED, Config.TRACE_PATH, Config.LOG_LLM_LABELS
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.TRACING_ENABLED = True
+        Config.TRACE_PATH = os.path.join(tmp, "traces.jsonl")
+        Config.LOG_LLM_LABELS = False  # Fake answers are no training data
+        tracing._tracer = None
+        try:
+            check_agent_trace()
+        finally:
+            Config.TRACING_ENABLED, Config.TRACE_PATH, Config.LOG_LLM_LABELS = original
+            tracing._tracer = None
+
+
+def check_agent_trace():
+    agent = PromptAgent()
+    agent.fast_model = agent.model = FakeModel()
+
+    result = agent.process_input_sync("my python dict lookups slow down with custom __hash__, why?",
+                                      defer_evaluation=True)
+    assert result.evaluation.result() == (77, ["Show the colliding keys"])
+
+    traces = read_traces()
+    assert len(traces) == 1
+    spans = {s['name']: s for s in traces[0]}
+    root = spans['prompt_agent.process_input']
+    assert root['parent_id'] is None and root['attributes'] == {'cached': False}
+    for stage in ('prompt_agent.analyze', 'prompt_agent.render', 'prompt_agent.evaluate_deferred'):
+        assert spans[stage]['parent_id'] == root['span_id'], stage
+    assert spans['prompt_agent.evaluate']['parent_id'] == spans['prompt_agent.evaluate_deferred']['span_id']
+    assert any(s['name'] == 'llm' and s['attributes']['model'].startswith('gemini:') for s in traces[0])
+    assert len(tracing.get_tracer().recent()[0]) == len(traces[0])
+    print(format_waterfall(traces[0]))
+    print(f"[OK] {len(traces[0])} spans exported")
+
+    # Async requests keep the nesting across asyncio.to_thread
+    asyncio.run(agent.process_input("my python set drops objects with equal __hash__, why?",
+                                    defer_evaluation=False))
+    spans = {s['name']: s for s in read_traces()[0]}
+    assert spans['prompt_agent.analyze']['parent_id'] == spans['prompt_agent.process_input']['span_id']
+    assert spans['prompt_agent.evaluate']['parent_id'] == spans['prompt_agent.process_input']['span_id']
+    print("[OK] Async request nested")
+
+    try:
+        with span("test.failing"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    assert read_traces()[0][0]['error'] == "ValueError: boom"
+    print("[OK] Errors recorded")
+
+
+if __name__ == "__main__":
+    test_disabled()
+    test_agent_trace()
+    print("\n[SUCCESS] All tracing tests passed!")
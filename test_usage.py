@@ -0,0 +1,109 @@
+"""
+Test script for token and cost accounting
+Tests reported vs. estimated token counts, pricing, one request's totals
+across its pipeline stages, and the stored per-stage breakdown
+"""
+import os
+import sys
+import uuid
+from types import SimpleNamespace
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.config import Config
+from core.database import DatabaseManager
+from core.prompt_agent import PromptAgent
+from core.usage import estimate_tokens, get_usage_tracker, price, record_usage, usage_scope
+
+ANALYSIS = ('{"domain": "research", "task_type": "literature_review", "complexity": "medium", '
+            '"key_topics": ["sleep"], "detected_language": null, "confidence": 0.9, '
+            '"context_summary": "Review sleep studies"}')
+EVALUATION = '{"score": 81, "suggestions": ["Name the time range"]}'
+
+
+class FakeResponse:
+    def __init__(self, text: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(prompt_token_count=prompt_tokens,
+                                              candidates_token_count=completion_tokens)
+
+
+class FakeModel:
+    """Stands in for Gemini, reporting 100 prompt tokens per call"""
+    model_name = "models/gemini-2.5-flash"
+
+    def generate_content(self, prompt: str, request_options=None) -> FakeResponse:
+        if prompt.startswith("Rate this prompt"):
+            return FakeResponse(EVALUATION, 100, 20)
+        return FakeResponse(ANALYSIS, 100, 50)
+
+
+def test_counts_and_prices():
+    """Test reported counts, the estimate when none are reported, and prices"""
+    print("\n" + "="*60)
+    print("TEST 1: Counts and Prices")
+    print("="*60)
+
+    with usage_scope(session_id="test-counts") as usage:
+        reported = record_usage("test.reported", "gemini:gemini-2.5-flash", "hi", FakeResponse("ok", 12, 3))
+        estimated = record_usage("test.estimated", "gemini:unpriced-model", "x" * 40,
+                                 SimpleNamespace(text="y" * 8))
+    assert (reported.prompt_tokens, reported.completion_tokens, reported.estimated) == (12, 3, False)
+    assert reported.session_id == "test-counts" and reported.request_id == usage.request_id
+    assert (estimated.prompt_tokens, estimated.completion_tokens, estimated.estimated) == (10, 2, True)
+    assert estimated.cost_usd is None
+    assert usage.to_dict()['calls'] == 2 and usage.prompt_tokens == 22
+
+    input_price, output_price = Config.LLM_PRICES['gemini-2.5-flash']
+    assert price("gemini:gemini-2.5-flash", 1_000_000, 1_000_000) == input_price + output_price
+    assert estimate_tokens(["abcd" * 5, b"bytes", "abcd"]) == 6
+    print("[OK] Reported, estimated and priced")
+
+
+def test_request_breakdown():
+    """Test one chat request's totals and its stored per-stage breakdown"""
+    print("\n" + "="*60)
+    print("TEST 2: Request Breakdown")
+    print("="*60)
+
+    original = Config.LOG_LLM_LABELS
+    Config.LOG_LLM_LABELS = False  # Fake answers are no training data
+    try:
+        agent = PromptAgent()
+        agent.fast_model = agent.model = FakeModel()
+        session_id = f"test-{uuid.uuid4().hex[:8]}"
+
+        with usage_scope(session_id=session_id) as usage:
+            result = agent.process_input_sync("summarize recent studies on sleep and memory consolidation",
+                                              defer_evaluation=False)
+        assert result.quality_score == 81
+        assert usage.to_dict() == {
+            'request_id': usage.request_id, 'calls': 2, 'prompt_tokens': 200, 'completion_tokens': 70,
+            'cost_usd': round(price("gemini:gemini-2.5-flash", 200, 70), 6),
+        }
+    finally:
+        Config.LOG_LLM_LABELS = original
+
+    assert get_usage_tracker().flush() >= 2
+    rows = DatabaseManager.get_llm_usage(group_by=('stage', 'model'), session_id=session_id)
+    stages = {row['stage']: row for row in rows}
+    assert set(stages) == {'prompt_agent.analyze', 'prompt_agent.evaluate'}
+    assert stages['prompt_agent.analyze']['total_tokens'] == 150
+    assert stages['prompt_agent.evaluate']['model'] == "gemini:gemini-2.5-flash"
+    assert all(row['estimated_calls'] == 0 for row in rows)
+    for row in rows:
+        print(f"  {row['stage']:<24} {row['total_tokens']:>5} tokens  ${row['cost_usd']:.6f}")
+
+    try:
+        DatabaseManager.get_llm_usage(group_by=('prompt',))
+        raise AssertionError("unknown group accepted")
+    except ValueError:
+        pass
+    print("[OK] Breakdown stored per stage")
+
+
+if __name__ == "__main__":
+    test_counts_and_prices()
+    test_request_breakdown()
+    print("\n[SUCCESS] All usage tests passed!")
@@ -0,0 +1,142 @@
+"""
+Train and evaluate the local prompt classifier
+
+The classifier learns from labels Gemini assigned earlier (logged to the
+llm_labels table by SmartAnalyzer and PromptAgent). Every fifth example, chosen
+by a stable hash of its text, is held out for evaluation.
+
+Usage:
+    python train_classifier.py label [--limit 500]           # label logged sessions with Gemini
+    python train_classifier.py train [--source smart_analyzer]
+    python train_classifier.py evaluate [--source smart_analyzer] [--threshold 0.85]
+"""
+import argparse
+import sys
+import time
+import zlib
+
+from sqlalchemy import select
+
+from core.config import Config
+from core.database import DatabaseManager, PromptSession, LLMLabel
+from core.local_classifier import HashedNgramClassifier, model_path
+
+# Heads learned per label source
+HEADS = {
+    'smart_analyzer': ['domain', 'role', 'task'],
+    'prompt_agent': ['domain', 'task_type', 'complexity'],
+}
+
+
+def is_holdout(text: str) -> bool:
+    return zlib.crc32(text.encode()) % 5 == 0
+
+
+def load_split(source: str):
+    """(train, holdout) lists of (text, labels) for a source"""
+    pairs = DatabaseManager.get_llm_labels(source)
+    train = [(text, labels) for text, labels in pairs if not is_holdout(text)]
+    holdout = [(text, labels) for text, labels in pairs if is_holdout(text)]
+    return train, holdout
+
+
+def print_report(report: dict):
+    print(f"  examples:          {report['examples']}")
+    for head, accuracy in report['accuracy'].items():
+        print(f"  {head + ' accuracy:':<19}{accuracy:.1%}")
+    covered = report['covered_accuracy']
+    print(f"  answered locally:  {report['coverage']:.1%} at confidence >= {report['threshold']}")
+    print(f"  accuracy there:    {'n/a' if covered is None else f'{covered:.1%}'} (all heads right)")
+
+
+def cmd_label(args):
+    """Ask Gemini to label logged session prompts that have no label yet"""
+    from core.smart_analyzer import SmartAnalyzer
+
+    with DatabaseManager.get_session() as session:
+        labelled = select(LLMLabel.text).where(LLMLabel.source == 'smart_analyzer')
+        prompts = session.execute(
+            select(PromptSession.raw_prompt)
+            .where(PromptSession.raw_prompt.not_in(labelled))
+            .distinct()
+            .limit(args.limit)
+        ).scalars().all()
+
+    analyzer = SmartAnalyzer()
+    done = 0
+    for prompt in prompts:
+        # Skip the local model: these labels must come from the LLM
+        if analyzer._analyze_with_llm(prompt):
+            done += 1
+    print(f"Labelled {done} of {len(prompts)} logged prompts")
+
+
+def cmd_train(args):
+    train, holdout = load_split(args.source)
+    if not train:
+        print(f"No logged LLM labels for '{args.source}' yet - use the app (or `label`) first")
+        return 1
+
+    start = time.perf_counter()
+    model = HashedNgramClassifier.fit(
+        [text for text, _ in train], [labels for _, labels in train], HEADS[args.source],
+        min_count=args.min_count, epochs=args.epochs
+    )
+    print(f"Trained on {len(train)} examples in {time.perf_counter() - start:.1f} s")
+    for head, names in model.labels.items():
+        print(f"  {head}: {len(names)} labels")
+
+    path = model_path(args.source)
+    model.save(path)
+    print(f"Saved {path}")
+
+    if holdout:
+        print("\nHoldout:")
+        print_report(model.evaluate([t for t, _ in holdout], [l for _, l in holdout], args.threshold))
+    return 0
+
+
+def cmd_evaluate(args):
+    path = model_path(args.source)
+    if not path.exists():
+        print(f"No model at {path} - run `train` first")
+        return 1
+
+    model = HashedNgramClassifier.load(path)
+    _, holdout = load_split(args.source)
+    if not holdout:
+        print("No held-out labels to evaluate against")
+        return 1
+
+    print(f"Holdout ({args.source}):")
+    print_report(model.evaluate([t for t, _ in holdout], [l for _, l in holdout], args.threshold))
+
+    start = time.perf_counter()
+    for text, _ in holdout:
+        model.predict(text)
+    print(f"  latency:           {(time.perf_counter() - start) / len(holdout) * 1e6:.0f} us per prompt")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    label = sub.add_parser("label", help="Label logged session prompts with Gemini")
+    label.add_argument("--limit", type=int, default=500)
+    label.set_defaults(func=cmd_label)
+
+    for name, func in (("train", cmd_train), ("evaluate", cmd_evaluate)):
+        cmd = sub.add_parser(name)
+        cmd.add_argument("--source", choices=sorted(HEADS), default="smart_analyzer")
+        cmd.add_argument("--threshold", type=float, default=Config.LOCAL_CLASSIFIER_THRESHOLD)
+        cmd.set_defaults(func=func)
+    sub.choices["train"].add_argument("--epochs", type=int, default=8)
+    sub.choices["train"].add_argument("--min-count", type=int, default=3, help="Rarer labels are not learned")
+
+    args = parser.parse_args()
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())